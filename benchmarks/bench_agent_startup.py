@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Agent启动延迟基准测试
+
+比较每个请求新建BedrockModel和Agent（旧方式）与从AgentPool获取复用Agent的耗时。
+只测量对象创建和重置，不会调用Bedrock。
+
+用法:
+    python benchmarks/bench_agent_startup.py --iterations 50
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+from strands import Agent
+from strands.tools.executors import ConcurrentToolExecutor
+from exam_generator.agent import (
+    AgentPool,
+    ToolConcurrencyLimit,
+    DEFAULT_TOOLS,
+    _build_bedrock_model
+)
+from exam_generator.config import llm_config, exam_config
+from exam_generator.utils import TaskTrackingHook
+
+def create_fresh_agent():
+    """旧方式：每次创建新的BedrockModel和Agent"""
+    return Agent(
+        name="ExamGeneratorAgent",
+        model=_build_bedrock_model(llm_config.read_timeout),
+        system_prompt=exam_config.system_prompt,
+        tools=ToolConcurrencyLimit(exam_config.max_concurrent_tools).wrap(DEFAULT_TOOLS),
+        callback_handler=None,
+        hooks=[TaskTrackingHook()],
+        tool_executor=ConcurrentToolExecutor()
+    )
+
+def measure(func, iterations):
+    """执行func多次，返回每次耗时（毫秒）"""
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description='Agent启动延迟基准测试')
+    parser.add_argument('-n', '--iterations', type=int, default=30, help='每种方式的执行次数')
+    args = parser.parse_args()
+
+    # 基准测试不需要日志输出
+    logging.disable(logging.INFO)
+
+    pool = AgentPool(max_size=1)
+
+    def pooled():
+        agent = pool.acquire()
+        pool.release(agent)
+
+    # 预热：第一次导入和创建共享模型的开销不计入结果
+    create_fresh_agent()
+    pooled()
+
+    fresh_timings = measure(create_fresh_agent, args.iterations)
+    pooled_timings = measure(pooled, args.iterations)
+
+    fresh = statistics.median(fresh_timings)
+    reused = statistics.median(pooled_timings)
+    print(f"迭代次数: {args.iterations}")
+    print(f"新建Agent:  中位数 {fresh:.2f} ms, 平均 {statistics.mean(fresh_timings):.2f} ms")
+    print(f"复用Agent:  中位数 {reused:.3f} ms, 平均 {statistics.mean(pooled_timings):.3f} ms")
+    print(f"每个请求节省: {fresh - reused:.2f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+异步引擎与线程池引擎的吞吐量和内存基准测试
+
+启动本地的模拟bedrock-runtime服务（fake_bedrock.py，固定延迟返回一道题目），分别用线程池 + call_claude
+和asyncio + call_claude_async发起相同数量的模型调用，比较耗时、吞吐量、峰值RSS和峰值线程数。
+每个引擎在独立的子进程中运行，峰值RSS互不影响。不会访问AWS。
+
+用法:
+    python benchmarks/bench_async_engine.py --calls 400 --concurrency 200 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class PeakSampler:
+    """在后台线程中采样峰值线程数"""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak_threads = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def run_engine(engine, calls, concurrency):
+    """在当前进程中运行一个引擎，打印JSON格式的结果"""
+    sys.path.append(PROJECT_ROOT)
+    import logging
+    logging.disable(logging.WARNING)
+    import concurrent.futures
+    import contextvars
+    from exam_generator.tools.exam_tools import call_claude
+    from exam_generator.tools.async_tools import call_claude_async
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with PeakSampler() as sampler:
+        start = time.perf_counter()
+        if engine == "thread":
+            with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = [
+                    executor.submit(contextvars.copy_context().run, call_claude, f"题目{i}", max_retries=1)
+                    for i in range(calls)
+                ]
+                results = [future.result() for future in futures]
+        else:
+            async def run_all():
+                return await asyncio.gather(*(call_claude_async(f"题目{i}", max_retries=1) for i in range(calls)))
+            results = asyncio.run(run_all())
+        elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "engine": engine,
+        "calls": len(results),
+        "elapsed": elapsed,
+        "throughput": len(results) / elapsed,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rss_growth_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+        "peak_threads": sampler.peak_threads
+    }))
+
+def free_port():
+    """获取一个空闲端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def main():
+    parser = argparse.ArgumentParser(description='异步引擎与线程池引擎的基准测试')
+    parser.add_argument('--calls', type=int, default=400, help='每个引擎的模型调用次数')
+    parser.add_argument('--concurrency', type=int, default=200, help='同时进行的模型调用数量')
+    parser.add_argument('--latency', type=float, default=0.5, help='模拟服务每次调用的延迟（秒）')
+    parser.add_argument('--engine', choices=['thread', 'async'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.engine:
+        run_engine(args.engine, args.calls, args.concurrency)
+        return
+
+    port = free_port()
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(PROJECT_ROOT, 'benchmarks', 'fake_bedrock.py'),
+         '--port', str(port), '--latency', f'fixed:{args.latency}'],
+        stdout=subprocess.DEVNULL
+    )
+    env = dict(
+        os.environ,
+        BEDROCK_ENDPOINT_URL=f"http://127.0.0.1:{port}",
+        MAX_CONCURRENT_GENERATIONS=str(args.concurrency),
+        ASYNC_MAX_CONNECTIONS=str(args.concurrency),
+        AWS_ACCESS_KEY_ID=os.environ.get("AWS_ACCESS_KEY_ID", "bench"),
+        AWS_SECRET_ACCESS_KEY=os.environ.get("AWS_SECRET_ACCESS_KEY", "bench"),
+        SHARED_STATE_DIR=""
+    )
+    try:
+        time.sleep(1)
+        results = []
+        for engine in ('thread', 'async'):
+            output = subprocess.run(
+                [sys.executable, __file__, '--engine', engine, '--calls', str(args.calls), '--concurrency', str(args.concurrency)],
+                env=env, capture_output=True, text=True, check=True, cwd=PROJECT_ROOT
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    print(f"调用次数: {args.calls}, 并发: {args.concurrency}, 模拟延迟: {args.latency}s")
+    print(f"{'引擎':<8}{'耗时(s)':>10}{'吞吐量(次/s)':>16}{'峰值RSS(MB)':>14}{'峰值线程数':>12}")
+    for result in results:
+        print(f"{result['engine']:<8}{result['elapsed']:>10.2f}{result['throughput']:>16.1f}"
+              f"{result['peak_rss_mb']:>14.1f}{result['peak_threads']:>12}")
+
+if __name__ == '__main__':
+    main()
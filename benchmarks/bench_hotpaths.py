@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+"""
+纯Python热点路径的微基准测试
+
+每个请求都会执行的CPU密集路径：格式验证和修复（validate_exam_format、fix_exam_format、
+standardize_question_format）、元数据提取（extract_exam_metadata）、TaskManager的工具调用记录和评估报告生成，
+以及渲染服务upload_markdown中的Markdown渲染。输入按规模生成（1到1000道题目，10到10万次工具调用），
+每个用例用timeit自动确定循环次数，关闭GC重复采样，报告单次调用耗时的最小值和中位数，
+并在单独的一次运行中用tracemalloc测量峰值内存。
+
+回归检查：先在部署前的版本上用--save-baseline保存基线，修改后用--check比较，
+中位数耗时或峰值内存超过基线的threshold倍时以非零状态退出。基线与机器相关，不要提交到仓库。
+
+用法:
+    python benchmarks/bench_hotpaths.py
+    python benchmarks/bench_hotpaths.py --quick --filter task_manager
+    python benchmarks/bench_hotpaths.py --save-baseline benchmarks/.hotpaths-baseline.json
+    python benchmarks/bench_hotpaths.py --check benchmarks/.hotpaths-baseline.json --threshold 1.25
+"""
+
+import argparse
+import functools
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from exam_generator.tools.content_tools import (
+    standardize_question_format,
+    fix_exam_format,
+    validate_exam_format,
+    extract_exam_metadata
+)
+from exam_generator.utils.task_manager import TaskManager, TaskStatus
+
+QUESTION_SIZES = [1, 10, 100, 1000]
+TOOL_CALL_SIZES = [10, 100, 1000, 10000, 100000]
+QUICK_QUESTION_SIZES = [1, 10, 100]
+QUICK_TOOL_CALL_SIZES = [10, 1000, 10000]
+
+QUESTION_TYPES = ["singleChoice", "multipleChoice", "fillBlank"]
+TOOL_NAMES = ["generate_single_choice_question", "generate_multiple_choice_question",
+              "generate_fill_blank_question", "validate_exam_format"]
+
+# 单次调用耗时的中位数低于这个值时不判定回归，避免计时噪声
+MIN_COMPARABLE_TIME = 2e-6
+
+def make_question(question_type, index, rng, messy=False):
+    """
+    生成一道符合项目格式的题目
+
+    Args:
+        question_type: 题目类型
+        index: 题目序号，用于生成不同的题干
+        rng: random.Random实例
+        messy: 为True时选项标记带有多余空格、标题缺失，模拟需要修复的模型输出
+
+    Returns:
+        str: 题目内容（不含"## 题型"标题）
+    """
+    stem = f"第{index}题：关于主题{rng.randint(1, 50)}的描述，下列说法{'正确' if index % 2 else '错误'}的是"
+    options = [f"选项{chr(65 + i)}：{'内容' * rng.randint(1, 6)}{i}" for i in range(4)]
+    if question_type == "singleChoice":
+        correct = rng.randrange(4)
+        marks = ["- (x)" if i == correct else "- ( )" for i in range(4)]
+        if messy:
+            marks = ["-  ( x )" if i == correct else "-(  )" for i in range(4)]
+        lines = [f"{mark} {option}" for mark, option in zip(marks, options)]
+    elif question_type == "multipleChoice":
+        correct = set(rng.sample(range(4), rng.randint(1, 3)))
+        marks = ["- [x]" if i in correct else "- [ ]" for i in range(4)]
+        if messy:
+            marks = ["- [ x ]" if i in correct else "-[ ]" for i in range(4)]
+        lines = [f"{mark} {option}" for mark, option in zip(marks, options)]
+    else:
+        stem = stem + "____。"
+        lines = [f"{'-  R :=' if messy else '- R:='} 答案{index}"]
+    return stem + "\n\n" + "\n".join(lines)
+
+def make_exam(question_count, seed=0, messy=False):
+    """
+    生成包含指定数量题目的Markdown考试内容，三种题型轮流出现
+
+    Args:
+        question_count: 题目数量
+        seed: 随机种子，相同参数生成相同内容
+        messy: 为True时加上一级标题和不规范的选项标记
+
+    Returns:
+        str: Markdown格式的考试内容
+    """
+    rng = random.Random(seed)
+    type_names = {"singleChoice": "单选题", "multipleChoice": "多选题", "fillBlank": "填空题"}
+    parts = ["# 模拟考试"] if messy else []
+    for i in range(question_count):
+        question_type = QUESTION_TYPES[i % len(QUESTION_TYPES)]
+        parts.append(f"## {type_names[question_type]}\n\n{make_question(question_type, i, rng, messy)}")
+    return "\n\n".join(parts)
+
+def make_exam_request(question_count):
+    """生成/workflows/run的请求数据"""
+    return {
+        "inputs": {
+            "grade": "初中二年级",
+            "subject": "物理",
+            "types": "singleChoice, multipleChoice, fillBlank",
+            "count": question_count,
+            "difficulty": "medium",
+            "topics": ",".join(f"主题{i}" for i in range(min(question_count, 50))),
+            "reference": "参考资料" * 100,
+            "teacher_notes": "注意覆盖重点"
+        }
+    }
+
+def make_workflow(tool_call_count, steps=3, seed=0):
+    """
+    生成一个包含指定数量工具调用记录的工作流，工具调用平均分布在各步骤中
+
+    直接填写完成状态而不是调用complete_tool_call，避免构造大规模输入本身的耗时成为平方级。
+
+    Returns:
+        tuple: (task_manager, workflow_id, 最后一个步骤ID)
+    """
+    rng = random.Random(seed)
+    manager = TaskManager()
+    workflow_id = manager.start_workflow("bench", input_data={"count": tool_call_count})
+    step_ids = [manager.add_step(workflow_id, f"步骤{i}") for i in range(steps)]
+    for step_id in step_ids:
+        manager.start_step(workflow_id, step_id)
+    step_calls = {step["id"]: step["tool_calls"] for step in manager.tasks[workflow_id]["steps"]}
+    for i in range(tool_call_count):
+        step_id = step_ids[i % steps]
+        manager.record_tool_call(workflow_id, step_id, TOOL_NAMES[i % len(TOOL_NAMES)],
+                                 input_data={"topic": f"主题{i}"}, tool_use_id=f"tooluse_{i}")
+        tool_call = step_calls[step_id][-1]
+        tool_call["status"] = TaskStatus.FAILED if rng.random() < 0.05 else TaskStatus.COMPLETED
+        tool_call["end_time"] = tool_call["start_time"]
+        tool_call["token_usage"]["input_tokens"] = rng.randint(100, 2000)
+        tool_call["token_usage"]["output_tokens"] = rng.randint(50, 800)
+    for step_id in step_ids[:-1]:
+        manager.complete_step(workflow_id, step_id)
+    manager.complete_workflow(workflow_id)
+    return manager, workflow_id, step_ids[-1]
+
+class BenchCase:
+    """一个基准测试用例：setup在计时之外执行一次，返回被计时的无参函数"""
+
+    def __init__(self, name, size, setup):
+        self.name = name
+        self.size = size
+        self.setup = setup
+
+    @property
+    def key(self):
+        return f"{self.name}[{self.size}]"
+
+@functools.lru_cache(maxsize=None)
+def _render_setup():
+    """
+    导入渲染服务的Flask应用（只导入一次）
+
+    Returns:
+        test_client，渲染服务依赖（markdown）未安装时返回None
+    """
+    try:
+        import markdown  # noqa: F401
+    except ImportError:
+        return None
+    # 渲染服务在当前目录下创建data目录并写入生成的HTML，切换到临时目录避免污染工作区
+    os.chdir(tempfile.mkdtemp(prefix="bench-render-"))
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, "flask-service"))
+    from main import app
+    return app.test_client()
+
+def build_cases(question_sizes, tool_call_sizes):
+    """生成所有基准测试用例"""
+    cases = []
+    for n in question_sizes:
+        def validate_setup(n=n):
+            exam = make_exam(n, seed=n)
+            return lambda: validate_exam_format(exam)
+        def fix_setup(n=n):
+            exam = make_exam(n, seed=n, messy=True)
+            return lambda: fix_exam_format(exam)
+        def standardize_setup(n=n):
+            # 一道题目的选项数随规模增长，覆盖单题较长的情况
+            rng = random.Random(n)
+            content = "单选题\n\n" + make_question("singleChoice", n, rng, messy=True) + "".join(
+                f"\n-( ) 附加选项{i}" for i in range(n))
+            return lambda: standardize_question_format("singleChoice", content)
+        def metadata_setup(n=n):
+            request = make_exam_request(n)
+            return lambda: extract_exam_metadata(request)
+        cases.append(BenchCase("validate_exam_format", n, validate_setup))
+        cases.append(BenchCase("fix_exam_format", n, fix_setup))
+        cases.append(BenchCase("standardize_question_format", n, standardize_setup))
+        cases.append(BenchCase("extract_exam_metadata", n, metadata_setup))
+        def render_setup(n=n):
+            client = _render_setup()
+            if client is None:
+                return None
+            exam = make_exam(n, seed=n)
+            def render():
+                response = client.post("/upload_markdown", data=exam.encode("utf-8"))
+                assert response.status_code == 200, response.status_code
+            return render
+        cases.append(BenchCase("render.upload_markdown", n, render_setup))
+
+    for n in tool_call_sizes:
+        def update_setup(n=n):
+            # 在已有n次工具调用的工作流上记录并完成一次工具调用
+            manager, workflow_id, step_id = make_workflow(n)
+            def update():
+                tool_call_id = manager.record_tool_call(workflow_id, step_id, "validate_exam_format",
+                                                        tool_use_id="tooluse_bench")
+                manager.complete_tool_call(workflow_id, step_id, tool_call_id, output_data=True)
+                manager.tasks[workflow_id]["steps"][-1]["tool_calls"].pop()
+            return update
+        def usage_setup(n=n):
+            manager, workflow_id, step_id = make_workflow(n)
+            usage = {"input_tokens": 100, "output_tokens": 50, "model_calls": 1}
+            return lambda: manager.record_model_usage(workflow_id, step_id, f"tooluse_{n - 1}",
+                                                      source="generate_single_choice_question", usage=usage)
+        def report_setup(n=n):
+            manager, workflow_id, _ = make_workflow(n)
+            return lambda: manager.generate_evaluation_report(workflow_id)
+        cases.append(BenchCase("task_manager.tool_call_update", n, update_setup))
+        cases.append(BenchCase("task_manager.record_model_usage", n, usage_setup))
+        cases.append(BenchCase("task_manager.evaluation_report", n, report_setup))
+    return cases
+
+def measure(func, repeat=7, min_time=0.05):
+    """
+    测量一个函数的单次调用耗时和峰值内存
+
+    timeit自动确定每次采样的循环次数，使每次采样至少持续min_time秒，采样期间关闭GC。
+    峰值内存在单独的一次调用中用tracemalloc测量，不影响计时。
+
+    Returns:
+        dict: min、median、stdev（秒/次）、loops和peak_memory（字节）
+    """
+    timer = timeit.Timer(func)
+    loops, elapsed = timer.autorange()
+    if elapsed < min_time:
+        loops = max(loops, int(loops * min_time / max(elapsed, 1e-9)))
+    samples = [t / loops for t in timer.repeat(repeat=repeat, number=loops)]
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "loops": loops,
+        "peak_memory": peak
+    }
+
+def run_cases(cases, repeat=7, min_time=0.05, progress=None):
+    """
+    运行基准测试用例
+
+    Returns:
+        tuple: (结果字典 {用例key: 测量结果}, 跳过的用例key列表)
+    """
+    results = {}
+    skipped = []
+    for case in cases:
+        func = case.setup()
+        if func is None:
+            skipped.append(case.key)
+            continue
+        results[case.key] = measure(func, repeat=repeat, min_time=min_time)
+        if progress:
+            progress(case.key, results[case.key])
+    return results, skipped
+
+def compare(baseline, results, threshold=1.25):
+    """
+    与基线比较，找出回归的用例
+
+    Args:
+        baseline: 基线结果字典
+        results: 本次结果字典
+        threshold: 中位数耗时或峰值内存超过基线的倍数时判定为回归
+
+    Returns:
+        list: 回归列表，每项为(用例key, 指标, 基线值, 本次值)
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        if base["median"] >= MIN_COMPARABLE_TIME and result["median"] > base["median"] * threshold:
+            regressions.append((key, "median", base["median"], result["median"]))
+        if base["peak_memory"] > 0 and result["peak_memory"] > base["peak_memory"] * threshold:
+            regressions.append((key, "peak_memory", base["peak_memory"], result["peak_memory"]))
+    return regressions
+
+def format_time(seconds):
+    """把耗时格式化为合适的单位"""
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f}µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f}ms"
+    return f"{seconds:.2f}s"
+
+def main():
+    parser = argparse.ArgumentParser(description='纯Python热点路径的微基准测试')
+    parser.add_argument('--quick', action='store_true', help='只运行较小的规模')
+    parser.add_argument('--filter', default='', help='只运行名称包含该字符串的用例')
+    parser.add_argument('--repeat', type=int, default=7, help='每个用例的采样次数')
+    parser.add_argument('--min-time', type=float, default=0.05, help='每次采样的最短持续时间（秒）')
+    parser.add_argument('--output', help='把结果保存为JSON文件')
+    parser.add_argument('--save-baseline', metavar='PATH', help='把结果保存为基线')
+    parser.add_argument('--check', metavar='PATH', help='与基线比较，有回归时以非零状态退出')
+    parser.add_argument('--threshold', type=float, default=1.25, help='判定回归的倍数')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    question_sizes = QUICK_QUESTION_SIZES if args.quick else QUESTION_SIZES
+    tool_call_sizes = QUICK_TOOL_CALL_SIZES if args.quick else TOOL_CALL_SIZES
+    cases = [case for case in build_cases(question_sizes, tool_call_sizes) if args.filter in case.key]
+
+    print(f"{'用例':<48}{'最小值':>12}{'中位数':>12}{'峰值内存(KB)':>16}")
+    def progress(key, result):
+        print(f"{key:<48}{format_time(result['min']):>12}{format_time(result['median']):>12}"
+              f"{result['peak_memory'] / 1024:>16.1f}", flush=True)
+    results, skipped = run_cases(cases, repeat=args.repeat, min_time=args.min_time, progress=progress)
+    for key in skipped:
+        print(f"{key:<48}{'跳过（渲染服务依赖未安装）':>12}")
+
+    data = {"version": 1, "python": sys.version.split()[0], "results": results}
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {path}")
+
+    if args.check:
+        with open(args.check, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)}项超过基线的{args.threshold}倍:")
+            for key, metric, base, value in regressions:
+                if metric == "median":
+                    print(f"  {key} 中位数耗时 {format_time(base)} -> {format_time(value)} ({value / base:.2f}x)")
+                else:
+                    print(f"  {key} 峰值内存 {base / 1024:.1f}KB -> {value / 1024:.1f}KB ({value / base:.2f}x)")
+            sys.exit(1)
+        print(f"\n没有超过基线{args.threshold}倍的用例")
+
+if __name__ == '__main__':
+    main()
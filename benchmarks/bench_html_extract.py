@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+网页文本提取的基准测试
+
+对html_corpus目录中保存的网页（<名称>.html，以及人工标注的正文<名称>.txt）比较各种提取方式的
+耗时和提取质量。顶层的网页在调整正文识别规则时使用过；holdout子目录中的网页是规则确定之后才加入的，
+没有据此调整规则，两组的质量分开统计，holdout组更接近规则在未见过的网站上的表现：
+
+- bs4（旧方式）：BeautifulSoup构建整棵文档树，去掉script和style后提取全部文字
+- html.parser全文：当前的html.parser提取器，不识别正文（MAIN_CONTENT_ONLY=false）
+- html.parser、lxml、selectolax：各解析器加正文识别，未安装的解析器跳过
+
+耗时按max_reference_length提取（与获取参考资料时相同，文本足够时停止），取中位数；
+质量不限制长度，按词（汉字或连续的字母数字）与标注正文比较：精确率是提取的词中属于正文的比例，
+召回率是正文的词被提取出来的比例，F1是两者的调和平均。
+
+用法:
+    python benchmarks/bench_html_extract.py
+    python benchmarks/bench_html_extract.py --corpus /path/to/pages --repeat 50
+"""
+
+import argparse
+import codecs
+import logging
+import os
+import re
+import statistics
+import sys
+import time
+from collections import Counter
+
+from bs4 import BeautifulSoup
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from exam_generator.config import exam_config
+from exam_generator.tools.html_extract import EXTRACTORS, create_extractor, extractor_available
+from exam_generator.tools.reference_tools import _sniff_charset
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "html_corpus")
+HOLDOUT = "holdout"
+CHUNK_SIZE = 16 * 1024
+_TOKEN = re.compile(r"[一-鿿]|[^\W_]+")
+
+def load_corpus(corpus_dir=CORPUS_DIR):
+    """
+    读取网页和标注的正文，包括holdout子目录
+
+    Returns:
+        list: (名称, 分组, 网页文本, 正文)，分组为tuned或holdout，网页按<meta>声明的编码解码
+    """
+    pages = []
+    for group, directory in (("tuned", corpus_dir), (HOLDOUT, os.path.join(corpus_dir, HOLDOUT))):
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            name, ext = os.path.splitext(filename)
+            if ext != ".html":
+                continue
+            with open(os.path.join(directory, filename), "rb") as f:
+                raw = f.read()
+            with open(os.path.join(directory, name + ".txt"), encoding="utf-8") as f:
+                gold = f.read()
+            encoding = codecs.lookup(_sniff_charset(raw) or "utf-8").name
+            pages.append((name, group, raw.decode(encoding, errors="replace"), gold))
+    return pages
+
+def bs4_extract(html, max_chars):
+    """旧方式：整棵文档树的全部文字"""
+    soup = BeautifulSoup(html, 'html.parser')
+    for script_or_style in soup(["script", "style"]):
+        script_or_style.extract()
+    text = soup.get_text(separator='\n', strip=True)
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)[:max_chars]
+
+def make_extract(name, main_content):
+    """返回使用指定解析器、按下载的块大小逐块输入的提取函数"""
+    def extract(html, max_chars):
+        extractor = create_extractor(max_chars, name, main_content)
+        for i in range(0, len(html), CHUNK_SIZE):
+            extractor.feed(html[i:i + CHUNK_SIZE])
+            if extractor.done:
+                break
+        extractor.close()
+        return extractor.get_text()
+    return extract
+
+def methods():
+    """参与比较的提取方式，未安装的解析器跳过"""
+    result = {"bs4（旧）": bs4_extract, "html.parser全文": make_extract("html.parser", False)}
+    for name in reversed(list(EXTRACTORS)):
+        if extractor_available(name):
+            result[name] = make_extract(name, True)
+    return result
+
+def score(text, gold):
+    """
+    按词比较提取的文本和标注的正文
+
+    Returns:
+        tuple: (精确率, 召回率, F1)
+    """
+    extracted = Counter(_TOKEN.findall(text.lower()))
+    expected = Counter(_TOKEN.findall(gold.lower()))
+    overlap = sum((extracted & expected).values())
+    precision = overlap / max(sum(extracted.values()), 1)
+    recall = overlap / max(sum(expected.values()), 1)
+    f1 = 2 * precision * recall / (precision + recall) if overlap else 0.0
+    return precision, recall, f1
+
+def run(corpus_dir=CORPUS_DIR, repeat=20):
+    """
+    运行基准测试
+
+    Returns:
+        dict: 提取方式 -> 每个网页的结果列表，包含name、group、size、median（秒）、precision、recall和f1
+    """
+    pages = load_corpus(corpus_dir)
+    results = {}
+    for method, extract in methods().items():
+        rows = []
+        for name, group, html, gold in pages:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                extract(html, exam_config.max_reference_length)
+                timings.append(time.perf_counter() - start)
+            precision, recall, f1 = score(extract(html, sys.maxsize), gold)
+            rows.append({"name": name, "group": group, "size": len(html.encode("utf-8")),
+                         "median": statistics.median(timings), "precision": precision, "recall": recall, "f1": f1})
+        results[method] = rows
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='网页文本提取的基准测试')
+    parser.add_argument('--corpus', default=CORPUS_DIR, help='网页目录，每个<名称>.html对应标注的正文<名称>.txt')
+    parser.add_argument('--repeat', type=int, default=20, help='每个网页提取的次数')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    results = run(args.corpus, args.repeat)
+    for method, rows in results.items():
+        print(f"\n{method}")
+        print(f"{'网页':<24}{'分组':<10}{'大小':>10}{'耗时(ms)':>10}{'精确率':>8}{'召回率':>8}{'F1':>8}")
+        for row in rows:
+            print(f"{row['name']:<24}{row['group']:<10}{row['size']:>10}{row['median'] * 1000:>10.2f}"
+                  f"{row['precision']:>8.2f}{row['recall']:>8.2f}{row['f1']:>8.2f}")
+
+    print(f"\n{'提取方式':<18}{'分组':<10}{'总耗时(ms)':>12}{'平均精确率':>10}{'平均召回率':>10}{'平均F1':>8}")
+    for method, rows in results.items():
+        for group in sorted({row["group"] for row in rows}, reverse=True):
+            group_rows = [row for row in rows if row["group"] == group]
+            print(f"{method:<18}{group:<10}{sum(row['median'] for row in group_rows) * 1000:>12.2f}"
+                  f"{statistics.mean(row['precision'] for row in group_rows):>10.2f}"
+                  f"{statistics.mean(row['recall'] for row in group_rows):>10.2f}"
+                  f"{statistics.mean(row['f1'] for row in group_rows):>8.2f}")
+
+if __name__ == '__main__':
+    main()
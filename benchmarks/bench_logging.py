@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+每个请求的日志开销基准测试
+
+模拟一次/workflows/run请求产生的日志：记录请求体和输入参数、Agent回调收到的每个流式文本片段、
+Strands的调试日志，以及整份考试结果。比较两种方式在请求线程上的耗时：
+
+- 同步（旧方式）：Strands强制为DEBUG，回调用f-string格式化每个片段，json.dumps完整的请求和结果，
+  FileHandler和StreamHandler在请求线程中格式化并写入
+- 队列（当前方式）：请求线程只把记录放入队列，后台线程格式化和写入；较大的数据截断后记录，
+  未开启DEBUG时回调的片段日志不格式化
+
+两种方式写入相同的输出（临时文件和/dev/null），另外报告队列方式写完所有记录的总耗时。
+
+用法:
+    python benchmarks/bench_logging.py --requests 200 --chunks 2000 --questions 20
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from exam_generator.config import log_config
+from exam_generator.utils import log_payload
+from exam_generator.utils.logging_utils import _QueueHandler, _QueueListener
+from exam_generator.utils.task_manager import create_task_tracking_callback
+from bench_hotpaths import make_exam, make_exam_request
+
+# Strands在DEBUG级别时每个请求输出的调试日志条数（事件循环、工具注册、流式事件等）
+STRANDS_DEBUG_LINES = 60
+
+def make_result(question_count):
+    """生成generate_exam返回的结果"""
+    exam = make_exam(question_count, seed=question_count)
+    return {
+        "exam_content": exam,
+        "metadata": {"question_count": question_count, "types": ["singleChoice", "multipleChoice", "fillBlank"]},
+        "render_result": {"message": "保存成功\n查看链接http://localhost:5006/get_html/abc123"},
+        "validation": {"valid": True, "errors": []}
+    }
+
+def make_chunks(result, chunk_count):
+    """把考试内容切分为模型流式返回的文本片段"""
+    text = result["exam_content"]
+    size = max(len(text) // chunk_count, 1)
+    return [text[i:i + size] for i in range(0, size * chunk_count, size)][:chunk_count]
+
+def sync_request(logger, strands_logger, exam_request, result, chunks):
+    """旧方式：一个请求在请求线程中产生的日志"""
+    logger.info("开始处理考试生成请求")
+    logger.info(f"收到考试生成请求: {json.dumps(exam_request, ensure_ascii=False)}")
+    logger.info(f"解析的输入参数: {json.dumps(exam_request['inputs'], ensure_ascii=False)}")
+    for i in range(STRANDS_DEBUG_LINES):
+        strands_logger.debug(f"event_loop_cycle_id=<{i}> | streaming model response")
+    for chunk in chunks:
+        kwargs = {"data": chunk}
+        logging.debug(f"回调接收到事件: {kwargs.keys()}")
+        logging.debug(f"模型生成: {kwargs['data']}")
+    logger.info(f"考试生成结果: {json.dumps(result, ensure_ascii=False, default=str)}")
+    response = {"event": "workflow_finished", "data": {"outputs": {"body": json.dumps({"message": result["render_result"]["message"]})}}}
+    logger.info(f"考试生成完成: wf-1, 响应: {json.dumps(response, ensure_ascii=False)}")
+
+def queued_request(logger, strands_logger, exam_request, result, chunks, callback):
+    """当前方式：一个请求在请求线程中产生的日志"""
+    logger.info("开始处理考试生成请求")
+    log_payload(logger, "收到考试生成请求", exam_request)
+    log_payload(logger, "解析的输入参数", exam_request["inputs"])
+    for i in range(STRANDS_DEBUG_LINES):
+        strands_logger.debug("event_loop_cycle_id=<%s> | streaming model response", i)
+    for chunk in chunks:
+        callback(data=chunk)
+    log_payload(logger, "考试生成结果", result)
+    logger.info("考试生成完成: %s, 渲染结果: %s", "wf-1", result["render_result"]["message"])
+
+def install(handlers, strands_level):
+    """把根日志记录器的handler替换为handlers，返回恢复原配置的函数"""
+    root = logging.getLogger()
+    strands_logger = logging.getLogger("strands")
+    saved = (root.handlers[:], root.level, strands_logger.level)
+    root.handlers = handlers
+    root.setLevel(logging.INFO)
+    strands_logger.setLevel(strands_level)
+
+    def restore():
+        root.handlers, level, strands = saved
+        root.setLevel(level)
+        strands_logger.setLevel(strands)
+    return restore
+
+def output_handlers(path, devnull):
+    formatter = logging.Formatter(log_config.format)
+    handlers = [logging.FileHandler(path, encoding="utf-8"), logging.StreamHandler(devnull)]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+def measure(func, requests):
+    """执行func多次，返回每次耗时（毫秒）"""
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def run(requests=200, chunks=2000, questions=20):
+    """
+    运行两种方式，返回每个请求在请求线程上的耗时
+
+    Returns:
+        dict: sync和queued的耗时列表（毫秒），以及队列方式写完所有记录的总耗时drain_total（毫秒）
+    """
+    logger = logging.getLogger("exam_generator.server")
+    strands_logger = logging.getLogger("strands.event_loop")
+    exam_request = make_exam_request(questions)
+    result = make_result(questions)
+    pieces = make_chunks(result, chunks)
+    callback = create_task_tracking_callback(None, "wf-1", "step-1")
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        handlers = output_handlers(os.path.join(tmp, "sync.log"), devnull)
+        restore = install(handlers, logging.DEBUG)
+        try:
+            sync = measure(lambda: sync_request(logger, strands_logger, exam_request, result, pieces), requests)
+        finally:
+            restore()
+            for handler in handlers:
+                handler.close()
+
+        handlers = output_handlers(os.path.join(tmp, "queued.log"), devnull)
+        import queue
+        log_queue = queue.Queue(log_config.queue_size)
+        listener = _QueueListener(log_queue, *handlers, respect_handler_level=True)
+        restore = install([_QueueHandler(log_queue)], getattr(logging, log_config.strands_level or log_config.level))
+        listener.start()
+        start = time.perf_counter()
+        try:
+            queued = measure(lambda: queued_request(logger, strands_logger, exam_request, result, pieces, callback), requests)
+        finally:
+            restore()
+            listener.stop()
+            drain_total = (time.perf_counter() - start) * 1000
+            for handler in handlers:
+                handler.close()
+    return {"sync": sync, "queued": queued, "drain_total": drain_total}
+
+def main():
+    parser = argparse.ArgumentParser(description='每个请求的日志开销基准测试')
+    parser.add_argument('-n', '--requests', type=int, default=200, help='模拟的请求数')
+    parser.add_argument('--chunks', type=int, default=2000, help='每个请求的流式文本片段数')
+    parser.add_argument('--questions', type=int, default=20, help='每份考试的题目数')
+    args = parser.parse_args()
+
+    results = run(args.requests, args.chunks, args.questions)
+    sync, queued = results["sync"], results["queued"]
+    print(f"请求数: {args.requests}，每个请求 {args.chunks} 个流式片段，{args.questions} 道题目")
+    print(f"同步写入（旧方式）:   中位数 {statistics.median(sync):.3f} ms, p95 {sorted(sync)[int(len(sync) * 0.95)]:.3f} ms")
+    print(f"队列写入（当前方式）: 中位数 {statistics.median(queued):.3f} ms, p95 {sorted(queued)[int(len(queued) * 0.95)]:.3f} ms")
+    print(f"每个请求节省: {statistics.median(sync) - statistics.median(queued):.3f} ms")
+    print(f"队列方式写完所有记录的总耗时: {results['drain_total']:.1f} ms（{results['drain_total'] / args.requests:.3f} ms/请求，在后台线程中）")
+
+if __name__ == '__main__':
+    main()
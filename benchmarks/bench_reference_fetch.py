@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""
+参考资料网页获取的基准测试
+
+在本地HTTP服务器上提供不同大小的网页，比较两种获取方式的耗时、峰值内存和读取的响应字节数：
+
+- 整页（旧方式）：requests读取完整响应（response.text），用BeautifulSoup构建整棵文档树，
+  提取全部文本后再截断到max_reference_length
+- 流式（当前方式）：fetch_reference_text边下载边增量提取，文本足够或达到FETCH_MAX_BYTES后关闭连接
+
+网页有两种布局：article（正文从开头到结尾）和script_heavy（正文之前是占80%的内联脚本和样式，
+类似单页应用的打包输出，流式方式也需要读过这部分才能得到正文）。获取缓存的新鲜期设为0且网页没有ETag，
+每次都完整获取。峰值内存在单独的一次获取中用tracemalloc测量。流式方式关闭正文识别（MAIN_CONTENT_ONLY=false），
+提取全部文字，与整页方式比较时忽略空白（分段方式不同），解析器可以用--extractor指定。
+
+用法:
+    python benchmarks/bench_reference_fetch.py
+    python benchmarks/bench_reference_fetch.py --sizes 100000 1000000 --repeat 3
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from unittest.mock import patch
+
+import requests
+from bs4 import BeautifulSoup
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from exam_generator.config import exam_config
+from exam_generator.tools import reference_tools
+from exam_generator.tools.reference_tools import FetchCache, ReferenceDownload, fetch_reference_text
+
+SIZES = [100 * 1024, 1024 * 1024, 5 * 1024 * 1024, 20 * 1024 * 1024]
+LAYOUTS = ["article", "script_heavy"]
+
+PARAGRAPH = ("<p>光合作用是绿色植物利用光能，把二氧化碳和水转化为储存能量的有机物，并释放氧气的过程。"
+             "<a href=\"/wiki/chloroplast\">叶绿体</a>是进行光合作用的场所。</p>\n")
+SCRIPT = "<script>window.__DATA__=" + "{\"id\":1,\"name\":\"item\",\"tags\":[\"a\",\"b\"]}," * 20 + "null;</script>\n"
+
+def make_page(layout, size):
+    """
+    生成约size字节的网页
+
+    Args:
+        layout: article或script_heavy
+        size: 网页的目标字节数
+
+    Returns:
+        bytes: UTF-8编码的网页
+    """
+    head = "<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>光合作用</title>" \
+           "<style>body{font-family:sans-serif}</style></head><body>\n" \
+           "<nav><a href=\"/\">首页</a><a href=\"/wiki\">目录</a></nav>\n"
+    parts = [head]
+    total = len(head.encode("utf-8"))
+    if layout == "script_heavy":
+        script_size = len(SCRIPT.encode("utf-8"))
+        while total < size * 0.8:
+            parts.append(SCRIPT)
+            total += script_size
+    paragraph_size = len(PARAGRAPH.encode("utf-8"))
+    index = 0
+    while total < size:
+        parts.append(PARAGRAPH.replace("光合作用是", f"第{index}段：光合作用是", 1))
+        total += paragraph_size + 12
+        index += 1
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+class PageServer:
+    """在后台线程中提供生成的网页，路径为/<layout>/<size>"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = server.pages.get(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                view = memoryview(body)
+                try:
+                    for i in range(0, len(body), 64 * 1024):
+                        self.wfile.write(view[i:i + 64 * 1024])
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+# 最近一次获取读取的响应字节数
+bytes_read = [0]
+
+class CountingDownload(ReferenceDownload):
+    """记录流式方式读取的字节数"""
+
+    def finish(self):
+        bytes_read[0] = self.bytes_read
+        return super().finish()
+
+def whole_page_fetch(url):
+    """旧方式：读取完整响应，构建整棵文档树后截断"""
+    response = requests.get(url, timeout=10)
+    response.raise_for_status()
+    bytes_read[0] = len(response.content)
+    soup = BeautifulSoup(response.text, 'html.parser')
+    for script_or_style in soup(["script", "style"]):
+        script_or_style.extract()
+    text = soup.get_text(separator='\n', strip=True)
+    lines = (line.strip() for line in text.splitlines())
+    text = '\n'.join(line for line in lines if line)
+    return text[:exam_config.max_reference_length]
+
+def measure(func, url, repeat):
+    """获取repeat次，返回耗时中位数、峰值内存、读取的字节数和最后一次的文本"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = func(url)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func(url)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "median": statistics.median(timings),
+        "peak_bytes": peak,
+        "bytes_read": bytes_read[0],
+        "text": text
+    }
+
+def same_text(stream_text, whole_text):
+    """流式方式的文本去掉空白后以整页方式的文本开头（只比较截断前的部分）"""
+    return "".join(stream_text.split()).startswith("".join(whole_text.split()))
+
+def run(sizes=SIZES, layouts=LAYOUTS, repeat=5, extractor="auto"):
+    """
+    运行基准测试
+
+    Returns:
+        list: 每种布局和大小的结果，包含whole和stream两种方式的耗时、峰值内存和读取的响应字节数，
+            以及两种方式提取的文本是否相同（same_text，只比较截断前的部分）
+    """
+    pages = {f"/{layout}/{size}": make_page(layout, size) for layout in layouts for size in sizes}
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, PageServer(pages) as server, \
+            patch.object(reference_tools, "fetch_cache", FetchCache(tmp, ttl=0)), \
+            patch.object(reference_tools, "ReferenceDownload", CountingDownload), \
+            patch.object(exam_config, "main_content_only", False), \
+            patch.object(exam_config, "html_extractor", extractor):
+        for layout in layouts:
+            for size in sizes:
+                url = f"{server.base_url}/{layout}/{size}"
+                whole = measure(whole_page_fetch, url, repeat)
+                stream = measure(fetch_reference_text, url, repeat)
+                same = same_text(stream["text"], whole["text"])
+                for result in (whole, stream):
+                    del result["text"]
+                results.append({"layout": layout, "size": len(pages[f"/{layout}/{size}"]),
+                                "whole": whole, "stream": stream, "same_text": same})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='参考资料网页获取的基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='网页大小（字节）')
+    parser.add_argument('--layouts', nargs='+', default=LAYOUTS, choices=LAYOUTS, help='网页布局')
+    parser.add_argument('--repeat', type=int, default=5, help='每种方式获取的次数')
+    parser.add_argument('--extractor', default='auto', help='流式方式使用的网页解析器')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    print(f"{'布局':<14}{'大小':>10}{'整页耗时':>12}{'流式耗时':>12}{'整页内存':>12}{'流式内存':>12}{'整页读取':>12}{'流式读取':>12}  文本一致")
+    for result in run(args.sizes, args.layouts, args.repeat, args.extractor):
+        whole, stream = result["whole"], result["stream"]
+        print(f"{result['layout']:<14}{result['size'] / 1024:>8.0f}KB"
+              f"{whole['median'] * 1000:>10.1f}ms{stream['median'] * 1000:>10.1f}ms"
+              f"{whole['peak_bytes'] / 1048576:>10.1f}MB{stream['peak_bytes'] / 1048576:>10.1f}MB"
+              f"{whole['bytes_read'] / 1024:>10.0f}KB{stream['bytes_read'] / 1024:>10.0f}KB"
+              f"  {'是' if result['same_text'] else '否'}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,479 @@
+#!/usr/bin/env python
+"""
+本地模拟bedrock-runtime服务，用于离线的负载和延迟测试
+
+支持InvokeModel、InvokeModelWithResponseStream、Converse和ConverseStream四个接口，
+返回符合项目Markdown格式的题目，不需要AWS账号，也不会产生费用：
+- InvokeModel接口按提示词中的题型和主题返回一道题目，供call_claude和call_claude_async使用
+- Converse接口模拟考试生成Agent：第一轮按请求的题目数量调用题目生成工具，收到工具结果后回复"完成"
+- 延迟按可配置的分布采样，可以注入限流（429 ThrottlingException）和服务端错误（500），
+  也可以设置服务端的并发上限，超出时返回限流，模拟Bedrock的配额
+
+用法:
+    python benchmarks/fake_bedrock.py --port 8765 --latency lognormal:0.8,0.4 --throttle-rate 0.02
+
+    # 另一个终端，让考试生成服务使用模拟服务（boto3需要凭证，任意值即可）
+    export BEDROCK_ENDPOINT_URL=http://127.0.0.1:8765 AWS_ACCESS_KEY_ID=fake AWS_SECRET_ACCESS_KEY=fake
+    python -m exam_generator.server
+
+运行中可以通过GET /__fake/stats查看统计，通过POST /__fake/config修改配置（JSON，字段同FakeBedrockConfig）。
+"""
+
+import argparse
+import asyncio
+import base64
+import binascii
+import json
+import math
+import os
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass, asdict, fields
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUESTION_TOOLS = {
+    "generate_single_choice_question": "singleChoice",
+    "generate_multiple_choice_question": "multipleChoice",
+    "generate_fill_blank_question": "fillBlank",
+}
+TYPE_NAMES = {"singleChoice": "单选题", "multipleChoice": "多选题", "fillBlank": "填空题"}
+
+def parse_latency(spec):
+    """
+    解析延迟分布
+
+    Args:
+        spec: 分布描述，支持fixed:秒、uniform:最小,最大、normal:均值,标准差、
+              lognormal:中位数,sigma，也可以直接写秒数
+
+    Returns:
+        callable: 每次调用返回一个采样的延迟（秒，不小于0）
+    """
+    name, _, params = str(spec).partition(":")
+    if not params:
+        value = float(name)
+        return lambda: value
+    values = [float(v) for v in params.split(",")]
+    if name == "fixed":
+        return lambda: values[0]
+    if name == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if name == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if name == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"不支持的延迟分布: {spec}")
+
+@dataclass
+class FakeBedrockConfig:
+    """模拟服务配置"""
+    latency: str = "fixed:0.5"  # 非流式调用的总延迟、流式调用的首个事件延迟
+    stream_chunk_delay: float = 0.02  # 流式调用相邻文本片段之间的延迟（秒）
+    throttle_rate: float = 0.0  # 返回429限流的概率
+    error_rate: float = 0.0  # 返回500服务端错误的概率
+    max_concurrency: int = 0  # 同时处理的模型调用上限，超出时返回限流，0表示不限制
+
+def encode_event(headers, payload):
+    """
+    按AWS事件流格式编码一条消息
+
+    Args:
+        headers: 字符串类型的消息头
+        payload: 消息体（字节）
+
+    Returns:
+        bytes: 编码后的消息
+    """
+    encoded_headers = b""
+    for name, value in headers.items():
+        name_bytes, value_bytes = name.encode(), value.encode()
+        encoded_headers += struct.pack(">B", len(name_bytes)) + name_bytes
+        encoded_headers += struct.pack(">BH", 7, len(value_bytes)) + value_bytes
+    total_length = 12 + len(encoded_headers) + len(payload) + 4
+    prelude = struct.pack(">II", total_length, len(encoded_headers))
+    prelude += struct.pack(">I", binascii.crc32(prelude) & 0xffffffff)
+    message = prelude + encoded_headers + payload
+    return message + struct.pack(">I", binascii.crc32(message) & 0xffffffff)
+
+def json_event(event_type, body):
+    """编码一条JSON事件"""
+    return encode_event(
+        {":event-type": event_type, ":content-type": "application/json", ":message-type": "event"},
+        json.dumps(body, ensure_ascii=False).encode("utf-8")
+    )
+
+def estimate_tokens(text):
+    """粗略估算token数量"""
+    return max(1, len(text) // 2)
+
+def message_text(message):
+    """提取Messages/Converse消息中的文本"""
+    content = message.get("content", "")
+    if isinstance(content, str):
+        return content
+    return "\n".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+def fake_question(prompt):
+    """
+    根据题目生成提示词返回一道符合项目格式的题目
+
+    Args:
+        prompt: call_claude使用的提示词
+
+    Returns:
+        str: 题目的Markdown内容
+    """
+    match = re.search(r'关于"(.+?)"的', prompt)
+    topic = match.group(1) if match else "模拟主题"
+    if "多选题" in prompt:
+        return f"## 多选题\n\n以下关于{topic}的说法，哪些是正确的？\n\n- [x] 正确说法一\n- [ ] 错误说法一\n- [x] 正确说法二\n- [ ] 错误说法二"
+    if "填空题" in prompt:
+        return f"## 填空题\n\n{topic}中最重要的概念是______。\n\n- R:= 核心概念"
+    return f"## 单选题\n\n关于{topic}，下列说法正确的是？\n\n- (x) 正确选项\n- ( ) 错误选项1\n- ( ) 错误选项2\n- ( ) 错误选项3"
+
+def plan_tool_calls(prompt, tool_names):
+    """
+    模拟考试生成Agent的第一轮：按请求计算需要调用的题目生成工具
+
+    续写提示词（"只需要再生成N道X题"）只生成缺少的题目，否则按请求的inputs规划题目数量和题型。
+
+    Args:
+        prompt: Agent收到的用户提示词
+        tool_names: 请求中提供的工具名称
+
+    Returns:
+        list: (工具名称, 工具参数) 列表
+    """
+    from exam_generator.tools.content_tools import extract_exam_metadata, plan_exam_content
+
+    inputs = {}
+    start = prompt.find("{")
+    if start >= 0:
+        try:
+            inputs, _ = json.JSONDecoder().raw_decode(prompt[start:])
+        except ValueError:
+            inputs = {}
+    metadata = extract_exam_metadata({"inputs": inputs})
+    type_counts = plan_exam_content(metadata)["type_counts"]
+
+    resume = re.search(r"只需要再生成(.+?)，", prompt)
+    if resume:
+        names = {name: code for code, name in TYPE_NAMES.items()}
+        type_counts = {names[name]: int(count) for count, name in re.findall(r"(\d+)道(单选题|多选题|填空题)", resume.group(1))}
+
+    topics = metadata.get("topics") or []
+    subject = metadata.get("subject") or "综合"
+    tools_by_type = {code: name for name, code in QUESTION_TOOLS.items() if name in tool_names}
+    calls = []
+    for question_type, count in type_counts.items():
+        if question_type not in tools_by_type:
+            continue
+        for _ in range(count):
+            index = len(calls)
+            topic = topics[index % len(topics)] if topics else f"{subject}知识点{index + 1}"
+            calls.append((tools_by_type[question_type], {"topic": topic, "difficulty": metadata.get("difficulty", "medium")}))
+    return calls
+
+class FakeBedrockServer:
+    """模拟bedrock-runtime服务，在后台线程的事件循环中运行"""
+
+    def __init__(self, host="127.0.0.1", port=0, config=None):
+        """
+        初始化服务
+
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示自动选择空闲端口
+            config: FakeBedrockConfig
+        """
+        self.host = host
+        self.port = port
+        self.config = config or FakeBedrockConfig()
+        self._latency = parse_latency(self.config.latency)
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._in_flight = 0
+        self._stats = {"requests": {}, "throttled": 0, "errors": 0, "peak_in_flight": 0}
+
+    @property
+    def url(self):
+        """服务地址，可以设置为BEDROCK_ENDPOINT_URL"""
+        return f"http://{self.host}:{self.port}"
+
+    def update_config(self, **changes):
+        """修改配置，对之后的调用生效"""
+        for field in fields(FakeBedrockConfig):
+            if field.name in changes:
+                setattr(self.config, field.name, field.type(changes[field.name]) if field.type in (int, float, str) else changes[field.name])
+        self._latency = parse_latency(self.config.latency)
+
+    def stats(self):
+        """获取调用统计"""
+        return {**self._stats, "requests": dict(self._stats["requests"]), "in_flight": self._in_flight, "config": asdict(self.config)}
+
+    def start(self):
+        """在后台线程中启动服务，返回自身"""
+        self._thread = threading.Thread(target=self._run, name="fake-bedrock", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._start_server())
+        self._ready.set()
+        try:
+            self._loop.run_until_complete(self._server.wait_closed())
+        finally:
+            self._loop.close()
+
+    async def _start_server(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        """在当前事件循环中运行服务（命令行模式）"""
+        await self._start_server()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _handle_connection(self, reader, writer):
+        """处理一个keep-alive连接上的请求"""
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                await self._route(method, path, body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, body, writer):
+        """按路径分发请求"""
+        if path == "/__fake/stats":
+            return await self._send_json(writer, 200, self.stats())
+        if path == "/__fake/config" and method == "POST":
+            self.update_config(**json.loads(body or b"{}"))
+            return await self._send_json(writer, 200, asdict(self.config))
+
+        match = re.match(r"^/model/([^/]+)/(invoke|invoke-with-response-stream|converse|converse-stream)$", path)
+        if method != "POST" or not match:
+            return await self._send_json(writer, 404, {"message": f"未知接口: {method} {path}"})
+
+        operation = match.group(2)
+        self._stats["requests"][operation] = self._stats["requests"].get(operation, 0) + 1
+        if self.config.max_concurrency and self._in_flight >= self.config.max_concurrency:
+            return await self._send_throttle(writer)
+        if random.random() < self.config.throttle_rate:
+            return await self._send_throttle(writer)
+        if random.random() < self.config.error_rate:
+            self._stats["errors"] += 1
+            return await self._send_json(writer, 500, {"message": "模拟的服务端错误"}, error_type="InternalServerException")
+
+        self._in_flight += 1
+        self._stats["peak_in_flight"] = max(self._stats["peak_in_flight"], self._in_flight)
+        try:
+            request = json.loads(body or b"{}")
+            if operation == "invoke":
+                await self._invoke(request, writer)
+            elif operation == "invoke-with-response-stream":
+                await self._invoke_stream(request, writer)
+            elif operation == "converse":
+                await self._converse(request, writer)
+            else:
+                await self._converse_stream(request, writer)
+        finally:
+            self._in_flight -= 1
+
+    async def _send_throttle(self, writer):
+        self._stats["throttled"] += 1
+        await self._send_json(writer, 429, {"message": "Too many requests, please wait before trying again."}, error_type="ThrottlingException")
+
+    async def _send_json(self, writer, status, payload, error_type=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        extra = f"x-amzn-ErrorType: {error_type}\r\n" if error_type else ""
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\nContent-Type: application/json\r\n"
+            f"x-amzn-RequestId: {uuid.uuid4()}\r\n{extra}Content-Length: {len(data)}\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+
+    async def _send_stream(self, writer, events):
+        """以chunked编码发送事件流，events是(延迟, 已编码事件)的列表"""
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/vnd.amazon.eventstream\r\n"
+            + f"x-amzn-RequestId: {uuid.uuid4()}\r\nTransfer-Encoding: chunked\r\n\r\n".encode()
+        )
+        for delay, event in events:
+            if delay:
+                await asyncio.sleep(delay)
+            writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    def _chunks(self, text, size=20):
+        return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+    def _prompt_tokens(self, request):
+        system = request.get("system", "")
+        system_text = system if isinstance(system, str) else " ".join(b.get("text", "") for b in system if isinstance(b, dict))
+        return estimate_tokens(system_text + "".join(message_text(m) for m in request.get("messages", [])))
+
+    async def _invoke(self, request, writer):
+        """InvokeModel：返回一道题目"""
+        started = time.monotonic()
+        text = fake_question(message_text(request["messages"][-1]))
+        await asyncio.sleep(self._latency())
+        await self._send_json(writer, 200, {
+            "id": f"msg_{uuid.uuid4().hex[:16]}",
+            "type": "message",
+            "role": "assistant",
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "usage": {"input_tokens": self._prompt_tokens(request), "output_tokens": estimate_tokens(text)},
+            "latency_ms": int((time.monotonic() - started) * 1000)
+        })
+
+    async def _invoke_stream(self, request, writer):
+        """InvokeModelWithResponseStream：以Anthropic流式事件返回一道题目"""
+        text = fake_question(message_text(request["messages"][-1]))
+        input_tokens, output_tokens = self._prompt_tokens(request), estimate_tokens(text)
+
+        def chunk(body):
+            return json_event("chunk", {"bytes": base64.b64encode(json.dumps(body, ensure_ascii=False).encode("utf-8")).decode()})
+
+        events = [(self._latency(), chunk({
+            "type": "message_start",
+            "message": {"id": f"msg_{uuid.uuid4().hex[:16]}", "type": "message", "role": "assistant", "content": [],
+                        "stop_reason": None, "usage": {"input_tokens": input_tokens, "output_tokens": 1}}
+        })), (0, chunk({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}))]
+        for piece in self._chunks(text):
+            events.append((self.config.stream_chunk_delay, chunk({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}})))
+        events += [
+            (0, chunk({"type": "content_block_stop", "index": 0})),
+            (0, chunk({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": output_tokens}})),
+            (0, chunk({"type": "message_stop", "amazon-bedrock-invocationMetrics": {"inputTokenCount": input_tokens, "outputTokenCount": output_tokens}}))
+        ]
+        await self._send_stream(writer, events)
+
+    def _agent_turn(self, request):
+        """
+        模拟Agent的一轮回复
+
+        Returns:
+            tuple: (内容块列表, 停止原因)
+        """
+        messages = request.get("messages", [])
+        last = messages[-1] if messages else {}
+        has_tool_result = any("toolResult" in block for block in last.get("content", []) if isinstance(block, dict))
+        tool_names = [t.get("toolSpec", {}).get("name") for t in request.get("toolConfig", {}).get("tools", [])]
+        if not has_tool_result:
+            calls = plan_tool_calls(message_text(last), tool_names)
+            if calls:
+                return [
+                    {"toolUse": {"toolUseId": f"tooluse_{uuid.uuid4().hex[:20]}", "name": name, "input": tool_input}}
+                    for name, tool_input in calls
+                ], "tool_use"
+        return [{"text": "完成"}], "end_turn"
+
+    async def _converse(self, request, writer):
+        """Converse：模拟考试生成Agent"""
+        started = time.monotonic()
+        content, stop_reason = self._agent_turn(request)
+        await asyncio.sleep(self._latency())
+        output_tokens = estimate_tokens(json.dumps(content, ensure_ascii=False))
+        input_tokens = self._prompt_tokens(request)
+        await self._send_json(writer, 200, {
+            "output": {"message": {"role": "assistant", "content": content}},
+            "stopReason": stop_reason,
+            "usage": {"inputTokens": input_tokens, "outputTokens": output_tokens, "totalTokens": input_tokens + output_tokens},
+            "metrics": {"latencyMs": int((time.monotonic() - started) * 1000)}
+        })
+
+    async def _converse_stream(self, request, writer):
+        """ConverseStream：以事件流模拟考试生成Agent"""
+        started = time.monotonic()
+        content, stop_reason = self._agent_turn(request)
+        events = [(self._latency(), json_event("messageStart", {"role": "assistant"}))]
+        for index, block in enumerate(content):
+            if "toolUse" in block:
+                tool_use = block["toolUse"]
+                events.append((0, json_event("contentBlockStart", {
+                    "contentBlockIndex": index,
+                    "start": {"toolUse": {"toolUseId": tool_use["toolUseId"], "name": tool_use["name"]}}
+                })))
+                events.append((self.config.stream_chunk_delay, json_event("contentBlockDelta", {
+                    "contentBlockIndex": index,
+                    "delta": {"toolUse": {"input": json.dumps(tool_use["input"], ensure_ascii=False)}}
+                })))
+            else:
+                for piece in self._chunks(block["text"]):
+                    events.append((self.config.stream_chunk_delay, json_event("contentBlockDelta", {
+                        "contentBlockIndex": index, "delta": {"text": piece}
+                    })))
+            events.append((0, json_event("contentBlockStop", {"contentBlockIndex": index})))
+        output_tokens = estimate_tokens(json.dumps(content, ensure_ascii=False))
+        input_tokens = self._prompt_tokens(request)
+        events.append((0, json_event("messageStop", {"stopReason": stop_reason})))
+        events.append((0, json_event("metadata", {
+            "usage": {"inputTokens": input_tokens, "outputTokens": output_tokens, "totalTokens": input_tokens + output_tokens},
+            "metrics": {"latencyMs": int((time.monotonic() - started) * 1000)}
+        })))
+        await self._send_stream(writer, events)
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟bedrock-runtime服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口')
+    parser.add_argument('--latency', default='fixed:0.5', help='延迟分布，例如fixed:0.5、uniform:0.2,1.5、lognormal:0.8,0.4')
+    parser.add_argument('--stream-chunk-delay', type=float, default=0.02, help='流式响应相邻片段之间的延迟（秒）')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='返回限流的概率')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回服务端错误的概率')
+    parser.add_argument('--max-concurrency', type=int, default=0, help='同时处理的调用上限，超出时返回限流')
+    parser.add_argument('--seed', type=int, help='随机数种子')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    server = FakeBedrockServer(args.host, args.port, FakeBedrockConfig(
+        latency=args.latency,
+        stream_chunk_delay=args.stream_chunk_delay,
+        throttle_rate=args.throttle_rate,
+        error_rate=args.error_rate,
+        max_concurrency=args.max_concurrency
+    ))
+    print(f"模拟bedrock-runtime服务: http://{args.host}:{args.port}")
+    print(f"export BEDROCK_ENDPOINT_URL=http://{args.host}:{args.port} AWS_ACCESS_KEY_ID=fake AWS_SECRET_ACCESS_KEY=fake")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+#!/usr/bin/env python
+"""
+考试生成服务的端到端负载测试
+
+按场景文件中的请求组合，以目标RPS向/workflows/run发送请求（开环负载：按计划时间发送，
+不等待前一个请求完成），分阶段记录延迟分位数、错误率和吞吐量，结果写入JSON文件，便于比较不同版本。
+
+两种运行方式：
+- 默认在本进程内启动考试生成服务、本地模拟Bedrock（fake_bedrock.py）和模拟渲染服务，不需要AWS
+- --target指向已经运行的服务（例如指向模拟Bedrock的生产模式服务）
+
+用法:
+    python benchmarks/loadtest.py --output results/loadtest.json
+    python benchmarks/loadtest.py --scenario my_scenario.json --bedrock-latency lognormal:0.8,0.4
+    python benchmarks/loadtest.py --target http://127.0.0.1:5001 --output results/prod.json
+    python benchmarks/loadtest.py --compare results/v1.json results/v2.json
+
+场景文件（JSON）:
+    {
+        "phases": [{"name": "warmup", "duration": 10, "rps": 1}, {"name": "steady", "duration": 30, "rps": 3}],
+        "mix": [{"name": "quiz", "weight": 6, "inputs": {"subject": "生物{n}", "count": 3}}]
+    }
+inputs中字符串里的{n}会替换为请求序号，避免题目缓存和幂等合并让请求变成空操作。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, "benchmarks"))
+
+RESULTS_VERSION = 1
+
+DEFAULT_SCENARIO = {
+    "phases": [
+        {"name": "warmup", "duration": 10, "rps": 0.5},
+        {"name": "steady", "duration": 30, "rps": 2},
+        {"name": "spike", "duration": 10, "rps": 6}
+    ],
+    "mix": [
+        {"name": "quiz", "weight": 6, "inputs": {"subject": "生物{n}", "grade": "初二", "count": 3, "types": "singleChoice"}},
+        {"name": "mixed", "weight": 3, "inputs": {"subject": "物理{n}", "count": 6, "types": "singleChoice,multipleChoice,fillBlank"}},
+        {"name": "large", "weight": 1, "inputs": {"subject": "历史{n}", "count": 15, "types": "singleChoice,fillBlank"}}
+    ]
+}
+
+def percentile(values, pct):
+    """
+    计算分位数（线性插值）
+
+    Args:
+        values: 数值列表
+        pct: 分位（0-100）
+
+    Returns:
+        float: 分位数，values为空时返回None
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def latency_summary(latencies):
+    """延迟的均值、分位数和最大值（秒）"""
+    if not latencies:
+        return {"mean": None, "p50": None, "p90": None, "p95": None, "p99": None, "max": None}
+    return {
+        "mean": statistics.mean(latencies),
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies)
+    }
+
+def summarize(records, duration=None, target_rps=None):
+    """
+    汇总一组请求记录
+
+    Args:
+        records: 请求记录列表，每条包含scenario、status、latency和error
+        duration: 阶段时长（秒），用于计算吞吐量
+        target_rps: 目标RPS
+
+    Returns:
+        dict: 请求数、状态码分布、错误率、吞吐量和成功请求的延迟分布
+    """
+    succeeded = [r for r in records if r["status"] == 200]
+    status_counts = {}
+    for record in records:
+        key = str(record["status"]) if record["status"] is not None else "error"
+        status_counts[key] = status_counts.get(key, 0) + 1
+    by_scenario = {}
+    for name in sorted({r["scenario"] for r in records}):
+        scenario_records = [r for r in records if r["scenario"] == name]
+        scenario_latencies = [r["latency"] for r in scenario_records if r["status"] == 200]
+        by_scenario[name] = {
+            "sent": len(scenario_records),
+            "succeeded": len(scenario_latencies),
+            "p50": percentile(scenario_latencies, 50),
+            "p95": percentile(scenario_latencies, 95)
+        }
+    return {
+        "duration": duration,
+        "target_rps": target_rps,
+        "sent": len(records),
+        "succeeded": len(succeeded),
+        "error_rate": (len(records) - len(succeeded)) / len(records) if records else 0,
+        "status_counts": status_counts,
+        "throughput": len(succeeded) / duration if duration else None,
+        "latency": latency_summary([r["latency"] for r in succeeded]),
+        "by_scenario": by_scenario
+    }
+
+def render_inputs(value, n):
+    """把inputs中字符串里的{n}替换为请求序号"""
+    if isinstance(value, str):
+        return value.replace("{n}", str(n))
+    if isinstance(value, dict):
+        return {k: render_inputs(v, n) for k, v in value.items()}
+    if isinstance(value, list):
+        return [render_inputs(v, n) for v in value]
+    return value
+
+async def send_request(client, target, entry, n, scheduled_at, timeout):
+    """
+    发送一个考试请求
+
+    延迟从计划发送时间开始计算，负载生成器落后于计划时也不会低估延迟。
+
+    Returns:
+        dict: 请求记录
+    """
+    body = {"inputs": render_inputs(entry["inputs"], n)}
+    headers = {"Idempotency-Key": str(uuid.uuid4()), "X-Tenant-Id": entry.get("tenant", f"loadtest-{entry['name']}")}
+    status, error = None, None
+    try:
+        response = await client.post(f"{target}/workflows/run", json=body, headers=headers, timeout=timeout)
+        status = response.status_code
+        if status != 200:
+            error = response.text[:200]
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return {
+        "scenario": entry["name"],
+        "status": status,
+        "latency": time.monotonic() - scheduled_at,
+        "error": error
+    }
+
+async def run_phases(target, scenario, timeout, arrival="poisson", seed=None):
+    """
+    按阶段以目标RPS发送请求
+
+    Args:
+        target: 服务地址
+        scenario: 场景配置
+        timeout: 单个请求的超时（秒）
+        arrival: 请求到达方式，poisson（指数分布的间隔）或uniform（固定间隔）
+        seed: 随机数种子
+
+    Returns:
+        list: (阶段配置, 请求记录列表)
+    """
+    import httpx
+
+    rng = random.Random(seed)
+    mix = scenario["mix"]
+    weights = [entry.get("weight", 1) for entry in mix]
+    results = []
+    n = 0
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+    async with httpx.AsyncClient(limits=limits) as client:
+        for phase in scenario["phases"]:
+            tasks = []
+            phase_start = time.monotonic()
+            next_at = phase_start
+            while True:
+                interval = rng.expovariate(phase["rps"]) if arrival == "poisson" else 1 / phase["rps"]
+                next_at += interval
+                if next_at - phase_start >= phase["duration"]:
+                    break
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                entry = rng.choices(mix, weights)[0]
+                n += 1
+                tasks.append(asyncio.create_task(send_request(client, target, entry, n, next_at, timeout)))
+            remaining = phase_start + phase["duration"] - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            # 阶段的请求全部结束后再进入下一阶段，各阶段的结果互不混杂
+            records = await asyncio.gather(*tasks)
+            print(f"阶段 {phase['name']}: 发送{len(records)}个请求，成功{sum(1 for r in records if r['status'] == 200)}个", flush=True)
+            results.append((phase, list(records)))
+    return results
+
+class _RenderHandler(BaseHTTPRequestHandler):
+    """模拟渲染服务：读取Markdown后返回查看链接"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        payload = json.dumps({"message": f"保存成功\n查看链接http://localhost:5006/get_html/{uuid.uuid4()}"}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def free_port():
+    """获取一个空闲端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_local_stack(bedrock_latency, throttle_rate, error_rate, max_concurrency):
+    """
+    在本进程内启动模拟Bedrock、模拟渲染服务和考试生成服务
+
+    Returns:
+        tuple: (考试生成服务地址, 模拟Bedrock服务)
+    """
+    from fake_bedrock import FakeBedrockServer, FakeBedrockConfig
+    bedrock = FakeBedrockServer(config=FakeBedrockConfig(
+        latency=bedrock_latency, throttle_rate=throttle_rate, error_rate=error_rate, max_concurrency=max_concurrency
+    )).start()
+
+    render = ThreadingHTTPServer(("127.0.0.1", 0), _RenderHandler)
+    threading.Thread(target=render.serve_forever, daemon=True).start()
+
+    # 配置在导入时从环境变量读取，必须在导入exam_generator之前设置
+    os.environ.update(
+        BEDROCK_ENDPOINT_URL=bedrock.url,
+        AWS_ACCESS_KEY_ID=os.environ.get("AWS_ACCESS_KEY_ID", "fake"),
+        AWS_SECRET_ACCESS_KEY=os.environ.get("AWS_SECRET_ACCESS_KEY", "fake"),
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING")
+    )
+    sys.path.append(PROJECT_ROOT)
+    import tempfile
+    from werkzeug.serving import make_server
+    from exam_generator.config import server_config
+    from exam_generator.server import app
+    from exam_generator.tools import exam_tools
+
+    server_config.flask_service_url = f"http://127.0.0.1:{render.server_address[1]}/upload_markdown"
+    # 使用空的题目缓存，各次负载测试的结果可以比较
+    exam_tools.question_cache.cache_dir = tempfile.mkdtemp(prefix="loadtest-cache-")
+
+    import logging
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    port = free_port()
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{port}", bedrock
+
+def git_commit():
+    """当前代码的git提交，不在git仓库中时返回None"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def fetch_json(url):
+    """GET一个JSON接口，失败时返回None"""
+    import httpx
+    try:
+        return httpx.get(url, timeout=10).json()
+    except Exception:
+        return None
+
+def compare(base_path, new_path):
+    """
+    比较两次负载测试的结果，打印各阶段关键指标的变化
+
+    Args:
+        base_path: 基准结果文件
+        new_path: 新结果文件
+    """
+    with open(base_path, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"基准: {base_path} ({base.get('git_commit')})  新: {new_path} ({new.get('git_commit')})")
+    print(f"{'阶段':<10}{'指标':<14}{'基准':>12}{'新':>12}{'变化':>10}")
+    base_phases = {p["name"]: p for p in base["phases"]}
+    for phase in new["phases"] + [dict(new["overall"], name="overall")]:
+        old = base_phases.get(phase["name"]) if phase["name"] != "overall" else base["overall"]
+        if old is None:
+            continue
+        metrics = [
+            ("throughput", old.get("throughput"), phase.get("throughput")),
+            ("error_rate", old.get("error_rate"), phase.get("error_rate")),
+            ("p50", old["latency"]["p50"], phase["latency"]["p50"]),
+            ("p95", old["latency"]["p95"], phase["latency"]["p95"]),
+            ("p99", old["latency"]["p99"], phase["latency"]["p99"])
+        ]
+        for metric, old_value, new_value in metrics:
+            if old_value is None or new_value is None:
+                change = "-"
+            elif old_value:
+                change = f"{(new_value - old_value) / old_value * 100:+.1f}%"
+            else:
+                change = "-" if new_value == old_value else "new"
+            fmt = lambda v: "-" if v is None else f"{v:.3f}"
+            print(f"{phase['name']:<10}{metric:<14}{fmt(old_value):>12}{fmt(new_value):>12}{change:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description='考试生成服务的端到端负载测试')
+    parser.add_argument('--scenario', help='场景文件（JSON），默认使用内置的请求组合和阶段')
+    parser.add_argument('--target', help='已运行的服务地址，默认在本进程内启动服务和模拟依赖')
+    parser.add_argument('--output', default='loadtest-results.json', help='结果文件')
+    parser.add_argument('--timeout', type=float, default=360, help='单个请求的超时（秒）')
+    parser.add_argument('--arrival', choices=['poisson', 'uniform'], default='poisson', help='请求到达方式')
+    parser.add_argument('--seed', type=int, default=1, help='随机数种子')
+    parser.add_argument('--bedrock-latency', default='lognormal:0.6,0.3', help='模拟Bedrock的延迟分布')
+    parser.add_argument('--bedrock-throttle-rate', type=float, default=0.0, help='模拟Bedrock的限流概率')
+    parser.add_argument('--bedrock-error-rate', type=float, default=0.0, help='模拟Bedrock的服务端错误概率')
+    parser.add_argument('--bedrock-max-concurrency', type=int, default=0, help='模拟Bedrock的并发上限')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='比较两个结果文件')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    scenario = DEFAULT_SCENARIO
+    if args.scenario:
+        with open(args.scenario, encoding="utf-8") as f:
+            scenario = json.load(f)
+
+    bedrock = None
+    target = args.target
+    if not target:
+        target, bedrock = start_local_stack(
+            args.bedrock_latency, args.bedrock_throttle_rate, args.bedrock_error_rate, args.bedrock_max_concurrency
+        )
+
+    started_at = datetime.now().isoformat()
+    phase_results = asyncio.run(run_phases(target, scenario, args.timeout, args.arrival, args.seed))
+
+    all_records = [record for _, records in phase_results for record in records]
+    results = {
+        "version": RESULTS_VERSION,
+        "started_at": started_at,
+        "git_commit": git_commit(),
+        "target": args.target or "local",
+        "config": {
+            "scenario": scenario,
+            "arrival": args.arrival,
+            "seed": args.seed,
+            "timeout": args.timeout,
+            "bedrock": None if args.target else {
+                "latency": args.bedrock_latency,
+                "throttle_rate": args.bedrock_throttle_rate,
+                "error_rate": args.bedrock_error_rate,
+                "max_concurrency": args.bedrock_max_concurrency
+            }
+        },
+        "phases": [
+            dict(summarize(records, phase["duration"], phase["rps"]), name=phase["name"])
+            for phase, records in phase_results
+        ],
+        "overall": summarize(all_records, sum(phase["duration"] for phase, _ in phase_results)),
+        "errors": sorted({r["error"] for r in all_records if r["error"]})[:20],
+        "server_health": fetch_json(f"{target}/health"),
+        "bedrock": bedrock.stats() if bedrock else None
+    }
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    print(f"{'阶段':<10}{'发送':>6}{'成功':>6}{'错误率':>8}{'吞吐量':>8}{'p50':>8}{'p95':>8}{'p99':>8}")
+    for phase in results["phases"] + [dict(results["overall"], name="overall")]:
+        latency = phase["latency"]
+        fmt = lambda v: "-" if v is None else f"{v:.2f}"
+        print(f"{phase['name']:<10}{phase['sent']:>6}{phase['succeeded']:>6}{phase['error_rate']:>8.1%}"
+              f"{fmt(phase['throughput']):>8}{fmt(latency['p50']):>8}{fmt(latency['p95']):>8}{fmt(latency['p99']):>8}")
+    print(f"结果已写入: {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,18 @@
 import logging
 import json
 import time
+import asyncio
+import threading
+from botocore.config import Config
 from strands import Agent, tool
-from strands.models import BedrockModel
-
-# 启用Strands的调试日志
-logging.getLogger("strands").setLevel(logging.DEBUG)
+from strands.handlers import null_callback_handler
+from strands.models import BedrockModel, CacheConfig
+from strands.tools.executors import ConcurrentToolExecutor
+from strands.types.tools import AgentTool
 from .config import llm_config, exam_config
 from .utils import handle_agent_error, create_task_tracking_callback, task_manager
+from .utils import get_deadline, cap_timeout, DeadlineExceeded
+from .utils import TaskTrackingHook, begin_tool_execution, workflow_scope, question_store, span
 from .tools import (
     process_reference,
     fetch_url_content,
@@ -19,6 +24,138 @@ from .tools import (
     send_to_flask_service,
     plan_exam_content
 )
+from .tools.exam_tools import supports_prompt_cache, instrument_bedrock_client
+from .tools.content_tools import fix_exam_format, _get_type_name
+
+class ToolConcurrencyLimit:
+    """Agent同一轮中并发执行的工具数量上限
+
+    ConcurrentToolExecutor让同一轮的多个工具调用并发执行，本类通过BoundedTool包装工具，
+    同时执行的工具数量不超过max_concurrency，避免触发Bedrock限流。只使用AgentTool的公开接口（stream），
+    不依赖执行器的内部方法。
+    """
+
+    def __init__(self, max_concurrency=3):
+        self.max_concurrency = max_concurrency
+        self._loop = None
+        self._semaphore = None
+
+    def semaphore(self):
+        """返回绑定到当前事件循环的信号量（每次Agent调用运行在新的事件循环中）"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def wrap(self, tools):
+        """
+        包装工具列表
+
+        Args:
+            tools: 工具列表
+
+        Returns:
+            list: 共享本上限的BoundedTool列表
+        """
+        return [BoundedTool(agent_tool, self) for agent_tool in tools]
+
+class BoundedTool(AgentTool):
+    """占用ToolConcurrencyLimit的一个名额后再执行被包装的工具
+
+    等待名额的时间记录为tool.queue阶段；获得名额后才开始工具阶段和工具调用的执行计时
+    （见TaskTrackingHook和begin_tool_execution），执行时间不包含排队时间。
+    """
+
+    # TaskTrackingHook推迟到获得名额后再开始计时
+    deferred_start = True
+
+    def __init__(self, agent_tool, limit):
+        super().__init__()
+        self.tool = agent_tool
+        self.limit = limit
+
+    @property
+    def tool_name(self):
+        return self.tool.tool_name
+
+    @property
+    def tool_spec(self):
+        return self.tool.tool_spec
+
+    @property
+    def tool_type(self):
+        return self.tool.tool_type
+
+    async def stream(self, tool_use, invocation_state, **kwargs):
+        semaphore = self.limit.semaphore()
+        with span("tool.queue", tool=self.tool_name):
+            await semaphore.acquire()
+        try:
+            begin_tool_execution()
+            async for event in self.tool.stream(tool_use, invocation_state, **kwargs):
+                yield event
+        finally:
+            semaphore.release()
+
+# 默认工具列表，所有Agent共享同一组工具对象（工具规格在装饰时已解析）
+DEFAULT_TOOLS = [
+    fetch_url_content,
+    process_reference,
+    generate_single_choice_question,
+    generate_multiple_choice_question,
+    generate_fill_blank_question,
+    validate_exam_format,
+    extract_exam_metadata,
+    plan_exam_content
+]
+
+# 共享的BedrockModel，boto3客户端是线程安全的，可以被多个Agent同时使用
+_shared_model = None
+_shared_model_lock = threading.Lock()
+
+def _build_bedrock_model(read_timeout):
+    """创建BedrockModel
+    
+    Args:
+        read_timeout: Bedrock读取超时（秒）
+    """
+    # 系统提示词和工具定义在每一轮对话中都相同，模型支持时标记为可缓存前缀
+    cache_options = {}
+    if supports_prompt_cache():
+        cache_options = {"cache_config": CacheConfig(strategy="anthropic", system_prompt_ttl=True, tools_ttl=True)}
+    
+    model = BedrockModel(
+        model_id=llm_config.model_id,
+        region_name=llm_config.region_name,
+        endpoint_url=llm_config.endpoint_url or None,
+        temperature=llm_config.temperature,
+        max_tokens=llm_config.max_tokens,
+        boto_client_config=Config(read_timeout=read_timeout),
+        **cache_options
+    )
+    # Agent直接调用Converse/ConverseStream，不经过call_claude，在客户端上记录Bedrock指标
+    instrument_bedrock_client(model.client, source="agent")
+    return model
+
+def get_bedrock_model():
+    """获取BedrockModel
+    
+    请求剩余的时间预算不少于配置的读取超时时复用共享实例，
+    否则为本次请求单独创建一个读取超时更短的实例。
+    
+    Returns:
+        BedrockModel: 模型实例
+    """
+    global _shared_model
+    read_timeout = cap_timeout(llm_config.read_timeout, minimum=1)
+    if read_timeout < llm_config.read_timeout:
+        return _build_bedrock_model(read_timeout)
+    
+    with _shared_model_lock:
+        if _shared_model is None:
+            _shared_model = _build_bedrock_model(llm_config.read_timeout)
+        return _shared_model
 
 def create_agent(workflow_id=None, step_id=None, custom_tools=None, custom_prompt=None):
     """创建Agent实例
@@ -39,36 +176,21 @@ def create_agent(workflow_id=None, step_id=None, custom_tools=None, custom_promp
         logging.info(f"为工作流 {workflow_id} 步骤 {step_id} 创建回调处理器")
     
     # 确定使用的工具
-    tools = custom_tools if custom_tools is not None else [
-        fetch_url_content,
-        process_reference,
-        generate_single_choice_question,
-        generate_multiple_choice_question,
-        generate_fill_blank_question,
-        validate_exam_format,
-        extract_exam_metadata,
-        plan_exam_content
-    ]
+    tools = custom_tools if custom_tools is not None else DEFAULT_TOOLS
     
     # 确定使用的系统提示词
     system_prompt = custom_prompt if custom_prompt is not None else exam_config.system_prompt
     
     try:
-        # 创建 BedrockModel
-        bedrock_model = BedrockModel(
-            model_id=llm_config.model_id,
-            region_name=llm_config.region_name,
-            temperature=llm_config.temperature,
-            max_tokens=llm_config.max_tokens
-        )
-        
-        # 创建Agent
+        # 创建Agent，读取超时不超过请求剩余的时间预算
         agent = Agent(
             name="ExamGeneratorAgent",
-            model=bedrock_model,  # 使用配置好的BedrockModel
+            model=get_bedrock_model(),
             system_prompt=system_prompt,
-            tools=tools,
-            callback_handler=callback
+            tools=ToolConcurrencyLimit(exam_config.max_concurrent_tools).wrap(tools),
+            callback_handler=callback,
+            hooks=[TaskTrackingHook()],  # 按toolUseId记录工具执行结果和token用量
+            tool_executor=ConcurrentToolExecutor()
         )
         
         return agent
@@ -76,6 +198,81 @@ def create_agent(workflow_id=None, step_id=None, custom_tools=None, custom_promp
         logging.error(f"创建Agent失败: {str(e)}")
         raise Exception(f"创建Agent失败: {str(e)}")
 
+class AgentPool:
+    """可复用的Agent池
+    
+    使用默认工具和系统提示词的Agent在请求结束后被重置并放回池中，
+    下一个请求只需替换回调处理器，避免重复创建模型和注册工具。
+    TaskTrackingHook从上下文获取工作流信息，因此可以直接复用。
+    """
+    
+    def __init__(self, max_size=4):
+        """
+        初始化Agent池
+        
+        Args:
+            max_size: 池中最多保留的空闲Agent数量
+        """
+        self.max_size = max_size
+        self._idle = []
+        self._lock = threading.Lock()
+    
+    def acquire(self, workflow_id=None, step_id=None):
+        """
+        获取一个Agent
+        
+        池中没有空闲Agent，或请求剩余时间不足以使用共享模型的读取超时时，创建新的Agent。
+        
+        Args:
+            workflow_id: 工作流ID，用于任务跟踪
+            step_id: 步骤ID，用于任务跟踪
+        
+        Returns:
+            Agent: 可以直接调用的Agent实例
+        """
+        agent = None
+        if cap_timeout(llm_config.read_timeout) >= llm_config.read_timeout:
+            with self._lock:
+                if self._idle:
+                    agent = self._idle.pop()
+        
+        if agent is None:
+            return create_agent(workflow_id, step_id)
+        
+        if workflow_id and step_id:
+            agent.callback_handler = create_task_tracking_callback(task_manager, workflow_id, step_id)
+        return agent
+    
+    def release(self, agent):
+        """
+        重置Agent并放回池中
+        
+        只回收使用共享模型的Agent，为单个请求创建的Agent直接丢弃。
+        
+        Args:
+            agent: acquire返回的Agent
+        """
+        if agent.model is not _shared_model:
+            return
+        
+        # 清除上一次请求的对话历史、状态、指标和回调
+        agent.messages = []
+        agent.state = type(agent.state)()
+        agent.event_loop_metrics = type(agent.event_loop_metrics)()
+        agent.callback_handler = null_callback_handler
+        
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append(agent)
+    
+    def clear(self):
+        """清空池中的空闲Agent"""
+        with self._lock:
+            self._idle = []
+
+# 创建全局Agent池
+agent_pool = AgentPool(exam_config.agent_pool_size)
+
 def create_exam_generation_prompt(exam_request):
     """创建考试生成提示词模板
     
@@ -85,7 +282,7 @@ def create_exam_generation_prompt(exam_request):
     Returns:
         str: 格式化的提示词
     """
-    return f"""
+    prompt = f"""
     请根据以下要求生成一份考试：
     
     {json.dumps(exam_request.get('inputs', {}), ensure_ascii=False, indent=2)}
@@ -93,12 +290,49 @@ def create_exam_generation_prompt(exam_request):
     请按照系统提示中的指导使用提供的工具来生成考试内容。
     记住，使用generate_single_choice_question、generate_multiple_choice_question和generate_fill_blank_question工具来生成题目，而不是自己直接生成题目内容。
     如果有多种题型，请先使用plan_exam_content工具规划考试内容结构。
+    生成的题目会保存在服务端，最终考试由服务端按规划顺序自动组装并验证格式，不要输出完整的考试内容，所有题目生成完成后只需回复"完成"。
+    """
+    
+    if exam_config.history_mode == "handles":
+        prompt += """
+    本次使用题目ID模式：
+    - 题目生成工具只返回题目ID（如q1），题目内容保存在服务端
+    - 参考资料工具可能返回参考资料ID（如ref-1），生成题目时把reference参数设为该ID，不要粘贴参考资料原文
+    """
+    
+    return prompt
+
+def create_resume_prompt(exam_request, existing_questions, missing_counts):
+    """创建从检查点继续生成考试的提示词
+    
+    上一次尝试失败时，已经生成的题目保留在服务端，重试只需要生成缺少的题目。
+    
+    Args:
+        exam_request: 考试请求数据
+        existing_questions: 已生成并保留的题目记录
+        missing_counts: 题型 -> 还需要生成的数量
+        
+    Returns:
+        str: 格式化的提示词
+    """
+    existing = "\n".join(
+        f"    - {q['id']}: {_get_type_name(q['type'])}，主题: {q['topic']}，难度: {q['difficulty']}"
+        for q in existing_questions
+    )
+    missing = "、".join(f"{count}道{_get_type_name(question_type)}" for question_type, count in missing_counts.items())
+    return create_exam_generation_prompt(exam_request) + f"""
+    上一次生成被中断，以下题目已经生成并保存在服务端，不要重新生成：
+{existing}
+    
+    只需要再生成{missing}，主题不要与已生成的题目重复，不需要再调用extract_exam_metadata或plan_exam_content。
     """
 
 def generate_exam(exam_request, workflow_id):
     """生成考试内容
     
     让Agent自主决定执行流程，根据系统提示词和工具描述来完成考试生成任务。
+    如果当前上下文设置了请求截止时间，重试等待不会超出剩余预算。
+    限流重试时保留上一次尝试已生成的题目，只生成缺少的题目。
     
     Args:
         exam_request: 考试请求数据
@@ -110,64 +344,108 @@ def generate_exam(exam_request, workflow_id):
     max_retries = 3
     initial_retry_delay = 5  # 初始重试延迟（秒）
     
-    for attempt in range(max_retries):
-        try:
-            # 创建考试生成步骤
-            step_id = task_manager.add_step(workflow_id, "生成考试")
-            task_manager.start_step(workflow_id, step_id)
-            
-            # 创建Agent
-            agent = create_agent(workflow_id, step_id)
-            
-            # 构建用户提示词
-            prompt = create_exam_generation_prompt(exam_request)
-            
-            # 让Agent自主执行考试生成流程
-            result = agent(prompt)  # 直接调用Agent实例，符合Strands Agent框架标准用法
-            
-            # 从结果中提取考试内容
-            # 检查result.message的类型，如果是字典，则提取content字段
-            if isinstance(result.message, dict) and "content" in result.message:
-                exam_content = result.message["content"]
-            elif isinstance(result.message, list) and len(result.message) > 0 and isinstance(result.message[0], dict) and "text" in result.message[0]:
-                # 如果是列表，提取第一个元素的text字段
-                exam_content = result.message[0]["text"]
-            else:
-                # 否则直接使用message
-                exam_content = result.message
+    deadline = get_deadline()
+    
+    # 按请求确定性地生成考试规划，组装考试时按规划的题型顺序和数量排列题目
+    question_store.clear(workflow_id)
+    with workflow_scope(workflow_id), span("plan"):
+        question_store.set_plan(workflow_id, plan_exam_content(extract_exam_metadata(exam_request)))
+    
+    try:
+        for attempt in range(max_retries):
+            try:
+                if deadline is not None and deadline.expired():
+                    raise DeadlineExceeded(f"请求时间预算已耗尽 ({deadline.timeout}秒)")
+                
+                # 创建考试生成步骤
+                step_id = task_manager.add_step(workflow_id, "生成考试")
+                task_manager.start_step(workflow_id, step_id)
+                
+                # 本次尝试的各个阶段（Agent编排、工具调用、组装、验证、渲染）都记录在这个步骤下
+                with workflow_scope(workflow_id, step_id), span("step", attempt=attempt + 1):
+                    # 重试时保留上一次尝试已生成的题目（备用题目除外），只生成缺少的部分
+                    result = None
+                    existing_questions = []
+                    if attempt > 0:
+                        question_store.discard_fallbacks(workflow_id)
+                        existing_questions = question_store.ordered_questions(workflow_id)
+                    missing_counts = question_store.missing_counts(workflow_id)
+                
+                    if existing_questions and not missing_counts:
+                        logging.info(f"上一次尝试已生成全部{len(existing_questions)}道题目，直接组装考试")
+                    else:
+                        # 构建用户提示词
+                        if existing_questions:
+                            logging.info(f"从检查点继续生成，复用{len(existing_questions)}道题目，缺少: {missing_counts}")
+                            prompt = create_resume_prompt(exam_request, existing_questions, missing_counts)
+                        else:
+                            prompt = create_exam_generation_prompt(exam_request)
+                    
+                        # 从池中获取Agent，用完后重置放回
+                        agent = agent_pool.acquire(workflow_id, step_id)
+                        try:
+                            # 让Agent自主执行考试生成流程
+                            # 工作流上下文会传递到工具线程，用于记录工具内模型调用的token用量和阶段耗时
+                            with span("orchestrator"):
+                                result = agent(prompt)  # 直接调用Agent实例，符合Strands Agent框架标准用法
+                        finally:
+                            agent_pool.release(agent)
+                
+                    # 由服务端按考试规划组装工具生成的题目，不依赖模型重新输出题目内容
+                    with span("assemble"):
+                        used_questions = question_store.ordered_questions(workflow_id)
+                        exam_content = question_store.assemble(workflow_id)
+                    if not exam_content and result is not None:
+                        # Agent没有调用题目生成工具时，退回使用Agent的最终回复
+                        logging.warning("题目存储中没有题目，使用Agent的最终回复作为考试内容")
+                        exam_content = str(result).strip()
+                    with span("validate"):
+                        if not validate_exam_format(exam_content):
+                            exam_content = fix_exam_format(exam_content)
+                
+                    # 记录复用和浪费的生成工作量
+                    used_ids = {q["id"] for q in used_questions}
+                    discarded_questions = question_store.get_discarded(workflow_id) + [
+                        q for q in question_store.get_questions(workflow_id) if q["id"] not in used_ids
+                    ]
+                    task_manager.record_generation_work(workflow_id, step_id, used_questions, discarded_questions)
             
-            # 发送到渲染服务
-            render_result = send_to_flask_service(exam_content)
+                    # 发送到渲染服务
+                    render_result = send_to_flask_service(exam_content)
             
-            # 完成步骤
-            task_manager.complete_step(workflow_id, step_id, output_data={
-                "exam_content": exam_content,
-                "render_result": render_result
-            })
+                    # 完成步骤
+                    task_manager.complete_step(workflow_id, step_id, output_data={
+                        "exam_content": exam_content,
+                        "render_result": render_result
+                    })
             
-            return {
-                "exam_content": exam_content,
-                "render_result": render_result
-            }
-        except Exception as e:
-            # 检查是否是限流错误
-            if "throttlingException" in str(e) or "Too many requests" in str(e):
-                if attempt < max_retries - 1:
+                    return {
+                        "exam_content": exam_content,
+                        "render_result": render_result
+                    }
+            except Exception as e:
+                # 检查是否是限流错误
+                if "throttlingException" in str(e) or "Too many requests" in str(e):
                     # 计算指数退避时间
                     retry_delay = initial_retry_delay * (2 ** attempt)
-                    logging.warning(f"API限流，等待{retry_delay}秒后重试 ({attempt+1}/{max_retries}): {str(e)}")
-                    time.sleep(retry_delay)
-                    # 如果有step_id，标记为失败
-                    if 'step_id' in locals() and step_id:
-                        task_manager.fail_step(workflow_id, step_id, f"API限流，正在重试 ({attempt+1}/{max_retries})")
+                    if attempt < max_retries - 1 and (deadline is None or deadline.allows(retry_delay)):
+                        logging.warning(f"API限流，等待{retry_delay}秒后重试 ({attempt+1}/{max_retries}): {str(e)}")
+                        with workflow_scope(workflow_id), span("retry.backoff"):
+                            time.sleep(retry_delay)
+                        # 如果有step_id，标记为失败
+                        if 'step_id' in locals() and step_id:
+                            task_manager.fail_step(workflow_id, step_id, f"API限流，正在重试 ({attempt+1}/{max_retries})")
+                    else:
+                        logging.error(f"生成考试失败，已达到最大重试次数或时间预算不足: {str(e)}")
+                        if 'step_id' in locals() and step_id:
+                            task_manager.fail_step(workflow_id, step_id, str(e))
+                        raise Exception(f"生成考试失败: {str(e)}")
                 else:
-                    logging.error(f"生成考试失败，已达到最大重试次数: {str(e)}")
+                    # 其他类型的错误
+                    logging.error(f"生成考试失败: {str(e)}")
                     if 'step_id' in locals() and step_id:
                         task_manager.fail_step(workflow_id, step_id, str(e))
                     raise Exception(f"生成考试失败: {str(e)}")
-            else:
-                # 其他类型的错误
-                logging.error(f"生成考试失败: {str(e)}")
-                if 'step_id' in locals() and step_id:
-                    task_manager.fail_step(workflow_id, step_id, str(e))
-                raise Exception(f"生成考试失败: {str(e)}")
+    finally:
+        # 题目存储只在本次生成期间使用
+        question_store.clear(workflow_id)
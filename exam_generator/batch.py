@@ -0,0 +1,252 @@
+import re
+import json
+import time
+import logging
+import contextvars
+import concurrent.futures
+from .config import exam_config
+from .utils import task_manager, workflow_scope, question_store, span, InvalidRequest
+from .tools import (
+    process_reference,
+    extract_exam_metadata,
+    plan_exam_content,
+    validate_exam_format,
+    send_to_flask_service
+)
+from .tools.exam_tools import (
+    generate_single_choice_question,
+    generate_multiple_choice_question,
+    generate_fill_blank_question,
+    _generate_with_content
+)
+from .tools.content_tools import fix_exam_format
+
+# 题型 -> 题目生成工具
+QUESTION_GENERATORS = {
+    'singleChoice': generate_single_choice_question,
+    'multipleChoice': generate_multiple_choice_question,
+    'fillBlank': generate_fill_blank_question
+}
+
+def expand_batch_request(batch_request):
+    """
+    把批量请求展开为考试请求列表
+
+    支持两种格式：
+    - {"requests": [考试请求, ...]}：每个元素是一个/workflows/run格式的请求
+    - {"spec": 考试请求, "variants": N}：同一考试规格生成N个不同的变体
+
+    Args:
+        batch_request: 批量请求数据
+
+    Returns:
+        list: (考试请求, 变体序号)列表
+
+    Raises:
+        InvalidRequest: 请求格式无效或考试数量超过上限
+    """
+    if not isinstance(batch_request, dict):
+        raise InvalidRequest("无效的请求格式")
+
+    if batch_request.get('spec'):
+        try:
+            variants = int(batch_request.get('variants', 1))
+        except (TypeError, ValueError):
+            raise InvalidRequest("variants必须是整数")
+        if variants < 1:
+            raise InvalidRequest("variants必须大于0")
+        # 先检查数量再展开，避免超大的variants在请求线程中分配大量对象
+        if variants > exam_config.max_batch_size:
+            raise InvalidRequest(f"批量请求最多包含{exam_config.max_batch_size}份考试，实际为{variants}份")
+        exams = [(batch_request['spec'], variant) for variant in range(variants)]
+    elif isinstance(batch_request.get('requests'), list):
+        exams = [(exam_request, 0) for exam_request in batch_request['requests']]
+    else:
+        raise InvalidRequest("缺少requests或spec参数")
+
+    if not exams:
+        raise InvalidRequest("批量请求中没有考试")
+    if len(exams) > exam_config.max_batch_size:
+        raise InvalidRequest(f"批量请求最多包含{exam_config.max_batch_size}份考试，实际为{len(exams)}份")
+    for exam_request, _ in exams:
+        if not isinstance(exam_request, dict) or not exam_request.get('inputs'):
+            raise InvalidRequest("批量请求中的考试缺少inputs参数")
+    return exams
+
+def _canonical(value):
+    """生成用于去重的规范化键"""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+def _question_slots(metadata, plan, reference_key, variant):
+    """
+    按考试规划列出一份考试的题目位置
+
+    每个位置对应一个题目键(题型, 主题, 难度, 参考资料, 序号)。同一份考试中相同
+    题型和主题的题目、以及同一规格的不同变体使用不同的序号，键相同的题目只生成一次。
+
+    Returns:
+        list: 按考试顺序排列的题目键
+    """
+    topics = metadata.get('topics') or [metadata.get('subject') or "综合"]
+    difficulty = metadata.get('difficulty') or exam_config.default_difficulty
+    slots = []
+    position = 0
+    for question_type, count in plan['type_counts'].items():
+        for _ in range(count):
+            slots.append((question_type, topics[position % len(topics)], difficulty, reference_key))
+            position += 1
+
+    # 相同的(题型, 主题)在一份考试中出现多次时依次编号，变体在此基础上整体偏移
+    per_exam = {}
+    for slot in slots:
+        per_exam[slot] = per_exam.get(slot, 0) + 1
+    seen = {}
+    keyed = []
+    for slot in slots:
+        ordinal = variant * per_exam[slot] + seen.get(slot, 0)
+        seen[slot] = seen.get(slot, 0) + 1
+        keyed.append(slot + (ordinal,))
+    return keyed
+
+def _generate_question(key, references):
+    """
+    生成一个题目键对应的题目
+
+    序号为0的题目直接使用主题，可以命中题目缓存；其余序号在主题后附加角度说明，
+    使同一主题的多道题目和不同变体得到不同的题目。
+    """
+    question_type, topic, difficulty, reference_key, ordinal = key
+    if ordinal:
+        topic = f"{topic}（第{ordinal + 1}个考查角度）"
+    generator = QUESTION_GENERATORS.get(question_type, generate_single_choice_question)
+    return _generate_with_content(generator, topic, difficulty, references.get(reference_key))
+
+def _extract_link(message):
+    """从渲染服务的响应消息中提取查看链接"""
+    match = re.search(r'https?://\S+', message or "")
+    return match.group(0) if match else None
+
+def run_batch(batch_request, workflow_id, exams=None):
+    """
+    批量生成考试
+
+    与逐个调用/workflows/run不同，批量生成使用确定性的流水线，不经过Agent：
+    1. 对所有考试提取元数据和规划考试内容，相同的输入只处理一次
+    2. 相同的参考资料只获取和处理一次
+    3. 所有考试的题目放进同一个生成线程池，相同的题目键只生成一次（已缓存的题目直接复用）
+    4. 每份考试按规划顺序组装、验证格式并渲染
+
+    Args:
+        batch_request: 批量请求数据，格式见expand_batch_request
+        workflow_id: 批量任务的工作流ID
+        exams: 已展开的考试请求列表（可选），为None时由batch_request展开
+
+    Returns:
+        dict: 每份考试的结果和链接、去重统计以及各阶段耗时
+    """
+    timings = {}
+    started = time.monotonic()
+    if exams is None:
+        exams = expand_batch_request(batch_request)
+
+    def run_step(name, func):
+        """以工作流步骤的形式执行一个阶段并记录耗时"""
+        step_id = task_manager.add_step(workflow_id, name)
+        task_manager.start_step(workflow_id, step_id)
+        step_started = time.monotonic()
+        try:
+            with workflow_scope(workflow_id, step_id), span(name):
+                result = func()
+        except Exception as e:
+            task_manager.fail_step(workflow_id, step_id, str(e))
+            raise
+        timings[name] = round(time.monotonic() - step_started, 3)
+        task_manager.complete_step(workflow_id, step_id)
+        return result
+
+    # 1. 提取元数据和规划，相同的inputs只处理一次
+    def plan_exams():
+        plans = {}
+        for exam_request, _ in exams:
+            key = _canonical(exam_request['inputs'])
+            if key not in plans:
+                metadata = extract_exam_metadata(exam_request)
+                plans[key] = (metadata, plan_exam_content(metadata))
+        return plans
+    plans = run_step("提取元数据和规划", plan_exams)
+
+    # 2. 处理参考资料，相同的参考资料只获取一次
+    def load_references():
+        references = {}
+        for metadata, _ in plans.values():
+            reference = metadata.get('reference')
+            if reference and reference not in references:
+                # 在工作流上下文之外处理，使长参考资料返回原文而不是参考资料ID
+                with workflow_scope(None):
+                    references[reference] = process_reference(reference)
+        return references
+    references = run_step("处理参考资料", load_references)
+
+    # 3. 列出所有考试的题目键，并在共享的线程池中生成去重后的题目
+    exam_slots = []
+    for exam_request, variant in exams:
+        metadata, plan = plans[_canonical(exam_request['inputs'])]
+        exam_slots.append(_question_slots(metadata, plan, metadata.get('reference') or None, variant))
+    unique_keys = list(dict.fromkeys(key for slots in exam_slots for key in slots))
+
+    def generate_questions():
+        questions = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=exam_config.batch_workers) as executor:
+            future_to_key = {
+                # 复制当前上下文，使截止时间、调度优先级和工作流上下文在工作线程中可见
+                executor.submit(contextvars.copy_context().run, _generate_question, key, references): key
+                for key in unique_keys
+            }
+            for future in concurrent.futures.as_completed(future_to_key):
+                questions[future_to_key[future]] = future.result()
+        return questions
+    try:
+        questions = run_step("生成题目", generate_questions)
+    finally:
+        # 批量生成直接使用工具返回的题目内容，不需要保留题目存储
+        question_store.clear(workflow_id)
+
+    # 4. 组装并渲染每份考试，相同内容的考试只渲染一次
+    def render_exams():
+        results = []
+        rendered = {}
+        for index, ((exam_request, variant), slots) in enumerate(zip(exams, exam_slots)):
+            exam_content = "\n\n".join(questions[key].strip() for key in slots)
+            if not validate_exam_format(exam_content):
+                exam_content = fix_exam_format(exam_content)
+            result = {"index": index, "variant": variant, "question_count": len(slots)}
+            try:
+                if exam_content not in rendered:
+                    rendered[exam_content] = send_to_flask_service(exam_content)
+                message = rendered[exam_content].get("message", "")
+                result.update({"status": "completed", "message": message, "link": _extract_link(message)})
+            except Exception as e:
+                logging.error(f"批量任务中第{index + 1}份考试渲染失败: {str(e)}")
+                result.update({"status": "failed", "error": str(e)})
+            result["exam_content"] = exam_content
+            results.append(result)
+        return results
+    results = run_step("渲染考试", render_exams)
+
+    timings["total"] = round(time.monotonic() - started, 3)
+    total_questions = sum(len(slots) for slots in exam_slots)
+    return {
+        "batch_id": workflow_id,
+        "exams": results,
+        "statistics": {
+            "exams": len(exams),
+            "completed": sum(1 for r in results if r["status"] == "completed"),
+            "failed": sum(1 for r in results if r["status"] == "failed"),
+            "unique_specs": len(plans),
+            "unique_references": len(references),
+            "questions_total": total_questions,
+            "questions_generated": len(unique_keys),
+            "questions_shared": total_questions - len(unique_keys)
+        },
+        "timings": timings
+    }
@@ -10,6 +10,29 @@ class LLMConfig:
     region_name: str = "us-east-1"  # 使用us-east-1区域
     max_tokens: int = 4000
     temperature: float = 0.7
+    read_timeout: float = 60  # Bedrock读取超时（秒），会被请求截止时间进一步裁剪
+    # bedrock-runtime的访问地址，为空时使用区域的默认地址；可以指向本地的模拟服务做离线测试
+    endpoint_url: str = os.environ.get("BEDROCK_ENDPOINT_URL", "")
+    # 异步引擎（asyncio）的HTTP连接池大小，同一事件循环内的所有模型调用共享
+    async_max_connections: int = int(os.environ.get("ASYNC_MAX_CONNECTIONS", "200"))
+    # 每1000个token的单价（美元），用于估算费用
+    input_token_price: float = 0.003
+    output_token_price: float = 0.015
+    cache_read_token_price: float = 0.0003
+    cache_write_token_price: float = 0.00375
+    # Bedrock提示词缓存：把共享的系统提示词和参考资料标记为可缓存前缀
+    enable_prompt_cache: bool = os.environ.get("ENABLE_PROMPT_CACHE", "true").lower() == "true"
+    prompt_cache_models: tuple = (
+        "claude-3-7-sonnet",
+        "claude-3-5-haiku",
+        "claude-sonnet-4",
+        "claude-opus-4"
+    )
+    prompt_cache_min_chars: int = 2000  # 低于该长度的前缀达不到最小缓存token数，不标记缓存点
+    # 题目生成调度：所有请求共享的并发模型调用上限，以及交互式/批量请求分配槽位的权重
+    max_concurrent_generations: int = int(os.environ.get("MAX_CONCURRENT_GENERATIONS", "3"))
+    interactive_weight: int = 4
+    batch_weight: int = 1
 
 @dataclass
 class AWSConfig:
@@ -90,13 +113,53 @@ class ServerConfig:
     port: int = 5001
     debug: bool = False
     flask_service_url: str = "http://localhost:5006/upload_markdown"
+    workflow_timeout: float = float(os.environ.get("WORKFLOW_TIMEOUT", 300))  # 单个考试生成请求的总时间预算（秒）
+    batch_timeout: float = float(os.environ.get("BATCH_TIMEOUT", 1800))  # 批量考试生成请求的总时间预算（秒）
+    # 准入控制：同时执行的工作流上限、排队上限和最长排队时间（秒）
+    max_concurrent_workflows: int = int(os.environ.get("MAX_CONCURRENT_WORKFLOWS", 4))
+    max_queue_depth: int = int(os.environ.get("MAX_QUEUE_DEPTH", 8))
+    max_queue_wait: float = float(os.environ.get("MAX_QUEUE_WAIT", 60))
+    idempotency_ttl: float = float(os.environ.get("IDEMPOTENCY_TTL", 600))  # 成功结果按幂等键保留的时间（秒）
+    # 多进程部署时各worker共享的状态目录（任务状态、跨进程并发名额），为空时只使用进程内状态
+    shared_state_dir: str = os.environ.get("SHARED_STATE_DIR", "")
+    # 工作流结束后保留的时间（秒），过期的工作流从内存和共享状态目录中删除
+    task_state_ttl: float = float(os.environ.get("TASK_STATE_TTL", 7 * 24 * 3600))
+    # 生产模式（gunicorn）的worker进程数、每个worker的线程数和优雅退出的等待时间（秒）
+    workers: int = int(os.environ.get("WORKERS", 2))
+    threads: int = int(os.environ.get("THREADS", 8))
+    graceful_timeout: float = float(os.environ.get("GRACEFUL_TIMEOUT", 330))
+    # 多进程部署时各worker把指标写入共享状态目录的间隔（秒），/metrics合并所有worker的快照
+    metrics_snapshot_interval: float = float(os.environ.get("METRICS_SNAPSHOT_INTERVAL", 5))
+    # 性能分析等管理接口，默认关闭；设置ADMIN_TOKEN时请求必须带相同的X-Admin-Token请求头
+    admin_enabled: bool = os.environ.get("ADMIN_ENDPOINTS", "false").lower() == "true"
+    admin_token: str = os.environ.get("ADMIN_TOKEN", "")
+    # 性能分析结果文件的目录，为空时使用系统临时目录
+    profile_dir: str = os.environ.get("PROFILE_DIR", "")
 
 @dataclass
 class LogConfig:
     """日志配置"""
     level: str = os.environ.get("LOG_LEVEL", "INFO")
     format: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    file: str = "agent.log"
+    file: str = os.environ.get("LOG_FILE", "agent.log")
+    # Strands日志级别，为空时与LOG_LEVEL相同
+    strands_level: str = os.environ.get("STRANDS_LOG_LEVEL", "")
+    # 等待后台线程写入的日志记录上限，队列满时丢弃新的记录
+    queue_size: int = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+    # 请求体和生成结果等较大数据：记录的比例和最多记录的字符数
+    payload_sample_rate: float = float(os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", 1.0))
+    payload_max_chars: int = int(os.environ.get("LOG_PAYLOAD_MAX_CHARS", 2000))
+
+@dataclass
+class TracingConfig:
+    """链路追踪配置（OpenTelemetry）"""
+    # 导出方式，逗号分隔："file"写入本地JSONL文件，"otlp"发送到OTLP端点（OTEL_EXPORTER_OTLP_ENDPOINT），为空时不追踪
+    exporters: str = os.environ.get("TRACING_EXPORTERS", "")
+    file_path: str = os.environ.get("TRACING_FILE", "traces.jsonl")
+    service_name: str = os.environ.get("OTEL_SERVICE_NAME", "exam-generator")
+    # 采样：按比例采样新的追踪，并且每秒最多开始max_traces_per_second个追踪（0表示不限），控制满负载时的追踪开销
+    sample_rate: float = float(os.environ.get("TRACING_SAMPLE_RATE", 1.0))
+    max_traces_per_second: float = float(os.environ.get("TRACING_MAX_TRACES_PER_SECOND", 10))
 
 @dataclass
 class ExamConfig:
@@ -104,6 +167,30 @@ class ExamConfig:
     max_reference_length: int = 5000
     default_question_count: int = 5
     default_difficulty: str = "medium"
+    max_concurrent_tools: int = 3  # Agent同一轮中并发执行的工具数量上限
+    agent_pool_size: int = 4  # 池中保留的可复用Agent数量
+    interactive_max_questions: int = 10  # 不超过该题目数量的请求按交互式优先级调度，否则按批量调度
+    max_batch_size: int = 50  # 一个批量请求最多包含的考试数量
+    batch_workers: int = 6  # 批量生成共享的题目生成线程数，实际并发仍受调度器限制
+    # 对话历史模式："handles"时工具只向Agent返回题目ID和参考资料ID，完整内容保存在服务端；
+    # "full"时工具返回完整内容（旧行为）
+    history_mode: str = os.environ.get("HISTORY_MODE", "handles")
+    reference_handle_min_chars: int = 500  # 超过该长度的参考资料才替换为句柄
+    question_cache_dir: str = os.environ.get("QUESTION_CACHE_DIR", "./cache")  # 题目缓存目录
+    # 参考资料URL的获取缓存：保存提取后的文本，新鲜期（秒）内直接使用，过期后用ETag/Last-Modified条件请求重新验证
+    fetch_cache_dir: str = os.environ.get("FETCH_CACHE_DIR", "./cache/fetch")
+    fetch_cache_ttl: float = float(os.environ.get("FETCH_CACHE_TTL", 3600))
+    fetch_cache_max_entries: int = int(os.environ.get("FETCH_CACHE_MAX_ENTRIES", 1000))
+    fetch_cache_max_bytes: int = int(os.environ.get("FETCH_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+    fetch_pool_size: int = 10  # 获取参考资料的HTTP连接池中每个主机保留的连接数
+    # 参考资料网页流式下载：最多读取的字节数（解压后），提取到max_reference_length字符后提前停止
+    fetch_max_bytes: int = int(os.environ.get("FETCH_MAX_BYTES", 2 * 1024 * 1024))
+    fetch_chunk_size: int = 16 * 1024
+    fetch_content_types: tuple = ("text/html", "application/xhtml+xml", "text/plain")
+    # 网页文本提取：解析器（auto、lxml、selectolax或html.parser，auto时使用已安装的最快的解析器），
+    # 以及是否只保留正文（跳过导航、侧栏、页脚等，避免占用max_reference_length）
+    html_extractor: str = os.environ.get("HTML_EXTRACTOR", "auto")
+    main_content_only: bool = os.environ.get("MAIN_CONTENT_ONLY", "true").lower() == "true"
     system_prompt: str = """
     你是一个专业的考试生成助手，能够根据用户需求生成高质量的考试内容。
 
@@ -111,8 +198,7 @@ class ExamConfig:
     1. 分析用户请求，提取考试元数据（年级、科目、题型、题目数量、难度、主题等）
     2. 如果提供了参考资料，处理参考资料（如果是URL，获取内容；如果是文本，直接使用）
     3. 根据元数据和参考资料，生成符合要求的考试题目
-    4. 验证生成的考试内容格式是否正确
-    5. 如果格式不正确，修复格式问题
+    4. 所有题目生成完成后回复"完成"，生成的题目由服务端按规划顺序组装成考试并验证格式
 
     ## 可用工具及用途
     - extract_exam_metadata: 从用户请求中提取考试元数据（年级、科目、题型等）
@@ -134,14 +220,14 @@ class ExamConfig:
       * 单选题：使用generate_single_choice_question
       * 多选题：使用generate_multiple_choice_question
       * 填空题：使用generate_fill_blank_question
-    - 使用validate_exam_format验证生成的内容格式
+    - 各道题目的生成互不依赖，应在同一轮回复中同时发出多个题目生成工具调用，系统会并发执行它们
+    - 不需要自己组合或重新输出题目内容，服务端会组装最终考试
 
     ## 复合题型处理流程
     1. 使用extract_exam_metadata提取元数据
     2. 使用plan_exam_content规划考试内容结构
-    3. 按照规划结果，依次生成各种题型的题目
-    4. 将所有题目组合成一个完整的考试
-    5. 使用validate_exam_format验证最终内容
+    3. 按照规划结果，同时发出各种题型的题目生成调用
+    4. 所有题目生成完成后回复"完成"，服务端会按规划顺序组装完整的考试
 
     ## 考试格式要求
     生成的考试需要符合markdown格式，包含正确答案标记：
@@ -152,7 +238,7 @@ class ExamConfig:
     ## 注意事项
     - 根据年级和科目调整题目难度和内容
     - 确保题目内容准确、清晰、无歧义
-    - 不要包含任何额外的解释，直接输出考试内容
+    - 不要包含任何额外的解释
     - 确保生成的考试内容格式正确，可以被Markdown解析器正确解析
     - 如果参考资料内容过长，优先使用重要和相关的部分
     - 每个题目都应该使用二级标题（##）开头，不要添加额外的一级标题或编号
@@ -169,4 +255,5 @@ if aws_config.region:
 
 server_config = ServerConfig()
 log_config = LogConfig()
+tracing_config = TracingConfig()
 exam_config = ExamConfig()
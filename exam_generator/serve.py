@@ -0,0 +1,162 @@
+"""
+生产环境启动入口
+
+使用gunicorn的gthread worker以多进程、多线程方式运行考试生成服务或渲染服务：
+    python -m exam_generator.serve exam     # 考试生成服务，默认监听server_config.host:port
+    python -m exam_generator.serve render   # 渲染服务，默认监听0.0.0.0:5006
+
+worker进程数、线程数和优雅退出的等待时间来自server_config（WORKERS、THREADS、GRACEFUL_TIMEOUT）。
+收到SIGTERM后worker不再接纳新的工作流（返回503和Retry-After），等待执行中的工作流结束后再退出。
+多个worker之间通过SHARED_STATE_DIR共享任务状态、工作流准入名额、幂等记录和Bedrock并发名额；
+命令行启动时没有设置，多worker的考试生成服务创建一个临时目录并以新的进程重新启动，
+让包导入时创建的全局单例读取到这个目录。
+"""
+import os
+import sys
+import signal
+import argparse
+import logging
+import tempfile
+from .config import server_config
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RENDER_SERVICE_DIR = os.path.join(PROJECT_ROOT, "flask-service")
+
+SERVICES = {
+    # 服务名: (WSGI应用, 默认监听地址, 工作目录)
+    "exam": ("exam_generator.wsgi:app", f"{server_config.host}:{server_config.port}", PROJECT_ROOT),
+    "render": ("wsgi:app", "0.0.0.0:5006", RENDER_SERVICE_DIR),
+}
+
+def post_worker_init(worker):
+    """
+    worker初始化完成后包装SIGTERM处理：先停止接纳新的工作流，再交给gunicorn的优雅退出
+
+    gunicorn的gthread worker收到SIGTERM后会等待已经接收的请求处理完成（最多graceful_timeout秒），
+    这里让准入控制同时拒绝新的工作流，避免在退出期间还开始新的生成。
+
+    Args:
+        worker: gunicorn的worker对象
+    """
+    original_handler = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(signum, frame):
+        try:
+            from .utils.admission import admission_controller
+            admission_controller.begin_drain()
+            worker.log.info(f"worker {worker.pid} 开始排空，不再接纳新的工作流")
+        finally:
+            if callable(original_handler):
+                original_handler(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+def worker_exit(server, worker):
+    """worker退出前等待执行中的工作流结束，最多等待graceful_timeout秒"""
+    from .utils.admission import admission_controller
+    if not admission_controller.wait_idle(timeout=server_config.graceful_timeout):
+        worker.log.warning(f"worker {worker.pid} 退出时仍有未完成的工作流")
+    # 保存最后一次指标快照，已退出worker的计数仍然计入/metrics
+    from .server import metrics_snapshot_dir
+    from .utils.metrics import metrics_registry
+    if metrics_snapshot_dir():
+        try:
+            metrics_registry.write_snapshot(metrics_snapshot_dir())
+        except Exception as e:
+            worker.log.warning(f"保存指标快照失败: {str(e)}")
+
+def build_options(service, bind=None, workers=None, threads=None):
+    """
+    生成gunicorn配置
+
+    Args:
+        service: 服务名，exam或render
+        bind: 监听地址，为None时使用服务的默认地址
+        workers: worker进程数，为None时使用server_config.workers
+        threads: 每个worker的线程数，为None时使用server_config.threads
+
+    Returns:
+        dict: gunicorn配置
+    """
+    _, default_bind, chdir = SERVICES[service]
+    return {
+        "bind": bind or default_bind,
+        "workers": workers or server_config.workers,
+        "threads": threads or server_config.threads,
+        "worker_class": "gthread",
+        # 每个worker各自导入应用，全局单例（调度器、准入控制等）在worker进程内创建
+        "preload_app": False,
+        "chdir": chdir,
+        # 单个请求可能运行到workflow_timeout/batch_timeout，worker心跳超时不能比它短
+        "timeout": int(max(server_config.workflow_timeout, server_config.batch_timeout)) + 30,
+        "graceful_timeout": int(server_config.graceful_timeout),
+        "post_worker_init": post_worker_init,
+        "worker_exit": worker_exit,
+        "accesslog": "-",
+    }
+
+def needs_shared_state(service, workers):
+    """考试生成服务以多个worker运行时需要共享状态目录"""
+    return service == "exam" and workers > 1
+
+def run(service="exam", bind=None, workers=None, threads=None):
+    """
+    使用gunicorn启动服务
+
+    Args:
+        service: 服务名，exam或render
+        bind: 监听地址
+        workers: worker进程数
+        threads: 每个worker的线程数
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit("生产模式需要gunicorn，请先运行: pip install gunicorn")
+
+    app_uri = SERVICES[service][0]
+    options = build_options(service, bind, workers, threads)
+
+    class Application(BaseApplication):
+        """按options配置gunicorn并加载指定的WSGI应用"""
+
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from gunicorn.util import import_app
+            if options["chdir"] not in sys.path:
+                sys.path.insert(0, options["chdir"])
+            return import_app(app_uri)
+
+    if server_config.shared_state_dir:
+        os.makedirs(server_config.shared_state_dir, exist_ok=True)
+    elif needs_shared_state(service, options["workers"]):
+        # 准入控制、幂等记录、任务状态和调度器在导入exam_generator时就已创建，这里再设置目录不会生效
+        sys.exit("多worker的考试生成服务需要设置SHARED_STATE_DIR，否则各worker的准入名额、幂等记录和任务状态互不可见")
+
+    logger.info(f"启动{service}服务: {options['bind']}，{options['workers']}个worker，每个{options['threads']}个线程")
+    Application().run()
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="以生产模式启动考试生成服务或渲染服务")
+    parser.add_argument("service", nargs="?", default="exam", choices=sorted(SERVICES), help="要启动的服务")
+    parser.add_argument("--bind", help="监听地址，例如0.0.0.0:5001")
+    parser.add_argument("--workers", type=int, help="worker进程数")
+    parser.add_argument("--threads", type=int, help="每个worker的线程数")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if not server_config.shared_state_dir and needs_shared_state(args.service, args.workers or server_config.workers):
+        # 全局单例在导入包时读取SHARED_STATE_DIR，设置环境变量后以新的进程重新启动，worker也继承这个目录
+        shared_state_dir = tempfile.mkdtemp(prefix="exam-generator-")
+        os.environ["SHARED_STATE_DIR"] = shared_state_dir
+        logger.warning(f"未设置SHARED_STATE_DIR，本次启动使用临时目录{shared_state_dir}在worker之间共享状态")
+        os.execv(sys.executable, [sys.executable, "-m", "exam_generator.serve"] + sys.argv[1:])
+    run(args.service, args.bind, args.workers, args.threads)
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,24 @@
+import os
+import hmac
+import math
 import logging
 import json
+from functools import wraps
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, send_file
 from flask_cors import CORS
 import boto3
-from .config import server_config, aws_config
-from .utils import setup_logging, task_manager, handle_error, TaskStatus
+from .config import server_config, aws_config, llm_config, exam_config
+from .utils import setup_logging, log_payload, task_manager, handle_error, InvalidRequest, TaskStatus, deadline_scope
+from .utils import schedule_scope, classify_priority, generation_scheduler, PRIORITY_BATCH
+from .utils import admission_controller, AdmissionRejected
+from .utils import idempotency_registry, derive_idempotency_key
+from .utils import metrics_registry
+from .utils import profiler, ProfilingError
+from .utils.profiling import MAX_PROFILE_WORKFLOWS, MAX_TRACEMALLOC_FRAMES, MAX_SNAPSHOT_ENTRIES
+from .utils import setup_tracing, start_server_span, end_otel_span, current_trace_id
 from .agent import generate_exam
+from .batch import run_batch, expand_batch_request
 
 # 初始化Flask应用
 app = Flask(__name__)
@@ -17,15 +29,149 @@ CORS(app)
 setup_logging()
 logger = logging.getLogger(__name__)
 
+# 初始化链路追踪（TRACING_EXPORTERS为空时不创建span）
+setup_tracing()
+
+# 瞬时值指标在采集时从准入控制和调度器读取
+metrics_registry.gauge(
+    "exam_workflows_in_flight", "正在执行的工作流数量",
+    lambda: admission_controller.get_stats()["running"])
+metrics_registry.gauge(
+    "exam_admission_queue_depth", "等待准入的工作流数量",
+    lambda: admission_controller.get_stats()["queue_depth"])
+metrics_registry.gauge(
+    "exam_generation_in_flight", "正在执行的模型调用数量",
+    lambda: generation_scheduler.get_stats()["running"])
+metrics_registry.gauge(
+    "exam_generation_queue_depth", "在公平调度器中排队的模型调用数量",
+    lambda: {priority: stats["queued"] for priority, stats in generation_scheduler.get_stats()["by_priority"].items()},
+    labelnames=["priority"])
+
+def metrics_snapshot_dir():
+    """多进程部署时各worker的指标快照目录，未配置共享状态目录时返回None"""
+    if not server_config.shared_state_dir:
+        return None
+    return os.path.join(server_config.shared_state_dir, "metrics")
+
+if metrics_snapshot_dir():
+    metrics_registry.start_snapshot_writer(metrics_snapshot_dir(), server_config.metrics_snapshot_interval)
+
+# 健康检查和指标采集请求频繁且没有下游调用，不创建追踪
+UNTRACED_PATHS = ("/health", "/metrics")
+
+@app.before_request
+def start_request_trace():
+    """每个请求一个SERVER span，生成考试的阶段、Agent和模型调用span都挂在它下面"""
+    if request.path in UNTRACED_PATHS:
+        return
+    route = request.url_rule.rule if request.url_rule else request.path
+    g.trace_span, g.trace_token = start_server_span(
+        f"{request.method} {route}", request.headers,
+        {"http.method": request.method, "http.route": route}
+    )
+
+@app.after_request
+def add_trace_header(response):
+    """记录响应状态码，并在响应头X-Trace-Id中返回追踪ID，便于在追踪后端中查找"""
+    trace_span = g.get("trace_span")
+    if trace_span is not None:
+        trace_span.set_attribute("http.status_code", response.status_code)
+        if response.headers.get("X-Workflow-Id"):
+            trace_span.set_attribute("exam.workflow_id", response.headers["X-Workflow-Id"])
+        trace_id = current_trace_id()
+        if trace_id:
+            response.headers["X-Trace-Id"] = trace_id
+        if response.status_code >= 500:
+            g.trace_error = f"HTTP {response.status_code}"
+    return response
+
+@app.teardown_request
+def end_request_trace(error=None):
+    """结束请求的SERVER span"""
+    end_otel_span(g.pop("trace_span", None), g.pop("trace_token", None), error or g.pop("trace_error", None))
+
+def admission_rejected_response(error):
+    """
+    构建准入控制拒绝请求时的响应
+    
+    Args:
+        error: AdmissionRejected异常
+        
+    Returns:
+        tuple: (响应对象, 状态码, 响应头)，响应头中包含Retry-After
+    """
+    logger.warning(f"拒绝请求: {str(error)}，建议{error.retry_after}秒后重试")
+    response = {
+        "event": "workflow_rejected",
+        "data": {
+            "outputs": {
+                "body": {"error": str(error), "retry_after": error.retry_after}
+            }
+        }
+    }
+    return jsonify(response), error.status_code, {"Retry-After": str(error.retry_after)}
+
+def invalid_request_response(error):
+    """
+    构建请求参数无效时的响应
+
+    Args:
+        error: InvalidRequest异常
+
+    Returns:
+        tuple: (响应对象, 状态码)
+    """
+    logger.warning(f"请求参数无效: {str(error)}")
+    response = {
+        "event": "workflow_finished",
+        "data": {
+            "outputs": {
+                "body": {"error": str(error)}
+            }
+        }
+    }
+    return jsonify(response), 400
+
+def request_timeout(request_data, limit):
+    """
+    确定请求的时间预算
+
+    Args:
+        request_data: 请求体，可以包含timeout字段（秒）
+        limit: 服务器配置的时间预算上限，没有timeout字段时使用
+
+    Returns:
+        float: 时间预算（秒）
+
+    Raises:
+        InvalidRequest: timeout不是大于0、有限且不超过上限的数字
+    """
+    value = request_data.get('timeout')
+    if value is None:
+        return limit
+    try:
+        if isinstance(value, bool):
+            raise TypeError(value)
+        timeout = float(value)
+    except (TypeError, ValueError):
+        timeout = None
+    if timeout is None or not math.isfinite(timeout) or not 0 < timeout <= limit:
+        raise InvalidRequest(f"timeout必须是大于0且不超过{limit:g}的秒数")
+    return timeout
+
 @app.route('/workflows/run', methods=['POST'])
 def run_workflow():
-    """处理考试生成请求"""
-    workflow_id = None
+    """处理考试生成请求
+    
+    请求头Idempotency-Key（或请求体中的idempotency_key）作为幂等键，没有提供时使用
+    租户和inputs的规范化哈希。相同幂等键的请求正在执行时，重复提交等待并共享其结果；
+    成功的结果在IDEMPOTENCY_TTL秒内直接返回，不会重复生成。
+    """
     try:
         # 获取请求数据
         logger.info("开始处理考试生成请求")
         exam_request = request.json
-        logger.info(f"收到考试生成请求: {json.dumps(exam_request, ensure_ascii=False)}")
+        log_payload(logger, "收到考试生成请求", exam_request)
         
         # 验证请求参数
         if not exam_request or not isinstance(exam_request, dict):
@@ -38,60 +184,128 @@ def run_workflow():
             logger.error("缺少inputs参数")
             return handle_error(ValueError("缺少inputs参数"))
         
-        logger.info(f"解析的输入参数: {json.dumps(inputs, ensure_ascii=False)}")
+        log_payload(logger, "解析的输入参数", inputs)
+        timeout = request_timeout(exam_request, server_config.workflow_timeout)
+        
+        tenant = request.headers.get('X-Tenant-Id') or exam_request.get('tenant') or request.remote_addr
+        idempotency_key = (
+            request.headers.get('Idempotency-Key')
+            or exam_request.get('idempotency_key')
+            or derive_idempotency_key(inputs, tenant)
+        )
+        entry, is_owner = idempotency_registry.begin(idempotency_key)
+    except InvalidRequest as e:
+        return invalid_request_response(e)
+    except Exception as e:
+        logger.error(f"处理考试生成请求失败: {str(e)}", exc_info=True)
+        return handle_error(e)
+    
+    if not is_owner:
+        # 重复提交：等待已有的请求完成，返回相同的结果
+        logger.info(f"重复的考试生成请求，复用已有请求的结果: {idempotency_key} (工作流: {entry.workflow_id})")
+        result = idempotency_registry.wait(entry, timeout=timeout)
+        if result is None:
+            return handle_error(TimeoutError("等待相同请求的结果超时"))
+        body, status = result
+        headers = {"Idempotency-Key": idempotency_key, "Idempotent-Replayed": "true"}
+        if entry.workflow_id:
+            headers["X-Workflow-Id"] = entry.workflow_id
+        return jsonify(body), status, headers
+    
+    response = app.make_response(execute_workflow(exam_request, inputs, tenant, idempotency_key, timeout))
+    if response.status_code == 200:
+        idempotency_registry.complete(entry, response.get_json(), response.status_code)
+    else:
+        idempotency_registry.fail(entry, response.get_json(), response.status_code)
+    response.headers["Idempotency-Key"] = idempotency_key
+    if entry.workflow_id:
+        response.headers["X-Workflow-Id"] = entry.workflow_id
+    return response
+
+def execute_workflow(exam_request, inputs, tenant, idempotency_key, timeout):
+    """
+    执行一次考试生成工作流
+    
+    Args:
+        exam_request: 考试请求数据
+        inputs: 已验证的inputs参数
+        tenant: 调度使用的租户标识
+        idempotency_key: 请求的幂等键
+        timeout: 已验证的时间预算（秒）
+        
+    Returns:
+        Flask响应
+    """
+    workflow_id = None
+    try:
+        # 准入控制：超出并发上限的请求排队等待，队列已满时立即拒绝
+        with admission_controller.admit(timeout=timeout) as admission:
+            # 排队时间计入请求的时间预算
+            timeout = max(1, timeout - (admission.admitted_at - admission.enqueued_at))
+            
+            # 创建工作流记录
+            workflow_id = task_manager.start_workflow("考试生成", input_data=exam_request)
+            idempotency_registry.set_workflow(idempotency_key, workflow_id)
+            logger.info(f"创建工作流: {workflow_id}")
         
-        # 创建工作流记录
-        workflow_id = task_manager.start_workflow("考试生成", input_data=exam_request)
-        logger.info(f"创建工作流: {workflow_id}")
+            # 设置AWS凭证
+            logger.info("设置AWS凭证")
+            try:
+                aws_config.setup_credentials()
+                logger.info("AWS凭证设置成功")
+            except Exception as aws_error:
+                logger.error(f"AWS凭证设置失败: {str(aws_error)}")
+                raise aws_error
         
-        # 设置AWS凭证
-        logger.info("设置AWS凭证")
-        try:
-            aws_config.setup_credentials()
-            logger.info("AWS凭证设置成功")
-        except Exception as aws_error:
-            logger.error(f"AWS凭证设置失败: {str(aws_error)}")
-            raise aws_error
-        
-        # 生成考试内容
-        logger.info("开始生成考试内容")
-        result = generate_exam(exam_request, workflow_id)
-        logger.info(f"考试生成结果: {json.dumps(result, ensure_ascii=False, default=str)}")
-        
-        # 从渲染结果中获取URL
-        render_result = result.get("render_result", {})
-        message = render_result.get("message", "")
-        logger.info(f"渲染结果消息: {message}")
-        
-        # 完成工作流之前，检查是否有未完成的工具调用
-        if workflow_id in task_manager.tasks:
-            for step in task_manager.tasks[workflow_id]["steps"]:
-                for tool_call in step["tool_calls"]:
-                    if tool_call["status"] == TaskStatus.RUNNING:
-                        # 自动标记为完成
-                        task_manager.complete_tool_call(
-                            workflow_id=workflow_id,
-                            step_id=step["id"],
-                            tool_call_id=tool_call["id"],
-                            output_data="自动标记为完成"
-                        )
-                        logger.info(f"自动标记最后的工具调用完成: {tool_call['tool_name']}")
-        
-        # 完成工作流
-        task_manager.complete_workflow(workflow_id, output_data=result)
-        
-        # 构建响应
-        response = {
-            "event": "workflow_finished",
-            "data": {
-                "outputs": {
-                    "body": json.dumps({"message": message})
+            # 确定调度的优先级：小考试按交互式优先级调度，大考试在后台按批量优先级推进，客户端只能主动降级
+            priority = classify_priority(
+                inputs.get('count', exam_config.default_question_count),
+                explicit=exam_request.get('priority'),
+                interactive_max_questions=exam_config.interactive_max_questions
+            )
+        
+            # 生成考试内容，截止时间会传递到Agent、模型调用、参考资料获取和渲染
+            logger.info(f"开始生成考试内容，时间预算: {timeout}秒，租户: {tenant}，优先级: {priority}")
+            with deadline_scope(timeout), schedule_scope(tenant, priority), profiler.workflow_scope():
+                result = generate_exam(exam_request, workflow_id)
+            log_payload(logger, "考试生成结果", result)
+        
+            # 从渲染结果中获取URL
+            render_result = result.get("render_result", {})
+            message = render_result.get("message", "")
+            logger.info(f"渲染结果消息: {message}")
+        
+            # 完成工作流之前，检查是否有未完成的工具调用
+            if workflow_id in task_manager.tasks:
+                for step in task_manager.tasks[workflow_id]["steps"]:
+                    for tool_call in step["tool_calls"]:
+                        if tool_call["status"] == TaskStatus.RUNNING:
+                            # 自动标记为完成
+                            task_manager.complete_tool_call(
+                                workflow_id=workflow_id,
+                                step_id=step["id"],
+                                tool_call_id=tool_call["id"],
+                                output_data="自动标记为完成"
+                            )
+                            logger.info(f"自动标记最后的工具调用完成: {tool_call['tool_name']}")
+        
+            # 完成工作流
+            task_manager.complete_workflow(workflow_id, output_data=result)
+        
+            # 构建响应
+            response = {
+                "event": "workflow_finished",
+                "data": {
+                    "outputs": {
+                        "body": json.dumps({"message": message})
+                    }
                 }
             }
-        }
         
-        logger.info(f"考试生成完成: {workflow_id}, 响应: {json.dumps(response, ensure_ascii=False)}")
-        return jsonify(response)
+            logger.info("考试生成完成: %s, 渲染结果: %s", workflow_id, message)
+            return jsonify(response)
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
     except Exception as e:
         logger.error(f"考试生成失败: {str(e)}", exc_info=True)
         logger.error(f"错误类型: {type(e).__name__}")
@@ -103,6 +317,40 @@ def run_workflow():
                 logger.error(f"标记工作流失败时出错: {str(task_error)}")
         return handle_error(e, workflow_id, task_manager=task_manager)
 
+@app.route('/workflows/batch', methods=['POST'])
+def run_batch_workflow():
+    """处理批量考试生成请求"""
+    workflow_id = None
+    try:
+        batch_request = request.json
+        # 在占用准入名额和创建工作流之前校验请求，格式错误直接返回400
+        exams = expand_batch_request(batch_request)
+        
+        timeout = request_timeout(batch_request, server_config.batch_timeout)
+        tenant = request.headers.get('X-Tenant-Id') or batch_request.get('tenant') or request.remote_addr
+        
+        # 批量请求作为一个工作流参与准入控制
+        with admission_controller.admit(timeout=timeout) as admission:
+            timeout = max(1, timeout - (admission.admitted_at - admission.enqueued_at))
+            workflow_id = task_manager.start_workflow("批量考试生成", input_data=batch_request)
+            logger.info(f"创建批量工作流: {workflow_id}")
+            aws_config.setup_credentials()
+            
+            # 批量请求总是按批量优先级调度，不影响其他教师的交互式请求
+            with deadline_scope(timeout), schedule_scope(tenant, PRIORITY_BATCH), profiler.workflow_scope():
+                result = run_batch(batch_request, workflow_id, exams)
+        
+        task_manager.complete_workflow(workflow_id, output_data=result["statistics"])
+        logger.info(f"批量考试生成完成: {workflow_id}, 统计: {json.dumps(result['statistics'], ensure_ascii=False)}, 耗时: {result['timings']}")
+        return jsonify({"event": "batch_finished", "data": result})
+    except InvalidRequest as e:
+        return invalid_request_response(e)
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+    except Exception as e:
+        logger.error(f"批量考试生成失败: {str(e)}", exc_info=True)
+        return handle_error(e, workflow_id, task_manager=task_manager)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查端点"""
@@ -119,25 +367,140 @@ def health_check():
             "aws_config": {
                 "region": llm_config.region_name,
                 "model_id": llm_config.model_id
-            }
+            },
+            "scheduler": generation_scheduler.get_stats(),
+            "admission": admission_controller.get_stats(),
+            "idempotency": idempotency_registry.get_stats()
         }
-        logger.info(f"健康检查通过: {health_info}")
+        logger.debug("健康检查通过: %s", health_info)
         return jsonify(health_info)
     except Exception as e:
         logger.error(f"健康检查失败: {str(e)}", exc_info=True)
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus格式的指标，多进程部署时合并所有worker的快照"""
+    return Response(metrics_registry.render(metrics_snapshot_dir()), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
 @app.route('/evaluation/report', methods=['GET'])
 def get_evaluation_report():
     """获取评估报告"""
     try:
         workflow_id = request.args.get('workflow_id')
         report = task_manager.generate_evaluation_report(workflow_id)
-        return jsonify({"status": "success", "report": report})
+        response = {"status": "success", "report": report}
+        if not workflow_id:
+            # 汇总所有工作流的token用量和估算费用
+            response["token_summary"] = task_manager.generate_token_summary()
+        return jsonify(response)
     except Exception as e:
         logger.error(f"获取评估报告失败: {str(e)}", exc_info=True)
         return jsonify({"status": "error", "message": str(e)}), 500
 
+def admin_required(view):
+    """管理接口默认关闭（返回404）；配置了ADMIN_TOKEN时校验X-Admin-Token请求头"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not server_config.admin_enabled:
+            return jsonify({"status": "error", "message": "Not Found"}), 404
+        if server_config.admin_token and not hmac.compare_digest(
+            request.headers.get('X-Admin-Token', ''), server_config.admin_token
+        ):
+            return jsonify({"status": "error", "message": "管理令牌无效"}), 403
+        try:
+            return view(*args, **kwargs)
+        except ProfilingError as e:
+            return jsonify({"status": "error", "message": str(e)}), e.status_code
+    return wrapper
+
+def int_option(options, name, default, minimum, maximum):
+    """
+    读取管理接口的整数参数
+
+    Args:
+        options: 请求体
+        name: 参数名
+        default: 没有提供时的默认值
+        minimum: 最小值
+        maximum: 最大值
+
+    Raises:
+        ProfilingError: 参数不是整数或超出范围，返回400
+    """
+    value = options.get(name)
+    if value is None:
+        return default
+    try:
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError(value)
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ProfilingError(f"{name}必须是整数")
+    if not minimum <= value <= maximum:
+        raise ProfilingError(f"{name}必须在{minimum}到{maximum}之间")
+    return value
+
+@app.route('/admin/profile', methods=['POST'])
+@admin_required
+def start_profile():
+    """开始性能分析
+
+    请求体: {"profiler": "cprofile"或"sampling", "seconds": 分析秒数, "workflows": 分析的工作流数量, "interval": 采样间隔}
+    """
+    options = request.get_json(silent=True) or {}
+    try:
+        seconds = float(options['seconds']) if options.get('seconds') is not None else None
+        interval = float(options.get('interval', 0.01))
+    except (TypeError, ValueError):
+        raise ProfilingError("seconds和interval必须是数字")
+    # seconds和interval的范围（有限、大于0）由profiler.start校验
+    workflows = int_option(options, 'workflows', None, 1, MAX_PROFILE_WORKFLOWS)
+    session = profiler.start(options.get('profiler', 'cprofile'), seconds=seconds, workflows=workflows, interval=interval)
+    return jsonify({"status": "success", "profile": session.to_dict()}), 202
+
+@app.route('/admin/profile', methods=['GET'])
+@admin_required
+def get_profile():
+    """查看最近一次（或query参数id指定的）性能分析的状态"""
+    session = profiler.get_session(request.args.get('id'))
+    if session is None:
+        raise ProfilingError("没有性能分析", status_code=404)
+    return jsonify({"status": "success", "profile": session.to_dict()})
+
+@app.route('/admin/profile/stop', methods=['POST'])
+@admin_required
+def stop_profile():
+    """提前结束当前的性能分析，正在执行的工作流结束后写出结果"""
+    session = profiler.stop()
+    if session is None:
+        raise ProfilingError("没有进行中的性能分析", status_code=404)
+    return jsonify({"status": "success", "profile": session.to_dict()})
+
+@app.route('/admin/profile/<profile_id>/download', methods=['GET'])
+@admin_required
+def download_profile(profile_id):
+    """下载性能分析结果：cProfile为pstats文件，采样分析为折叠栈文本"""
+    path = profiler.result_path(profile_id)
+    mimetype = "text/plain" if path.endswith(".collapsed") else "application/octet-stream"
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=os.path.basename(path))
+
+@app.route('/admin/tracemalloc/<action>', methods=['POST'])
+@admin_required
+def tracemalloc_action(action):
+    """内存分配跟踪：start开始跟踪，snapshot返回与上一次快照相比增长最多的分配位置，stop停止跟踪"""
+    options = request.get_json(silent=True) or {}
+    if action == 'start':
+        result = profiler.tracemalloc_start(int_option(options, 'frames', 1, 1, MAX_TRACEMALLOC_FRAMES))
+    elif action == 'snapshot':
+        limit = int_option(options, 'limit', 20, 0, MAX_SNAPSHOT_ENTRIES)
+        result = profiler.tracemalloc_snapshot(limit, options.get('key_type', 'lineno'))
+    elif action == 'stop':
+        result = profiler.tracemalloc_stop()
+    else:
+        raise ProfilingError(f"未知的操作: {action}", status_code=404)
+    return jsonify({"status": "success", "pid": os.getpid(), "tracemalloc": result})
+
 def run_server():
     """启动服务器"""
     logger.info(f"启动服务器: {server_config.host}:{server_config.port}")
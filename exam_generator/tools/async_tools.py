@@ -0,0 +1,389 @@
+"""
+异步（asyncio）题目生成引擎
+
+与基于线程的exam_tools并列：模型调用、参考资料获取和渲染都是等待网络的I/O，
+在一个事件循环中用协程并发执行，单个进程可以同时保持数百个模型调用而不需要同等数量的线程。
+模型调用同样经过generation_scheduler公平排队，并记录token用量和遵守请求截止时间。
+"""
+import asyncio
+import json
+import time
+import logging
+import weakref
+from urllib.parse import quote
+import boto3
+import httpx
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from ..config import llm_config, aws_config, server_config, exam_config
+from ..utils.deadline_utils import get_deadline, cap_timeout, check_deadline, DeadlineExceeded
+from ..utils.usage_utils import record_usage
+from ..utils.scheduler import generation_scheduler
+from ..utils.span_utils import span
+from ..utils.tracing import inject_trace_headers
+from ..utils.metrics import bedrock_retries
+from .content_tools import standardize_question_format
+from .exam_tools import (
+    build_request_body,
+    build_question_system_prompt,
+    build_question_prompt,
+    fallback_question,
+    is_throttling_error,
+    observe_bedrock_call,
+    question_cache,
+    resolve_reference,
+    finish_question,
+    _return_content
+)
+from .reference_tools import is_url, reference_result, fetch_cache, ReferenceDownload, _deadline_fallback
+from .render_tools import prepare_render_content
+
+QUESTION_SOURCES = {
+    'singleChoice': 'generate_single_choice_question',
+    'multipleChoice': 'generate_multiple_choice_question',
+    'fillBlank': 'generate_fill_blank_question'
+}
+
+class BedrockHTTPError(Exception):
+    """bedrock-runtime返回的错误响应"""
+
+    def __init__(self, status_code, error_type, message):
+        """
+        初始化异常
+
+        Args:
+            status_code: HTTP状态码
+            error_type: 错误类型，例如ThrottlingException
+            message: 错误信息
+        """
+        # 与botocore的ClientError保持相同的格式，重试逻辑可以用同样的方式识别限流
+        super().__init__(f"An error occurred ({error_type}) when calling the InvokeModel operation: {message}")
+        self.status_code = status_code
+        self.error_type = error_type
+
+class AsyncBedrockClient:
+    """基于httpx的异步bedrock-runtime客户端
+
+    请求使用SigV4签名，同一客户端的所有调用共享连接。httpcore的连接池在连接数很多时
+    分配请求的开销随连接数平方增长，所以把连接分到多个较小的池中，按请求轮流使用。
+    httpx.AsyncClient绑定创建它的事件循环，每个事件循环使用各自的客户端（见get_async_bedrock_client）。
+    """
+
+    CONNECTIONS_PER_SHARD = 16
+
+    def __init__(self, region_name=None, endpoint_url=None, max_connections=None):
+        """
+        初始化客户端
+
+        Args:
+            region_name: AWS区域，默认使用llm_config.region_name
+            endpoint_url: 服务地址，默认使用llm_config.endpoint_url或区域的默认地址
+            max_connections: 连接池大小，默认使用llm_config.async_max_connections
+        """
+        self.region_name = region_name or llm_config.region_name
+        self.endpoint_url = (
+            endpoint_url or llm_config.endpoint_url or f"https://bedrock-runtime.{self.region_name}.amazonaws.com"
+        ).rstrip("/")
+        max_connections = max_connections or llm_config.async_max_connections
+        self._credentials = boto3.Session(
+            aws_access_key_id=aws_config.access_key or None,
+            aws_secret_access_key=aws_config.secret_key or None,
+            region_name=self.region_name
+        ).get_credentials()
+        shards = max(1, -(-max_connections // self.CONNECTIONS_PER_SHARD))
+        per_shard = -(-max_connections // shards)
+        self._clients = [
+            httpx.AsyncClient(limits=httpx.Limits(max_connections=per_shard, max_keepalive_connections=per_shard))
+            for _ in range(shards)
+        ]
+        self._next = 0
+
+    def _signed_headers(self, url, body):
+        """生成带SigV4签名的请求头，没有凭证时（例如本地模拟服务）不签名"""
+        request = AWSRequest(
+            method="POST",
+            url=url,
+            data=body,
+            headers={"Content-Type": "application/json", "Accept": "application/json"}
+        )
+        if self._credentials is not None:
+            SigV4Auth(self._credentials.get_frozen_credentials(), "bedrock", self.region_name).add_auth(request)
+        return dict(request.headers.items())
+
+    async def invoke_model(self, model_id, body, read_timeout=None):
+        """
+        调用InvokeModel
+
+        Args:
+            model_id: 模型ID
+            body: 请求体（字节）
+            read_timeout: 读取超时（秒），默认使用llm_config.read_timeout
+
+        Returns:
+            dict: 解析后的响应体
+
+        Raises:
+            BedrockHTTPError: 服务返回错误状态码
+        """
+        url = f"{self.endpoint_url}/model/{quote(model_id, safe='')}/invoke"
+        timeout = httpx.Timeout(read_timeout or llm_config.read_timeout, connect=10)
+        client = self._clients[self._next]
+        self._next = (self._next + 1) % len(self._clients)
+        response = await client.post(url, content=body, headers=self._signed_headers(url, body), timeout=timeout)
+        if response.status_code >= 400:
+            error_type = response.headers.get("x-amzn-ErrorType", "").split(":")[0]
+            try:
+                payload = response.json()
+                message = payload.get("message") or payload.get("Message") or response.text
+            except ValueError:
+                message = response.text
+            if not error_type:
+                error_type = "ThrottlingException" if response.status_code == 429 else f"HTTP{response.status_code}"
+            raise BedrockHTTPError(response.status_code, error_type, message)
+        return response.json()
+
+    async def aclose(self):
+        """关闭连接池"""
+        for client in self._clients:
+            await client.aclose()
+
+# 事件循环 -> 该循环使用的客户端，事件循环结束后自动释放
+_clients = weakref.WeakKeyDictionary()
+
+def get_async_bedrock_client():
+    """获取当前事件循环共享的异步Bedrock客户端"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = AsyncBedrockClient()
+        _clients[loop] = client
+    return client
+
+async def call_claude_async(prompt, max_tokens=1000, temperature=0.7, max_retries=3, initial_retry_delay=2, source="call_claude", system=None, client=None):
+    """
+    call_claude的异步版本，带有指数退避重试策略
+
+    排队、重试等待和网络I/O期间都不占用线程。截止时间、token用量和公平调度的处理与call_claude相同。
+
+    Args:
+        prompt: 提示词
+        max_tokens: 最大生成token数
+        temperature: 温度参数，控制随机性
+        max_retries: 最大重试次数
+        initial_retry_delay: 初始重试延迟（秒）
+        source: 调用来源，用于token用量统计
+        system: 系统提示词（可选），模型支持时会标记为可缓存的前缀
+        client: AsyncBedrockClient（可选），默认使用当前事件循环共享的客户端
+
+    Returns:
+        str: 生成的内容
+    """
+    deadline = get_deadline()
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded("调用Claude前请求时间预算已耗尽")
+
+    client = client or get_async_bedrock_client()
+    body = json.dumps(build_request_body(prompt, max_tokens, temperature, system)).encode("utf-8")
+
+    for attempt in range(max_retries):
+        try:
+            async with generation_scheduler.slot_async():
+                with span("model.invoke", source=source, attempt=attempt + 1):
+                    started = time.perf_counter()
+                    try:
+                        response_body = await client.invoke_model(
+                            llm_config.model_id,
+                            body,
+                            read_timeout=cap_timeout(llm_config.read_timeout, minimum=1)
+                        )
+                    except Exception as e:
+                        observe_bedrock_call(source, started, e)
+                        raise
+                    observe_bedrock_call(source, started)
+            record_usage(source, response_body.get('usage'))
+            return response_body['content'][0]['text']
+        except (DeadlineExceeded, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            retry_delay = initial_retry_delay * (2 ** attempt) if is_throttling_error(e) else initial_retry_delay
+            if attempt >= max_retries - 1:
+                logging.error(f"调用Claude失败，已达到最大重试次数: {str(e)}")
+                raise
+            if deadline is not None and not deadline.allows(retry_delay):
+                logging.warning(f"调用Claude失败，剩余时间不足以等待{retry_delay}秒，放弃重试: {str(e)}")
+                raise DeadlineExceeded(f"调用Claude失败且请求时间预算不足: {str(e)}")
+            logging.warning(f"调用Claude失败，等待{retry_delay}秒后重试 ({attempt+1}/{max_retries}): {str(e)}")
+            bedrock_retries.inc(source=source)
+            with span("model.backoff", source=source):
+                await asyncio.sleep(retry_delay)
+
+async def generate_question_async(question_type, topic, difficulty, reference=None, client=None):
+    """
+    异步生成一道题目，行为与对应的题目生成工具相同（缓存、格式标准化、保存到题目存储、失败时返回备用题目）
+
+    Args:
+        question_type: 题目类型，singleChoice、multipleChoice或fillBlank
+        topic: 题目主题
+        difficulty: 难度级别
+        reference: 参考资料或参考资料ID（可选）
+        client: AsyncBedrockClient（可选）
+
+    Returns:
+        str: 题目的Markdown内容
+    """
+    # 每个任务有自己的上下文副本，这里的设置不影响调用方
+    _return_content.set(True)
+    logging.info(f"异步生成{question_type}，主题: {topic}, 难度: {difficulty}")
+    reference = resolve_reference(reference)
+
+    # 缓存是小文件读写，放到线程中执行，避免阻塞事件循环
+    cached_question = await asyncio.to_thread(question_cache.get, topic, difficulty, question_type, reference)
+    if cached_question:
+        return finish_question(question_type, topic, difficulty, cached_question)
+
+    try:
+        question = await call_claude_async(
+            build_question_prompt(question_type, topic, difficulty),
+            max_tokens=llm_config.max_tokens,
+            temperature=llm_config.temperature,
+            system=build_question_system_prompt(reference),
+            source=QUESTION_SOURCES[question_type],
+            client=client
+        )
+        question = standardize_question_format(question_type, question)
+        await asyncio.to_thread(question_cache.set, topic, difficulty, question_type, question, reference)
+        return finish_question(question_type, topic, difficulty, question)
+    except Exception as e:
+        logging.error(f"异步生成{question_type}失败: {str(e)}")
+        return finish_question(question_type, topic, difficulty, fallback_question(question_type, topic, difficulty), fallback=True)
+
+async def generate_questions_parallel_async(question_specs, client=None):
+    """
+    generate_questions_parallel的异步版本，所有题目同时发起，并发数量由generation_scheduler控制
+
+    Args:
+        question_specs: 题目规格列表，每个元素是一个字典，包含type, topic, difficulty等
+        client: AsyncBedrockClient（可选）
+
+    Returns:
+        list: 生成的题目列表，顺序与question_specs一致
+    """
+    results = await asyncio.gather(
+        *(generate_question_async(spec['type'], spec['topic'], spec['difficulty'], spec.get('reference'), client)
+          for spec in question_specs),
+        return_exceptions=True
+    )
+    questions = []
+    for spec, result in zip(question_specs, results):
+        if isinstance(result, BaseException):
+            logging.error(f"生成题目失败: {str(result)}")
+            result = fallback_question(spec['type'], spec['topic'], spec['difficulty'])
+        questions.append(result)
+    return questions
+
+async def fetch_url_content_async(url, http_client=None):
+    """
+    fetch_url_content的异步版本，与同步版本共享获取缓存
+
+    Args:
+        url: 需要获取内容的URL
+        http_client: httpx.AsyncClient（可选），默认为本次调用创建一个
+
+    Returns:
+        str: 提取的文本内容；内容较长时可能返回参考资料ID
+    """
+    check_deadline("获取URL内容")
+    try:
+        text, headers, entry = await asyncio.to_thread(fetch_cache.lookup, url)
+        if text is None:
+            text = await _fetch_reference_text_async(url, headers, entry, http_client)
+        return reference_result(text)
+    except Exception as e:
+        logging.error(f"获取URL内容失败: {str(e)}")
+        raise Exception(f"获取URL内容失败: {str(e)}")
+
+async def _fetch_reference_text_async(url, headers, entry, http_client=None):
+    """缓存未命中或需要重新验证时获取URL，参数为fetch_cache.lookup的结果"""
+    if http_client is None:
+        async with httpx.AsyncClient(follow_redirects=True) as client:
+            return await _fetch_reference_text_async(url, headers, entry, client)
+    download = None
+    with span("reference.fetch", revalidate=entry is not None) as current:
+        try:
+            async with http_client.stream("GET", url, headers=headers, timeout=cap_timeout(10, minimum=1)) as response:
+                if response.status_code == 304 and entry is not None:
+                    return await asyncio.to_thread(fetch_cache.revalidated, url, entry, response.headers)
+                response.raise_for_status()
+                # 边下载边提取，文本足够或达到字节上限后关闭连接；解析HTML是CPU密集的操作，放到线程中执行。
+                # 每读一块都检查请求的时间预算
+                download = ReferenceDownload(url, response.headers.get("Content-Type"))
+                async for chunk in response.aiter_bytes(exam_config.fetch_chunk_size):
+                    check_deadline("下载参考资料")
+                    if await asyncio.to_thread(download.feed, chunk):
+                        break
+                text = await asyncio.to_thread(download.finish)
+        except DeadlineExceeded as e:
+            return await asyncio.to_thread(_deadline_fallback, url, entry, download, e)
+        except httpx.HTTPError as e:
+            if entry is None:
+                raise
+            logging.warning(f"重新验证参考资料失败，使用缓存的内容: {url}, {str(e)}")
+            return entry["text"]
+        if current is not None:
+            current.set_attribute("bytes", download.bytes_read)
+    await asyncio.to_thread(fetch_cache.store, url, text, response.headers, entry)
+    return text
+
+async def process_reference_async(reference, http_client=None):
+    """
+    process_reference的异步版本
+
+    Args:
+        reference: 参考资料文本或URL
+        http_client: httpx.AsyncClient（可选）
+
+    Returns:
+        str: 处理后的参考资料内容
+    """
+    if not reference or not reference.strip():
+        return ""
+    if is_url(reference):
+        try:
+            return await fetch_url_content_async(reference, http_client)
+        except Exception as e:
+            logging.warning(f"URL处理失败，将使用原始文本: {str(e)}")
+            return reference
+    return reference_result(reference)
+
+async def send_to_flask_service_async(markdown_content, http_client=None):
+    """
+    send_to_flask_service的异步版本
+
+    Args:
+        markdown_content: Markdown格式的考试内容
+        http_client: httpx.AsyncClient（可选）
+
+    Returns:
+        dict: 渲染服务的响应，包含生成的HTML页面URL
+    """
+    content = prepare_render_content(markdown_content)
+    # 渲染是最后一步，预算耗尽时仍保留最短2秒，避免丢弃已生成的题目
+    timeout = cap_timeout(10, minimum=2)
+    try:
+        with span("render"):
+            headers = inject_trace_headers({"Content-Type": "text/plain; charset=utf-8"})
+            if http_client is None:
+                async with httpx.AsyncClient() as client:
+                    response = await client.post(server_config.flask_service_url, content=content.encode('utf-8'), headers=headers, timeout=timeout)
+            else:
+                response = await http_client.post(server_config.flask_service_url, content=content.encode('utf-8'), headers=headers, timeout=timeout)
+            response.raise_for_status()
+        result = response.json()
+        logging.info(f"渲染服务响应: {result}")
+        return result
+    except httpx.HTTPError as e:
+        logging.error(f"调用渲染服务失败: {str(e)}")
+        raise Exception(f"调用渲染服务失败: {str(e)}")
+    except ValueError as e:
+        logging.error(f"解析渲染服务响应失败: {str(e)}")
+        raise Exception(f"解析渲染服务响应失败: {str(e)}")
@@ -3,40 +3,215 @@ import boto3
 import json
 import time
 import concurrent.futures
+import contextvars
+import threading
 import os
 import pickle
 import hashlib
 import re
 from datetime import datetime, timedelta
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from strands import tool
-from ..config import llm_config, aws_config
+from ..config import llm_config, aws_config, exam_config
+from ..utils.deadline_utils import get_deadline, cap_timeout, DeadlineExceeded
+from ..utils.usage_utils import record_usage
+from ..utils.context_utils import get_workflow_context, get_current_tool_use
+from ..utils.span_utils import span
+from ..utils.metrics import (
+    bedrock_call_duration, bedrock_throttles, bedrock_retries, cache_requests, cache_evictions
+)
+from ..utils.question_store import question_store
+from ..utils.scheduler import generation_scheduler
 from .content_tools import standardize_question_format
 
-def get_bedrock_client():
-    """获取Bedrock客户端"""
+def get_bedrock_client(read_timeout=None):
+    """
+    获取Bedrock客户端
+    
+    Args:
+        read_timeout: 读取超时（秒），默认使用llm_config.read_timeout
+    """
+    if read_timeout is None:
+        read_timeout = llm_config.read_timeout
     return boto3.client(
         service_name='bedrock-runtime',
         region_name=llm_config.region_name,
+        endpoint_url=llm_config.endpoint_url or None,
         aws_access_key_id=aws_config.access_key,
-        aws_secret_access_key=aws_config.secret_key
+        aws_secret_access_key=aws_config.secret_key,
+        config=Config(read_timeout=read_timeout)
     )
 
-def call_claude(prompt, max_tokens=1000, temperature=0.7, max_retries=3, initial_retry_delay=2):
+# 题目生成共享的系统提示词。对同一份参考资料，各题型、各主题的请求前缀完全相同，
+# 可以命中Bedrock的提示词缓存
+QUESTION_SYSTEM_PROMPT = """你是一个专业的考试题目生成助手，根据用户指定的题型、主题和难度生成一道题目。
+
+通用要求：
+1. 题目应该清晰、准确，没有歧义
+2. 选项或答案应该合理，不要有明显错误或不相关的内容
+3. 严格使用用户给出的Markdown格式，不要添加任何额外的标题、编号或解释"""
+
+def build_question_system_prompt(reference=None):
     """
-    调用Claude模型生成内容，带有指数退避重试策略
+    构建题目生成的系统提示词
+    
+    Args:
+        reference: 参考资料（可选）
+        
+    Returns:
+        str: 系统提示词，相同参考资料得到完全相同的结果
+    """
+    if not reference:
+        return QUESTION_SYSTEM_PROMPT
+    return f"{QUESTION_SYSTEM_PROMPT}\n\n参考以下资料生成题目：\n{reference}"
+
+# 各题型的提示词模板，format时传入topic和difficulty
+QUESTION_PROMPT_TEMPLATES = {
+    "singleChoice": """请生成一道关于"{topic}"的单选题，难度级别为"{difficulty}"。
+
+题目要求：
+1. 题目应该清晰、准确，没有歧义
+2. 提供4个选项，其中只有1个正确答案
+3. 选项应该合理，不要有明显错误或不相关的选项
+4. 难度应该符合"{difficulty}"级别
+
+请严格使用以下格式：
+
+## 单选题
+
+[题目描述]
+
+- (x) [正确选项]
+- ( ) [错误选项1]
+- ( ) [错误选项2]
+- ( ) [错误选项3]
+
+不要添加任何额外的标题、编号或解释。不要添加"单选题1"这样的编号，就是"## 单选题"。
+""",
+    "multipleChoice": """请生成一道关于"{topic}"的多选题，难度级别为"{difficulty}"。
+
+题目要求：
+1. 题目应该清晰、准确，没有歧义
+2. 提供4-6个选项，其中2-4个是正确答案
+3. 选项应该合理，不要有明显错误或不相关的选项
+4. 难度应该符合"{difficulty}"级别
+
+请严格使用以下格式：
+
+## 多选题
+
+[题目描述]
+
+- [x] [正确选项1]
+- [ ] [错误选项1]
+- [x] [正确选项2]
+- [ ] [错误选项2]
+
+不要添加任何额外的标题、编号或解释。不要添加"多选题1"这样的编号，就是"## 多选题"。
+""",
+    "fillBlank": """请生成一道关于"{topic}"的填空题，难度级别为"{difficulty}"。
+
+题目要求：
+1. 题目应该清晰、准确，没有歧义
+2. 使用下划线（______）表示需要填写的空白处
+3. 提供正确答案
+4. 难度应该符合"{difficulty}"级别
+
+请严格使用以下格式：
+
+## 填空题
+
+[题目描述，包含______需要填写的部分]
+
+- R:= [正确答案]
+
+不要添加任何额外的标题、编号或解释。不要添加"填空题1"这样的编号，就是"## 填空题"。
+"""
+}
+
+# 生成失败时使用的备用题目模板，重试时会被重新生成
+FALLBACK_QUESTION_TEMPLATES = {
+    "singleChoice": """## 单选题
+
+关于{topic}的问题，难度为{difficulty}。
+
+- (x) 正确选项
+- ( ) 错误选项1
+- ( ) 错误选项2
+- ( ) 错误选项3
+""",
+    "multipleChoice": """## 多选题
+
+关于{topic}的问题，难度为{difficulty}。
+
+- [x] 正确选项1
+- [ ] 错误选项1
+- [x] 正确选项2
+- [ ] 错误选项2
+""",
+    "fillBlank": """## 填空题
+
+关于{topic}的问题，难度为{difficulty}。______
+
+- R:= 正确答案
+"""
+}
+
+def build_question_prompt(question_type, topic, difficulty):
+    """
+    构建题目生成的提示词
+    
+    Args:
+        question_type: 题目类型
+        topic: 题目主题
+        difficulty: 难度级别
+        
+    Returns:
+        str: 提示词
+    """
+    return QUESTION_PROMPT_TEMPLATES[question_type].format(topic=topic, difficulty=difficulty)
+
+def fallback_question(question_type, topic, difficulty):
+    """
+    生成失败时的备用题目
+    
+    Args:
+        question_type: 题目类型
+        topic: 题目主题
+        difficulty: 难度级别
+        
+    Returns:
+        str: 备用题目的Markdown内容
+    """
+    return FALLBACK_QUESTION_TEMPLATES[question_type].format(topic=topic, difficulty=difficulty)
+
+def supports_prompt_cache(model_id=None):
+    """
+    判断是否对模型启用提示词缓存
+    
+    Args:
+        model_id: 模型ID，默认使用llm_config.model_id
+        
+    Returns:
+        bool: 开关已打开且模型支持提示词缓存时返回True
+    """
+    model_id = model_id or llm_config.model_id
+    return llm_config.enable_prompt_cache and any(name in model_id for name in llm_config.prompt_cache_models)
+
+def build_request_body(prompt, max_tokens, temperature, system=None):
+    """
+    构建InvokeModel的请求体
     
     Args:
         prompt: 提示词
         max_tokens: 最大生成token数
-        temperature: 温度参数，控制随机性
-        max_retries: 最大重试次数
-        initial_retry_delay: 初始重试延迟（秒）
+        temperature: 温度参数
+        system: 系统提示词（可选），模型支持时会标记为可缓存的前缀
         
     Returns:
-        str: 生成的内容
+        dict: Anthropic Messages格式的请求体
     """
-    client = get_bedrock_client()
-    
     request_body = {
         "anthropic_version": "bedrock-2023-05-31",
         "max_tokens": max_tokens,
@@ -49,32 +224,145 @@ def call_claude(prompt, max_tokens=1000, temperature=0.7, max_retries=3, initial
         ]
     }
     
+    if system:
+        system_block = {"type": "text", "text": system}
+        # 系统提示词足够长时才标记缓存点，过短的前缀达不到模型的最小缓存长度
+        if supports_prompt_cache() and len(system) >= llm_config.prompt_cache_min_chars:
+            system_block["cache_control"] = {"type": "ephemeral"}
+        request_body["system"] = [system_block]
+    return request_body
+
+def is_throttling_error(error):
+    """判断模型调用的异常是否为限流"""
+    message = str(error)
+    return "ThrottlingException" in message or "throttlingException" in message or "Too many requests" in message
+
+def observe_bedrock_call(source, started, error=None):
+    """
+    记录一次Bedrock调用的耗时指标，被限流时同时计入限流次数
+    
+    Args:
+        source: 调用来源
+        started: 调用开始时的time.perf_counter()
+        error: 调用失败时的异常
+    """
+    status = "ok" if error is None else ("throttled" if is_throttling_error(error) else "error")
+    bedrock_call_duration.observe(time.perf_counter() - started, source=source, status=status)
+    if status == "throttled":
+        bedrock_throttles.inc(source=source)
+
+def instrument_bedrock_client(client, source="agent", operations=("Converse", "ConverseStream")):
+    """
+    在boto3客户端上注册botocore事件处理器，让不经过call_claude的调用（Agent的BedrockModel）也记录Bedrock指标
+
+    botocore在客户端内部重试，调用方只能看到最后一次的结果，所以按每次尝试记录：
+    request-created在每次发送前触发，记录开始时间，第2次及以后的尝试计入重试次数；
+    needs-retry在每次尝试得到响应或异常后触发，记录耗时，限流时计入限流次数。
+    流式接口的耗时记录到收到响应头为止。
+
+    Args:
+        client: bedrock-runtime的boto3客户端
+        source: 调用来源
+        operations: 需要记录的接口名
+    """
+    def on_request_created(request, **kwargs):
+        context = request.context
+        if context.get("retries", {}).get("attempt", 1) > 1:
+            bedrock_retries.inc(source=source)
+        context["exam_attempt_started"] = time.perf_counter()
+
+    def on_needs_retry(request_dict, operation, response=None, caught_exception=None, **kwargs):
+        started = request_dict["context"].pop("exam_attempt_started", None)
+        if started is None:
+            return None
+        error = caught_exception
+        if error is None and response is not None and response[0].status_code >= 300:
+            error = ClientError(response[1], operation.name)
+        observe_bedrock_call(source, started, error)
+        # 返回None，是否重试仍由botocore的重试处理器决定
+        return None
+
+    events = client.meta.events
+    for operation in operations:
+        events.register(f"request-created.bedrock-runtime.{operation}", on_request_created,
+                        unique_id=f"exam-metrics-request-created-{operation}")
+        events.register(f"needs-retry.bedrock-runtime.{operation}", on_needs_retry,
+                        unique_id=f"exam-metrics-needs-retry-{operation}")
+
+def call_claude(prompt, max_tokens=1000, temperature=0.7, max_retries=3, initial_retry_delay=2, source="call_claude", system=None):
+    """
+    调用Claude模型生成内容，带有指数退避重试策略
+    
+    如果当前上下文设置了请求截止时间，读取超时会被裁剪到剩余预算以内，
+    剩余时间不足以等待下一次重试时直接放弃，抛出DeadlineExceeded。
+    响应中的token用量会记录到当前工作流（以及当前工具调用）上。
+    每次调用都要先从generation_scheduler获得槽位，按请求的租户和优先级公平排队。
+    
+    Args:
+        prompt: 提示词
+        max_tokens: 最大生成token数
+        temperature: 温度参数，控制随机性
+        max_retries: 最大重试次数
+        initial_retry_delay: 初始重试延迟（秒）
+        source: 调用来源，用于token用量统计
+        system: 系统提示词（可选），模型支持时会标记为可缓存的前缀
+        
+    Returns:
+        str: 生成的内容
+    """
+    deadline = get_deadline()
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded("调用Claude前请求时间预算已耗尽")
+    
+    request_body = build_request_body(prompt, max_tokens, temperature, system)
+    
     # 添加指数退避重试逻辑
     for attempt in range(max_retries):
         try:
-            response = client.invoke_model(
-                modelId=llm_config.model_id,
-                body=json.dumps(request_body)
-            )
+            # 经过公平调度器排队，所有请求共享有限的并发调用数量
+            with generation_scheduler.slot(), span("model.invoke", source=source, attempt=attempt + 1):
+                # 每次尝试按排队和退避之后剩余的时间预算重新裁剪读取超时
+                client = get_bedrock_client(read_timeout=cap_timeout(llm_config.read_timeout, minimum=1))
+                started = time.perf_counter()
+                try:
+                    response = client.invoke_model(
+                        modelId=llm_config.model_id,
+                        body=json.dumps(request_body)
+                    )
+                except Exception as e:
+                    observe_bedrock_call(source, started, e)
+                    raise
+                observe_bedrock_call(source, started)
             
             response_body = json.loads(response['body'].read().decode('utf-8'))
+            record_usage(source, response_body.get('usage'))
             return response_body['content'][0]['text']
         except Exception as e:
             # 检查是否是限流错误
-            if "throttlingException" in str(e) or "Too many requests" in str(e):
+            if is_throttling_error(e):
                 if attempt < max_retries - 1:
                     # 计算指数退避时间
                     retry_delay = initial_retry_delay * (2 ** attempt)
+                    if deadline is not None and not deadline.allows(retry_delay):
+                        logging.warning(f"API限流，剩余时间不足以等待{retry_delay}秒，放弃重试: {str(e)}")
+                        raise DeadlineExceeded(f"API限流且请求时间预算不足: {str(e)}")
                     logging.warning(f"API限流，等待{retry_delay}秒后重试 ({attempt+1}/{max_retries}): {str(e)}")
-                    time.sleep(retry_delay)
+                    bedrock_retries.inc(source=source)
+                    with span("model.backoff", source=source):
+                        time.sleep(retry_delay)
                 else:
                     logging.error(f"API限流，已达到最大重试次数: {str(e)}")
                     raise
             else:
                 # 其他类型的错误
                 if attempt < max_retries - 1:
+                    if deadline is not None and not deadline.allows(initial_retry_delay):
+                        logging.warning(f"调用Claude失败，剩余时间不足，放弃重试: {str(e)}")
+                        raise DeadlineExceeded(f"调用Claude失败且请求时间预算不足: {str(e)}")
                     logging.warning(f"调用Claude失败，尝试重试 ({attempt+1}/{max_retries}): {str(e)}")
-                    time.sleep(initial_retry_delay)
+                    bedrock_retries.inc(source=source)
+                    with span("model.backoff", source=source):
+                        time.sleep(initial_retry_delay)
                 else:
                     logging.error(f"调用Claude失败，已达到最大重试次数: {str(e)}")
                     raise
@@ -120,6 +408,15 @@ class QuestionCache:
         Returns:
             str: 缓存的题目，如果没有缓存或缓存过期则返回None
         """
+        with span("cache.get", question_type=question_type) as cache_span:
+            question = self._read(topic, difficulty, question_type, reference)
+            cache_requests.inc(cache="question", result="hit" if question is not None else "miss")
+            if cache_span is not None:
+                cache_span.set_attribute("hit", question is not None)
+            return question
+    
+    def _read(self, topic, difficulty, question_type, reference=None):
+        """读取缓存文件，没有缓存或缓存过期时返回None"""
         key = self._get_cache_key(topic, difficulty, question_type, reference)
         cache_file = os.path.join(self.cache_dir, f"{key}.pkl")
         
@@ -132,6 +429,7 @@ class QuestionCache:
             
             # 检查缓存是否过期
             if datetime.now() - cache_data["timestamp"] > self.ttl:
+                cache_evictions.inc(cache="question", reason="expired")
                 return None
             
             return cache_data["question"]
@@ -159,13 +457,67 @@ class QuestionCache:
         }
         
         try:
-            with open(cache_file, "wb") as f:
-                pickle.dump(cache_data, f)
+            # 先写临时文件再替换，多个worker进程同时读写时不会读到写了一半的缓存
+            tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with span("cache.set", question_type=question_type):
+                with open(tmp_file, "wb") as f:
+                    pickle.dump(cache_data, f)
+                os.replace(tmp_file, cache_file)
         except Exception as e:
             logging.warning(f"写入缓存失败: {str(e)}")
 
 # 创建全局缓存实例
-question_cache = QuestionCache()
+question_cache = QuestionCache(exam_config.question_cache_dir)
+
+# 为True时题目生成工具总是返回题目内容（供generate_questions_parallel等直接调用使用）
+_return_content = contextvars.ContextVar("exam_generator_return_content", default=False)
+
+def use_handles():
+    """当前是否处于题目ID模式（在工作流中且history_mode为handles）"""
+    workflow_id, _ = get_workflow_context()
+    return bool(workflow_id) and exam_config.history_mode == "handles" and not _return_content.get()
+
+def resolve_reference(reference):
+    """把Agent传入的参考资料ID解析为参考资料内容，不是ID时原样返回"""
+    workflow_id, _ = get_workflow_context()
+    return question_store.resolve_reference(workflow_id, reference)
+
+def finish_question(question_type, topic, difficulty, question, fallback=False):
+    """
+    题目生成完成后的处理
+    
+    在工作流中时把题目保存到服务端的题目存储，最终考试由服务端组装。
+    题目ID模式下只返回简短的题目ID，避免完整题目在Agent的对话历史中累积；
+    否则原样返回题目内容。
+    
+    Args:
+        question_type: 题目类型
+        topic: 题目主题
+        difficulty: 难度级别
+        question: 题目的Markdown内容
+        fallback: 是否为生成失败时的备用题目，重试时备用题目会被重新生成
+        
+    Returns:
+        str: 返回给调用方的内容
+    """
+    workflow_id, step_id = get_workflow_context()
+    if not workflow_id:
+        return question
+    
+    question_id = question_store.add_question(
+        workflow_id, question_type, topic, difficulty, question,
+        step_id=step_id, tool_use_id=get_current_tool_use(), fallback=fallback
+    )
+    if not use_handles():
+        return question
+    
+    type_name = {'singleChoice': '单选题', 'multipleChoice': '多选题', 'fillBlank': '填空题'}[question_type]
+    return f"已生成{type_name}，题目ID: {question_id}（主题: {topic}，难度: {difficulty}）。题目内容已保存在服务端，最终考试会自动组装，无需输出题目内容。"
+
+def _generate_with_content(generate_func, *args):
+    """调用题目生成工具并让其返回题目内容而不是题目ID"""
+    _return_content.set(True)
+    return generate_func(*args)
 
 def generate_questions_parallel(question_specs):
     """
@@ -184,8 +536,12 @@ def generate_questions_parallel(question_specs):
         # 创建Future对象
         future_to_spec = {}
         for spec in question_specs:
+            # 复制当前上下文，使请求截止时间等上下文变量在工作线程中可见
+            context = contextvars.copy_context()
             if spec['type'] == 'singleChoice':
                 future = executor.submit(
+                    context.run,
+                    _generate_with_content,
                     generate_single_choice_question, 
                     spec['topic'], 
                     spec['difficulty'], 
@@ -193,6 +549,8 @@ def generate_questions_parallel(question_specs):
                 )
             elif spec['type'] == 'multipleChoice':
                 future = executor.submit(
+                    context.run,
+                    _generate_with_content,
                     generate_multiple_choice_question, 
                     spec['topic'], 
                     spec['difficulty'], 
@@ -200,6 +558,8 @@ def generate_questions_parallel(question_specs):
                 )
             elif spec['type'] == 'fillBlank':
                 future = executor.submit(
+                    context.run,
+                    _generate_with_content,
                     generate_fill_blank_question, 
                     spec['topic'], 
                     spec['difficulty'], 
@@ -216,12 +576,7 @@ def generate_questions_parallel(question_specs):
             except Exception as e:
                 logging.error(f"生成题目失败: {str(e)}")
                 # 使用备用题目
-                if spec['type'] == 'singleChoice':
-                    results.append(f"## 单选题\n\n关于{spec['topic']}的问题，难度为{spec['difficulty']}。\n\n- (x) 正确选项\n- ( ) 错误选项1\n- ( ) 错误选项2\n- ( ) 错误选项3")
-                elif spec['type'] == 'multipleChoice':
-                    results.append(f"## 多选题\n\n关于{spec['topic']}的问题，难度为{spec['difficulty']}。\n\n- [x] 正确选项1\n- [ ] 错误选项1\n- [x] 正确选项2\n- [ ] 错误选项2")
-                elif spec['type'] == 'fillBlank':
-                    results.append(f"## 填空题\n\n关于{spec['topic']}的问题，难度为{spec['difficulty']}。______\n\n- R:= 正确答案")
+                results.append(fallback_question(spec['type'], spec['topic'], spec['difficulty']))
     
     return results
 
@@ -241,7 +596,7 @@ def generate_single_choice_question(topic: str, difficulty: str, reference: str
     Args:
         topic: 题目主题，指定问题应该关注的具体领域或概念
         difficulty: 难度级别，可选值为"easy"、"medium"或"hard"
-        reference: 参考资料（可选），用于提供问题内容的背景信息
+        reference: 参考资料（可选），用于提供问题内容的背景信息；也可以传入参考资料ID（如"ref-1"）
         
     Returns:
         生成的单选题Markdown文本，格式如下：
@@ -257,45 +612,26 @@ def generate_single_choice_question(topic: str, difficulty: str, reference: str
     """
     logging.info(f"生成单选题，主题: {topic}, 难度: {difficulty}")
     
+    # Agent可能传入参考资料ID，解析为参考资料内容
+    reference = resolve_reference(reference)
+    
     # 尝试从缓存获取
     cached_question = question_cache.get(topic, difficulty, "singleChoice", reference)
     if cached_question:
         logging.info("使用缓存的单选题")
-        return cached_question
+        return finish_question("singleChoice", topic, difficulty, cached_question)
     
     # 构建提示词
-    prompt = f"""
-    请生成一道关于"{topic}"的单选题，难度级别为"{difficulty}"。
-    
-    题目要求：
-    1. 题目应该清晰、准确，没有歧义
-    2. 提供4个选项，其中只有1个正确答案
-    3. 选项应该合理，不要有明显错误或不相关的选项
-    4. 难度应该符合"{difficulty}"级别
-    
-    请严格使用以下格式：
-    
-    ## 单选题
-    
-    [题目描述]
-    
-    - (x) [正确选项]
-    - ( ) [错误选项1]
-    - ( ) [错误选项2]
-    - ( ) [错误选项3]
-    
-    不要添加任何额外的标题、编号或解释。不要添加"单选题1"这样的编号，就是"## 单选题"。
-    """
-    
-    if reference:
-        prompt += f"\n\n参考以下资料生成题目：\n{reference}"
+    prompt = build_question_prompt("singleChoice", topic, difficulty)
     
     try:
-        # 调用Claude生成内容
+        # 调用Claude生成内容，参考资料放在各题型共享的系统提示词前缀中
         question = call_claude(
             prompt, 
             max_tokens=llm_config.max_tokens, 
-            temperature=llm_config.temperature
+            temperature=llm_config.temperature,
+            system=build_question_system_prompt(reference),
+            source="generate_single_choice_question"
         )
         
         # 标准化格式
@@ -304,19 +640,11 @@ def generate_single_choice_question(topic: str, difficulty: str, reference: str
         # 缓存结果
         question_cache.set(topic, difficulty, "singleChoice", question, reference)
         
-        return question
+        return finish_question("singleChoice", topic, difficulty, question)
     except Exception as e:
         logging.error(f"生成单选题失败: {str(e)}")
         # 返回一个基本的示例题目
-        return f"""## 单选题
-
-关于{topic}的问题，难度为{difficulty}。
-
-- (x) 正确选项
-- ( ) 错误选项1
-- ( ) 错误选项2
-- ( ) 错误选项3
-"""
+        return finish_question("singleChoice", topic, difficulty, fallback_question("singleChoice", topic, difficulty), fallback=True)
 
 @tool
 def generate_multiple_choice_question(topic: str, difficulty: str, reference: str = None) -> str:
@@ -334,7 +662,7 @@ def generate_multiple_choice_question(topic: str, difficulty: str, reference: st
     Args:
         topic: 题目主题，指定问题应该关注的具体领域或概念
         difficulty: 难度级别，可选值为"easy"、"medium"或"hard"
-        reference: 参考资料（可选），用于提供问题内容的背景信息
+        reference: 参考资料（可选），用于提供问题内容的背景信息；也可以传入参考资料ID（如"ref-1"）
         
     Returns:
         生成的多选题Markdown文本，格式如下：
@@ -350,45 +678,26 @@ def generate_multiple_choice_question(topic: str, difficulty: str, reference: st
     """
     logging.info(f"生成多选题，主题: {topic}, 难度: {difficulty}")
     
+    # Agent可能传入参考资料ID，解析为参考资料内容
+    reference = resolve_reference(reference)
+    
     # 尝试从缓存获取
     cached_question = question_cache.get(topic, difficulty, "multipleChoice", reference)
     if cached_question:
         logging.info("使用缓存的多选题")
-        return cached_question
+        return finish_question("multipleChoice", topic, difficulty, cached_question)
     
     # 构建提示词
-    prompt = f"""
-    请生成一道关于"{topic}"的多选题，难度级别为"{difficulty}"。
-    
-    题目要求：
-    1. 题目应该清晰、准确，没有歧义
-    2. 提供4-6个选项，其中2-4个是正确答案
-    3. 选项应该合理，不要有明显错误或不相关的选项
-    4. 难度应该符合"{difficulty}"级别
-    
-    请严格使用以下格式：
-    
-    ## 多选题
-    
-    [题目描述]
-    
-    - [x] [正确选项1]
-    - [ ] [错误选项1]
-    - [x] [正确选项2]
-    - [ ] [错误选项2]
-    
-    不要添加任何额外的标题、编号或解释。不要添加"多选题1"这样的编号，就是"## 多选题"。
-    """
-    
-    if reference:
-        prompt += f"\n\n参考以下资料生成题目：\n{reference}"
+    prompt = build_question_prompt("multipleChoice", topic, difficulty)
     
     try:
-        # 调用Claude生成内容
+        # 调用Claude生成内容，参考资料放在各题型共享的系统提示词前缀中
         question = call_claude(
             prompt, 
             max_tokens=llm_config.max_tokens, 
-            temperature=llm_config.temperature
+            temperature=llm_config.temperature,
+            system=build_question_system_prompt(reference),
+            source="generate_multiple_choice_question"
         )
         
         # 标准化格式
@@ -397,19 +706,11 @@ def generate_multiple_choice_question(topic: str, difficulty: str, reference: st
         # 缓存结果
         question_cache.set(topic, difficulty, "multipleChoice", question, reference)
         
-        return question
+        return finish_question("multipleChoice", topic, difficulty, question)
     except Exception as e:
         logging.error(f"生成多选题失败: {str(e)}")
         # 返回一个基本的示例题目
-        return f"""## 多选题
-
-关于{topic}的问题，难度为{difficulty}。
-
-- [x] 正确选项1
-- [ ] 错误选项1
-- [x] 正确选项2
-- [ ] 错误选项2
-"""
+        return finish_question("multipleChoice", topic, difficulty, fallback_question("multipleChoice", topic, difficulty), fallback=True)
 
 @tool
 def generate_fill_blank_question(topic: str, difficulty: str, reference: str = None) -> str:
@@ -427,7 +728,7 @@ def generate_fill_blank_question(topic: str, difficulty: str, reference: str = N
     Args:
         topic: 题目主题，指定问题应该关注的具体领域或概念
         difficulty: 难度级别，可选值为"easy"、"medium"或"hard"
-        reference: 参考资料（可选），用于提供问题内容的背景信息
+        reference: 参考资料（可选），用于提供问题内容的背景信息；也可以传入参考资料ID（如"ref-1"）
         
     Returns:
         生成的填空题Markdown文本，格式如下：
@@ -440,42 +741,26 @@ def generate_fill_blank_question(topic: str, difficulty: str, reference: str = N
     """
     logging.info(f"生成填空题，主题: {topic}, 难度: {difficulty}")
     
+    # Agent可能传入参考资料ID，解析为参考资料内容
+    reference = resolve_reference(reference)
+    
     # 尝试从缓存获取
     cached_question = question_cache.get(topic, difficulty, "fillBlank", reference)
     if cached_question:
         logging.info("使用缓存的填空题")
-        return cached_question
+        return finish_question("fillBlank", topic, difficulty, cached_question)
     
     # 构建提示词
-    prompt = f"""
-    请生成一道关于"{topic}"的填空题，难度级别为"{difficulty}"。
-    
-    题目要求：
-    1. 题目应该清晰、准确，没有歧义
-    2. 使用下划线（______）表示需要填写的空白处
-    3. 提供正确答案
-    4. 难度应该符合"{difficulty}"级别
-    
-    请严格使用以下格式：
-    
-    ## 填空题
-    
-    [题目描述，包含______需要填写的部分]
-    
-    - R:= [正确答案]
-    
-    不要添加任何额外的标题、编号或解释。不要添加"填空题1"这样的编号，就是"## 填空题"。
-    """
-    
-    if reference:
-        prompt += f"\n\n参考以下资料生成题目：\n{reference}"
+    prompt = build_question_prompt("fillBlank", topic, difficulty)
     
     try:
-        # 调用Claude生成内容
+        # 调用Claude生成内容，参考资料放在各题型共享的系统提示词前缀中
         question = call_claude(
             prompt, 
             max_tokens=llm_config.max_tokens, 
-            temperature=llm_config.temperature
+            temperature=llm_config.temperature,
+            system=build_question_system_prompt(reference),
+            source="generate_fill_blank_question"
         )
         
         # 标准化格式
@@ -484,13 +769,8 @@ def generate_fill_blank_question(topic: str, difficulty: str, reference: str = N
         # 缓存结果
         question_cache.set(topic, difficulty, "fillBlank", question, reference)
         
-        return question
+        return finish_question("fillBlank", topic, difficulty, question)
     except Exception as e:
         logging.error(f"生成填空题失败: {str(e)}")
         # 返回一个基本的示例题目
-        return f"""## 填空题
-
-关于{topic}的问题，难度为{difficulty}。______
-
-- R:= 正确答案
-"""
+        return finish_question("fillBlank", topic, difficulty, fallback_question("fillBlank", topic, difficulty), fallback=True)
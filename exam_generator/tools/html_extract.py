@@ -0,0 +1,458 @@
+import re
+import logging
+from html.parser import HTMLParser
+
+# 这些元素的内容不是可见文本
+SKIP_TAGS = frozenset(["script", "style", "noscript", "template", "svg", "iframe", "object", "select", "button"])
+# 块级元素，开始和结束时分段；行内元素（a、b、span等）中的文字与前后文字连在同一段
+BLOCK_TAGS = frozenset([
+    "address", "article", "aside", "blockquote", "body", "br", "caption", "dd", "details", "dialog", "div",
+    "dl", "dt", "fieldset", "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6",
+    "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section", "summary", "table", "td", "th",
+    "title", "tr", "ul"
+])
+# 没有结束标签的元素
+VOID_TAGS = frozenset(["area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"])
+# 导航、侧栏、页眉页脚等模板内容；header和footer在正文容器中时是文章的标题和署名，不算模板内容
+BOILERPLATE_TAGS = frozenset(["nav", "aside", "form"])
+PAGE_FRAME_TAGS = frozenset(["header", "footer"])
+BOILERPLATE_ROLES = frozenset(["navigation", "banner", "contentinfo", "complementary", "search"])
+MAIN_TAGS = frozenset(["main", "article"])
+# 只对通用容器按class/id判断，body等外层元素的class（例如has-sidebar）不影响整页
+CLASS_CHECK_TAGS = frozenset(["div", "section", "ul", "ol", "li", "table", "td", "span", "p"])
+# class/id中以这些词开头的词（例如sidebar、sidebar-left、nav_top），with-sidebar、no-ads等后缀不算
+BOILERPLATE_CLASS = re.compile(
+    r"(?:nav|navbar|menu|breadcrumbs?|crumbs?|position|location|footer|sidebar|comments?|share|social|related|recommend|"
+    r"hot|ads?|advert\w*|banner|cookie|popup|modal|subscribe|login|toolbar|pagination|pager|copyright)(?:$|[_\d-])",
+    re.IGNORECASE)
+# 链接文字占比超过该值的段落视为导航或链接列表
+MAX_LINK_DENSITY = 0.5
+# 正文不到全部文字的该比例（且不足max_chars）时，认为正文识别失败，退回全部文字
+MIN_CONTENT_RATIO = 0.1
+# 没有字母、数字和汉字的段落（例如"|"、"»"）
+_WORD = re.compile(r"\w")
+
+# 元素入栈时增加的计数
+_SKIP, _LINK, _PRE = 1, 2, 4
+
+def _is_boilerplate_class(attrs):
+    """class或id中有以模板关键词开头的词"""
+    names = f"{attrs.get('class') or ''} {attrs.get('id') or ''}".split()
+    return any(BOILERPLATE_CLASS.match(name) for name in names)
+
+class Block:
+    """网页中的一段文字"""
+
+    __slots__ = ("text", "link_chars", "boilerplate", "main", "title")
+
+    def __init__(self, text, link_chars, boilerplate, main, title):
+        self.text = text
+        self.link_chars = link_chars
+        self.boilerplate = boilerplate
+        self.main = main
+        self.title = title
+
+    def is_content(self):
+        """按段落自身的特征判断是否为正文：不在模板区域中，链接文字不多，含有文字"""
+        return (not self.boilerplate and not self.title
+                and self.link_chars <= len(self.text) * MAX_LINK_DENSITY
+                and _WORD.search(self.text) is not None)
+
+class TextCollector:
+    """接收解析器的开始标签、结束标签和文本事件，分段并识别正文
+
+    不同的解析器（见EXTRACTORS）只负责产生事件，分段和正文识别的规则相同。main_content为True时
+    只保留正文：跳过nav、aside、页面级的header/footer、按class/id判断的导航和侧栏，以及链接占多数的段落；
+    页面中有main或article时只保留其中的正文。main、article和role="main"中的内容不受外层模板区域的影响。
+    没有识别出正文，或者正文与全部文字相比过少时，退回全部文字。
+    正文（或未开启正文识别时的全部文字）超过max_chars后done为True，调用方可以停止输入。
+    """
+
+    def __init__(self, max_chars, main_content=True):
+        self.max_chars = max_chars
+        self.main_content = main_content
+        self.blocks = []
+        self.done = False
+        # (标签, 计数标志, 元素内是否为模板区域, 元素内是否为正文容器)
+        self._stack = []
+        self._counts = {_SKIP: 0, _LINK: 0, _PRE: 0}
+        self._boilerplate = False
+        self._main = False
+        self._parts = []
+        self._link_chars = 0
+        self._flags = None
+        self._title = False
+        self._chars = 0
+        self._main_chars = 0
+
+    def start(self, tag, attrs):
+        """
+        开始标签
+
+        Args:
+            tag: 小写的标签名
+            attrs: 属性字典，或者返回属性字典的函数（只在需要时读取属性）
+        """
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag in VOID_TAGS:
+            return
+        flags = 0
+        main = boilerplate = False
+        if tag in SKIP_TAGS:
+            flags |= _SKIP
+        elif tag == "a":
+            flags |= _LINK
+        elif tag == "pre":
+            flags |= _PRE
+        elif tag in MAIN_TAGS:
+            main = True
+        elif tag in BOILERPLATE_TAGS or (tag in PAGE_FRAME_TAGS and not self._main):
+            boilerplate = True
+        if tag in CLASS_CHECK_TAGS or tag in PAGE_FRAME_TAGS:
+            attrs = attrs() if callable(attrs) else attrs
+            role = attrs.get("role")
+            if role == "main":
+                main = True
+            elif role in BOILERPLATE_ROLES or (tag in CLASS_CHECK_TAGS and _is_boilerplate_class(attrs)):
+                boilerplate = True
+        if tag == "title":
+            self._title = True
+        if flags:
+            for flag in (_SKIP, _LINK, _PRE):
+                if flags & flag:
+                    self._counts[flag] += 1
+        # 正文容器覆盖外层的模板区域（例如class为with-sidebar的布局容器中的article）
+        if main:
+            self._boilerplate, self._main = False, True
+        elif boilerplate:
+            self._boilerplate = True
+        self._stack.append((tag, flags, self._boilerplate, self._main))
+
+    def end(self, tag):
+        """结束标签，关闭到最近的同名元素（容忍没有闭合的元素）"""
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag in VOID_TAGS:
+            return
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                for _, flags, _, _ in self._stack[i:]:
+                    if flags:
+                        for flag in (_SKIP, _LINK, _PRE):
+                            if flags & flag:
+                                self._counts[flag] -= 1
+                del self._stack[i:]
+                self._boilerplate, self._main = self._stack[-1][2:] if self._stack else (False, False)
+                break
+        if tag == "title":
+            self._title = False
+
+    def data(self, text):
+        """文本"""
+        if self._counts[_SKIP] or self.done:
+            return
+        if self._flags is None:
+            if text.isspace():
+                return
+            self._flags = (self._boilerplate, self._main, self._title, self._counts[_PRE] > 0)
+        self._parts.append(text)
+        if self._counts[_LINK]:
+            self._link_chars += len(text.strip())
+
+    def _flush(self):
+        if self._flags is None:
+            return
+        text = "".join(self._parts)
+        boilerplate, main, title, pre = self._flags
+        link_chars = self._link_chars
+        self._parts = []
+        self._link_chars = 0
+        self._flags = None
+        # pre中保留换行，其他段落合并连续的空白（包括换行），与浏览器显示一致
+        lines = [line.strip() for line in text.splitlines()] if pre else [" ".join(text.split())]
+        for line in lines:
+            if not line:
+                continue
+            block = Block(line, min(link_chars, len(line)), boilerplate, main, title)
+            self.blocks.append(block)
+            if not self.main_content:
+                self._chars += len(line) + 1
+            elif block.is_content():
+                self._chars += len(line) + 1
+                if main:
+                    self._main_chars += len(line) + 1
+        if self._main_chars > self.max_chars or (not self._main_chars and self._chars > self.max_chars):
+            self.done = True
+
+    def close(self):
+        self._flush()
+
+    def selected_blocks(self):
+        """
+        返回保留的段落
+
+        Returns:
+            list: 开启正文识别时为正文段落，否则为全部段落
+        """
+        if not self.main_content:
+            return self.blocks
+        content = [block for block in self.blocks if block.is_content()]
+        if any(block.main for block in content):
+            content = [block for block in content if block.main]
+        # 没有识别出正文（例如整页都在没有闭合的nav中），或者只识别出很少的文字时（规则误判了正文所在的区域），
+        # 退回全部文字；正文已经足够max_chars时不退回
+        page = [block for block in self.blocks if not block.title]
+        content_chars = sum(len(block.text) + 1 for block in content)
+        page_chars = sum(len(block.text) + 1 for block in page)
+        if content_chars < self.max_chars and content_chars < page_chars * MIN_CONTENT_RATIO:
+            return page
+        return content
+
+    def get_text(self):
+        """
+        返回提取的文本
+
+        Returns:
+            str: 每段一行，限制在max_chars以内；超过时注明已截断
+        """
+        text = "\n".join(block.text for block in self.selected_blocks())
+        if len(text) <= self.max_chars:
+            return text
+        return f"{text[:self.max_chars]}\n\n[内容已截断，已截断至: {self.max_chars}字符]"
+
+class _HTMLParserEvents(HTMLParser):
+    """标准库html.parser，把事件转给TextCollector"""
+
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, lambda: dict(attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.collector.start(tag, lambda: dict(attrs))
+        self.collector.end(tag)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+class TextExtractor:
+    """网页文本提取器
+
+    HTML可以分多次传入（feed）；done为True表示已经得到足够的文本，可以停止输入；
+    输入结束后调用close，再用get_text取得文本。子类使用不同的解析器产生事件，
+    incremental为False的解析器在close时才解析缓存的全部HTML。
+    """
+
+    name = None
+    incremental = True
+
+    def __init__(self, max_chars, main_content=True):
+        """
+        初始化提取器
+
+        Args:
+            max_chars: 需要的文本长度
+            main_content: 是否只保留正文
+        """
+        self.collector = TextCollector(max_chars, main_content)
+
+    @property
+    def done(self):
+        return self.collector.done
+
+    def feed(self, html):
+        raise NotImplementedError
+
+    def close(self):
+        self.collector.close()
+
+    def get_text(self):
+        return self.collector.get_text()
+
+class HTMLParserExtractor(TextExtractor):
+    """使用标准库html.parser，不需要额外依赖，逐块增量解析"""
+
+    name = "html.parser"
+
+    def __init__(self, max_chars, main_content=True):
+        super().__init__(max_chars, main_content)
+        self._parser = _HTMLParserEvents(self.collector)
+
+    def feed(self, html):
+        if not self.done:
+            self._parser.feed(html)
+
+    def close(self):
+        if not self.done:
+            self._parser.close()
+        super().close()
+
+class _LxmlTarget:
+    """lxml解析器的事件接收对象"""
+
+    def __init__(self, collector):
+        self.collector = collector
+
+    def start(self, tag, attrib):
+        self.collector.start(tag, attrib)
+
+    def end(self, tag):
+        self.collector.end(tag)
+
+    def data(self, data):
+        self.collector.data(data)
+
+    def close(self):
+        return None
+
+class LxmlExtractor(TextExtractor):
+    """使用lxml（libxml2）的增量解析器，需要安装lxml"""
+
+    name = "lxml"
+
+    def __init__(self, max_chars, main_content=True):
+        super().__init__(max_chars, main_content)
+        from lxml import etree
+        self._parser = etree.HTMLParser(target=_LxmlTarget(self.collector), no_network=True)
+
+    def feed(self, html):
+        if not self.done:
+            self._parser.feed(html)
+
+    def close(self):
+        if not self.done:
+            self._parser.close()
+        super().close()
+
+class SelectolaxExtractor(TextExtractor):
+    """使用selectolax（lexbor）解析整个文档后遍历，需要安装selectolax
+
+    lexbor不支持增量解析，HTML在close时一次性解析，遍历时得到足够的文本后停止。
+    """
+
+    name = "selectolax"
+    incremental = False
+
+    def __init__(self, max_chars, main_content=True):
+        super().__init__(max_chars, main_content)
+        from selectolax.lexbor import LexborHTMLParser
+        self._parser_class = LexborHTMLParser
+        self._parts = []
+
+    def feed(self, html):
+        self._parts.append(html)
+
+    def close(self):
+        tree = self._parser_class("".join(self._parts))
+        self._parts = []
+        collector = self.collector
+        if tree.head is not None:
+            self._walk(tree.head, collector)
+        if tree.body is not None and not collector.done:
+            self._walk(tree.body, collector)
+        super().close()
+
+    @staticmethod
+    def _walk(root, collector):
+        # 用显式的栈代替递归，(节点, 是否为结束事件)
+        stack = [(root, False)]
+        while stack and not collector.done:
+            node, closing = stack.pop()
+            tag = node.tag
+            if closing:
+                collector.end(tag)
+                continue
+            if tag == "-text":
+                collector.data(node.text_content)
+                continue
+            if tag.startswith("-") or tag.startswith("_"):
+                # 注释和文档类型节点
+                continue
+            collector.start(tag, lambda node=node: node.attributes)
+            if tag in SKIP_TAGS:
+                collector.end(tag)
+                continue
+            stack.append((node, True))
+            children = []
+            child = node.child
+            while child is not None:
+                children.append(child)
+                child = child.next
+            stack.extend((child, False) for child in reversed(children))
+
+class PlainTextExtractor(TextExtractor):
+    """纯文本，每行一段，逐行增量处理"""
+
+    name = "text"
+
+    def __init__(self, max_chars, main_content=True):
+        super().__init__(max_chars, main_content)
+        self._pending = ""
+        self.collector.start("pre", {})
+
+    def feed(self, text):
+        if self.done:
+            return
+        complete, _, self._pending = (self._pending + text).rpartition("\n")
+        if complete:
+            self.collector.data(complete)
+            # 结束再开始pre，使完整的行成段，正文足够时done变为True
+            self.collector.end("pre")
+            self.collector.start("pre", {})
+
+    def close(self):
+        if not self.done and self._pending:
+            self.collector.data(self._pending)
+        self.collector.end("pre")
+        super().close()
+
+# 可用的解析器
+EXTRACTORS = {
+    "lxml": LxmlExtractor,
+    "selectolax": SelectolaxExtractor,
+    "html.parser": HTMLParserExtractor
+}
+# auto时按顺序使用第一个已安装的解析器。selectolax解析同样快，但不能增量解析，
+# 需要读完整个网页（最多FETCH_MAX_BYTES），只在指定时使用
+AUTO_EXTRACTORS = ("lxml", "html.parser")
+
+_available = {}
+
+def extractor_available(name):
+    """检查解析器的依赖是否已安装"""
+    if name not in _available:
+        try:
+            EXTRACTORS[name](1)
+            _available[name] = True
+        except ImportError:
+            _available[name] = False
+    return _available[name]
+
+def create_extractor(max_chars, name="auto", main_content=True):
+    """
+    创建网页文本提取器
+
+    Args:
+        max_chars: 需要的文本长度
+        name: 解析器名称（EXTRACTORS中的键），auto时使用AUTO_EXTRACTORS中第一个已安装的；
+            指定的解析器未安装时退回html.parser
+        main_content: 是否只保留正文
+
+    Returns:
+        TextExtractor
+    """
+    if name == "auto":
+        name = next(candidate for candidate in AUTO_EXTRACTORS if extractor_available(candidate))
+    elif name not in EXTRACTORS:
+        logging.warning(f"未知的网页解析器: {name}，使用html.parser")
+        name = "html.parser"
+    elif not extractor_available(name):
+        logging.warning(f"网页解析器{name}未安装，使用html.parser: pip install {name}")
+        name = "html.parser"
+    return EXTRACTORS[name](max_chars, main_content)
@@ -1,9 +1,21 @@
-import logging
+import os
 import re
+import json
+import time
+import codecs
+import hashlib
+import logging
+import threading
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 from strands import tool
 from ..config import exam_config
+from .html_extract import create_extractor, PlainTextExtractor
+from ..utils.deadline_utils import cap_timeout, check_deadline, DeadlineExceeded
+from ..utils.context_utils import get_workflow_context
+from ..utils.span_utils import span
+from ..utils.question_store import question_store
+from ..utils.metrics import cache_requests, cache_evictions
 
 def is_url(text):
     """
@@ -24,25 +36,415 @@ def is_url(text):
         r'(?:/?|[/?]\S+)$', re.IGNORECASE)
     return bool(url_pattern.match(text))
 
-def limit_reference_size(text, max_length):
+def extract_page_text(html):
     """
-    限制参考资料文本大小
+    从网页HTML中提取参考资料文本
     
     Args:
-        text: 原始文本
-        max_length: 最大长度
+        html: 网页HTML
         
     Returns:
-        str: 截断后的文本
+        str: 正文文本（ExamConfig.main_content_only为False时为全部文字），每段一行，并限制在max_reference_length以内
+    """
+    extractor = create_extractor(exam_config.max_reference_length, exam_config.html_extractor, exam_config.main_content_only)
+    extractor.feed(html)
+    extractor.close()
+    return extractor.get_text()
+
+def _declared_charset(content_type):
+    match = re.search(r'charset=["\']?([\w.:-]+)', content_type or "", re.IGNORECASE)
+    return match.group(1) if match else None
+
+def _sniff_charset(head):
+    """从网页开头的<meta>声明中查找编码"""
+    match = re.search(rb'<meta[^>]+charset=["\']?([\w.:-]+)', head[:4096], re.IGNORECASE)
+    return match.group(1).decode("ascii") if match else None
+
+class ReferenceDownload:
+    """参考资料网页的流式下载
+
+    检查响应的Content-Type，逐块解码并交给网页解析器（见html_extract）提取文本；读取的字节数达到上限，
+    或者提取的文本已经足够max_reference_length时，feed返回True，调用方停止读取并关闭响应。
+    不支持增量解析的解析器在finish时才解析已经读取的内容，只受字节上限限制。
+    """
+
+    def __init__(self, url, content_type, max_bytes=None, max_chars=None, extractor=None):
+        """
+        初始化下载
+
+        Args:
+            url: 参考资料URL
+            content_type: 响应的Content-Type
+            max_bytes: 最多读取的字节数，默认为ExamConfig.fetch_max_bytes
+            max_chars: 需要的文本长度，默认为ExamConfig.max_reference_length
+            extractor: 网页解析器名称，默认为ExamConfig.html_extractor
+
+        Raises:
+            ValueError: Content-Type不是网页或纯文本
+        """
+        media_type = (content_type or "").split(";")[0].strip().lower()
+        # 没有Content-Type时按网页处理
+        if media_type and media_type not in exam_config.fetch_content_types:
+            raise ValueError(f"不支持的内容类型: {media_type}")
+        self.url = url
+        self.content_type = content_type
+        self.max_bytes = max_bytes or exam_config.fetch_max_bytes
+        max_chars = max_chars or exam_config.max_reference_length
+        if media_type == "text/plain":
+            self.extractor = PlainTextExtractor(max_chars, exam_config.main_content_only)
+        else:
+            self.extractor = create_extractor(max_chars, extractor or exam_config.html_extractor, exam_config.main_content_only)
+        self.bytes_read = 0
+        self.truncated = False
+        self._head = b""
+        self._decoder = None
+
+    def feed(self, chunk):
+        """
+        处理一块响应内容
+
+        Args:
+            chunk: 字节内容
+
+        Returns:
+            bool: 是否应当停止读取
+        """
+        if self.bytes_read + len(chunk) > self.max_bytes:
+            chunk = chunk[:self.max_bytes - self.bytes_read]
+            self.truncated = True
+        self.bytes_read += len(chunk)
+        self._decode(chunk)
+        return self.truncated or self.extractor.done
+
+    def _decode(self, chunk, final=False):
+        if self._decoder is None:
+            # 响应头没有声明编码时，先缓存开头的1KB，从<meta>中查找编码
+            self._head += chunk
+            if len(self._head) < 1024 and not (final or self.truncated or _declared_charset(self.content_type)):
+                return
+            chunk, self._head = self._head, b""
+            self._decoder = codecs.getincrementaldecoder(self._encoding(chunk))(errors="replace")
+        self.extractor.feed(self._decoder.decode(chunk, final))
+
+    def _encoding(self, head):
+        if head.startswith(codecs.BOM_UTF8):
+            return "utf-8-sig"
+        for charset in (_declared_charset(self.content_type), _sniff_charset(head)):
+            if charset:
+                try:
+                    return codecs.lookup(charset).name
+                except LookupError:
+                    pass
+        return "utf-8"
+
+    def finish(self):
+        """
+        结束下载，返回提取的文本
+
+        Returns:
+            str: 提取的文本，已限制在max_reference_length以内
+        """
+        if not self.extractor.done:
+            self._decode(b"", final=True)
+        self.extractor.close()
+        text = self.extractor.get_text()
+        if self.truncated and not self.extractor.done:
+            logging.warning(f"参考资料网页超过{self.max_bytes}字节，只提取了开头部分: {self.url}")
+            text += f"\n\n[网页超过{self.max_bytes}字节，只提取了开头部分]"
+        return text
+
+    def finish_partial(self):
+        """
+        下载被中断（超出请求时间预算）时结束下载，返回已下载部分提取的文本
+
+        Returns:
+            str: 提取的文本，文本不完整时注明只提取了已下载的部分
+        """
+        text = self.finish()
+        if text.strip() and not self.extractor.done:
+            text += "\n\n[下载超出请求时间预算，只提取了已下载的部分]"
+        return text
+
+def extraction_settings():
+    """
+    影响提取结果的配置，保存在获取缓存的条目中
+
+    Returns:
+        dict: 文本长度上限、网页字节上限、解析器和是否只保留正文
+    """
+    return {
+        "max_reference_length": exam_config.max_reference_length,
+        "fetch_max_bytes": exam_config.fetch_max_bytes,
+        "html_extractor": exam_config.html_extractor,
+        "main_content_only": exam_config.main_content_only
+    }
+
+class FetchCache:
+    """参考资料URL的获取缓存
+
+    按URL保存提取后的文本和响应的ETag/Last-Modified，每个URL一个JSON文件，多个worker进程可以共享目录。
+    新鲜期内直接返回文本；过期后由调用方带上条件请求头重新验证，服务器返回304时继续使用缓存的文本。
+    条目中记录提取时的配置（见extraction_settings），配置改变后旧的条目按未命中处理，不会再通过304延续。
+    条目数量或总大小超过上限时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, cache_dir="./cache/fetch", ttl=3600, max_entries=1000, max_bytes=50 * 1024 * 1024):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 缓存目录
+            ttl: 新鲜期（秒），超过后需要重新验证
+            max_entries: 最多保存的URL数量
+            max_bytes: 缓存文件的总大小上限（字节）
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read(self, url):
+        try:
+            with open(self._path(url), encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"读取获取缓存失败: {str(e)}")
+            return None
+        # 不同URL的哈希相同的可能性可以忽略，这里仍然核对URL
+        return entry if entry.get("url") == url else None
+
+    def _write(self, entry):
+        path = self._path(entry["url"])
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def lookup(self, url):
+        """
+        查询缓存
+
+        Args:
+            url: 参考资料URL
+
+        Returns:
+            tuple: (文本, 条件请求头, 缓存条目)。文本不为None时在新鲜期内，可以直接使用；
+                否则带上条件请求头发送请求，返回304时调用revalidated，返回新内容时调用store
+        """
+        entry = self._read(url)
+        if entry is None or entry.get("settings") != extraction_settings():
+            cache_requests.inc(cache="fetch", result="miss")
+            return None, {}, None
+        if time.time() - entry["validated_at"] < self.ttl:
+            cache_requests.inc(cache="fetch", result="hit")
+            try:
+                # 修改时间作为最近使用时间，淘汰时使用
+                os.utime(self._path(url))
+            except OSError:
+                pass
+            return entry["text"], {}, entry
+
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return None, headers, entry
+
+    def revalidated(self, url, entry, response_headers):
+        """
+        服务器返回304：延长缓存条目的新鲜期
+
+        Returns:
+            str: 缓存的文本
+        """
+        cache_requests.inc(cache="fetch", result="revalidated")
+        entry["validated_at"] = time.time()
+        entry["etag"] = response_headers.get("ETag") or entry.get("etag")
+        entry["last_modified"] = response_headers.get("Last-Modified") or entry.get("last_modified")
+        try:
+            self._write(entry)
+        except Exception as e:
+            logging.warning(f"更新获取缓存失败: {str(e)}")
+        return entry["text"]
+
+    def store(self, url, text, response_headers, replaced=None):
+        """
+        保存新获取的文本
+
+        Args:
+            url: 参考资料URL
+            text: 提取后的文本
+            response_headers: 响应头，保存其中的ETag和Last-Modified
+            replaced: 被替换的过期条目（重新验证时内容已经改变）
+        """
+        if replaced is not None:
+            cache_requests.inc(cache="fetch", result="miss")
+            cache_evictions.inc(cache="fetch", reason="expired")
+        now = time.time()
+        entry = {
+            "url": url,
+            "settings": extraction_settings(),
+            "text": text,
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+            "fetched_at": now,
+            "validated_at": now
+        }
+        try:
+            self._write(entry)
+            self._enforce_limits()
+        except Exception as e:
+            logging.warning(f"写入获取缓存失败: {str(e)}")
+
+    def _enforce_limits(self):
+        """条目数量或总大小超过上限时，按最近使用时间淘汰最旧的条目"""
+        with self._lock:
+            files = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".json"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            if len(files) <= self.max_entries and total <= self.max_bytes:
+                return
+            files.sort()
+            count = len(files)
+            for _, size, path in files:
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    cache_evictions.inc(cache="fetch", reason="capacity")
+                except FileNotFoundError:
+                    pass
+                count -= 1
+                total -= size
+
+def create_http_session(pool_size=10):
+    """
+    创建获取参考资料使用的HTTP会话，连接池在各次请求之间复用连接
+
+    Args:
+        pool_size: 每个主机保留的连接数
+
+    Returns:
+        requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# 创建全局的获取缓存和HTTP会话
+fetch_cache = FetchCache(
+    exam_config.fetch_cache_dir, exam_config.fetch_cache_ttl,
+    exam_config.fetch_cache_max_entries, exam_config.fetch_cache_max_bytes
+)
+http_session = create_http_session(exam_config.fetch_pool_size)
+
+def _deadline_fallback(url, entry, download, error):
+    """
+    下载超出请求时间预算时的结果：有过期的缓存时使用缓存的文本，否则使用已下载部分提取的文本
+
+    不完整的文本不写入缓存。还没有开始下载时重新抛出DeadlineExceeded。
+
+    Args:
+        url: 参考资料URL
+        entry: fetch_cache.lookup返回的过期条目，没有时为None
+        download: 进行中的ReferenceDownload，没有时为None
+        error: DeadlineExceeded异常
+    """
+    if entry is not None:
+        logging.warning(f"下载参考资料超出请求时间预算，使用缓存的内容: {url}")
+        return entry["text"]
+    if download is None:
+        raise error
+    logging.warning(f"下载参考资料超出请求时间预算，使用已下载的部分: {url}")
+    return download.finish_partial()
+
+def fetch_reference_text(url):
     """
-    if len(text) <= max_length:
+    获取URL并提取参考资料文本，使用共享的连接池和获取缓存
+
+    响应内容流式读取并增量提取，最多读取ExamConfig.fetch_max_bytes字节；
+    缓存过期后重新验证失败（网络错误或服务器错误）时，继续使用缓存的文本。
+
+    Args:
+        url: 参考资料URL
+
+    Returns:
+        str: 提取的文本，已限制在max_reference_length以内
+
+    Raises:
+        ValueError: 响应不是网页或纯文本
+    """
+    text, headers, entry = fetch_cache.lookup(url)
+    if text is not None:
         return text
+    # 超时时间不超过请求剩余的时间预算
+    download = None
+    with span("reference.fetch", revalidate=entry is not None) as current:
+        try:
+            with http_session.get(url, headers=headers, timeout=cap_timeout(10, minimum=1), stream=True) as response:
+                if response.status_code == 304 and entry is not None:
+                    return fetch_cache.revalidated(url, entry, response.headers)
+                response.raise_for_status()
+                # 边下载边提取，文本足够或达到字节上限后关闭连接，不读取剩余内容；
+                # 超时只限制每次读取，服务器缓慢发送时每读一块都检查请求的时间预算
+                download = ReferenceDownload(url, response.headers.get("Content-Type"))
+                for chunk in response.iter_content(exam_config.fetch_chunk_size):
+                    check_deadline("下载参考资料")
+                    if download.feed(chunk):
+                        break
+                text = download.finish()
+        except DeadlineExceeded as e:
+            return _deadline_fallback(url, entry, download, e)
+        except requests.RequestException as e:
+            if entry is None:
+                raise
+            logging.warning(f"重新验证参考资料失败，使用缓存的内容: {url}, {str(e)}")
+            return entry["text"]
+        if current is not None:
+            current.set_attribute("bytes", download.bytes_read)
+    fetch_cache.store(url, text, response.headers, replaced=entry)
+    return text
+
+def reference_result(text):
+    """
+    参考资料处理完成后的处理
     
-    # 截断文本，并添加提示信息
-    truncated_text = text[:max_length]
-    truncated_text += f"\n\n[内容已截断，原始长度: {len(text)}字符，已截断至: {max_length}字符]"
+    题目ID模式下较长的参考资料保存到服务端，只向Agent返回参考资料ID和简短预览，
+    生成题目时通过ID引用，避免参考资料在对话历史和工具参数中反复出现。
     
-    return truncated_text
+    Args:
+        text: 参考资料内容
+        
+    Returns:
+        str: 返回给调用方的内容
+    """
+    workflow_id, _ = get_workflow_context()
+    if not workflow_id or exam_config.history_mode != "handles" or len(text) < exam_config.reference_handle_min_chars:
+        return text
+    
+    reference_id = question_store.add_reference(workflow_id, text)
+    preview = text[:200].replace("\n", " ")
+    return (
+        f"参考资料已保存在服务端，参考资料ID: {reference_id}（共{len(text)}字符）。"
+        f"生成题目时把reference参数设为\"{reference_id}\"即可。内容预览: {preview}..."
+    )
 
 @tool
 def process_reference(reference: str) -> str:
@@ -58,7 +460,7 @@ def process_reference(reference: str) -> str:
         reference: 参考资料文本或URL
         
     Returns:
-        处理后的参考资料内容
+        处理后的参考资料内容；内容较长时可能返回参考资料ID，生成题目时直接传入该ID
         
     示例:
         >>> process_reference("https://example.com/article")
@@ -79,7 +481,7 @@ def process_reference(reference: str) -> str:
             logging.warning(f"URL处理失败，将使用原始文本: {str(e)}")
             return reference
     
-    return reference
+    return reference_result(reference)
 
 @tool
 def fetch_url_content(url: str) -> str:
@@ -93,33 +495,16 @@ def fetch_url_content(url: str) -> str:
         url: 需要获取内容的URL，必须是完整的URL（包含http://或https://）
         
     Returns:
-        提取的文本内容，已去除HTML标签和多余空白
+        提取的文本内容，已去除HTML标签和多余空白；内容较长时可能返回参考资料ID，生成题目时直接传入该ID
         
     示例:
         >>> fetch_url_content("https://en.wikipedia.org/wiki/Python_(programming_language)")
         "Python is a high-level, general-purpose programming language..."
     """
     try:
-        # 发送请求
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        
-        # 提取文本内容
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 移除脚本和样式元素
-        for script_or_style in soup(["script", "style"]):
-            script_or_style.extract()
-        
-        # 获取文本
-        text = soup.get_text(separator='\n', strip=True)
-        
-        # 处理多余的空行
-        lines = (line.strip() for line in text.splitlines())
-        text = '\n'.join(line for line in lines if line)
-        
-        # 限制内容大小
-        return limit_reference_size(text, exam_config.max_reference_length)
+        check_deadline("获取URL内容")
+        # 同一URL在缓存新鲜期内不会重复下载和解析
+        return reference_result(fetch_reference_text(url))
     except Exception as e:
         logging.error(f"获取URL内容失败: {str(e)}")
         raise Exception(f"获取URL内容失败: {str(e)}")
@@ -2,6 +2,52 @@ import logging
 import requests
 import re
 from ..config import server_config
+from ..utils.deadline_utils import cap_timeout
+from ..utils.span_utils import span
+from ..utils.tracing import inject_trace_headers
+
+def prepare_render_content(markdown_content):
+    """
+    把考试内容整理为渲染服务接受的Markdown文本
+    
+    Args:
+        markdown_content: 考试内容，可能是字符串、内容块列表或包含content的字典
+        
+    Returns:
+        str: 去除开头总结性文本、修正缩进后的Markdown
+    """
+    # 确保markdown_content是字符串
+    if isinstance(markdown_content, list):
+        # 如果是列表，尝试提取文本内容
+        content_str = ""
+        for item in markdown_content:
+            if isinstance(item, dict) and "text" in item:
+                content_str += item["text"]
+            elif isinstance(item, str):
+                content_str += item
+        markdown_content = content_str
+    elif isinstance(markdown_content, dict) and "content" in markdown_content:
+        # 如果是字典，尝试提取content字段
+        markdown_content = markdown_content["content"]
+    
+    # 确保是字符串类型
+    if not isinstance(markdown_content, str):
+        markdown_content = str(markdown_content)
+    
+    # 处理可能的格式问题
+    # 如果内容不是以"## "开头，检查是否有总结性文本
+    if not markdown_content.strip().startswith("## "):
+        # 尝试查找第一个"## "的位置
+        pos = markdown_content.find("\n## ")
+        if pos > 0:
+            # 移除前面的总结性文本
+            markdown_content = markdown_content[pos+1:]
+            logging.info("移除了考试内容前的总结性文本")
+    
+    # 确保缩进格式正确（3个空格后跟减号会被Flask服务替换为4个空格）
+    markdown_content = re.sub(r"^\s{3}-", "    -", markdown_content, flags=re.MULTILINE)
+    
+    return markdown_content
 
 def send_to_flask_service(markdown_content: str) -> dict:
     """
@@ -24,47 +70,22 @@ def send_to_flask_service(markdown_content: str) -> dict:
     try:
         logging.info("发送Markdown内容到Flask渲染服务")
         
-        # 确保markdown_content是字符串
-        if isinstance(markdown_content, list):
-            # 如果是列表，尝试提取文本内容
-            content_str = ""
-            for item in markdown_content:
-                if isinstance(item, dict) and "text" in item:
-                    content_str += item["text"]
-                elif isinstance(item, str):
-                    content_str += item
-            markdown_content = content_str
-        elif isinstance(markdown_content, dict) and "content" in markdown_content:
-            # 如果是字典，尝试提取content字段
-            markdown_content = markdown_content["content"]
-        
-        # 确保是字符串类型
-        if not isinstance(markdown_content, str):
-            markdown_content = str(markdown_content)
-        
-        # 处理可能的格式问题
-        # 如果内容不是以"## "开头，检查是否有总结性文本
-        if not markdown_content.strip().startswith("## "):
-            # 尝试查找第一个"## "的位置
-            pos = markdown_content.find("\n## ")
-            if pos > 0:
-                # 移除前面的总结性文本
-                markdown_content = markdown_content[pos+1:]
-                logging.info("移除了考试内容前的总结性文本")
-        
-        # 确保缩进格式正确（3个空格后跟减号会被Flask服务替换为4个空格）
-        markdown_content = re.sub(r"^\s{3}-", "    -", markdown_content, flags=re.MULTILINE)
+        markdown_content = prepare_render_content(markdown_content)
         
         # 发送请求到Flask服务
-        response = requests.post(
-            server_config.flask_service_url,
-            data=markdown_content.encode('utf-8'),  # 确保数据是字节类型
-            headers={"Content-Type": "text/plain; charset=utf-8"},
-            timeout=10
-        )
-        
-        # 检查响应状态
-        response.raise_for_status()
+        # 渲染是最后一步，预算耗尽时仍保留最短2秒，避免丢弃已生成的题目
+        with span("render"):
+            # 启用链路追踪时带上traceparent，渲染服务继续同一个追踪
+            headers = inject_trace_headers({"Content-Type": "text/plain; charset=utf-8"})
+            response = requests.post(
+                server_config.flask_service_url,
+                data=markdown_content.encode('utf-8'),  # 确保数据是字节类型
+                headers=headers,
+                timeout=cap_timeout(10, minimum=2)
+            )
+            
+            # 检查响应状态
+            response.raise_for_status()
         
         # 解析响应
         result = response.json()
@@ -1,14 +1,73 @@
-from .logging_utils import setup_logging, get_logger
-from .error_utils import handle_error, handle_agent_error
-from .task_manager import TaskManager, TaskStatus, task_manager, create_task_tracking_callback
+from .logging_utils import setup_logging, get_logger, log_payload
+from .error_utils import handle_error, handle_agent_error, InvalidRequest
+from .task_manager import TaskManager, TaskStatus, task_manager, create_task_tracking_callback, TaskTrackingHook, begin_tool_execution
+from .deadline_utils import Deadline, DeadlineExceeded, deadline_scope, get_deadline, cap_timeout, check_deadline
+from .context_utils import workflow_scope, get_workflow_context
+from .span_utils import span, start_span, end_span, summarize_spans
+from .usage_utils import record_usage, normalize_usage, estimate_cost
+from .question_store import QuestionStore, question_store
+from .scheduler import (
+    FairScheduler, generation_scheduler, schedule_scope, classify_priority,
+    PRIORITY_INTERACTIVE, PRIORITY_BATCH
+)
+from .admission import AdmissionController, AdmissionRejected, admission_controller
+from .idempotency import IdempotencyRegistry, idempotency_registry, derive_idempotency_key
+from .process_slots import ProcessSlots
+from .metrics import MetricsRegistry, metrics_registry
+from .profiling import Profiler, ProfilingError, profiler
+from .tracing import setup_tracing, start_server_span, end_otel_span, inject_trace_headers, current_trace_id
 
 __all__ = [
     'setup_logging',
     'get_logger',
+    'log_payload',
     'handle_error',
     'handle_agent_error',
+    'InvalidRequest',
     'TaskManager',
     'TaskStatus',
     'task_manager',
-    'create_task_tracking_callback'
+    'create_task_tracking_callback',
+    'TaskTrackingHook',
+    'begin_tool_execution',
+    'Deadline',
+    'DeadlineExceeded',
+    'deadline_scope',
+    'get_deadline',
+    'cap_timeout',
+    'check_deadline',
+    'workflow_scope',
+    'get_workflow_context',
+    'span',
+    'start_span',
+    'end_span',
+    'summarize_spans',
+    'record_usage',
+    'normalize_usage',
+    'estimate_cost',
+    'QuestionStore',
+    'question_store',
+    'FairScheduler',
+    'generation_scheduler',
+    'schedule_scope',
+    'classify_priority',
+    'PRIORITY_INTERACTIVE',
+    'PRIORITY_BATCH',
+    'AdmissionController',
+    'AdmissionRejected',
+    'admission_controller',
+    'IdempotencyRegistry',
+    'idempotency_registry',
+    'derive_idempotency_key',
+    'ProcessSlots',
+    'MetricsRegistry',
+    'metrics_registry',
+    'Profiler',
+    'ProfilingError',
+    'profiler',
+    'setup_tracing',
+    'start_server_span',
+    'end_otel_span',
+    'inject_trace_headers',
+    'current_trace_id'
 ]
@@ -0,0 +1,333 @@
+import os
+import math
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from ..config import server_config
+from .deadline_utils import DeadlineExceeded
+from .process_slots import ProcessSlots
+from .metrics import admission_queue_wait, admission_rejections
+
+# 拒绝原因，对应exam_admission_rejections_total的reason标签
+REJECT_QUEUE_FULL = "queue_full"
+REJECT_DRAINING = "draining"
+REJECT_TIMEOUT = "timeout"
+
+class AdmissionRejected(Exception):
+    """请求未被接纳：队列已满或排队超时"""
+
+    def __init__(self, message, retry_after, status_code=429):
+        """
+        初始化异常
+
+        Args:
+            message: 错误信息
+            retry_after: 建议客户端重试前等待的秒数
+            status_code: HTTP状态码，队列已满为429，排队超时为503
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+class _Admission:
+    """一次被接纳（或排队中）的工作流"""
+    __slots__ = ("granted", "enqueued_at", "admitted_at", "fd")
+
+    def __init__(self):
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+        self.admitted_at = None
+        self.fd = None  # 跨进程执行名额的句柄（ProcessSlots.acquire的返回值）
+
+class AdmissionController:
+    """工作流准入控制
+
+    限制同时执行的工作流数量，超出的请求在有界队列中按先后顺序等待；
+    队列也满时立即拒绝，并根据最近的工作流耗时估算Retry-After，
+    避免突发请求堆积成大量阻塞的线程和Bedrock限流。
+
+    多进程部署时可以传入ProcessSlots，执行名额和排队名额都是共享目录中的锁文件，
+    并发上限和排队上限是所有worker合计的；跨进程的排队通过轮询锁文件等待，不保证先后顺序。
+    """
+
+    def __init__(self, max_concurrent=4, max_queue_depth=8, max_queue_wait=60, ewma_alpha=0.2,
+                 process_slots=None, queue_slots=None):
+        """
+        初始化准入控制
+
+        Args:
+            max_concurrent: 同时执行的工作流数量上限
+            max_queue_depth: 排队等待的工作流数量上限
+            max_queue_wait: 在队列中最长等待时间（秒）
+            ewma_alpha: 工作流耗时指数加权移动平均的系数
+            process_slots: 跨进程共享的执行名额（可选），名额数量应等于max_concurrent
+            queue_slots: 跨进程共享的排队名额（可选，与process_slots一起使用），为None时不排队
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_wait = max_queue_wait
+        self.ewma_alpha = ewma_alpha
+        self.process_slots = process_slots
+        self.queue_slots = queue_slots
+        self._cond = threading.Condition()
+        self._running = 0
+        self._queue = deque()
+        self._average_duration = None  # 工作流耗时的指数加权移动平均（秒）
+        self._draining = False  # 进程准备退出时不再接纳新的工作流
+        self._stats = {
+            "admitted": 0,
+            "rejected": 0,
+            "timed_out": 0,
+            "completed": 0,
+            "total_queue_wait": 0.0,
+            "max_queue_wait": 0.0
+        }
+
+    def acquire(self, timeout=None):
+        """
+        申请执行一个工作流，必要时排队等待
+
+        Args:
+            timeout: 最长排队时间（秒），不超过max_queue_wait
+
+        Returns:
+            _Admission: 准入记录，执行结束后传给release
+
+        Raises:
+            AdmissionRejected: 队列已满（429）或排队超时（503）
+        """
+        wait_limit = self.max_queue_wait if timeout is None else min(timeout, self.max_queue_wait)
+        admission = _Admission()
+        if self.process_slots is not None:
+            return self._acquire_shared(admission, wait_limit)
+        with self._cond:
+            if self._draining:
+                self._record_rejection(REJECT_DRAINING)
+                raise AdmissionRejected("服务正在重启，请稍后重试", self._estimate_retry_after(1), status_code=503)
+            if self._running < self.max_concurrent and not self._queue:
+                self._grant(admission)
+                return admission
+            if len(self._queue) >= self.max_queue_depth:
+                self._record_rejection(REJECT_QUEUE_FULL)
+                raise AdmissionRejected(
+                    f"服务繁忙，正在执行{self._running}个工作流，排队{len(self._queue)}个",
+                    self._estimate_retry_after(len(self._queue) + 1)
+                )
+
+            self._queue.append(admission)
+            end = admission.enqueued_at + wait_limit
+            while not admission.granted:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(admission)
+                    self._record_rejection(REJECT_TIMEOUT)
+                    raise AdmissionRejected(
+                        f"排队等待超过{wait_limit:.0f}秒",
+                        self._estimate_retry_after(len(self._queue) + 1),
+                        status_code=503
+                    )
+                self._cond.wait(remaining)
+            return admission
+
+    def _acquire_shared(self, admission, wait_limit):
+        """
+        从跨进程的名额中申请执行一个工作流，没有空闲的执行名额时占用一个排队名额等待
+
+        Args:
+            admission: 准入记录
+            wait_limit: 最长排队时间（秒）
+
+        Returns:
+            _Admission: 准入记录
+
+        Raises:
+            AdmissionRejected: 所有worker合计的队列已满（429）或排队超时（503）
+        """
+        with self._cond:
+            if self._draining:
+                self._record_rejection(REJECT_DRAINING)
+                raise AdmissionRejected("服务正在重启，请稍后重试", self._estimate_retry_after(1), status_code=503)
+        try:
+            admission.fd = self.process_slots.acquire(timeout=0)
+        except DeadlineExceeded:
+            admission.fd = self._wait_shared(admission, wait_limit)
+        with self._cond:
+            self._grant(admission)
+        return admission
+
+    def _wait_shared(self, admission, wait_limit):
+        """
+        占用一个跨进程的排队名额，等待执行名额
+
+        Returns:
+            int: 执行名额的文件描述符
+        """
+        try:
+            if self.queue_slots is None:
+                raise DeadlineExceeded("未配置排队名额")
+            queue_fd = self.queue_slots.acquire(timeout=0)
+        except DeadlineExceeded:
+            with self._cond:
+                self._record_rejection(REJECT_QUEUE_FULL)
+                queue_depth = self._queue_depth()
+                raise AdmissionRejected(
+                    f"服务繁忙，所有worker正在执行{self.process_slots.in_use()}个工作流，排队{queue_depth}个",
+                    self._estimate_retry_after(queue_depth + 1)
+                )
+
+        with self._cond:
+            self._queue.append(admission)
+        try:
+            return self.process_slots.acquire(timeout=wait_limit)
+        except DeadlineExceeded:
+            with self._cond:
+                self._record_rejection(REJECT_TIMEOUT)
+                raise AdmissionRejected(
+                    f"排队等待超过{wait_limit:.0f}秒",
+                    self._estimate_retry_after(self._queue_depth()),
+                    status_code=503
+                )
+        finally:
+            self.queue_slots.release(queue_fd)
+            with self._cond:
+                self._queue.remove(admission)
+                self._cond.notify_all()
+
+    def release(self, admission):
+        """
+        工作流执行结束，释放名额并接纳队列中的下一个工作流
+
+        Args:
+            admission: acquire返回的准入记录
+        """
+        if admission.fd is not None:
+            self.process_slots.release(admission.fd)
+            admission.fd = None
+        with self._cond:
+            duration = time.monotonic() - admission.admitted_at
+            if self._average_duration is None:
+                self._average_duration = duration
+            else:
+                self._average_duration += self.ewma_alpha * (duration - self._average_duration)
+            self._stats["completed"] += 1
+            self._running = max(0, self._running - 1)
+            # 跨进程时排队的工作流各自等待共享名额，不在这里分配
+            while self.process_slots is None and self._queue and self._running < self.max_concurrent:
+                self._grant(self._queue.popleft())
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, timeout=None):
+        """
+        在准入名额内执行代码块
+
+        Args:
+            timeout: 最长排队时间（秒）
+
+        Yields:
+            _Admission: 准入记录
+        """
+        admission = self.acquire(timeout)
+        try:
+            yield admission
+        finally:
+            self.release(admission)
+
+    def begin_drain(self):
+        """开始排空：拒绝新的工作流，已接纳和排队中的工作流继续执行"""
+        with self._cond:
+            self._draining = True
+            self._cond.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """
+        等待所有执行中和排队中的工作流结束
+
+        Args:
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            bool: 是否已经没有执行中和排队中的工作流
+        """
+        end = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while self._running or self._queue:
+                remaining = end - time.monotonic() if end is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def _grant(self, admission):
+        """接纳一个工作流，调用方需持有锁"""
+        admission.granted = True
+        admission.admitted_at = time.monotonic()
+        wait_time = admission.admitted_at - admission.enqueued_at
+        self._running += 1
+        self._stats["admitted"] += 1
+        self._stats["total_queue_wait"] += wait_time
+        self._stats["max_queue_wait"] = max(self._stats["max_queue_wait"], wait_time)
+        admission_queue_wait.observe(wait_time)
+
+    def _record_rejection(self, reason):
+        """记录一次拒绝：队列已满和排空计入rejected，排队超时计入timed_out，调用方需持有锁"""
+        self._stats["timed_out" if reason == REJECT_TIMEOUT else "rejected"] += 1
+        admission_rejections.inc(reason=reason)
+
+    def _estimate_retry_after(self, position):
+        """
+        按当前吞吐量估算排在指定位置的请求需要等待的秒数，调用方需持有锁
+
+        吞吐量为max_concurrent / 平均工作流耗时，还没有完成的工作流时使用服务器的时间预算估算
+        """
+        average_duration = self._average_duration or server_config.workflow_timeout / 4
+        return max(1, math.ceil(position * average_duration / self.max_concurrent))
+
+    def _queue_depth(self):
+        """排队中的工作流数量，跨进程时为所有worker合计"""
+        if self.process_slots is None:
+            return len(self._queue)
+        return self.queue_slots.in_use() if self.queue_slots is not None else 0
+
+    def get_stats(self):
+        """
+        获取准入控制统计
+
+        Returns:
+            dict: 执行中和排队中的工作流数量（本进程以及所有worker合计）、排队时间、拒绝次数和当前的Retry-After估算
+        """
+        with self._cond:
+            admitted = self._stats["admitted"]
+            queue_depth = self._queue_depth()
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue_depth": self.max_queue_depth,
+                "draining": self._draining,
+                "running": self._running,
+                "queue_depth": len(self._queue),
+                "running_all_processes": self.process_slots.in_use() if self.process_slots else self._running,
+                "queue_depth_all_processes": queue_depth,
+                "admitted": admitted,
+                "completed": self._stats["completed"],
+                "rejected": self._stats["rejected"],
+                "timed_out": self._stats["timed_out"],
+                "average_queue_wait": self._stats["total_queue_wait"] / admitted if admitted else 0,
+                "max_queue_wait": self._stats["max_queue_wait"],
+                "average_workflow_duration": self._average_duration or 0,
+                "retry_after_estimate": self._estimate_retry_after(queue_depth + 1)
+            }
+
+# 创建全局准入控制实例，配置了共享状态目录时所有worker共享并发上限和排队上限
+_slots_dir = os.path.join(server_config.shared_state_dir, "slots") if server_config.shared_state_dir else None
+admission_controller = AdmissionController(
+    max_concurrent=server_config.max_concurrent_workflows,
+    max_queue_depth=server_config.max_queue_depth,
+    max_queue_wait=server_config.max_queue_wait,
+    process_slots=ProcessSlots(
+        os.path.join(_slots_dir, "workflows"), server_config.max_concurrent_workflows
+    ) if _slots_dir else None,
+    queue_slots=ProcessSlots(
+        os.path.join(_slots_dir, "workflow-queue"), server_config.max_queue_depth
+    ) if _slots_dir and server_config.max_queue_depth > 0 else None
+)
@@ -0,0 +1,47 @@
+import contextvars
+from contextlib import contextmanager
+
+# 当前工作流上下文，通过contextvars传递到Agent线程和工具线程
+_current_workflow = contextvars.ContextVar("exam_generator_workflow", default=(None, None))
+# 当前正在执行的工具调用（Strands的toolUseId）
+_current_tool_use = contextvars.ContextVar("exam_generator_tool_use", default=None)
+
+@contextmanager
+def workflow_scope(workflow_id, step_id=None):
+    """
+    在上下文中设置当前工作流和步骤
+
+    Args:
+        workflow_id: 工作流ID
+        step_id: 步骤ID（可选）
+    """
+    token = _current_workflow.set((workflow_id, step_id))
+    try:
+        yield
+    finally:
+        _current_workflow.reset(token)
+
+def get_workflow_context():
+    """
+    获取当前工作流上下文
+
+    Returns:
+        tuple: (workflow_id, step_id)，没有设置时为(None, None)
+    """
+    return _current_workflow.get()
+
+def set_current_tool_use(tool_use_id):
+    """
+    设置当前正在执行的工具调用
+
+    Args:
+        tool_use_id: Strands的toolUseId，传入None表示清除
+
+    Returns:
+        contextvars.Token: 用于恢复之前的值
+    """
+    return _current_tool_use.set(tool_use_id)
+
+def get_current_tool_use():
+    """获取当前正在执行的工具调用ID，不在工具中时返回None"""
+    return _current_tool_use.get()
@@ -0,0 +1,90 @@
+import time
+import contextvars
+from contextlib import contextmanager
+
+class DeadlineExceeded(Exception):
+    """请求的时间预算已耗尽"""
+    pass
+
+class Deadline:
+    """请求截止时间
+
+    使用单调时钟记录整个请求的时间预算，各层据此裁剪自己的超时和重试。
+    """
+    def __init__(self, timeout):
+        """
+        初始化截止时间
+
+        Args:
+            timeout: 时间预算（秒）
+        """
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self):
+        """剩余时间（秒），不会小于0"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        """时间预算是否已耗尽"""
+        return self.remaining() <= 0
+
+    def allows(self, seconds):
+        """剩余时间是否足够再等待指定秒数"""
+        return self.remaining() > seconds
+
+    def cap(self, timeout, minimum=0.0):
+        """
+        将超时时间裁剪到剩余预算以内
+
+        Args:
+            timeout: 原始超时时间（秒）
+            minimum: 下限，避免得到0超时
+
+        Returns:
+            float: 裁剪后的超时时间
+        """
+        return max(minimum, min(timeout, self.remaining()))
+
+# 当前请求的截止时间，通过contextvars在线程池和Agent线程间传递
+_current_deadline = contextvars.ContextVar("exam_generator_deadline", default=None)
+
+@contextmanager
+def deadline_scope(timeout):
+    """
+    在上下文中设置请求截止时间
+
+    Args:
+        timeout: 时间预算（秒），为None时不设置截止时间
+
+    Yields:
+        Deadline: 当前的截止时间对象（可能为None）
+    """
+    deadline = Deadline(timeout) if timeout else None
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+def get_deadline():
+    """获取当前上下文的截止时间，没有设置时返回None"""
+    return _current_deadline.get()
+
+def cap_timeout(timeout, minimum=0.0):
+    """按当前截止时间裁剪超时时间，没有截止时间时原样返回"""
+    deadline = get_deadline()
+    if deadline is None:
+        return timeout
+    return deadline.cap(timeout, minimum)
+
+def check_deadline(operation):
+    """
+    检查截止时间，已超时则抛出DeadlineExceeded
+
+    Args:
+        operation: 操作名称，用于错误信息
+    """
+    deadline = get_deadline()
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded(f"{operation}超出请求时间预算 ({deadline.timeout}秒)")
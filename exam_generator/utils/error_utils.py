@@ -1,6 +1,9 @@
 import logging
 from flask import jsonify
 
+class InvalidRequest(ValueError):
+    """请求参数无效，返回400"""
+
 def handle_error(error, workflow_id=None, step_id=None, task_manager=None):
     """处理错误并返回适当的响应
     
@@ -0,0 +1,380 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import logging
+import hashlib
+import threading
+from contextlib import contextmanager
+from ..config import server_config
+from .metrics import cache_requests, cache_evictions
+
+class _Entry:
+    """一个幂等键对应的请求"""
+    __slots__ = ("key", "done", "response", "completed_at", "workflow_id", "waiters", "token", "lock_fd", "remote")
+
+    def __init__(self, key):
+        self.key = key
+        self.done = threading.Event()
+        self.response = None  # (响应体, 状态码)
+        self.completed_at = None
+        self.workflow_id = None
+        self.waiters = 0
+        self.token = None  # 共享目录中本次执行的标识
+        self.lock_fd = None  # 执行期间持有的共享锁文件
+        self.remote = False  # 由其他worker执行（或已经完成），结果从共享目录读取
+
+class IdempotencyRegistry:
+    """考试提交的幂等注册表
+
+    相同幂等键的请求在执行中时，重复提交会等待并共享第一个请求的结果，而不是再启动一个工作流；
+    成功的结果在一段时间内保留，期间重复提交直接返回保存的结果。失败的结果不保留，重试会重新执行。
+
+    设置shared_dir时，执行中的标记和结果同时保存到各worker共享的目录：每个幂等键对应一个JSON记录和一个锁文件，
+    执行的worker在执行期间持有锁文件的fcntl.flock独占锁，进程退出时锁自动释放，其他worker据此判断执行是否还在进行；
+    落到其他worker的重复提交轮询记录等待结果，结果保留期内直接返回保存的结果。
+    """
+
+    def __init__(self, ttl=600, max_entries=1000, shared_dir=None, poll_interval=0.1, cleanup_interval=60):
+        """
+        初始化注册表
+
+        Args:
+            ttl: 成功结果的保留时间（秒）
+            max_entries: 最多保留的已完成结果数量（进程内）
+            shared_dir: 各worker共享的记录目录（可选）
+            poll_interval: 等待其他worker的结果时的轮询间隔（秒）
+            cleanup_interval: 清理共享目录中过期记录的最短间隔（秒）
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared_dir = shared_dir
+        self.poll_interval = poll_interval
+        self.cleanup_interval = cleanup_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._last_cleanup = None
+        self._stats = {"executed": 0, "coalesced": 0, "replayed": 0}
+        if shared_dir:
+            os.makedirs(shared_dir, exist_ok=True)
+
+    def begin(self, key):
+        """
+        登记一个请求
+
+        Args:
+            key: 幂等键
+
+        Returns:
+            tuple: (entry, is_owner)。is_owner为True时调用方负责执行请求并调用complete或fail；
+                   否则entry是已有的请求，可以等待其结果
+        """
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.done.is_set():
+                    self._stats["replayed"] += 1
+                    cache_requests.inc(cache="idempotency", result="hit")
+                else:
+                    self._stats["coalesced"] += 1
+                    cache_requests.inc(cache="idempotency", result="coalesced")
+                    entry.waiters += 1
+                return entry, False
+            if self.shared_dir:
+                entry = self._begin_shared(key)
+                if entry.remote:
+                    if entry.done.is_set():
+                        self._stats["replayed"] += 1
+                        cache_requests.inc(cache="idempotency", result="hit")
+                    else:
+                        self._stats["coalesced"] += 1
+                        cache_requests.inc(cache="idempotency", result="coalesced")
+                    return entry, False
+            else:
+                entry = _Entry(key)
+            self._entries[key] = entry
+            self._stats["executed"] += 1
+            cache_requests.inc(cache="idempotency", result="miss")
+            return entry, True
+
+    def set_workflow(self, key, workflow_id):
+        """记录执行中的请求对应的工作流ID"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.workflow_id = workflow_id
+        if entry is not None and entry.lock_fd is not None:
+            self._save_shared(entry, "in_flight")
+
+    def complete(self, entry, body, status=200):
+        """
+        请求执行成功，保存结果并唤醒等待的重复请求
+
+        Args:
+            entry: begin返回的entry
+            body: 响应体
+            status: HTTP状态码
+        """
+        entry.response = (body, status)
+        entry.completed_at = time.monotonic()
+        self._finish_shared(entry, "done")
+        entry.done.set()
+
+    def fail(self, entry, body, status=500):
+        """
+        请求执行失败，把结果交给等待中的重复请求，但不保留结果，之后的重试会重新执行
+
+        Args:
+            entry: begin返回的entry
+            body: 响应体
+            status: HTTP状态码
+        """
+        with self._lock:
+            if self._entries.get(entry.key) is entry:
+                del self._entries[entry.key]
+        entry.response = (body, status)
+        self._finish_shared(entry, "failed")
+        entry.done.set()
+
+    def wait(self, entry, timeout=None):
+        """
+        等待请求执行完成
+
+        Args:
+            entry: begin返回的entry
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            tuple: (响应体, 状态码)，超时时返回None
+        """
+        if entry.remote:
+            end = time.monotonic() + timeout if timeout is not None else None
+            while not entry.done.is_set():
+                result = self._poll_shared(entry)
+                if result is not None:
+                    entry.response = result
+                    entry.done.set()
+                    break
+                if end is not None and time.monotonic() >= end:
+                    return None
+                time.sleep(self.poll_interval)
+        if not entry.done.wait(timeout):
+            return None
+        return entry.response
+
+    def _paths(self, key):
+        """幂等键在共享目录中的记录和锁文件路径"""
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.shared_dir, f"{name}.json"), os.path.join(self.shared_dir, f"{name}.lock")
+
+    @contextmanager
+    def _registry_lock(self):
+        """共享目录的跨进程互斥，登记请求、判断执行是否结束和清理记录时持有"""
+        fd = os.open(os.path.join(self.shared_dir, "registry.lock"), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    @staticmethod
+    def _try_lock(path):
+        """尝试获得锁文件的独占锁，返回文件描述符，已被其他执行持有时返回None"""
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            os.close(fd)
+            return None
+
+    @staticmethod
+    def _unlock(fd):
+        """释放_try_lock获得的锁"""
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _read_record(path):
+        """读取共享目录中的记录，不存在或无法解析时返回None"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"读取幂等记录失败: {str(e)}")
+            return None
+
+    def _begin_shared(self, key):
+        """
+        在共享目录中登记请求，调用方需持有self._lock
+
+        Returns:
+            _Entry: remote为False时本进程负责执行，已持有锁文件并写入了执行中的标记；
+                    否则是其他worker执行中的请求，或者已经完成、可以直接返回的结果
+        """
+        record_path, lock_path = self._paths(key)
+        entry = _Entry(key)
+        with self._registry_lock():
+            self._cleanup_shared()
+            lock_fd = self._try_lock(lock_path)
+            record = self._read_record(record_path) or {}
+            if lock_fd is None:
+                # 其他worker正在执行，执行中的标记在登记时已经写入
+                entry.remote = True
+                entry.token = record.get("token")
+                entry.workflow_id = record.get("workflow_id")
+                return entry
+            if record.get("status") == "done" and time.time() - record.get("completed_at", 0) <= self.ttl:
+                self._unlock(lock_fd)
+                entry.remote = True
+                entry.workflow_id = record.get("workflow_id")
+                entry.response = tuple(record["response"])
+                entry.done.set()
+                return entry
+            # 没有记录、结果已过期、上次执行失败或执行的worker已经退出，由本进程执行
+            entry.token = uuid.uuid4().hex
+            entry.lock_fd = lock_fd
+            self._save_shared(entry, "in_flight")
+        return entry
+
+    def _save_shared(self, entry, status):
+        """把执行中的标记或结果写入共享目录（先写临时文件再替换）"""
+        record_path, _ = self._paths(entry.key)
+        record = {"status": status, "token": entry.token, "pid": os.getpid(), "workflow_id": entry.workflow_id}
+        if status == "in_flight":
+            record["started_at"] = time.time()
+        else:
+            record["completed_at"] = time.time()
+            record["response"] = list(entry.response)
+        tmp_path = f"{record_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, record_path)
+        except Exception as e:
+            logging.warning(f"保存幂等记录失败: {str(e)}")
+
+    def _finish_shared(self, entry, status):
+        """保存结果并释放锁文件，失败的结果只交给正在等待的其他worker，之后的登记不会重放"""
+        if entry.lock_fd is None:
+            return
+        try:
+            self._save_shared(entry, status)
+        finally:
+            self._unlock(entry.lock_fd)
+            entry.lock_fd = None
+
+    def _poll_shared(self, entry):
+        """
+        读取其他worker的执行结果
+
+        Returns:
+            tuple: (响应体, 状态码)，执行还在进行时返回None
+        """
+        record_path, lock_path = self._paths(entry.key)
+        record = self._read_record(record_path) or {}
+        if record.get("token") == entry.token and record.get("status") in ("done", "failed"):
+            entry.workflow_id = record.get("workflow_id") or entry.workflow_id
+            return tuple(record["response"])
+        if record.get("token") == entry.token:
+            with self._registry_lock():
+                lock_fd = self._try_lock(lock_path)
+                if lock_fd is None:
+                    return None
+                self._unlock(lock_fd)
+            # 锁已释放：结果可能刚刚写入，否则执行的worker已经退出
+            record = self._read_record(record_path) or {}
+            if record.get("token") == entry.token and record.get("status") in ("done", "failed"):
+                entry.workflow_id = record.get("workflow_id") or entry.workflow_id
+                return tuple(record["response"])
+        # 等待的执行已经结束但没有留下结果（worker退出，或者记录已被新的执行替换）
+        body = {"event": "workflow_finished", "data": {"outputs": {"body": {"error": "执行相同请求的worker已退出，请重试"}}}}
+        return body, 500
+
+    def _cleanup_shared(self):
+        """删除共享目录中过期的记录，调用方需持有_registry_lock；执行中（锁文件被持有）的记录不删除"""
+        now = time.monotonic()
+        if self._last_cleanup is not None and now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        for filename in os.listdir(self.shared_dir):
+            if not filename.endswith(".json"):
+                continue
+            record_path = os.path.join(self.shared_dir, filename)
+            record = self._read_record(record_path) or {}
+            if time.time() - record.get("completed_at", record.get("started_at", 0)) <= self.ttl:
+                continue
+            lock_path = record_path[:-len(".json")] + ".lock"
+            lock_fd = self._try_lock(lock_path)
+            if lock_fd is None:
+                continue
+            try:
+                os.remove(record_path)
+                os.remove(lock_path)
+                cache_evictions.inc(cache="idempotency", reason="expired")
+            except FileNotFoundError:
+                pass
+            finally:
+                self._unlock(lock_fd)
+
+    def _evict(self):
+        """删除过期的结果，已完成的结果超过上限时删除最早完成的，调用方需持有锁"""
+        now = time.monotonic()
+        completed = []
+        for key, entry in list(self._entries.items()):
+            if entry.completed_at is None:
+                continue
+            if now - entry.completed_at > self.ttl:
+                del self._entries[key]
+                cache_evictions.inc(cache="idempotency", reason="expired")
+            else:
+                completed.append(entry)
+        if len(completed) > self.max_entries:
+            completed.sort(key=lambda e: e.completed_at)
+            for entry in completed[:len(completed) - self.max_entries]:
+                del self._entries[entry.key]
+                cache_evictions.inc(cache="idempotency", reason="capacity")
+
+    def get_stats(self):
+        """
+        获取注册表统计
+
+        Returns:
+            dict: 执行中和已保存的请求数量，以及执行、合并和重放的次数
+        """
+        with self._lock:
+            in_flight = sum(1 for e in self._entries.values() if not e.done.is_set())
+            return {
+                "in_flight": in_flight,
+                "stored": len(self._entries) - in_flight,
+                **self._stats
+            }
+
+def derive_idempotency_key(inputs, tenant=None):
+    """
+    根据请求的inputs生成幂等键
+
+    inputs按键排序后序列化，相同内容的inputs得到相同的键。
+
+    Args:
+        inputs: 考试请求的inputs
+        tenant: 租户标识（可选），不同租户的相同请求不会合并
+
+    Returns:
+        str: 幂等键
+    """
+    canonical = json.dumps({"tenant": tenant, "inputs": inputs}, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return "sha256:" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+# 创建全局幂等注册表实例，配置了共享状态目录时各worker共享执行中的标记和结果
+idempotency_registry = IdempotencyRegistry(
+    ttl=server_config.idempotency_ttl,
+    shared_dir=os.path.join(server_config.shared_state_dir, "idempotency") if server_config.shared_state_dir else None
+)
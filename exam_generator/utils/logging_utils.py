@@ -1,38 +1,140 @@
-import logging
 import os
+import json
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
 from ..config import log_config
+from .metrics import log_records_dropped
+
+# 请求线程只把日志记录放入队列，格式化和写入由后台线程完成
+_queue_handler = None
+_listener = None
+_output_handlers = []
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """把日志记录原样放入有界队列
+
+    同一进程内的队列不需要序列化，消息的格式化推迟到后台线程；队列已满时丢弃记录并计数，不阻塞请求线程。
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            # 异常在这里格式化，避免traceback引用的栈帧在队列中滞留
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.inc()
+
+class _QueueListener(logging.handlers.QueueListener):
+    """后台写入线程，退出时等待队列中的记录写完"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+def _start_listener():
+    global _listener
+    log_queue = queue.Queue(log_config.queue_size)
+    _queue_handler.queue = log_queue
+    _listener = _QueueListener(log_queue, *_output_handlers, respect_handler_level=True)
+    _listener.start()
+
+def _restart_after_fork():
+    # fork出的子进程（例如gunicorn的worker）没有父进程的后台写入线程，重新创建队列和写入线程
+    if _queue_handler is not None:
+        _start_listener()
+
+def stop_logging():
+    """停止后台写入线程，写完队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
 def setup_logging():
-    """设置日志配置"""
-    # 创建日志目录（如果需要）
-    log_dir = os.path.dirname(log_config.file)
-    if log_dir and not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    
-    # 配置根日志记录器
-    logging.basicConfig(
-        level=getattr(logging, log_config.level),
-        format=log_config.format,
-        handlers=[
-            logging.FileHandler(log_config.file),
-            logging.StreamHandler()
-        ]
-    )
-    
-    # 配置Strands日志记录器
+    """设置日志配置
+
+    根日志记录器只把记录放入有界队列（LOG_QUEUE_SIZE），文件和控制台的写入由后台线程完成；
+    重复调用或根日志记录器已经有handler时不重复配置。
+    """
+    global _queue_handler, _output_handlers
+    root = logging.getLogger()
+    level = getattr(logging, log_config.level)
+    if _queue_handler is None and not root.handlers:
+        # 创建日志目录（如果需要）
+        log_dir = os.path.dirname(log_config.file)
+        if log_dir and not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+
+        formatter = logging.Formatter(log_config.format)
+        _output_handlers = [logging.FileHandler(log_config.file, encoding="utf-8"), logging.StreamHandler()]
+        for handler in _output_handlers:
+            handler.setFormatter(formatter)
+        _queue_handler = _QueueHandler(None)
+        _start_listener()
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+        atexit.register(stop_logging)
+        os.register_at_fork(after_in_child=_restart_after_fork)
+
+    # 配置Strands日志记录器，默认与LOG_LEVEL相同
     strands_logger = logging.getLogger("strands")
-    strands_logger.setLevel(getattr(logging, log_config.level))
-    
+    strands_logger.setLevel(getattr(logging, log_config.strands_level or log_config.level))
+
     # 配置请求日志记录器
     requests_logger = logging.getLogger("requests")
     requests_logger.setLevel(logging.WARNING)
-    
+
     # 配置urllib3日志记录器
     urllib3_logger = logging.getLogger("urllib3")
     urllib3_logger.setLevel(logging.WARNING)
-    
+
     logging.info("日志系统初始化完成")
 
 def get_logger(name):
     """获取指定名称的日志记录器"""
     return logging.getLogger(name)
+
+class _Payload:
+    """日志中的较大数据，在写入时才序列化并截断"""
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        try:
+            text = self.value if isinstance(self.value, str) else json.dumps(self.value, ensure_ascii=False, default=str)
+        except Exception as e:
+            return f"<无法序列化: {str(e)}>"
+        if len(text) > self.limit:
+            return f"{text[:self.limit]}...（共{len(text)}字符，已截断）"
+        return text
+
+def log_payload(logger, message, payload, level=logging.INFO):
+    """
+    记录请求体、生成结果等较大的数据
+
+    按LOG_PAYLOAD_SAMPLE_RATE抽样记录，超过LOG_PAYLOAD_MAX_CHARS字符的部分截断；
+    序列化在日志后台线程中进行，记录之后不要再修改payload。
+
+    Args:
+        logger: 日志记录器
+        message: 说明，例如"收到考试生成请求"
+        payload: 可以JSON序列化的对象或字符串
+        level: 日志级别
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if log_config.payload_sample_rate < 1 and random.random() >= log_config.payload_sample_rate:
+        return
+    logger.log(level, "%s: %s", message, _Payload(payload, log_config.payload_max_chars))
@@ -0,0 +1,362 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+
+# 默认的延迟直方图分桶（秒），覆盖缓存读写到模型调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 工作流耗时的分桶（秒）
+WORKFLOW_BUCKETS = (1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1800)
+
+class _Metric:
+    """指标的公共部分"""
+
+    type = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels):
+        try:
+            key = tuple(str(labels[name]) for name in self.labelnames)
+        except KeyError:
+            key = None
+        if key is None or len(labels) != len(self.labelnames):
+            raise ValueError(f"指标{self.name}需要标签{self.labelnames}，实际为{tuple(labels)}")
+        return key
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        """
+        增加计数
+
+        Args:
+            amount: 增加的数量
+            **labels: 标签值，必须与labelnames一致
+        """
+        shard = self.registry._shard()
+        key = (self.name, self._key(labels))
+        shard[key] = shard.get(key, 0) + amount
+
+class Histogram(_Metric):
+    """直方图，记录观测值的分布、总和和次数"""
+
+    type = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """
+        记录一个观测值
+
+        Args:
+            value: 观测值，例如耗时（秒）
+            **labels: 标签值
+        """
+        shard = self.registry._shard()
+        key = (self.name, self._key(labels))
+        values = shard.get(key)
+        if values is None:
+            # 各分桶的计数（不累计，最后一个为+Inf）和观测值总和
+            values = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+class Gauge(_Metric):
+    """在采集时通过回调函数计算的瞬时值，例如队列长度"""
+
+    type = "gauge"
+
+    def __init__(self, registry, name, documentation, labelnames=(), function=None):
+        super().__init__(registry, name, documentation, labelnames)
+        self.function = function
+
+    def collect(self):
+        """
+        调用回调函数
+
+        Returns:
+            dict: 标签值元组 -> 数值。没有标签时回调返回数值，有标签时返回{标签值或标签值元组: 数值}
+        """
+        value = self.function()
+        if not self.labelnames:
+            return {(): float(value)}
+        return {
+            (tuple(str(v) for v in labels) if isinstance(labels, tuple) else (str(labels),)): float(v)
+            for labels, v in value.items()
+        }
+
+class MetricsRegistry:
+    """进程内的指标注册表
+
+    计数器和直方图的更新写入当前线程自己的分片（一个普通dict），热点路径上不获取任何锁；
+    只有线程第一次写入时注册分片、以及采集时合并分片需要加锁。已结束线程的分片在采集时合并到汇总值中。
+
+    多进程部署时，每个worker定期把自己的汇总值写入快照目录，采集时合并所有worker的快照，
+    计数器和直方图按进程相加，瞬时值只合并仍在运行的进程。
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []  # (线程, 分片)
+        self._retired = {}  # 已结束线程的分片合并后的值
+        self._snapshot_thread = None
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"指标{metric.name}已经以不同的类型或标签注册")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """注册（或获取已注册的）计数器"""
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """注册（或获取已注册的）直方图"""
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, function, labelnames=()):
+        """
+        注册瞬时值，重复注册时替换回调函数
+
+        Args:
+            name: 指标名称
+            documentation: 说明
+            function: 采集时调用的回调函数
+            labelnames: 标签名称
+        """
+        gauge = self._register(Gauge(self, name, documentation, labelnames, function))
+        gauge.function = function
+        return gauge
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    @staticmethod
+    def _merge(target, key, value):
+        if isinstance(value, list):
+            existing = target.get(key)
+            if existing is None:
+                target[key] = list(value)
+            else:
+                for i, v in enumerate(value):
+                    existing[i] += v
+        else:
+            target[key] = target.get(key, 0) + value
+
+    def _collect_local(self):
+        """
+        合并本进程所有线程的分片
+
+        Returns:
+            dict: (指标名称, 标签值元组) -> 计数或直方图数组
+        """
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if not thread.is_alive():
+                    for key, value in shard.copy().items():
+                        self._merge(self._retired, key, value)
+                else:
+                    alive.append((thread, shard))
+            self._shards = alive
+            totals = {key: list(value) if isinstance(value, list) else value for key, value in self._retired.items()}
+            for _, shard in alive:
+                # dict.copy()在持有GIL时一次完成，不会与所属线程的写入交错
+                for key, value in shard.copy().items():
+                    self._merge(totals, key, value)
+        return totals
+
+    def _collect_gauges(self):
+        values = {}
+        for metric in list(self._metrics.values()):
+            if isinstance(metric, Gauge):
+                try:
+                    for labels, value in metric.collect().items():
+                        values[(metric.name, labels)] = value
+                except Exception as e:
+                    logging.warning(f"采集指标{metric.name}失败: {str(e)}")
+        return values
+
+    def write_snapshot(self, snapshot_dir):
+        """把本进程的指标写入快照目录（先写临时文件再替换）"""
+        os.makedirs(snapshot_dir, exist_ok=True)
+        data = {
+            "pid": os.getpid(),
+            "time": time.time(),
+            "values": [[name, list(labels), value] for (name, labels), value in self._collect_local().items()],
+            "gauges": [[name, list(labels), value] for (name, labels), value in self._collect_gauges().items()]
+        }
+        path = os.path.join(snapshot_dir, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def start_snapshot_writer(self, snapshot_dir, interval=5):
+        """
+        启动后台线程，定期把本进程的指标写入快照目录
+
+        Args:
+            snapshot_dir: 快照目录，各worker共享
+            interval: 写入间隔（秒）
+        """
+        if self._snapshot_thread is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.write_snapshot(snapshot_dir)
+                except Exception as e:
+                    logging.warning(f"写入指标快照失败: {str(e)}")
+                time.sleep(interval)
+
+        self._snapshot_thread = threading.Thread(target=run, name="metrics-snapshot", daemon=True)
+        self._snapshot_thread.start()
+
+    def collect(self, snapshot_dir=None):
+        """
+        采集所有指标
+
+        Args:
+            snapshot_dir: 快照目录（可选），设置时合并其他worker进程的快照
+
+        Returns:
+            tuple: (计数器和直方图的值, 瞬时值)，键为(指标名称, 标签值元组)
+        """
+        values = self._collect_local()
+        gauges = self._collect_gauges()
+        if not snapshot_dir or not os.path.isdir(snapshot_dir):
+            return values, gauges
+
+        for filename in os.listdir(snapshot_dir):
+            if not filename.endswith(".json") or filename == f"{os.getpid()}.json":
+                continue
+            try:
+                with open(os.path.join(snapshot_dir, filename), encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception:
+                continue
+            for name, labels, value in data.get("values", []):
+                self._merge(values, (name, tuple(labels)), value)
+            if _process_alive(data.get("pid")):
+                for name, labels, value in data.get("gauges", []):
+                    self._merge(gauges, (name, tuple(labels)), value)
+        return values, gauges
+
+    def render(self, snapshot_dir=None):
+        """
+        以Prometheus文本格式输出所有指标
+
+        Args:
+            snapshot_dir: 快照目录（可选），设置时合并其他worker进程的快照
+
+        Returns:
+            str: Prometheus文本格式（text/plain; version=0.0.4）
+        """
+        values, gauges = self.collect(snapshot_dir)
+        samples = {}
+        for (name, labels), value in list(values.items()) + list(gauges.items()):
+            samples.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            metric_samples = samples.get(metric.name, [])
+            if not metric_samples and not metric.labelnames and isinstance(metric, Counter):
+                metric_samples = [((), 0)]
+            for labels, value in sorted(metric_samples):
+                pairs = list(zip(metric.labelnames, labels))
+                if isinstance(metric, Histogram):
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (float("inf"),), value):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else _format_value(bound)
+                        lines.append(f"{metric.name}_bucket{_format_labels(pairs + [('le', le)])} {cumulative}")
+                    lines.append(f"{metric.name}_sum{_format_labels(pairs)} {_format_value(value[-1])}")
+                    lines.append(f"{metric.name}_count{_format_labels(pairs)} {cumulative}")
+                else:
+                    lines.append(f"{metric.name}{_format_labels(pairs)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def _process_alive(pid):
+    """判断进程是否仍在运行"""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+def _escape_help(text):
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+def _escape_label_value(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+# 创建全局指标注册表和服务使用的指标
+metrics_registry = MetricsRegistry()
+
+workflows_started = metrics_registry.counter(
+    "exam_workflows_started_total", "已开始的工作流数量")
+workflows_finished = metrics_registry.counter(
+    "exam_workflows_finished_total", "已结束的工作流数量", ["status"])
+workflow_duration = metrics_registry.histogram(
+    "exam_workflow_duration_seconds", "工作流从开始到结束的耗时", ["status"], buckets=WORKFLOW_BUCKETS)
+tool_call_duration = metrics_registry.histogram(
+    "exam_tool_call_duration_seconds", "Agent工具调用的执行耗时", ["tool", "status"])
+bedrock_call_duration = metrics_registry.histogram(
+    "exam_bedrock_call_duration_seconds", "单次Bedrock调用（每次尝试）的耗时（不含排队）", ["source", "status"])
+bedrock_throttles = metrics_registry.counter(
+    "exam_bedrock_throttles_total", "Bedrock调用被限流的次数", ["source"])
+bedrock_retries = metrics_registry.counter(
+    "exam_bedrock_retries_total", "Bedrock调用失败后重试的次数", ["source"])
+cache_requests = metrics_registry.counter(
+    "exam_cache_requests_total", "缓存查询次数", ["cache", "result"])
+cache_evictions = metrics_registry.counter(
+    "exam_cache_evictions_total", "缓存条目被淘汰的次数", ["cache", "reason"])
+admission_queue_wait = metrics_registry.histogram(
+    "exam_admission_queue_wait_seconds", "工作流在准入控制中等待执行名额的时间")
+admission_rejections = metrics_registry.counter(
+    "exam_admission_rejections_total", "准入控制拒绝的工作流数量", ["reason"])
+log_records_dropped = metrics_registry.counter(
+    "exam_log_records_dropped_total", "日志队列已满时丢弃的日志记录数量")
@@ -0,0 +1,107 @@
+import os
+import time
+import fcntl
+from contextlib import contextmanager
+from .deadline_utils import DeadlineExceeded
+
+class ProcessSlots:
+    """跨进程的并发名额
+
+    多个服务进程（例如gunicorn的多个worker）共享同一个名额上限。每个名额对应目录中的一个锁文件，
+    通过fcntl.flock独占锁获得；进程退出时操作系统会自动释放锁，不会遗留占用的名额。
+
+    获得名额后还持有对应的占用标记文件（.busy）的独占锁，in_use只用共享锁探测标记文件，
+    统计占用数量时不会碰名额锁文件，也就不会让同时申请名额的请求误以为名额已满。
+    """
+
+    def __init__(self, lock_dir, slots, poll_interval=0.05):
+        """
+        初始化名额
+
+        Args:
+            lock_dir: 存放锁文件的目录，所有进程需要使用同一个目录
+            slots: 名额数量
+            poll_interval: 没有空闲名额时的轮询间隔（秒）
+        """
+        self.lock_dir = lock_dir
+        self.slots = slots
+        self.poll_interval = poll_interval
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def acquire(self, timeout=None):
+        """
+        获得一个名额
+
+        Args:
+            timeout: 最长等待时间（秒），为None时一直等待
+
+        Returns:
+            tuple: 名额锁文件和占用标记文件的文件描述符，释放时传给release
+
+        Raises:
+            DeadlineExceeded: 等待超时
+        """
+        end = time.monotonic() + timeout if timeout is not None else None
+        # 不同进程从不同的名额开始尝试，减少对同一个锁文件的竞争
+        start = os.getpid() % self.slots
+        while True:
+            for offset in range(self.slots):
+                index = (start + offset) % self.slots
+                fd = os.open(self._path(index, "lock"), os.O_CREAT | os.O_RDWR, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    continue
+                # 名额已经属于本次申请，占用标记最多等待正在探测的in_use释放共享锁
+                busy_fd = os.open(self._path(index, "busy"), os.O_CREAT | os.O_RDWR, 0o644)
+                fcntl.flock(busy_fd, fcntl.LOCK_EX)
+                return fd, busy_fd
+            if end is not None and time.monotonic() >= end:
+                raise DeadlineExceeded(f"等待跨进程名额超时: {self.lock_dir}")
+            time.sleep(self.poll_interval)
+
+    def release(self, handle):
+        """释放acquire获得的名额"""
+        fd, busy_fd = handle
+        try:
+            fcntl.flock(busy_fd, fcntl.LOCK_UN)
+        finally:
+            os.close(busy_fd)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                os.close(fd)
+
+    def _path(self, index, suffix):
+        """名额锁文件（lock）或占用标记文件（busy）的路径"""
+        return os.path.join(self.lock_dir, f"slot-{index}.{suffix}")
+
+    @contextmanager
+    def slot(self, timeout=None):
+        """
+        在名额内执行代码块
+
+        Args:
+            timeout: 最长等待时间（秒）
+        """
+        fd = self.acquire(timeout)
+        try:
+            yield
+        finally:
+            self.release(fd)
+
+    def in_use(self):
+        """当前被占用的名额数量（所有进程合计）"""
+        count = 0
+        for index in range(self.slots):
+            fd = os.open(self._path(index, "busy"), os.O_CREAT | os.O_RDWR, 0o644)
+            try:
+                # 共享锁之间不冲突，多个探测可以同时进行；只有持有名额的独占锁会让探测失败
+                fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            except BlockingIOError:
+                count += 1
+            finally:
+                os.close(fd)
+        return count
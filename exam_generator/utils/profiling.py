@@ -0,0 +1,399 @@
+"""
+运行中服务的按需性能分析
+
+管理接口可以在不重启服务的情况下开启：
+- cProfile：对接下来N秒内开始的、或接下来N个工作流的请求线程做确定性分析（TaskManager记录、组卷、校验和渲染），
+  结果为pstats文件，可以用`python -m pstats`或snakeviz查看
+- 采样分析：后台线程定期读取所有线程的调用栈（包括Agent和工具线程），结果为火焰图工具使用的折叠栈（collapsed stack）文本
+- tracemalloc：对比两次快照之间新增的内存分配
+
+未开启分析时，工作流入口只检查一个属性，没有额外开销。分析只覆盖当前worker进程。
+"""
+import os
+import re
+import sys
+import math
+import time
+import uuid
+import pstats
+import cProfile
+import logging
+import tempfile
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from ..config import server_config
+
+PROFILER_CPROFILE = "cprofile"
+PROFILER_SAMPLING = "sampling"
+
+# 工作流数量模式下分析的最长时间（秒），避免一直没有请求时分析不结束
+DEFAULT_MAX_SECONDS = 600
+# 保留最近的分析会话数量
+MAX_SESSIONS = 20
+MAX_SAMPLE_DEPTH = 128
+# 采样间隔的下限（秒），更短的间隔会让采样线程占满一个CPU
+MIN_SAMPLE_INTERVAL = 0.001
+# 管理接口参数的上限：一次分析的工作流数量、tracemalloc记录的调用栈深度和快照返回的条目数
+MAX_PROFILE_WORKFLOWS = 1000
+MAX_TRACEMALLOC_FRAMES = 64
+MAX_SNAPSHOT_ENTRIES = 1000
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class ProfilingError(Exception):
+    """无法开始分析或获取结果"""
+
+    def __init__(self, message, status_code=400):
+        """
+        初始化异常
+
+        Args:
+            message: 错误信息
+            status_code: HTTP状态码，参数错误为400，已有分析在进行为409，结果不存在为404
+        """
+        super().__init__(message)
+        self.status_code = status_code
+
+def _short_path(path):
+    """把代码文件路径缩短为项目内的相对路径或第三方包内的路径"""
+    if "site-packages" + os.sep in path:
+        return path.split("site-packages" + os.sep, 1)[1]
+    if path.startswith(_PROJECT_ROOT + os.sep):
+        return os.path.relpath(path, _PROJECT_ROOT)
+    return os.path.basename(path)
+
+def _frame_label(code):
+    # 折叠栈格式中分号是栈帧分隔符
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+class ProfileSession:
+    """一次分析：按时间（seconds）或按工作流数量（workflows）结束"""
+
+    def __init__(self, profiler, seconds=None, workflows=None, interval=0.01, output_dir=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.profiler = profiler
+        self.workflows = workflows
+        self.seconds = seconds if seconds else DEFAULT_MAX_SECONDS
+        self.interval = interval
+        self.output_dir = output_dir or tempfile.gettempdir()
+        self.started_at = time.time()
+        self.finished_at = None
+        self.path = None
+        self.error = None
+        self._deadline = time.monotonic() + self.seconds
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._done = threading.Event()
+        self._workflows_started = 0
+        self._workflows_finished = 0
+        self._active = 0
+        self._stats = None
+        self._samples = Counter()
+        self._sample_count = 0
+        self._thread = None
+
+    @property
+    def running(self):
+        return not self._done.is_set()
+
+    def start(self):
+        """启动计时线程（采样分析时同时负责采样）"""
+        target = self._sample if self.profiler == PROFILER_SAMPLING else self._wait
+        self._thread = threading.Thread(target=target, name=f"profiler-{self.id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """提前结束分析，正在执行的工作流结束后写出结果"""
+        with self._lock:
+            self._stopping = True
+            finalize = self.profiler == PROFILER_CPROFILE and self._active == 0
+        if finalize:
+            self._finalize()
+
+    def wait(self, timeout=None):
+        """等待分析结束并写出结果"""
+        return self._done.wait(timeout)
+
+    def _wait(self):
+        while not self._done.is_set() and not self._stopping and time.monotonic() < self._deadline:
+            self._done.wait(min(0.5, max(self._deadline - time.monotonic(), 0)))
+        self.stop()
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        try:
+            while not self._stopping and time.monotonic() < self._deadline:
+                names = {thread.ident: re.sub(r"\d+", "N", thread.name) for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None and len(stack) < MAX_SAMPLE_DEPTH:
+                        stack.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    stack.append(names.get(thread_id, "unknown"))
+                    self._samples[";".join(reversed(stack))] += 1
+                self._sample_count += 1
+                time.sleep(self.interval)
+        except Exception as e:
+            logging.error(f"采样分析失败: {str(e)}")
+            self.error = str(e)
+        finally:
+            # 采样线程出错时也要结束分析，否则会话一直处于running，之后的分析都返回409
+            self._finalize()
+
+    def enter_workflow(self):
+        """
+        工作流开始时调用
+
+        Returns:
+            bool: 是否分析这个工作流
+        """
+        with self._lock:
+            if self._stopping or time.monotonic() >= self._deadline:
+                return False
+            if self.workflows and self._workflows_started >= self.workflows:
+                return False
+            self._workflows_started += 1
+            self._active += 1
+            return True
+
+    def exit_workflow(self, profile=None):
+        """
+        工作流结束时调用
+
+        Args:
+            profile: 工作流请求线程的cProfile.Profile（cProfile分析时）
+        """
+        with self._lock:
+            self._active -= 1
+            self._workflows_finished += 1
+            if profile is not None:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+            if self.workflows and self._workflows_finished >= self.workflows:
+                self._stopping = True
+            finalize = self.profiler == PROFILER_CPROFILE and self._stopping and self._active == 0
+        # 采样分析由采样线程在停止后写出结果
+        if finalize:
+            self._finalize()
+
+    def _finalize(self):
+        with self._lock:
+            if self._done.is_set():
+                return
+            try:
+                os.makedirs(self.output_dir, exist_ok=True)
+                if self.profiler == PROFILER_CPROFILE:
+                    self.path = os.path.join(self.output_dir, f"profile-{self.id}.pstats")
+                    if self._stats is not None:
+                        self._stats.dump_stats(self.path)
+                    else:
+                        # 分析期间没有工作流，写出空的结果
+                        profile = cProfile.Profile()
+                        profile.enable()
+                        profile.disable()
+                        pstats.Stats(profile).dump_stats(self.path)
+                else:
+                    self.path = os.path.join(self.output_dir, f"profile-{self.id}.collapsed")
+                    with open(self.path, "w", encoding="utf-8") as f:
+                        for stack, count in self._samples.most_common():
+                            f.write(f"{stack} {count}\n")
+            except Exception as e:
+                logging.error(f"写出性能分析结果失败: {str(e)}")
+                self.error = str(e)
+                self.path = None
+            self.finished_at = time.time()
+            self._done.set()
+        logging.info(f"性能分析结束: {self.id}，结果: {self.path}")
+
+    def to_dict(self):
+        """分析的状态"""
+        return {
+            "id": self.id,
+            "profiler": self.profiler,
+            "pid": os.getpid(),
+            "status": "running" if self.running else ("failed" if self.error else "finished"),
+            "seconds": self.seconds,
+            "workflows": self.workflows,
+            "workflows_profiled": self._workflows_finished,
+            "samples": self._sample_count if self.profiler == PROFILER_SAMPLING else None,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error
+        }
+
+class Profiler:
+    """进程内的按需分析器，同一时间只进行一次分析"""
+
+    def __init__(self, output_dir=None):
+        """
+        初始化分析器
+
+        Args:
+            output_dir: 分析结果目录，默认为系统临时目录
+        """
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._session = None
+        self._sessions = {}
+        self._snapshot = None
+
+    def start(self, profiler=PROFILER_CPROFILE, seconds=None, workflows=None, interval=0.01):
+        """
+        开始分析
+
+        Args:
+            profiler: "cprofile"或"sampling"
+            seconds: 分析的秒数；同时设置workflows时作为最长时间
+            workflows: 分析接下来的工作流数量
+            interval: 采样分析的采样间隔（秒）
+
+        Returns:
+            ProfileSession: 分析会话
+
+        Raises:
+            ProfilingError: 参数无效，或已有分析在进行
+        """
+        if profiler not in (PROFILER_CPROFILE, PROFILER_SAMPLING):
+            raise ProfilingError(f"未知的分析器: {profiler}，可选 {PROFILER_CPROFILE}、{PROFILER_SAMPLING}")
+        if not seconds and not workflows:
+            raise ProfilingError("需要指定seconds或workflows")
+        if seconds is not None and not (math.isfinite(seconds) and seconds > 0):
+            raise ProfilingError("seconds必须是大于0的有限数字")
+        if workflows is not None and workflows <= 0:
+            raise ProfilingError("workflows必须为正数")
+        if not (math.isfinite(interval) and interval >= MIN_SAMPLE_INTERVAL):
+            raise ProfilingError(f"interval必须是不小于{MIN_SAMPLE_INTERVAL}的有限数字")
+        with self._lock:
+            if self._session is not None and self._session.running:
+                raise ProfilingError(f"已有分析在进行: {self._session.id}", status_code=409)
+            session = ProfileSession(profiler, seconds, workflows, interval, self.output_dir)
+            self._session = session
+            self._sessions[session.id] = session
+            while len(self._sessions) > MAX_SESSIONS:
+                self._sessions.pop(next(iter(self._sessions)))
+        logging.info(f"开始性能分析: {session.id}，分析器: {profiler}，秒数: {seconds}，工作流数: {workflows}")
+        return session.start()
+
+    def stop(self):
+        """提前结束当前的分析，返回分析会话（没有分析时返回None）"""
+        session = self._session
+        if session is None or not session.running:
+            return None
+        session.stop()
+        return session
+
+    def get_session(self, session_id=None):
+        """获取指定的分析会话，默认为最近一次"""
+        if session_id is None:
+            return self._session
+        return self._sessions.get(session_id)
+
+    def result_path(self, session_id):
+        """
+        获取分析结果文件
+
+        Raises:
+            ProfilingError: 分析不存在、未结束或失败
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise ProfilingError(f"分析不存在: {session_id}（分析只保存在开始它的worker进程中）", status_code=404)
+        if session.running:
+            raise ProfilingError(f"分析尚未结束: {session_id}", status_code=409)
+        if not session.path or not os.path.exists(session.path):
+            raise ProfilingError(f"分析结果不可用: {session.error or session_id}", status_code=404)
+        return session.path
+
+    @contextmanager
+    def workflow_scope(self):
+        """
+        在工作流外使用：cProfile分析时对当前线程执行的工作流做确定性分析，采样分析时计数工作流
+
+        未在分析时只检查一个属性，没有额外开销。
+        """
+        session = self._session
+        if session is None or not session.running or not session.enter_workflow():
+            yield
+            return
+        profile = None
+        if session.profiler == PROFILER_CPROFILE:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # 当前线程已经在分析中（例如嵌套的工作流）
+                profile = None
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            session.exit_workflow(profile)
+
+    def tracemalloc_start(self, frames=1):
+        """
+        开始跟踪内存分配，并记录一次基准快照
+
+        Args:
+            frames: 每个分配记录的调用栈深度，越大开销越大
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._snapshot = tracemalloc.take_snapshot()
+        return {"tracing": True, "frames": tracemalloc.get_traceback_limit()}
+
+    def tracemalloc_snapshot(self, limit=20, key_type="lineno"):
+        """
+        记录一次快照，返回与上一次快照相比增长最多的分配位置
+
+        Args:
+            limit: 返回的条目数
+            key_type: 分组方式，"lineno"、"filename"或"traceback"
+
+        Returns:
+            dict: 当前和峰值的跟踪内存，以及按增长量排序的分配位置
+
+        Raises:
+            ProfilingError: 未开始跟踪
+        """
+        if not tracemalloc.is_tracing():
+            raise ProfilingError("未开始跟踪内存分配", status_code=409)
+        if key_type not in ("lineno", "filename", "traceback"):
+            raise ProfilingError(f"未知的分组方式: {key_type}")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+        ))
+        previous, self._snapshot = self._snapshot, snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        stats = snapshot.compare_to(previous, key_type) if previous is not None else snapshot.statistics(key_type)
+        return {
+            "traced_memory": current,
+            "peak_traced_memory": peak,
+            "top": [
+                {
+                    "location": [f"{_short_path(frame.filename)}:{frame.lineno}" for frame in stat.traceback],
+                    "size": stat.size,
+                    "size_diff": getattr(stat, "size_diff", stat.size),
+                    "count": stat.count,
+                    "count_diff": getattr(stat, "count_diff", stat.count)
+                }
+                for stat in stats[:limit]
+            ]
+        }
+
+    def tracemalloc_stop(self):
+        """停止跟踪内存分配"""
+        tracemalloc.stop()
+        self._snapshot = None
+        return {"tracing": False}
+
+# 创建全局分析器实例
+profiler = Profiler(server_config.profile_dir or None)
@@ -0,0 +1,233 @@
+import re
+import logging
+import threading
+
+# 参考资料句柄的格式，例如"ref-1"
+REFERENCE_HANDLE_PATTERN = re.compile(r'^\s*(ref-\d+)\s*$')
+
+class QuestionStore:
+    """按工作流保存已生成题目和参考资料的服务端存储
+
+    工具把生成的题目和较长的参考资料保存在这里，只把简短的句柄（题目ID、参考资料ID）
+    返回给Agent，避免完整内容在对话历史中被反复发送。最终考试由服务端按考试规划组装，
+    不依赖模型重新输出题目内容。
+    """
+
+    # 没有考试规划时的默认题型顺序
+    DEFAULT_TYPE_ORDER = ("singleChoice", "multipleChoice", "fillBlank")
+
+    def __init__(self):
+        self._workflows = {}  # workflow_id -> {"questions": {...}, "references": {...}}
+        self._lock = threading.Lock()
+
+    def _get_workflow(self, workflow_id):
+        """获取工作流的存储记录，不存在时创建"""
+        if workflow_id not in self._workflows:
+            self._workflows[workflow_id] = {
+                "questions": {},
+                "references": {},
+                "plan": None,
+                "discarded": []  # 重试时被丢弃的题目
+            }
+        return self._workflows[workflow_id]
+
+    def add_question(self, workflow_id, question_type, topic, difficulty, content,
+                     step_id=None, tool_use_id=None, fallback=False):
+        """
+        保存一道题目
+
+        Args:
+            workflow_id: 工作流ID
+            question_type: 题目类型（'singleChoice', 'multipleChoice', 'fillBlank'）
+            topic: 题目主题
+            difficulty: 难度级别
+            content: 题目的Markdown内容
+            step_id: 生成题目的步骤ID（可选）
+            tool_use_id: 生成题目的工具调用ID（可选）
+            fallback: 是否为生成失败时的备用题目
+
+        Returns:
+            str: 题目ID，例如"q1"
+        """
+        with self._lock:
+            workflow = self._get_workflow(workflow_id)
+            # 题目ID在整个工作流中递增，被丢弃的题目ID不会复用
+            question_id = f"q{len(workflow['questions']) + len(workflow['discarded']) + 1}"
+            workflow["questions"][question_id] = {
+                "id": question_id,
+                "type": question_type,
+                "topic": topic,
+                "difficulty": difficulty,
+                "content": content,
+                "step_id": step_id,
+                "tool_use_id": tool_use_id,
+                "fallback": fallback
+            }
+            return question_id
+
+    def get_questions(self, workflow_id):
+        """
+        获取工作流的所有题目
+
+        Returns:
+            list: 按生成顺序排列的题目记录
+        """
+        with self._lock:
+            workflow = self._workflows.get(workflow_id)
+            return list(workflow["questions"].values()) if workflow else []
+
+    def discard_fallbacks(self, workflow_id):
+        """
+        丢弃备用题目，使重试时重新生成
+
+        Returns:
+            list: 被丢弃的题目记录
+        """
+        with self._lock:
+            workflow = self._workflows.get(workflow_id)
+            if not workflow:
+                return []
+            removed = [q for q in workflow["questions"].values() if q["fallback"]]
+            for question in removed:
+                del workflow["questions"][question["id"]]
+            workflow["discarded"].extend(removed)
+            return removed
+
+    def get_discarded(self, workflow_id):
+        """获取重试时被丢弃的题目"""
+        with self._lock:
+            workflow = self._workflows.get(workflow_id)
+            return list(workflow["discarded"]) if workflow else []
+
+    def add_reference(self, workflow_id, text):
+        """
+        保存参考资料
+
+        Args:
+            workflow_id: 工作流ID
+            text: 参考资料内容
+
+        Returns:
+            str: 参考资料ID，例如"ref-1"；相同内容返回已有的ID
+        """
+        with self._lock:
+            references = self._get_workflow(workflow_id)["references"]
+            for reference_id, existing in references.items():
+                if existing == text:
+                    return reference_id
+            reference_id = f"ref-{len(references) + 1}"
+            references[reference_id] = text
+            return reference_id
+
+    def resolve_reference(self, workflow_id, reference):
+        """
+        把参考资料ID解析为参考资料内容
+
+        Args:
+            workflow_id: 工作流ID
+            reference: 参考资料ID或参考资料原文
+
+        Returns:
+            str: 参考资料内容；不是已知ID时原样返回
+        """
+        if not reference or not workflow_id:
+            return reference
+        match = REFERENCE_HANDLE_PATTERN.match(reference)
+        if not match:
+            return reference
+        with self._lock:
+            workflow = self._workflows.get(workflow_id)
+            if workflow and match.group(1) in workflow["references"]:
+                return workflow["references"][match.group(1)]
+        return reference
+
+    def set_plan(self, workflow_id, plan):
+        """
+        记录工作流的考试规划，组装考试时按规划的题型顺序和数量排列题目
+
+        Args:
+            workflow_id: 工作流ID
+            plan: plan_exam_content返回的规划，包含type_counts和topics
+        """
+        with self._lock:
+            self._get_workflow(workflow_id)["plan"] = plan
+
+    def get_plan(self, workflow_id):
+        """获取工作流的考试规划，没有时返回None"""
+        with self._lock:
+            workflow = self._workflows.get(workflow_id)
+            return workflow["plan"] if workflow else None
+
+    def ordered_questions(self, workflow_id):
+        """
+        按考试规划排列题目
+
+        题型按规划中type_counts的顺序排列（没有规划时使用DEFAULT_TYPE_ORDER），
+        同一题型内按主题在规划中的位置排列，主题相同时按生成顺序排列。
+        有规划时每种题型最多保留规划的数量，不在规划中的题型被丢弃。
+
+        Returns:
+            list: 排列后的题目记录
+        """
+        questions = self.get_questions(workflow_id)
+        plan = self.get_plan(workflow_id) or {}
+        type_counts = plan.get("type_counts") or {}
+        type_order = list(type_counts) or list(self.DEFAULT_TYPE_ORDER)
+        topics = list(plan.get("topics") or [])
+
+        def sort_key(question):
+            question_type = question["type"]
+            type_index = type_order.index(question_type) if question_type in type_order else len(type_order)
+            topic_index = topics.index(question["topic"]) if question["topic"] in topics else len(topics)
+            return (type_index, topic_index, int(question["id"][1:]))
+
+        ordered = []
+        kept = {}
+        for question in sorted(questions, key=sort_key):
+            question_type = question["type"]
+            if type_counts:
+                if question_type not in type_counts:
+                    logging.warning(f"题目{question['id']}的题型{question_type}不在考试规划中，已忽略")
+                    continue
+                if kept.get(question_type, 0) >= type_counts[question_type]:
+                    logging.warning(f"题目{question['id']}超出规划的{question_type}数量，已忽略")
+                    continue
+            kept[question_type] = kept.get(question_type, 0) + 1
+            ordered.append(question)
+        return ordered
+
+    def missing_counts(self, workflow_id):
+        """
+        计算距离考试规划还缺少的题目数量
+
+        Returns:
+            dict: 题型 -> 缺少的数量，只包含缺少题目的题型；没有规划时返回空字典
+        """
+        plan = self.get_plan(workflow_id) or {}
+        type_counts = plan.get("type_counts") or {}
+        kept = {}
+        for question in self.ordered_questions(workflow_id):
+            kept[question["type"]] = kept.get(question["type"], 0) + 1
+        return {
+            question_type: count - kept.get(question_type, 0)
+            for question_type, count in type_counts.items()
+            if count > kept.get(question_type, 0)
+        }
+
+    def assemble(self, workflow_id):
+        """
+        按考试规划组装考试内容
+
+        Returns:
+            str: Markdown格式的考试内容，没有题目时返回空字符串
+        """
+        questions = self.ordered_questions(workflow_id)
+        return "\n\n".join(question["content"].strip() for question in questions)
+
+    def clear(self, workflow_id):
+        """删除工作流的存储记录"""
+        with self._lock:
+            self._workflows.pop(workflow_id, None)
+
+# 创建全局题目存储实例
+question_store = QuestionStore()
@@ -0,0 +1,362 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager
+from ..config import llm_config, server_config
+from .deadline_utils import get_deadline, DeadlineExceeded
+from .process_slots import ProcessSlots
+from .span_utils import span
+
+# 优先级类别：交互式请求（小考试）优先，批量请求（大考试）在后台推进
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+
+# 当前请求的租户和优先级，通过contextvars传递到Agent线程和工具线程
+_current_schedule = contextvars.ContextVar("exam_generator_schedule", default=(None, None))
+
+@contextmanager
+def schedule_scope(tenant, priority=PRIORITY_INTERACTIVE):
+    """
+    在上下文中设置当前请求的租户和优先级
+
+    Args:
+        tenant: 租户标识（例如教师ID），同一租户的请求共享一个公平队列
+        priority: 优先级类别，PRIORITY_INTERACTIVE或PRIORITY_BATCH
+    """
+    token = _current_schedule.set((tenant, priority))
+    try:
+        yield
+    finally:
+        _current_schedule.reset(token)
+
+def get_schedule_context():
+    """
+    获取当前请求的调度上下文
+
+    Returns:
+        tuple: (tenant, priority)，没有设置时为(None, None)
+    """
+    return _current_schedule.get()
+
+def classify_priority(question_count, explicit=None, interactive_max_questions=10):
+    """
+    确定请求的优先级类别
+
+    Args:
+        question_count: 请求的题目数量
+        explicit: 请求中显式指定的优先级（可选），只能把请求降为批量优先级；
+            大考试指定interactive时仍按批量优先级调度，避免占用交互式请求的份额
+        interactive_max_questions: 交互式请求的最大题目数量
+
+    Returns:
+        str: PRIORITY_INTERACTIVE或PRIORITY_BATCH
+    """
+    if explicit == PRIORITY_BATCH:
+        return PRIORITY_BATCH
+    try:
+        question_count = int(question_count)
+    except (TypeError, ValueError):
+        return PRIORITY_INTERACTIVE
+    return PRIORITY_BATCH if question_count > interactive_max_questions else PRIORITY_INTERACTIVE
+
+class _Ticket:
+    """排队中的一次模型调用"""
+    __slots__ = ("tenant", "priority", "granted", "enqueued_at", "on_grant")
+
+    def __init__(self, tenant, priority, on_grant=None):
+        self.tenant = tenant
+        self.priority = priority
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+        self.on_grant = on_grant  # 异步调用获得槽位时的回调，在持有锁的线程中执行
+
+class FairScheduler:
+    """题目生成的公平调度器
+
+    所有题目生成的模型调用共享有限的Bedrock配额，调度器限制同时进行的调用数量：
+    - 优先级类别之间按权重分配空闲槽位（stride调度），交互式请求获得大部分槽位，
+      批量请求也不会被完全饿死
+    - 同一优先级类别内按租户轮转，一个租户的大考试不会挡住其他租户的小测验
+
+    多进程部署时可以传入ProcessSlots，获得本进程的槽位后还要获得跨进程的名额，
+    使所有worker合计的并发调用数量不超过上限；公平排队只在进程内进行。
+    """
+
+    def __init__(self, max_concurrent=3, weights=None, process_slots=None):
+        """
+        初始化调度器
+
+        Args:
+            max_concurrent: 同时进行的模型调用数量上限
+            weights: 优先级类别 -> 权重，默认交互式4、批量1
+            process_slots: 跨进程共享的名额（可选）
+        """
+        self.max_concurrent = max_concurrent
+        self.process_slots = process_slots
+        self.weights = weights or {PRIORITY_INTERACTIVE: 4, PRIORITY_BATCH: 1}
+        self._cond = threading.Condition()
+        self._running = 0
+        # 优先级类别 -> OrderedDict(租户 -> 排队的ticket)
+        self._queues = {priority: OrderedDict() for priority in self.weights}
+        # stride调度的进度值，值最小的非空类别优先获得槽位
+        self._pass = {priority: 0.0 for priority in self.weights}
+        self._stats = {
+            priority: {"granted": 0, "timed_out": 0, "total_wait_time": 0.0, "max_wait_time": 0.0}
+            for priority in self.weights
+        }
+
+    def _resolve(self, tenant, priority, timeout):
+        """用上下文中的租户、优先级和剩余时间预算补全参数"""
+        context_tenant, context_priority = get_schedule_context()
+        tenant = tenant or context_tenant or "default"
+        priority = priority or context_priority or PRIORITY_INTERACTIVE
+        if priority not in self._queues:
+            priority = PRIORITY_INTERACTIVE
+        if timeout is None:
+            deadline = get_deadline()
+            timeout = deadline.remaining() if deadline is not None else None
+        return tenant, priority, timeout
+
+    def _enqueue(self, ticket):
+        """把调用加入所属类别和租户的队列并尝试分配槽位，调用方需持有锁"""
+        queue = self._queues[ticket.priority]
+        if not any(self._queues.values()):
+            # 没有排队的调用时重置进度值，历史分配不影响新的一轮竞争
+            for p in self._pass:
+                self._pass[p] = 0.0
+        elif not queue:
+            # 类别从空变为非空时不能使用空闲期间落后的进度值抢占槽位
+            active = [self._pass[p] for p, q in self._queues.items() if q]
+            self._pass[ticket.priority] = max(self._pass[ticket.priority], min(active))
+        queue.setdefault(ticket.tenant, deque()).append(ticket)
+        self._dispatch()
+
+    def _record_wait(self, ticket):
+        """记录获得槽位前的等待时间，调用方需持有锁"""
+        wait_time = time.monotonic() - ticket.enqueued_at
+        stats = self._stats[ticket.priority]
+        stats["total_wait_time"] += wait_time
+        stats["max_wait_time"] = max(stats["max_wait_time"], wait_time)
+        if wait_time > 1:
+            logging.debug(f"题目生成排队{wait_time:.2f}秒 (租户: {ticket.tenant}, 优先级: {ticket.priority})")
+
+    def acquire(self, tenant=None, priority=None, timeout=None):
+        """
+        获取一个槽位，必要时排队等待
+
+        Args:
+            tenant: 租户标识，默认使用上下文中的租户
+            priority: 优先级类别，默认使用上下文中的优先级
+            timeout: 最长等待时间（秒），默认使用当前请求的剩余时间预算
+
+        Raises:
+            DeadlineExceeded: 等待超时
+        """
+        tenant, priority, timeout = self._resolve(tenant, priority, timeout)
+        ticket = _Ticket(tenant, priority)
+        with self._cond:
+            self._enqueue(ticket)
+
+            end = time.monotonic() + timeout if timeout is not None else None
+            while not ticket.granted:
+                remaining = end - time.monotonic() if end is not None else None
+                if remaining is not None and remaining <= 0:
+                    self._remove(ticket)
+                    self._stats[priority]["timed_out"] += 1
+                    raise DeadlineExceeded(f"等待题目生成槽位超时 (租户: {tenant}, 优先级: {priority})")
+                self._cond.wait(remaining)
+
+            self._record_wait(ticket)
+
+    async def acquire_async(self, tenant=None, priority=None, timeout=None):
+        """
+        acquire的异步版本：排队期间不占用线程，和同步调用在同一个公平队列中竞争槽位
+
+        Args:
+            tenant: 租户标识，默认使用上下文中的租户
+            priority: 优先级类别，默认使用上下文中的优先级
+            timeout: 最长等待时间（秒），默认使用当前请求的剩余时间预算
+
+        Raises:
+            DeadlineExceeded: 等待超时
+        """
+        tenant, priority, timeout = self._resolve(tenant, priority, timeout)
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            if not granted.done():
+                granted.set_result(True)
+
+        # 槽位可能由其他线程释放时分配，通过call_soon_threadsafe唤醒事件循环中的等待者
+        ticket = _Ticket(tenant, priority, on_grant=lambda: loop.call_soon_threadsafe(wake))
+        with self._cond:
+            self._enqueue(ticket)
+            if ticket.granted:
+                self._record_wait(ticket)
+                return
+
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._cond:
+                if ticket.granted:
+                    # 超时或取消的同时获得了槽位，归还给下一个排队的调用
+                    self._running = max(0, self._running - 1)
+                    self._dispatch()
+                else:
+                    self._remove(ticket)
+                if isinstance(e, asyncio.TimeoutError):
+                    self._stats[priority]["timed_out"] += 1
+            if isinstance(e, asyncio.TimeoutError):
+                raise DeadlineExceeded(f"等待题目生成槽位超时 (租户: {tenant}, 优先级: {priority})")
+            raise
+
+        with self._cond:
+            self._record_wait(ticket)
+
+    def release(self):
+        """释放一个槽位，并把它分配给下一个排队的调用"""
+        with self._cond:
+            self._running = max(0, self._running - 1)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, tenant=None, priority=None, timeout=None):
+        """
+        在槽位内执行代码块
+
+        Args:
+            tenant: 租户标识，默认使用上下文中的租户
+            priority: 优先级类别，默认使用上下文中的优先级
+            timeout: 最长等待时间（秒），默认使用当前请求的剩余时间预算
+        """
+        with span("scheduler.wait"):
+            self.acquire(tenant, priority, timeout)
+        try:
+            if self.process_slots is None:
+                yield
+            else:
+                if timeout is None:
+                    deadline = get_deadline()
+                    timeout = deadline.remaining() if deadline is not None else None
+                with self.process_slots.slot(timeout):
+                    yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def slot_async(self, tenant=None, priority=None, timeout=None):
+        """
+        slot的异步版本
+
+        Args:
+            tenant: 租户标识，默认使用上下文中的租户
+            priority: 优先级类别，默认使用上下文中的优先级
+            timeout: 最长等待时间（秒），默认使用当前请求的剩余时间预算
+        """
+        with span("scheduler.wait"):
+            await self.acquire_async(tenant, priority, timeout)
+        try:
+            if self.process_slots is None:
+                yield
+            else:
+                if timeout is None:
+                    deadline = get_deadline()
+                    timeout = deadline.remaining() if deadline is not None else None
+                # 跨进程名额使用文件锁轮询，放到线程中等待，不阻塞事件循环
+                pending = asyncio.ensure_future(asyncio.to_thread(self.process_slots.acquire, timeout))
+                try:
+                    fd = await asyncio.shield(pending)
+                except asyncio.CancelledError:
+                    # 取消时线程仍可能拿到名额，拿到后立即释放
+                    pending.add_done_callback(
+                        lambda task: task.cancelled() or task.exception() or self.process_slots.release(task.result())
+                    )
+                    raise
+                try:
+                    yield
+                finally:
+                    self.process_slots.release(fd)
+        finally:
+            self.release()
+
+    def _dispatch(self):
+        """把空闲槽位分配给排队的调用，调用方需持有锁"""
+        granted = False
+        while self._running < self.max_concurrent:
+            candidates = [p for p, queue in self._queues.items() if queue]
+            if not candidates:
+                break
+            priority = min(candidates, key=lambda p: (self._pass[p], -self.weights[p]))
+            queue = self._queues[priority]
+
+            # 取出轮到的租户的第一个调用，该租户还有排队的调用时移到队尾
+            tenant, tickets = next(iter(queue.items()))
+            ticket = tickets.popleft()
+            del queue[tenant]
+            if tickets:
+                queue[tenant] = tickets
+
+            ticket.granted = True
+            if ticket.on_grant is not None:
+                ticket.on_grant()
+            self._running += 1
+            self._pass[priority] += 1.0 / self.weights[priority]
+            self._stats[priority]["granted"] += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _remove(self, ticket):
+        """从队列中移除等待超时的调用，调用方需持有锁"""
+        queue = self._queues[ticket.priority]
+        tickets = queue.get(ticket.tenant)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del queue[ticket.tenant]
+
+    def get_stats(self):
+        """
+        获取调度统计
+
+        Returns:
+            dict: 运行中和排队中的调用数量，以及各优先级类别的分配次数和等待时间
+        """
+        with self._cond:
+            by_priority = {}
+            for priority, stats in self._stats.items():
+                queue = self._queues[priority]
+                granted = stats["granted"]
+                by_priority[priority] = {
+                    "queued": sum(len(tickets) for tickets in queue.values()),
+                    "tenants_waiting": len(queue),
+                    "granted": granted,
+                    "timed_out": stats["timed_out"],
+                    "average_wait_time": stats["total_wait_time"] / granted if granted else 0,
+                    "max_wait_time": stats["max_wait_time"]
+                }
+            return {
+                "max_concurrent": self.max_concurrent,
+                "running": self._running,
+                "running_all_processes": self.process_slots.in_use() if self.process_slots else self._running,
+                "by_priority": by_priority
+            }
+
+# 创建全局题目生成调度器实例，配置了共享状态目录时所有worker共享并发上限
+generation_scheduler = FairScheduler(
+    max_concurrent=llm_config.max_concurrent_generations,
+    weights={
+        PRIORITY_INTERACTIVE: llm_config.interactive_weight,
+        PRIORITY_BATCH: llm_config.batch_weight
+    },
+    process_slots=ProcessSlots(
+        os.path.join(server_config.shared_state_dir, "slots", "generation"),
+        llm_config.max_concurrent_generations
+    ) if server_config.shared_state_dir else None
+)
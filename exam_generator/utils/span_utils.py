@@ -0,0 +1,236 @@
+import time
+import uuid
+import logging
+import contextvars
+from contextlib import contextmanager
+from .context_utils import get_workflow_context, get_current_tool_use
+from .tracing import start_otel_span, end_otel_span
+
+# 当前正在执行的阶段，子阶段据此记录父阶段ID，通过contextvars传递到工具线程和异步任务
+_current_span = contextvars.ContextVar("exam_generator_span", default=None)
+
+class Span:
+    """工作流中的一个计时阶段
+
+    开始时间使用time.time()，可以和工作流的start_time/end_time比较；耗时使用perf_counter测量。
+    结束时记录到当前工作流，不在工作流中时不记录。
+    """
+
+    def __init__(self, name, workflow_id, step_id=None, parent=None, attributes=None):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.workflow_id = workflow_id
+        self.step_id = step_id
+        self.parent = parent
+        self.tool_use_id = get_current_tool_use()
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self._perf_start = time.perf_counter()
+        self.finished = False
+        # 启用链路追踪时对应的OpenTelemetry span
+        self.otel_span = None
+        self.otel_token = None
+
+    def set_attribute(self, key, value):
+        """设置阶段属性，例如缓存是否命中"""
+        self.attributes[key] = value
+        if self.otel_span is not None:
+            self.otel_span.set_attribute(key, _otel_value(value))
+
+    def finish(self, error=None, task_manager=None):
+        """
+        结束阶段并记录到工作流
+
+        Args:
+            error: 阶段失败时的异常或错误信息
+            task_manager: 任务管理器实例，默认使用全局实例
+
+        Returns:
+            dict: 阶段记录，已经结束过时返回None
+        """
+        if self.finished:
+            return None
+        self.finished = True
+        duration = time.perf_counter() - self._perf_start
+        if task_manager is None:
+            from .task_manager import task_manager
+        record = {
+            "id": self.id,
+            "parent_id": self.parent.id if self.parent else None,
+            "name": self.name,
+            "step_id": self.step_id,
+            "tool_use_id": self.tool_use_id,
+            "start": self.start,
+            "end": self.start + duration,
+            "duration": duration,
+            "status": "error" if error is not None else "ok",
+            "error": str(error) if error is not None else None,
+            "attributes": self.attributes
+        }
+        task_manager.record_span(self.workflow_id, record)
+        return record
+
+def start_span(name, **attributes):
+    """
+    开始一个阶段并设为当前阶段，用于开始和结束不在同一个代码块中的情况（例如工具调用的Hook）
+
+    Args:
+        name: 阶段名称，例如"model.call"、"cache.get"
+        **attributes: 阶段属性
+
+    Returns:
+        Span: 不在工作流中时返回None
+    """
+    workflow_id, step_id = get_workflow_context()
+    if not workflow_id:
+        return None
+    span = Span(name, workflow_id, step_id, parent=_current_span.get(), attributes=attributes)
+    _current_span.set(span)
+    otel_attributes = {key: _otel_value(value) for key, value in attributes.items()}
+    otel_attributes["exam.workflow_id"] = workflow_id
+    if step_id:
+        otel_attributes["exam.step_id"] = step_id
+    span.otel_span, span.otel_token = start_otel_span(name, otel_attributes)
+    return span
+
+def end_span(span, error=None):
+    """
+    结束start_span开始的阶段，并把当前阶段恢复为它的父阶段
+
+    Args:
+        span: start_span返回的Span，为None时忽略
+        error: 阶段失败时的异常或错误信息
+
+    Returns:
+        dict: 阶段记录，span为None或记录失败时返回None
+    """
+    if span is None:
+        return None
+    if _current_span.get() is span:
+        _current_span.set(span.parent)
+    try:
+        return span.finish(error)
+    except Exception as e:
+        logging.warning(f"记录阶段耗时失败: {str(e)}")
+        return None
+    finally:
+        end_otel_span(span.otel_span, span.otel_token, error)
+        span.otel_span = None
+
+@contextmanager
+def span(name, **attributes):
+    """
+    在代码块外记录一个阶段的耗时，阶段嵌套在当前工作流、步骤和外层阶段下
+
+    Args:
+        name: 阶段名称
+        **attributes: 阶段属性
+
+    Yields:
+        Span: 不在工作流中时为None
+    """
+    current = start_span(name, **attributes)
+    if current is None:
+        yield None
+        return
+    try:
+        yield current
+    except BaseException as e:
+        end_span(current, e)
+        raise
+    else:
+        end_span(current)
+    finally:
+        _current_span.set(current.parent)
+
+def _otel_value(value):
+    """OpenTelemetry属性只支持字符串、数字和布尔值"""
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value if value is not None else ""
+    return str(value)
+
+def get_current_span():
+    """获取当前阶段，不在阶段中时返回None"""
+    return _current_span.get()
+
+def critical_path(spans, start, end):
+    """
+    计算工作流的关键路径，并按阶段名称汇总关键路径上的耗时
+
+    从工作流结束时间向前回溯：每一层选择在游标之前最晚结束的子阶段，进入该子阶段递归，
+    然后把游标移到它的开始时间；没有被子阶段覆盖的时间计为父阶段自身的耗时。
+    并发执行的阶段中只有决定结束时间的那一个计入关键路径。
+
+    Args:
+        spans: 工作流记录的阶段列表
+        start: 工作流开始时间（时间戳）
+        end: 工作流结束时间（时间戳）
+
+    Returns:
+        dict: 阶段名称 -> 关键路径上的耗时（秒），不属于任何阶段的时间计为"untracked"
+    """
+    span_ids = {item["id"] for item in spans}
+    children = {}
+    for item in spans:
+        # 父阶段没有记录（例如仍在执行）时作为顶层阶段
+        parent_id = item.get("parent_id") if item.get("parent_id") in span_ids else None
+        children.setdefault(parent_id, []).append(item)
+    for items in children.values():
+        items.sort(key=lambda item: item["end"], reverse=True)
+
+    breakdown = {}
+
+    def walk(name, span_id, span_start, span_end):
+        cursor = span_end
+        for child in children.get(span_id, []):
+            if cursor <= span_start:
+                break
+            if child["start"] >= cursor:
+                # 与关键路径上更晚的阶段并发执行，不影响结束时间
+                continue
+            child_end = min(child["end"], cursor)
+            breakdown[name] = breakdown.get(name, 0) + cursor - child_end
+            child_start = max(child["start"], span_start)
+            walk(child["name"], child["id"], child_start, child_end)
+            cursor = child_start
+        breakdown[name] = breakdown.get(name, 0) + max(cursor - span_start, 0)
+
+    walk("untracked", None, start, end)
+    return breakdown
+
+def summarize_spans(spans, start=None, end=None):
+    """
+    生成阶段耗时报告
+
+    Args:
+        spans: 工作流记录的阶段列表
+        start: 工作流开始时间（时间戳），默认为最早的阶段开始时间
+        end: 工作流结束时间（时间戳），默认为最晚的阶段结束时间
+
+    Returns:
+        dict: critical_path（按关键路径耗时降序的阶段列表）、critical_path_total和phases（各阶段的次数、总耗时、最大耗时和失败次数）
+    """
+    if not spans:
+        return {"critical_path": [], "critical_path_total": 0, "phases": {}}
+    if start is None:
+        start = min(item["start"] for item in spans)
+    if end is None:
+        end = max(item["end"] for item in spans)
+
+    phases = {}
+    for item in spans:
+        stats = phases.setdefault(item["name"], {"count": 0, "total_time": 0, "max_time": 0, "errors": 0})
+        stats["count"] += 1
+        stats["total_time"] += item["duration"]
+        stats["max_time"] = max(stats["max_time"], item["duration"])
+        if item.get("status") == "error":
+            stats["errors"] += 1
+
+    breakdown = critical_path(spans, start, end)
+    total = max(end - start, 0)
+    path = [
+        {"name": name, "duration": duration, "share": duration / total if total > 0 else 0}
+        for name, duration in sorted(breakdown.items(), key=lambda item: item[1], reverse=True)
+        if duration > 0
+    ]
+    return {"critical_path": path, "critical_path_total": total, "phases": phases}
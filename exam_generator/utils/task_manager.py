@@ -1,7 +1,18 @@
+import os
+import time
 import uuid
 import logging
+import threading
+import contextvars
 from datetime import datetime
 import json
+from strands.hooks import HookProvider, BeforeToolCallEvent, AfterToolCallEvent
+from .context_utils import set_current_tool_use, get_workflow_context
+from .usage_utils import empty_usage, normalize_usage, add_usage, estimate_cost
+from .span_utils import start_span, end_span, get_current_span, summarize_spans
+from .tracing import current_trace_id
+from .metrics import workflows_started, workflows_finished, workflow_duration, tool_call_duration
+from ..config import server_config
 
 class TaskStatus:
     """任务状态枚举"""
@@ -10,11 +21,131 @@ class TaskStatus:
     COMPLETED = "completed"
     FAILED = "failed"
 
+# 每个工作流最多保存的阶段记录数量
+MAX_SPANS_PER_WORKFLOW = 20000
+
 class TaskManager:
-    """任务管理器"""
-    def __init__(self):
+    """任务管理器
+    
+    设置state_dir时，工作流在开始、每个步骤开始和结束、工作流结束时保存为JSON文件，多个worker进程共享同一个目录，
+    任意worker都能查询其他worker处理的工作流（包括执行中的进度）和评估报告。
+    设置ttl时，结束超过ttl秒的工作流从内存中删除，共享状态目录中超过ttl秒没有更新的文件也被删除。
+    """
+    def __init__(self, state_dir=None, ttl=None, cleanup_interval=60):
+        """
+        初始化任务管理器
+
+        Args:
+            state_dir: 各worker共享的状态目录（可选）
+            ttl: 工作流结束后保留的时间（秒），为None时一直保留
+            cleanup_interval: 清理过期工作流的最短间隔（秒）
+        """
         self.tasks = {}  # workflow_id -> workflow_data
         self.current_workflow_id = None
+        self._usage_lock = threading.Lock()  # 并发的模型调用会同时累加token统计
+        self.state_dir = state_dir
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = None
+        self._loaded = {}  # workflow_id -> (文件修改时间, 工作流)，其他进程的文件没有变化时不重新读取
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+    
+    def _persist(self, workflow_id):
+        """把工作流保存到共享状态目录"""
+        if not self.state_dir or workflow_id not in self.tasks:
+            return
+        path = os.path.join(self.state_dir, f"{workflow_id}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with self._usage_lock:
+                data = json.dumps(self.tasks[workflow_id], ensure_ascii=False, default=str)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning(f"保存工作流状态失败: {str(e)}")
+    
+    def _load(self, workflow_id):
+        """从共享状态目录读取其他进程保存的工作流"""
+        if not self.state_dir or not workflow_id:
+            return None
+        path = os.path.join(self.state_dir, f"{os.path.basename(workflow_id)}.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"读取工作流状态失败: {str(e)}")
+            return None
+    
+    def _all_workflows(self):
+        """所有工作流，包括其他进程保存在共享状态目录中的工作流
+
+        本进程的工作流直接使用内存中的数据；其他进程的文件按修改时间缓存，没有变化时不重新读取。
+        """
+        self.cleanup()
+        workflows = {}
+        if self.state_dir:
+            seen = set()
+            for entry in sorted(os.scandir(self.state_dir), key=lambda e: e.name):
+                if not entry.name.endswith(".json"):
+                    continue
+                workflow_id = entry.name[:-len(".json")]
+                seen.add(workflow_id)
+                if workflow_id in self.tasks:
+                    continue
+                try:
+                    mtime = entry.stat().st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                cached = self._loaded.get(workflow_id)
+                if cached is None or cached[0] != mtime:
+                    workflow = self._load(workflow_id)
+                    if not workflow:
+                        continue
+                    cached = self._loaded[workflow_id] = (mtime, workflow)
+                workflows[cached[1]["id"]] = cached[1]
+            for workflow_id in set(self._loaded) - seen:
+                self._loaded.pop(workflow_id, None)
+        workflows.update(self.tasks)
+        return workflows
+    
+    def cleanup(self, force=False):
+        """
+        删除过期的工作流：本进程中结束超过ttl秒的工作流，以及共享状态目录中超过ttl秒没有更新的文件
+        
+        执行中的工作流每个步骤都会更新文件，长时间没有更新的文件属于已经结束或者worker已退出的工作流。
+        
+        Args:
+            force: 为True时忽略cleanup_interval立即清理
+        """
+        if self.ttl is None:
+            return
+        now = time.monotonic()
+        if not force and self._last_cleanup is not None and now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        
+        expire_before = time.time() - self.ttl
+        for workflow_id, workflow in list(self.tasks.items()):
+            end_time = workflow.get("end_time")
+            if end_time and datetime.fromisoformat(end_time).timestamp() < expire_before:
+                self.tasks.pop(workflow_id, None)
+        if not self.state_dir:
+            return
+        for entry in os.scandir(self.state_dir):
+            if not entry.name.endswith((".json", ".tmp")) or entry.name[:-len(".json")] in self.tasks:
+                continue
+            try:
+                if entry.stat().st_mtime < expire_before:
+                    os.remove(entry.path)
+                    self._loaded.pop(entry.name[:-len(".json")], None)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logging.warning(f"删除过期的工作流状态失败: {str(e)}")
     
     def start_workflow(self, name, description=None, input_data=None):
         """开始一个新的工作流"""
@@ -27,9 +158,17 @@ class TaskManager:
             "status": TaskStatus.RUNNING,
             "start_time": datetime.now().isoformat(),
             "end_time": None,
-            "steps": []
+            "steps": [],
+            "token_usage": empty_usage(),
+            "token_usage_by_source": {},
+            "spans": [],
+            # 启用链路追踪时所属的追踪ID，用于在追踪后端中查找这个工作流
+            "trace_id": current_trace_id()
         }
         self.current_workflow_id = workflow_id
+        self._persist(workflow_id)
+        workflows_started.inc()
+        self.cleanup()
         return workflow_id
     
     def complete_workflow(self, workflow_id, output_data=None):
@@ -38,6 +177,8 @@ class TaskManager:
             self.tasks[workflow_id]["status"] = TaskStatus.COMPLETED
             self.tasks[workflow_id]["end_time"] = datetime.now().isoformat()
             self.tasks[workflow_id]["output_data"] = output_data
+            self._persist(workflow_id)
+            self._observe_finished(workflow_id)
     
     def fail_workflow(self, workflow_id, error):
         """标记工作流失败"""
@@ -45,6 +186,16 @@ class TaskManager:
             self.tasks[workflow_id]["status"] = TaskStatus.FAILED
             self.tasks[workflow_id]["end_time"] = datetime.now().isoformat()
             self.tasks[workflow_id]["error"] = str(error)
+            self._persist(workflow_id)
+            self._observe_finished(workflow_id)
+    
+    def _observe_finished(self, workflow_id):
+        """记录工作流结束的指标"""
+        workflow = self.tasks[workflow_id]
+        status = workflow["status"]
+        workflows_finished.inc(status=status)
+        duration = datetime.fromisoformat(workflow["end_time"]) - datetime.fromisoformat(workflow["start_time"])
+        workflow_duration.observe(duration.total_seconds(), status=status)
     
     def add_step(self, workflow_id, name, description=None):
         """添加工作流步骤"""
@@ -55,7 +206,8 @@ class TaskManager:
                 "name": name,
                 "description": description,
                 "status": TaskStatus.PENDING,
-                "tool_calls": []
+                "tool_calls": [],
+                "token_usage": empty_usage()
             }
             self.tasks[workflow_id]["steps"].append(step)
             return step_id
@@ -70,6 +222,7 @@ class TaskManager:
                     step["start_time"] = datetime.now().isoformat()
                     step["input_data"] = input_data
                     break
+            self._persist(workflow_id)
     
     def complete_step(self, workflow_id, step_id, output_data=None):
         """完成步骤"""
@@ -80,6 +233,7 @@ class TaskManager:
                     step["end_time"] = datetime.now().isoformat()
                     step["output_data"] = output_data
                     break
+            self._persist(workflow_id)
     
     def fail_step(self, workflow_id, step_id, error):
         """标记步骤失败"""
@@ -90,8 +244,9 @@ class TaskManager:
                     step["end_time"] = datetime.now().isoformat()
                     step["error"] = str(error)
                     break
+            self._persist(workflow_id)
     
-    def record_tool_call(self, workflow_id, step_id, tool_name, input_data=None):
+    def record_tool_call(self, workflow_id, step_id, tool_name, input_data=None, tool_use_id=None):
         """记录工具调用"""
         if workflow_id in self.tasks:
             for step in self.tasks[workflow_id]["steps"]:
@@ -100,9 +255,11 @@ class TaskManager:
                     tool_call = {
                         "id": tool_call_id,
                         "tool_name": tool_name,
+                        "tool_use_id": tool_use_id,
                         "input_data": input_data,
                         "status": TaskStatus.RUNNING,
-                        "start_time": datetime.now().isoformat()
+                        "start_time": datetime.now().isoformat(),
+                        "token_usage": empty_usage()
                     }
                     step["tool_calls"].append(tool_call)
                     return tool_call_id
@@ -132,13 +289,121 @@ class TaskManager:
                             tool_call["error"] = str(error)
                             break
     
+    def find_tool_call(self, workflow_id, tool_use_id):
+        """
+        根据Strands的toolUseId查找工具调用记录
+        
+        Returns:
+            tuple: (step_id, tool_call)，找不到时返回(None, None)
+        """
+        if workflow_id in self.tasks and tool_use_id:
+            for step in self.tasks[workflow_id]["steps"]:
+                for tool_call in step["tool_calls"]:
+                    if tool_call.get("tool_use_id") == tool_use_id:
+                        return step["id"], tool_call
+        return None, None
+    
+    def record_model_usage(self, workflow_id, step_id=None, tool_use_id=None, source="unknown", usage=None):
+        """
+        记录一次模型调用的token用量
+        
+        用量会累加到工作流、步骤和（如果能找到）对应的工具调用记录上。
+        
+        Args:
+            workflow_id: 工作流ID
+            step_id: 步骤ID（可选）
+            tool_use_id: Strands的toolUseId（可选），用于关联工具调用记录
+            source: 调用来源，例如"agent"或工具名称
+            usage: normalize_usage返回的统一格式token统计
+        """
+        if workflow_id not in self.tasks or not usage:
+            return
+        
+        with self._usage_lock:
+            workflow = self.tasks[workflow_id]
+            add_usage(workflow["token_usage"], usage)
+            by_source = workflow["token_usage_by_source"].setdefault(source, empty_usage())
+            add_usage(by_source, usage)
+            
+            for step in workflow["steps"]:
+                if step_id and step["id"] == step_id:
+                    add_usage(step["token_usage"], usage)
+                if tool_use_id:
+                    for tool_call in step["tool_calls"]:
+                        if tool_call.get("tool_use_id") == tool_use_id:
+                            add_usage(tool_call["token_usage"], usage)
+                            break
+    
+    def record_span(self, workflow_id, span):
+        """
+        记录一个阶段的耗时
+
+        超过MAX_SPANS_PER_WORKFLOW后只计数，避免超大工作流的记录无限增长。
+
+        Args:
+            workflow_id: 工作流ID
+            span: Span.finish生成的阶段记录
+        """
+        if workflow_id not in self.tasks:
+            return
+        with self._usage_lock:
+            workflow = self.tasks[workflow_id]
+            spans = workflow.setdefault("spans", [])
+            if len(spans) < MAX_SPANS_PER_WORKFLOW:
+                spans.append(span)
+            else:
+                workflow["spans_dropped"] = workflow.get("spans_dropped", 0) + 1
+    
+    def record_generation_work(self, workflow_id, step_id, used_questions, discarded_questions):
+        """
+        记录考试生成中被复用和被浪费的工作量
+        
+        失败的步骤中已生成的题目在重试时会被保留，这些题目计为复用；
+        失败步骤中其余的token用量以及被丢弃题目的token用量计为浪费。
+        
+        Args:
+            workflow_id: 工作流ID
+            step_id: 最终成功的步骤ID
+            used_questions: 最终考试中使用的题目记录（QuestionStore的题目记录）
+            discarded_questions: 被丢弃的题目记录
+        """
+        workflow = self.tasks.get(workflow_id)
+        if not workflow:
+            return
+        
+        def question_tokens(question):
+            _, tool_call = self.find_tool_call(workflow_id, question.get("tool_use_id"))
+            usage = tool_call["token_usage"] if tool_call else {}
+            return usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+        
+        failed_steps = [s for s in workflow["steps"] if s.get("status") == TaskStatus.FAILED]
+        failed_step_ids = {s["id"] for s in failed_steps}
+        failed_tokens = sum(
+            s["token_usage"].get("input_tokens", 0) + s["token_usage"].get("output_tokens", 0)
+            for s in failed_steps
+        )
+        reused = [q for q in used_questions if q.get("step_id") in failed_step_ids]
+        reused_tokens = sum(question_tokens(q) for q in reused)
+        # 失败步骤中的丢弃题目已经包含在失败步骤的用量中
+        discarded_tokens = sum(question_tokens(q) for q in discarded_questions if q.get("step_id") not in failed_step_ids)
+        
+        workflow["generation_work"] = {
+            "questions_used": len(used_questions),
+            "questions_reused": len(reused),
+            "questions_discarded": len(discarded_questions),
+            "failed_steps": len(failed_steps),
+            "reused_tokens": reused_tokens,
+            "wasted_tokens": max(failed_tokens - reused_tokens, 0) + discarded_tokens,
+            "final_step_id": step_id
+        }
+    
     def get_workflow(self, workflow_id):
-        """获取工作流数据"""
-        return self.tasks.get(workflow_id)
+        """获取工作流数据，本进程没有时从共享状态目录读取"""
+        return self.tasks.get(workflow_id) or self._load(workflow_id)
     
     def get_workflows(self):
-        """获取所有工作流数据"""
-        return self.tasks
+        """获取所有工作流数据，包括其他进程保存在共享状态目录中的工作流"""
+        return self._all_workflows()
     
     def get_interrupted_workflows(self):
         """获取中断的工作流"""
@@ -173,9 +438,14 @@ class TaskManager:
                     "total": 0,
                     "successful": 0,
                     "failed": 0,
+                    "input_tokens": 0,
+                    "output_tokens": 0,
                     "execution_times": []  # 添加执行时间列表
                 }
             tool_distribution[tool_name]["total"] += 1
+            tool_usage = tc.get("token_usage", {})
+            tool_distribution[tool_name]["input_tokens"] += tool_usage.get("input_tokens", 0)
+            tool_distribution[tool_name]["output_tokens"] += tool_usage.get("output_tokens", 0)
             if tc.get("status") == TaskStatus.COMPLETED:
                 tool_distribution[tool_name]["successful"] += 1
             elif tc.get("status") == TaskStatus.FAILED:
@@ -214,6 +484,7 @@ class TaskManager:
             "workflow_id": workflow_id,
             "workflow_name": workflow["name"],
             "status": workflow["status"],
+            "trace_id": workflow.get("trace_id"),
             "execution_time": None,
             "tool_call_statistics": {
                 "total": total_tool_calls,
@@ -230,7 +501,13 @@ class TaskManager:
             },
             "performance_metrics": {
                 "average_tool_execution_time": avg_tool_time
-            }
+            },
+            "token_usage": self._summarize_usage(workflow.get("token_usage", empty_usage())),
+            "token_usage_by_source": {
+                source: self._summarize_usage(usage)
+                for source, usage in workflow.get("token_usage_by_source", {}).items()
+            },
+            "generation_work": workflow.get("generation_work", {})
         }
         
         # 计算总执行时间
@@ -239,35 +516,70 @@ class TaskManager:
             end = datetime.fromisoformat(workflow["end_time"])
             report["execution_time"] = (end - start).total_seconds()
         
+        # 按阶段的耗时和关键路径，工作流未结束时以最晚结束的阶段为终点
+        with self._usage_lock:
+            spans = list(workflow.get("spans", []))
+        workflow_start = datetime.fromisoformat(workflow["start_time"]).timestamp() if workflow.get("start_time") else None
+        workflow_end = datetime.fromisoformat(workflow["end_time"]).timestamp() if workflow.get("end_time") else None
+        report["phase_breakdown"] = summarize_spans(spans, workflow_start, workflow_end)
+        report["phase_breakdown"]["spans_dropped"] = workflow.get("spans_dropped", 0)
+        
         return report
     
+    def _summarize_usage(self, usage):
+        """为报告生成token统计摘要，附带总token数、估算费用和提示词缓存命中率"""
+        summary = dict(usage)
+        summary["total_tokens"] = usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+        summary["estimated_cost"] = round(estimate_cost(usage), 6)
+        model_calls = usage.get("model_calls", 0)
+        summary["cache_hit_rate"] = usage.get("cache_hits", 0) / model_calls if model_calls > 0 else 0
+        return summary
+    
+    def generate_token_summary(self):
+        """汇总所有工作流的token用量和估算费用"""
+        total = empty_usage()
+        by_source = {}
+        workflows = self._all_workflows()
+        for workflow in workflows.values():
+            add_usage(total, workflow.get("token_usage", empty_usage()))
+            for source, usage in workflow.get("token_usage_by_source", {}).items():
+                add_usage(by_source.setdefault(source, empty_usage()), usage)
+        summary = self._summarize_usage(total)
+        summary["workflows"] = len(workflows)
+        summary["by_source"] = {source: self._summarize_usage(usage) for source, usage in by_source.items()}
+        return summary
+    
     def generate_evaluation_report(self, workflow_id=None):
         """生成评估报告"""
         if workflow_id:
             return self._generate_workflow_report(workflow_id)
         else:
             reports = []
-            for wf_id in self.tasks:
+            for wf_id in self._all_workflows():
                 reports.append(self._generate_workflow_report(wf_id))
             return reports
 
-# 创建全局任务管理器实例
-task_manager = TaskManager()
+# 创建全局任务管理器实例，配置了共享状态目录时各worker进程共享工作流状态
+task_manager = TaskManager(
+    state_dir=os.path.join(server_config.shared_state_dir, "tasks") if server_config.shared_state_dir else None,
+    ttl=server_config.task_state_ttl
+)
 
 def create_task_tracking_callback(task_manager, workflow_id, step_id):
     """创建用于任务跟踪的回调函数"""
     
     tool_call_map = {}  # 工具调用ID到工具调用记录ID的映射
+    # 每个流式片段都会调用回调，未开启DEBUG时跳过片段日志
+    debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG)
     
     def callback_handler(**kwargs):
-        # 获取上一个工具调用ID
-        last_tool_id = getattr(callback_handler, 'last_tool_id', None)
-        # 添加调试日志，查看实际接收到的事件格式
-        logging.debug(f"回调接收到事件: {kwargs.keys()}")
+        if debug_enabled:
+            logging.debug("回调接收到事件: %s", kwargs.keys())
         
         if "data" in kwargs:
             # 记录模型生成的文本
-            logging.debug(f"模型生成: {kwargs['data']}")
+            if debug_enabled:
+                logging.debug("模型生成: %s", kwargs['data'])
             
         elif "current_tool_use" in kwargs:
             tool_use = kwargs["current_tool_use"]
@@ -275,36 +587,12 @@ def create_task_tracking_callback(task_manager, workflow_id, step_id):
             tool_name = tool_use.get("name")
             tool_status = tool_use.get("status")
             
-            logging.info(f"工具调用: {tool_name}, 状态: {tool_status}, ID: {tool_id}")
+            logging.debug("工具调用: %s, 状态: %s, ID: %s", tool_name, tool_status, tool_id)
             
             # 如果状态为None，但有工具名称和ID，则视为工具调用开始
+            # 同一轮中的多个工具调用可能并发执行，这里只记录开始，
+            # 完成和失败由TaskTrackingHook在工具实际执行结束时按toolUseId记录
             if tool_status is None and tool_name and tool_id:
-                # 如果有上一个工具调用，并且与当前不同，则自动完成上一个
-                if last_tool_id and last_tool_id != tool_id and last_tool_id in tool_call_map:
-                    prev_tool_call_id = tool_call_map[last_tool_id]
-                    # 检查工具调用是否已经完成
-                    is_completed = False
-                    for step in task_manager.tasks[workflow_id]["steps"]:
-                        for tool_call in step["tool_calls"]:
-                            if tool_call["id"] == prev_tool_call_id and tool_call["status"] != TaskStatus.RUNNING:
-                                is_completed = True
-                                break
-                        if is_completed:
-                            break
-                    
-                    if not is_completed:
-                        # 自动标记为完成
-                        task_manager.complete_tool_call(
-                            workflow_id=workflow_id,
-                            step_id=step_id,
-                            tool_call_id=prev_tool_call_id,
-                            output_data="自动标记为完成"
-                        )
-                        logging.info(f"自动标记上一个工具调用完成: {last_tool_id}")
-                
-                # 更新上一个工具调用ID
-                callback_handler.last_tool_id = tool_id
-                
                 # 检查这个工具ID是否已经记录过
                 if tool_id not in tool_call_map:
                     # 记录工具调用开始
@@ -312,7 +600,8 @@ def create_task_tracking_callback(task_manager, workflow_id, step_id):
                         workflow_id=workflow_id,
                         step_id=step_id,
                         tool_name=tool_name,
-                        input_data=tool_use.get("input")
+                        input_data=tool_use.get("input"),
+                        tool_use_id=tool_id
                     )
                     tool_call_map[tool_id] = tool_call_id
                     logging.info(f"记录工具调用开始: {tool_name}, ID: {tool_call_id}")
@@ -363,7 +652,8 @@ def create_task_tracking_callback(task_manager, workflow_id, step_id):
                     workflow_id=workflow_id,
                     step_id=step_id,
                     tool_name=tool_name,
-                    input_data=tool_use.get("input")
+                    input_data=tool_use.get("input"),
+                    tool_use_id=tool_id
                 )
                 tool_call_map[tool_id] = tool_call_id
                 logging.info(f"记录工具调用开始: {tool_name}, ID: {tool_call_id}")
@@ -392,8 +682,120 @@ def create_task_tracking_callback(task_manager, workflow_id, step_id):
             elif tool_id not in tool_call_map and tool_status != "started":
                 logging.warning(f"收到未知工具调用的状态更新: {tool_name}, 状态: {tool_status}, ID: {tool_id}")
         
+        elif "event" in kwargs and isinstance(kwargs["event"], dict) and "metadata" in kwargs["event"]:
+            # 模型调用结束时的元数据事件，包含本次调用的token用量
+            usage = kwargs["event"]["metadata"].get("usage")
+            if usage:
+                task_manager.record_model_usage(
+                    workflow_id,
+                    step_id=step_id,
+                    source="agent",
+                    usage=normalize_usage(usage)
+                )
+        
         # 记录其他类型的事件
         else:
             logging.debug(f"收到其他类型的事件: {kwargs.keys()}")
     
     return callback_handler
+
+# 等待并发名额的工具调用获得名额后要执行的计时开始操作，由TaskTrackingHook设置
+_pending_tool_start = contextvars.ContextVar("exam_generator_pending_tool_start", default=None)
+
+def begin_tool_execution():
+    """
+    等待并发名额的工具获得名额后调用，开始TaskTrackingHook推迟的工具阶段和执行计时
+
+    工具的deferred_start属性为True时，TaskTrackingHook在工具调用前只记录调用，
+    排队等待的时间不计入工具的执行时间。不在工作流中时不做任何事。
+    """
+    start = _pending_tool_start.get()
+    if start is not None:
+        _pending_tool_start.set(None)
+        start()
+
+class TaskTrackingHook(HookProvider):
+    """按toolUseId跟踪工具实际执行的Hook
+    
+    工作流和步骤从上下文（workflow_scope）中获取，因此同一个Hook可以在多个请求间复用。
+    - 工具开始执行时设置当前toolUseId，工具内的模型调用据此关联token用量
+    - 工具执行结束时按toolUseId完成或失败对应的工具调用记录，
+      并发执行的多个工具调用互不影响
+    """
+    
+    def __init__(self, task_manager=None):
+        self._task_manager = task_manager
+    
+    @property
+    def task_manager(self):
+        return self._task_manager or task_manager
+    
+    def register_hooks(self, registry, **kwargs):
+        registry.add_callback(BeforeToolCallEvent, self.before_tool_call)
+        registry.add_callback(AfterToolCallEvent, self.after_tool_call)
+    
+    def before_tool_call(self, event):
+        tool_use = event.tool_use
+        tool_use_id = tool_use.get("toolUseId")
+        set_current_tool_use(tool_use_id)
+        
+        workflow_id, step_id = get_workflow_context()
+        if not workflow_id:
+            return
+        _, tool_call = self.task_manager.find_tool_call(workflow_id, tool_use_id)
+        if tool_call is None:
+            # 回调没有记录到这个工具调用（例如非流式模型），在这里补充记录
+            self.task_manager.record_tool_call(
+                workflow_id=workflow_id,
+                step_id=step_id,
+                tool_name=tool_use.get("name"),
+                input_data=tool_use.get("input"),
+                tool_use_id=tool_use_id
+            )
+        if getattr(event.selected_tool, "deferred_start", False):
+            # 工具需要先等待并发名额，获得名额后由工具调用begin_tool_execution开始计时
+            _pending_tool_start.set(lambda: self.start_tool_execution(workflow_id, tool_use))
+        else:
+            self.start_tool_execution(workflow_id, tool_use)
+    
+    def start_tool_execution(self, workflow_id, tool_use):
+        """
+        工具实际开始执行：开始工具阶段，并以当前时间作为工具调用的开始时间
+        
+        Args:
+            workflow_id: 工作流ID
+            tool_use: Strands的工具调用
+        """
+        # 工具内的模型调用、缓存读写等阶段嵌套在工具阶段下
+        start_span(f"tool.{tool_use.get('name')}")
+        _, tool_call = self.task_manager.find_tool_call(workflow_id, tool_use.get("toolUseId"))
+        if tool_call is not None:
+            # 以工具实际开始执行的时间作为开始时间，而不是模型开始输出工具调用或开始排队的时间
+            tool_call["start_time"] = datetime.now().isoformat()
+    
+    def after_tool_call(self, event):
+        set_current_tool_use(None)
+        _pending_tool_start.set(None)
+        
+        workflow_id, _ = get_workflow_context()
+        if not workflow_id:
+            return
+        result = event.result or {}
+        exception = getattr(event, "exception", None)
+        current_span = get_current_span()
+        if current_span is not None and current_span.name == f"tool.{event.tool_use.get('name')}":
+            record = end_span(current_span, exception or (result.get("content") if result.get("status") == "error" else None))
+            if record is not None:
+                tool_call_duration.observe(record["duration"], tool=event.tool_use.get("name"), status=record["status"])
+        tool_use_id = event.tool_use.get("toolUseId")
+        tool_step_id, tool_call = self.task_manager.find_tool_call(workflow_id, tool_use_id)
+        if tool_call is None or tool_call["status"] != TaskStatus.RUNNING:
+            return
+        
+        if exception is not None or result.get("status") == "error":
+            error = exception or result.get("content")
+            self.task_manager.fail_tool_call(workflow_id, tool_step_id, tool_call["id"], error)
+            logging.info(f"记录工具调用失败: {tool_call['tool_name']}, ID: {tool_use_id}")
+        else:
+            self.task_manager.complete_tool_call(workflow_id, tool_step_id, tool_call["id"], output_data=result.get("content"))
+            logging.info(f"记录工具调用完成: {tool_call['tool_name']}, ID: {tool_use_id}")
@@ -0,0 +1,251 @@
+"""
+链路追踪（OpenTelemetry）
+
+每个HTTP请求是一个追踪的根span，阶段计时（span_utils）、Strands的Agent循环、模型调用和工具调用span
+都挂在它下面；发送到渲染服务的请求带有traceparent请求头，渲染服务可以继续同一个追踪。
+追踪可以导出到OTLP端点，或者写入本地JSONL文件离线分析。未配置导出方式时不创建任何span。
+"""
+import json
+import time
+import logging
+import threading
+from opentelemetry import trace, context as otel_context, propagate
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import Sampler, SamplingResult, Decision, ParentBased, TraceIdRatioBased
+from ..config import tracing_config
+
+# 未启用追踪时为None，阶段计时不创建OpenTelemetry span
+_tracer = None
+_provider = None
+_setup_lock = threading.Lock()
+
+class RateLimitedSampler(Sampler):
+    """按比例采样新的追踪，并用令牌桶限制每秒开始的追踪数量
+
+    只对没有父span的根span做决定（配合ParentBased使用），同一个追踪中的span要么全部采样，要么全部丢弃。
+    满负载时追踪数量不超过max_per_second，导出开销有固定的上限。
+    """
+
+    def __init__(self, rate=1.0, max_per_second=0):
+        self.rate = rate
+        self.max_per_second = max_per_second
+        self._ratio = TraceIdRatioBased(rate)
+        self._tokens = max_per_second
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.max_per_second, self._tokens + (now - self._last) * self.max_per_second)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+        result = self._ratio.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+        if result.decision != Decision.RECORD_AND_SAMPLE or self.max_per_second <= 0 or self._take():
+            return result
+        return SamplingResult(Decision.DROP)
+
+    def get_description(self):
+        return f"RateLimitedSampler{{rate={self.rate}, max_per_second={self.max_per_second}}}"
+
+def span_to_dict(span):
+    """
+    把结束的span转换为JSON对象，字段与OTLP的span对应
+
+    Args:
+        span: opentelemetry.sdk.trace.ReadableSpan
+
+    Returns:
+        dict: trace_id、span_id、parent_span_id（十六进制）、名称、时间（Unix纳秒）、属性、状态和事件
+    """
+    span_context = span.get_span_context()
+    return {
+        "trace_id": format(span_context.trace_id, "032x"),
+        "span_id": format(span_context.span_id, "016x"),
+        "parent_span_id": format(span.parent.span_id, "016x") if span.parent else None,
+        "name": span.name,
+        "kind": span.kind.name,
+        "start_time_unix_nano": span.start_time,
+        "end_time_unix_nano": span.end_time,
+        "duration_ms": (span.end_time - span.start_time) / 1e6 if span.end_time and span.start_time else None,
+        "attributes": dict(span.attributes or {}),
+        "status": span.status.status_code.name,
+        "status_message": span.status.description,
+        "events": [
+            {"name": event.name, "time_unix_nano": event.timestamp, "attributes": dict(event.attributes or {})}
+            for event in span.events
+        ],
+        "service": span.resource.attributes.get("service.name")
+    }
+
+class JsonlSpanExporter(SpanExporter):
+    """把span逐行写入本地JSONL文件
+
+    每批span一次追加写入，多个worker进程可以写同一个文件。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        try:
+            lines = "".join(json.dumps(span_to_dict(span), ensure_ascii=False, default=str) + "\n" for span in spans)
+            with self._lock:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            return SpanExportResult.SUCCESS
+        except Exception as e:
+            logging.warning(f"写入追踪文件失败: {str(e)}")
+            return SpanExportResult.FAILURE
+
+    def shutdown(self):
+        pass
+
+def _otlp_exporter():
+    """创建OTLP导出器，端点等参数从OTEL_EXPORTER_OTLP_*环境变量读取"""
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        logging.warning("未安装opentelemetry-exporter-otlp-proto-http，无法导出到OTLP端点: pip install opentelemetry-exporter-otlp-proto-http")
+        return None
+    return OTLPSpanExporter()
+
+def setup_tracing(config=None):
+    """
+    根据配置启用链路追踪，设置全局的TracerProvider（Strands的Agent span也使用它）
+
+    重复调用时返回已创建的TracerProvider。
+
+    Args:
+        config: TracingConfig，默认使用tracing_config
+
+    Returns:
+        TracerProvider: 未配置导出方式时返回None
+    """
+    global _provider
+    config = config or tracing_config
+    with _setup_lock:
+        if _provider is not None:
+            return _provider
+        exporters = [name.strip() for name in config.exporters.split(",") if name.strip()]
+        if not exporters:
+            return None
+
+        provider = TracerProvider(
+            resource=Resource.create({"service.name": config.service_name}),
+            sampler=ParentBased(RateLimitedSampler(config.sample_rate, config.max_traces_per_second))
+        )
+        for name in exporters:
+            if name == "file":
+                exporter = JsonlSpanExporter(config.file_path)
+            elif name == "otlp":
+                exporter = _otlp_exporter()
+            else:
+                logging.warning(f"未知的追踪导出方式: {name}")
+                exporter = None
+            if exporter is not None:
+                # 批量导出在后台线程中进行，不阻塞请求
+                provider.add_span_processor(BatchSpanProcessor(exporter))
+
+        trace.set_tracer_provider(provider)
+        _provider = provider
+        use_tracer_provider(provider)
+        logging.info(f"链路追踪已启用: {', '.join(exporters)}，采样率 {config.sample_rate}，每秒最多 {config.max_traces_per_second} 个追踪")
+        return provider
+
+def use_tracer_provider(provider):
+    """
+    设置本项目创建span使用的TracerProvider
+
+    Args:
+        provider: TracerProvider，为None时停止创建span
+    """
+    global _tracer
+    _tracer = provider.get_tracer("exam_generator") if provider is not None else None
+
+def get_tracer():
+    """获取本项目使用的Tracer，未启用追踪时返回None"""
+    return _tracer
+
+def start_otel_span(name, attributes=None, kind=trace.SpanKind.INTERNAL, parent_context=None):
+    """
+    开始一个OpenTelemetry span并设为当前span
+
+    Args:
+        name: span名称
+        attributes: 属性，值必须是字符串、数字或布尔值
+        kind: span类型
+        parent_context: 父上下文（例如从请求头中提取的上下文），默认为当前上下文
+
+    Returns:
+        tuple: (span, token)，未启用追踪时为(None, None)
+    """
+    if _tracer is None:
+        return None, None
+    otel_span = _tracer.start_span(name, context=parent_context, kind=kind, attributes=attributes)
+    token = otel_context.attach(trace.set_span_in_context(otel_span))
+    return otel_span, token
+
+def end_otel_span(otel_span, token, error=None):
+    """
+    结束start_otel_span开始的span，并恢复之前的当前span
+
+    Args:
+        otel_span: start_otel_span返回的span
+        token: start_otel_span返回的token
+        error: 失败时的异常或错误信息
+    """
+    if otel_span is None:
+        return
+    if error is not None:
+        otel_span.set_status(trace.Status(trace.StatusCode.ERROR, str(error)[:200]))
+        if isinstance(error, BaseException):
+            otel_span.record_exception(error)
+    otel_span.end()
+    if token is not None:
+        otel_context.detach(token)
+
+def start_server_span(name, headers, attributes=None):
+    """
+    为收到的HTTP请求开始一个SERVER span，请求头中有traceparent时继续上游的追踪
+
+    Args:
+        name: span名称，例如"POST /workflows/run"
+        headers: 请求头
+        attributes: 属性
+
+    Returns:
+        tuple: (span, token)，未启用追踪时为(None, None)
+    """
+    if _tracer is None:
+        return None, None
+    return start_otel_span(name, attributes, kind=trace.SpanKind.SERVER, parent_context=propagate.extract(headers))
+
+def inject_trace_headers(headers):
+    """
+    把当前追踪上下文写入请求头（traceparent），未启用追踪时不修改
+
+    Args:
+        headers: 请求头字典
+
+    Returns:
+        dict: 传入的headers
+    """
+    if _tracer is not None:
+        propagate.inject(headers)
+    return headers
+
+def current_trace_id():
+    """当前被采样的追踪ID（十六进制），不在追踪中时返回None"""
+    span_context = trace.get_current_span().get_span_context()
+    if not span_context.is_valid or not span_context.trace_flags.sampled:
+        return None
+    return format(span_context.trace_id, "032x")
@@ -0,0 +1,97 @@
+import logging
+from ..config import llm_config
+from .context_utils import get_workflow_context, get_current_tool_use
+
+# Bedrock InvokeModel（Anthropic格式）和Converse API的usage字段名到统一字段名的映射
+_USAGE_FIELDS = {
+    "input_tokens": "input_tokens",
+    "inputTokens": "input_tokens",
+    "output_tokens": "output_tokens",
+    "outputTokens": "output_tokens",
+    "cache_read_input_tokens": "cache_read_input_tokens",
+    "cacheReadInputTokens": "cache_read_input_tokens",
+    "cache_creation_input_tokens": "cache_write_input_tokens",
+    "cacheWriteInputTokens": "cache_write_input_tokens"
+}
+
+def empty_usage():
+    """创建空的token统计"""
+    return {
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cache_read_input_tokens": 0,
+        "cache_write_input_tokens": 0,
+        "cache_hits": 0,
+        "model_calls": 0
+    }
+
+def normalize_usage(usage):
+    """
+    将模型返回的usage统一为相同的字段名
+
+    Args:
+        usage: InvokeModel响应体中的usage，或Converse/Strands事件中的usage
+
+    Returns:
+        dict: 统一格式的token统计（model_calls为1，命中提示词缓存时cache_hits为1）
+    """
+    normalized = empty_usage()
+    for key, value in (usage or {}).items():
+        field = _USAGE_FIELDS.get(key)
+        if field and isinstance(value, (int, float)):
+            normalized[field] += int(value)
+    normalized["model_calls"] = 1
+    normalized["cache_hits"] = 1 if normalized["cache_read_input_tokens"] > 0 else 0
+    return normalized
+
+def add_usage(target, usage):
+    """将usage累加到target中"""
+    for key, value in usage.items():
+        target[key] = target.get(key, 0) + value
+    return target
+
+def estimate_cost(usage):
+    """
+    根据llm_config中的单价估算费用（美元）
+
+    Args:
+        usage: 统一格式的token统计
+
+    Returns:
+        float: 估算费用
+    """
+    return (
+        usage.get("input_tokens", 0) * llm_config.input_token_price
+        + usage.get("output_tokens", 0) * llm_config.output_token_price
+        + usage.get("cache_read_input_tokens", 0) * llm_config.cache_read_token_price
+        + usage.get("cache_write_input_tokens", 0) * llm_config.cache_write_token_price
+    ) / 1000
+
+def record_usage(source, usage, task_manager=None):
+    """
+    将一次模型调用的token用量记录到当前工作流
+
+    工作流、步骤和工具调用从上下文中获取，不在工作流中时只记录日志。
+
+    Args:
+        source: 调用来源，例如"agent"或工具名称
+        usage: 模型返回的usage
+        task_manager: 任务管理器实例，默认使用全局实例
+    """
+    if not usage:
+        return
+    if task_manager is None:
+        from .task_manager import task_manager
+
+    normalized = normalize_usage(usage)
+    workflow_id, step_id = get_workflow_context()
+    logging.debug(f"模型调用token用量 [{source}]: 输入 {normalized['input_tokens']}, 输出 {normalized['output_tokens']}")
+
+    if workflow_id:
+        task_manager.record_model_usage(
+            workflow_id,
+            step_id=step_id,
+            tool_use_id=get_current_tool_use(),
+            source=source,
+            usage=normalized
+        )
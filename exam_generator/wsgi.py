@@ -0,0 +1,4 @@
+"""考试生成服务的WSGI入口，供gunicorn等WSGI服务器加载: gunicorn exam_generator.wsgi:app"""
+from .server import app
+
+__all__ = ['app']
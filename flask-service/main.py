@@ -8,6 +8,14 @@ import re
 import uuid
 import requests
 
+# 链路追踪是可选的：安装opentelemetry并通过opentelemetry-instrument启动时，
+# 渲染请求作为考试生成服务追踪（请求头traceparent）的子span记录
+try:
+    from opentelemetry import trace, propagate, context as otel_context
+    tracer = trace.get_tracer("markdown-render")
+except ImportError:
+    tracer = None
+
 app = Flask(__name__)
 
 # 配置文件夹路径
@@ -35,6 +43,27 @@ def get_host_address():
         return "localhost"
 
 
+@app.before_request
+def start_trace():
+    """继续上游的追踪，未安装opentelemetry时不做任何事"""
+    if tracer is None or 'traceparent' not in request.headers:
+        return
+    request_span = tracer.start_span(f"{request.method} {request.path}", context=propagate.extract(request.headers), kind=trace.SpanKind.SERVER)
+    request.environ['otel.span'] = request_span
+    request.environ['otel.token'] = otel_context.attach(trace.set_span_in_context(request_span))
+
+@app.teardown_request
+def end_trace(error=None):
+    request_span = request.environ.pop('otel.span', None)
+    if request_span is None:
+        return
+    if error is not None:
+        request_span.record_exception(error)
+        request_span.set_status(trace.Status(trace.StatusCode.ERROR, str(error)))
+    request_span.end()
+    otel_context.detach(request.environ.pop('otel.token'))
+
+
 @app.route('/upload_markdown', methods=['POST'])
 def upload_markdown():
     host_ip = get_host_address()
@@ -44,10 +73,6 @@ def upload_markdown():
         return jsonify({"error": "Invalid input"}), 400
     """Render quiz in Markdown format to HTML."""
     
-    # 添加调试信息
-    print("原始Markdown内容:")
-    print(content)
-    
     # 确保题目被正确包装在<p>标签中
     # 在每个题目标题后添加一个空行，确保Markdown解析器将题目内容包装在<p>标签中
     content = re.sub(r'(## [^\n]+)\n', r'\1\n\n', content)
@@ -60,10 +85,6 @@ def upload_markdown():
                              extensions=extensions,
                              output_format="html5")
     
-    # 添加调试信息
-    print("生成的HTML内容:")
-    print(html)
-    
     # 确保每个题目都被包装在一个div中，方便JavaScript识别
     html = re.sub(r'<h2>([^<]+)</h2>', r'<div class="question-container"><h2>\1</h2>', html)
     html = re.sub(r'(<ul class="(?:radio-list|checklist|textbox)">[^<]*(?:<li>.*?</li>\s*)+</ul>)', r'\1</div>', html)
@@ -73,9 +94,8 @@ def upload_markdown():
     test_html = env.get_template('base.html').render(content=html,
                                                      javascript=javascript)
     
-    # 添加调试信息
-    print("最终HTML内容:")
-    print(test_html)
+    # 只记录长度，完整内容在DEBUG级别也不输出，避免每次渲染写入大量日志
+    app.logger.debug("渲染完成: Markdown %d字符，HTML %d字符", len(content), len(test_html))
     test_html = env.get_template('wrapper.html').render(content=test_html)
     filename = str(uuid.uuid4())
     with open(os.path.join(OUTPUT_FOLDER, f"{filename}.html"),
@@ -101,4 +121,5 @@ def get_html(filename):
 
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5006, host='0.0.0.0')
+    # 开发模式启动，生产环境请使用: python -m exam_generator.serve render
+    app.run(debug=os.environ.get("FLASK_DEBUG", "false").lower() == "true", port=5006, host='0.0.0.0')
@@ -0,0 +1,4 @@
+"""渲染服务的WSGI入口，需要在flask-service目录下加载: gunicorn wsgi:app"""
+from main import app
+
+__all__ = ['app']
@@ -180,7 +180,9 @@ def create_workflow_table(data):
         'average_tool_execution_time', 'total_steps', 'completed_steps',
         'failed_steps', 'step_completion_rate', 'total_tool_calls',
         'successful_tool_calls', 'failed_tool_calls', 'tool_call_success_rate',
-        'timestamp'
+        'input_tokens', 'output_tokens', 'total_tokens', 'model_calls',
+        'estimated_cost', 'cache_read_input_tokens', 'cache_hit_rate',
+        'questions_reused', 'questions_discarded', 'wasted_tokens', 'timestamp'
     ]
     
     rows = [headers]  # 第一行是表头
@@ -190,6 +192,9 @@ def create_workflow_table(data):
     
     # 处理每个工作流
     for workflow in data['report']:
+        # 旧版本的报告没有token统计，使用0填充
+        token_usage = workflow.get('token_usage', {})
+        generation_work = workflow.get('generation_work', {})
         row = [
             workflow['workflow_id'],
             workflow['workflow_name'],
@@ -204,6 +209,16 @@ def create_workflow_table(data):
             workflow['tool_call_statistics']['successful'],
             workflow['tool_call_statistics']['failed'],
             workflow['tool_call_statistics'].get('success_rate', 0),
+            token_usage.get('input_tokens', 0),
+            token_usage.get('output_tokens', 0),
+            token_usage.get('total_tokens', 0),
+            token_usage.get('model_calls', 0),
+            token_usage.get('estimated_cost', 0),
+            token_usage.get('cache_read_input_tokens', 0),
+            token_usage.get('cache_hit_rate', 0),
+            generation_work.get('questions_reused', 0),
+            generation_work.get('questions_discarded', 0),
+            generation_work.get('wasted_tokens', 0),
             current_time  # 使用当前时间作为时间戳
         ]
         rows.append(row)
@@ -224,7 +239,7 @@ def create_tool_call_table(data):
     headers = [
         'workflow_id', 'workflow_name', 'tool_name', 'total_calls',
         'successful_calls', 'failed_calls', 'success_rate',
-        'average_execution_time', 'status'
+        'average_execution_time', 'input_tokens', 'output_tokens', 'status'
     ]
     
     rows = [headers]  # 第一行是表头
@@ -246,6 +261,8 @@ def create_tool_call_table(data):
                 tool_data['failed'],
                 tool_data['successful'] / tool_data['total'] if tool_data['total'] > 0 else 0,
                 tool_data['average_execution_time'],
+                tool_data.get('input_tokens', 0),
+                tool_data.get('output_tokens', 0),
                 status
             ]
             rows.append(row)
@@ -1 +1,11 @@
-# 这个文件是空的，用于将tests目录标记为Python包
+# 将tests目录标记为Python包
+#
+# 在测试模块导入exam_generator之前，把题目缓存、参考资料获取缓存和日志文件指向临时目录，
+# 测试不会读写仓库中的./cache和agent.log
+import os
+import tempfile
+
+_state_dir = tempfile.TemporaryDirectory(prefix="exam-generator-tests-")
+os.environ.setdefault("QUESTION_CACHE_DIR", os.path.join(_state_dir.name, "cache"))
+os.environ.setdefault("FETCH_CACHE_DIR", os.path.join(_state_dir.name, "cache", "fetch"))
+os.environ.setdefault("LOG_FILE", os.path.join(_state_dir.name, "agent.log"))
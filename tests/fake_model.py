@@ -0,0 +1,41 @@
+import json
+from strands.models import Model
+
+class ScriptedModel(Model):
+    """按预设脚本输出的模型，用于在不访问Bedrock的情况下驱动Agent
+
+    turns中的每个元素对应一轮模型输出：
+    - 字符串：输出文本并结束
+    - 列表：输出一组工具调用，每个元素为(工具名, 输入字典)
+    """
+
+    def __init__(self, turns, usage=None):
+        self.turns = list(turns)
+        self.usage = usage or {"inputTokens": 10, "outputTokens": 5, "totalTokens": 15}
+        self.calls = 0
+
+    def update_config(self, **model_config):
+        pass
+
+    def get_config(self):
+        return {}
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        turn = self.turns[min(self.calls, len(self.turns) - 1)]
+        self.calls += 1
+        yield {"messageStart": {"role": "assistant"}}
+        if isinstance(turn, str):
+            yield {"contentBlockDelta": {"delta": {"text": turn}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+        else:
+            for i, (name, tool_input) in enumerate(turn):
+                tool_use_id = f"tooluse-{self.calls}-{i}"
+                yield {"contentBlockStart": {"start": {"toolUse": {"toolUseId": tool_use_id, "name": name}}}}
+                yield {"contentBlockDelta": {"delta": {"toolUse": {"input": json.dumps(tool_input, ensure_ascii=False)}}}}
+                yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "tool_use"}}
+        yield {"metadata": {"usage": dict(self.usage), "metrics": {"latencyMs": 1}}}
@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import re
+import time
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exam_generator.utils.admission import AdmissionController, AdmissionRejected
+from exam_generator.utils.metrics import metrics_registry
+
+class TestAdmissionController(unittest.TestCase):
+    """测试工作流准入控制"""
+
+    def test_queue_and_reject(self):
+        """测试超出并发上限时排队，队列已满时立即拒绝"""
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=1, max_queue_wait=5)
+        first = controller.acquire()
+
+        admitted = threading.Event()
+        def waiter():
+            with controller.admit():
+                admitted.set()
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        while controller.get_stats()["queue_depth"] < 1:
+            time.sleep(0.001)
+
+        # 队列已满，第三个请求立即被拒绝并得到Retry-After估算
+        started = time.monotonic()
+        with self.assertRaises(AdmissionRejected) as context:
+            controller.acquire()
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(context.exception.status_code, 429)
+        self.assertGreaterEqual(context.exception.retry_after, 1)
+
+        # 释放名额后排队的请求被接纳
+        self.assertFalse(admitted.is_set())
+        controller.release(first)
+        thread.join()
+        self.assertTrue(admitted.is_set())
+
+        stats = controller.get_stats()
+        self.assertEqual(stats["admitted"], 2)
+        self.assertEqual(stats["rejected"], 1)
+        self.assertEqual(stats["running"], 0)
+        self.assertGreater(stats["max_queue_wait"], 0)
+
+    def test_queue_wait_timeout(self):
+        """测试排队超时返回503"""
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=4)
+        first = controller.acquire()
+        with self.assertRaises(AdmissionRejected) as context:
+            controller.acquire(timeout=0.05)
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertEqual(controller.get_stats()["queue_depth"], 0)
+        controller.release(first)
+
+    def test_metrics(self):
+        """测试排队时间和按原因统计的拒绝次数导出到/metrics"""
+        def metric(pattern):
+            match = re.search(pattern + r" (\S+)", metrics_registry.render())
+            return float(match.group(1)) if match else 0.0
+
+        rejected = r'exam_admission_rejections_total\{reason="%s"\}'
+        before = {reason: metric(rejected % reason) for reason in ("queue_full", "timeout")}
+        waits = metric("exam_admission_queue_wait_seconds_count")
+
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=1)
+        first = controller.acquire()
+        with self.assertRaises(AdmissionRejected):
+            controller.acquire(timeout=0.05)
+        controller.release(first)
+        controller.release(controller.acquire())
+
+        self.assertEqual(metric(rejected % "timeout"), before["timeout"] + 1)
+        self.assertEqual(metric(rejected % "queue_full"), before["queue_full"])
+        self.assertEqual(metric("exam_admission_queue_wait_seconds_count"), waits + 2)
+
+    def test_retry_after_follows_throughput(self):
+        """测试Retry-After按最近的工作流耗时估算"""
+        controller = AdmissionController(max_concurrent=2, max_queue_depth=0)
+        controller._average_duration = 30
+        admissions = [controller.acquire(), controller.acquire()]
+        with self.assertRaises(AdmissionRejected) as context:
+            controller.acquire()
+        # 排在第1位，吞吐量为每30秒2个工作流
+        self.assertEqual(context.exception.retry_after, 15)
+        for admission in admissions:
+            controller.release(admission)
+
+    def test_server_returns_429(self):
+        """测试/workflows/run在队列已满时返回429和Retry-After"""
+        from exam_generator.server import app
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=0)
+        holder = controller.acquire()
+        with patch('exam_generator.server.admission_controller', controller):
+            response = app.test_client().post('/workflows/run', json={"inputs": {"count": 1}})
+        controller.release(holder)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response.headers)
+
+if __name__ == '__main__':
+    unittest.main()
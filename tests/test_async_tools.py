@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import patch, AsyncMock
+import sys
+import os
+import json
+import asyncio
+import httpx
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exam_generator.tools.async_tools import AsyncBedrockClient, generate_questions_parallel_async
+from exam_generator.utils.scheduler import FairScheduler
+
+def make_client(handler):
+    """创建使用模拟传输层的异步Bedrock客户端"""
+    client = AsyncBedrockClient(endpoint_url="http://fake-bedrock", max_connections=4)
+    client._clients = [httpx.AsyncClient(transport=httpx.MockTransport(handler))]
+    return client
+
+class TestAsyncEngine(unittest.TestCase):
+    """测试异步题目生成引擎"""
+
+    @patch('exam_generator.tools.async_tools.question_cache')
+    def test_parallel_generation_keeps_order_and_retries(self, mock_cache):
+        """测试并行生成的结果与规格顺序一致，限流后重试成功"""
+        mock_cache.get.return_value = None
+        calls = []
+
+        def handler(request):
+            body = json.loads(request.content)
+            prompt = body["messages"][0]["content"]
+            calls.append(prompt)
+            if "主题B" in prompt and sum("主题B" in c for c in calls) == 1:
+                return httpx.Response(429, json={"message": "Too many requests"})
+            topic = "主题A" if "主题A" in prompt else "主题B"
+            return httpx.Response(200, json={
+                "content": [{"type": "text", "text": f"## 单选题\n\n关于{topic}？\n\n- (x) 对\n- ( ) 错"}],
+                "usage": {"input_tokens": 10, "output_tokens": 5}
+            })
+
+        specs = [
+            {"type": "singleChoice", "topic": "主题A", "difficulty": "easy"},
+            {"type": "singleChoice", "topic": "主题B", "difficulty": "easy"}
+        ]
+
+        async def run():
+            client = make_client(handler)
+            with patch('exam_generator.tools.async_tools.generation_scheduler', FairScheduler(max_concurrent=2)), \
+                 patch('exam_generator.tools.async_tools.asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+                questions = await generate_questions_parallel_async(specs, client=client)
+            # 限流后按指数退避等待
+            mock_sleep.assert_awaited_once_with(2)
+            return questions
+
+        questions = asyncio.run(run())
+        self.assertIn("主题A", questions[0])
+        self.assertIn("主题B", questions[1])
+        self.assertEqual(len(calls), 3)
+        mock_cache.set.assert_called()
+
+    def test_async_acquire_shares_fair_queue(self):
+        """测试异步等待者与同步调用共享槽位，释放后被唤醒"""
+        scheduler = FairScheduler(max_concurrent=1)
+        scheduler.acquire(tenant="t1")
+
+        async def run():
+            waiter = asyncio.create_task(scheduler.acquire_async(tenant="t2", timeout=1))
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiter.done())
+            await asyncio.to_thread(scheduler.release)
+            await waiter
+            scheduler.release()
+
+        asyncio.run(run())
+        self.assertEqual(scheduler.get_stats()["running"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
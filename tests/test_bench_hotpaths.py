@@ -0,0 +1,59 @@
+import unittest
+import sys
+import os
+import logging
+
+# 添加项目根目录和benchmarks目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from bench_hotpaths import make_exam, make_workflow, compare
+from exam_generator.tools.content_tools import validate_exam_format, fix_exam_format
+
+class TestHotpathInputs(unittest.TestCase):
+    """测试热点路径基准测试的输入生成和回归判定"""
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_generated_exam_is_valid(self):
+        """测试生成的考试内容能通过格式验证，不规范的版本修复后也能通过"""
+        exam = make_exam(30, seed=1)
+        self.assertEqual(exam.count("## "), 30)
+        self.assertTrue(validate_exam_format(exam))
+        fixed = fix_exam_format(make_exam(30, seed=1, messy=True))
+        self.assertNotIn("# 模拟考试", fixed)
+        self.assertNotIn("-(  )", fixed)
+        self.assertIn("- [x]", fixed)
+        self.assertTrue(validate_exam_format(fixed))
+        self.assertEqual(make_exam(5, seed=2), make_exam(5, seed=2))
+
+    def test_generated_workflow_report(self):
+        """测试生成的工作流包含指定数量的工具调用"""
+        manager, workflow_id, _ = make_workflow(90)
+        report = manager.generate_evaluation_report(workflow_id)
+        self.assertEqual(report["tool_call_statistics"]["total"], 90)
+        self.assertEqual(report["step_statistics"]["total"], 3)
+
+    def test_compare_flags_regressions(self):
+        """测试超过阈值的耗时和内存判定为回归，过小的耗时忽略"""
+        baseline = {
+            "a[1]": {"median": 1e-3, "peak_memory": 1000},
+            "b[1]": {"median": 1e-7, "peak_memory": 0},
+            "c[1]": {"median": 1e-3, "peak_memory": 1000}
+        }
+        results = {
+            "a[1]": {"median": 1.3e-3, "peak_memory": 2000},
+            "b[1]": {"median": 1e-6, "peak_memory": 0},
+            "c[1]": {"median": 1.1e-3, "peak_memory": 1100},
+            "d[1]": {"median": 1.0, "peak_memory": 1}
+        }
+        regressions = compare(baseline, results, threshold=1.25)
+        self.assertEqual([(key, metric) for key, metric, _, _ in regressions],
+                         [("a[1]", "median"), ("a[1]", "peak_memory")])
+
+if __name__ == "__main__":
+    unittest.main()
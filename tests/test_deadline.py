@@ -0,0 +1,147 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import io
+import json
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exam_generator.utils.deadline_utils import (
+    Deadline,
+    DeadlineExceeded,
+    deadline_scope,
+    get_deadline,
+    cap_timeout
+)
+from exam_generator.tools.exam_tools import call_claude, generate_questions_parallel, question_cache
+
+class TestDeadline(unittest.TestCase):
+    """测试请求截止时间的传递"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        # 清空缓存
+        if os.path.exists(question_cache.cache_dir):
+            for file in os.listdir(question_cache.cache_dir):
+                if file.endswith('.pkl'):
+                    os.remove(os.path.join(question_cache.cache_dir, file))
+
+    def test_cap_timeout(self):
+        """测试超时时间被裁剪到剩余预算"""
+        # 没有截止时间时原样返回
+        self.assertEqual(cap_timeout(10), 10)
+
+        with deadline_scope(2):
+            self.assertLessEqual(cap_timeout(10), 2)
+            self.assertEqual(cap_timeout(1), 1)
+
+        # 离开上下文后恢复
+        self.assertIsNone(get_deadline())
+
+    def test_expired_deadline_minimum(self):
+        """测试预算耗尽时使用下限"""
+        deadline = Deadline(0.01)
+        time.sleep(0.02)
+        self.assertTrue(deadline.expired())
+        self.assertEqual(deadline.cap(10, minimum=1), 1)
+        self.assertFalse(deadline.allows(0.5))
+
+    @patch('exam_generator.tools.exam_tools.get_bedrock_client')
+    def test_call_claude_skips_call_when_expired(self, mock_get_client):
+        """测试预算耗尽时不再调用模型"""
+        with deadline_scope(0.01):
+            time.sleep(0.02)
+            with self.assertRaises(DeadlineExceeded):
+                call_claude("测试")
+        mock_get_client.assert_not_called()
+
+    @patch('exam_generator.tools.exam_tools.time.sleep')
+    @patch('exam_generator.tools.exam_tools.get_bedrock_client')
+    def test_call_claude_stops_retry_when_budget_short(self, mock_get_client, mock_sleep):
+        """测试剩余时间不足以等待重试时直接放弃"""
+        mock_client = MagicMock()
+        mock_client.invoke_model.side_effect = Exception("throttlingException: Too many requests")
+        mock_get_client.return_value = mock_client
+
+        with deadline_scope(1):
+            with self.assertRaises(DeadlineExceeded):
+                call_claude("测试", initial_retry_delay=2)
+
+        self.assertEqual(mock_client.invoke_model.call_count, 1)
+        mock_sleep.assert_not_called()
+
+    @patch('exam_generator.tools.exam_tools.time.sleep')
+    @patch('exam_generator.tools.exam_tools.get_bedrock_client')
+    def test_call_claude_recaps_timeout_per_attempt(self, mock_get_client, mock_sleep):
+        """测试重试时按剩余的时间预算重新裁剪读取超时"""
+        mock_client = MagicMock()
+        mock_client.invoke_model.side_effect = [
+            Exception("throttlingException: Too many requests"),
+            {"body": io.BytesIO(json.dumps({"content": [{"text": "完成"}]}).encode("utf-8"))}
+        ]
+        mock_get_client.return_value = mock_client
+
+        def backoff(seconds):
+            # 退避期间消耗3秒预算
+            deadline.expires_at -= 3
+
+        mock_sleep.side_effect = backoff
+
+        with deadline_scope(8) as deadline:
+            self.assertEqual(call_claude("测试", initial_retry_delay=2), "完成")
+
+        timeouts = [call.kwargs["read_timeout"] for call in mock_get_client.call_args_list]
+        self.assertEqual(len(timeouts), 2)
+        self.assertLessEqual(timeouts[1], timeouts[0] - 3 + 0.5)
+
+    @patch('exam_generator.tools.exam_tools.call_claude')
+    def test_parallel_generation_sees_deadline(self, mock_call_claude):
+        """测试并行生成的工作线程可以看到截止时间"""
+        seen = []
+
+        def fake_call(prompt, **kwargs):
+            seen.append(get_deadline())
+            return "## 填空题\n\n1+2=______\n\n- R:= 3"
+
+        mock_call_claude.side_effect = fake_call
+
+        with deadline_scope(30) as deadline:
+            generate_questions_parallel([
+                {"type": "fillBlank", "topic": "截止时间传递测试", "difficulty": "hard"}
+            ])
+
+        self.assertEqual(len(seen), 1)
+        self.assertIs(seen[0], deadline)
+
+class TestRequestTimeout(unittest.TestCase):
+    """测试请求体中的timeout"""
+
+    def test_request_timeout(self):
+        """测试没有timeout时使用服务器上限，有效的timeout原样使用"""
+        from exam_generator.server import request_timeout
+        self.assertEqual(request_timeout({}, 300), 300)
+        self.assertEqual(request_timeout({"timeout": 30}, 300), 30)
+        self.assertEqual(request_timeout({"timeout": "30.5"}, 300), 30.5)
+
+    def test_invalid_timeout_returns_400(self):
+        """测试无效的timeout在/workflows/run（包括重复提交）和/workflows/batch中返回400，不开始生成"""
+        from exam_generator.server import app
+        client = app.test_client()
+        with patch('exam_generator.server.idempotency_registry') as registry, \
+                patch('exam_generator.server.run_batch') as run_batch:
+            for timeout in ["abc", 0, -5, "nan", "inf", 1e9, True, [1]]:
+                with self.subTest(timeout=timeout):
+                    response = client.post('/workflows/run', json={"inputs": {"count": 1}, "timeout": timeout},
+                                           headers={"Idempotency-Key": "k"})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn("timeout", response.get_json()["data"]["outputs"]["body"]["error"])
+                    response = client.post('/workflows/batch', json={"requests": [{"inputs": {"count": 1}}], "timeout": timeout})
+                    self.assertEqual(response.status_code, 400)
+            registry.begin.assert_not_called()
+            run_batch.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,10 +2,12 @@ import unittest
 from unittest.mock import patch, MagicMock
 import sys
 import os
+import io
 import json
 
-# 添加项目根目录到Python路径
+# 添加项目根目录和benchmarks目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
 
 from exam_generator.tools.exam_tools import (
     generate_single_choice_question,
@@ -13,8 +15,12 @@ from exam_generator.tools.exam_tools import (
     generate_fill_blank_question,
     call_claude,
     get_bedrock_client,
+    instrument_bedrock_client,
     question_cache
 )
+from exam_generator.utils.metrics import metrics_registry, bedrock_call_duration, bedrock_throttles, bedrock_retries
+from exam_generator.utils.context_utils import workflow_scope
+from exam_generator.utils.question_store import question_store
 
 class TestExamTools(unittest.TestCase):
     """测试题目生成工具"""
@@ -93,6 +99,88 @@ class TestExamTools(unittest.TestCase):
         cached = question_cache.get("减法", "easy", "singleChoice")
         self.assertIsNone(cached)
     
+    @patch('exam_generator.tools.exam_tools.call_claude')
+    def test_shared_prompt_prefix(self, mock_call_claude):
+        """测试不同题型共享相同的系统提示词前缀"""
+        mock_call_claude.return_value = "## 单选题\n\n问题\n\n- (x) A\n- ( ) B"
+        reference = "光合作用是植物利用光能合成有机物的过程。" * 200
+        
+        generate_single_choice_question("光合作用", "easy", reference)
+        generate_multiple_choice_question("叶绿体", "hard", reference)
+        
+        systems = [call.kwargs["system"] for call in mock_call_claude.call_args_list]
+        self.assertEqual(len(systems), 2)
+        self.assertEqual(systems[0], systems[1])
+        self.assertIn(reference, systems[0])
+        # 参考资料不再拼接在题目提示词中
+        self.assertNotIn(reference, mock_call_claude.call_args_list[0].args[0])
+    
+    @patch('exam_generator.tools.exam_tools.get_bedrock_client')
+    def test_call_claude_marks_cache_point(self, mock_get_client):
+        """测试长系统提示词被标记为缓存点"""
+        body = json.dumps({
+            "content": [{"text": "ok"}],
+            "usage": {"input_tokens": 10, "output_tokens": 2, "cache_read_input_tokens": 3000}
+        }).encode('utf-8')
+        mock_client = MagicMock()
+        mock_client.invoke_model.return_value = {"body": io.BytesIO(body)}
+        mock_get_client.return_value = mock_client
+        
+        with patch('exam_generator.tools.exam_tools.llm_config.enable_prompt_cache', True):
+            call_claude("问题", system="资料" * 2000)
+        
+        request_body = json.loads(mock_client.invoke_model.call_args.kwargs["body"])
+        self.assertEqual(request_body["system"][0]["cache_control"], {"type": "ephemeral"})
+        
+        with patch('exam_generator.tools.exam_tools.llm_config.enable_prompt_cache', False):
+            mock_client.invoke_model.return_value = {"body": io.BytesIO(body)}
+            call_claude("问题", system="资料" * 2000)
+        
+        request_body = json.loads(mock_client.invoke_model.call_args.kwargs["body"])
+        self.assertNotIn("cache_control", request_body["system"][0])
+    
+    def test_agent_model_cache_points(self):
+        """测试Agent使用的BedrockModel通过CacheConfig缓存系统提示词和工具定义，不使用已弃用的参数"""
+        import warnings
+        from exam_generator.agent import _build_bedrock_model
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", DeprecationWarning)
+            with patch('exam_generator.tools.exam_tools.llm_config.enable_prompt_cache', True):
+                model = _build_bedrock_model(10)
+        self.assertNotIn("cache_tools", model.config)
+        request = model.format_request(
+            [{"role": "user", "content": [{"text": "问题"}]}],
+            tool_specs=[{"name": "t", "description": "工具", "inputSchema": {"json": {"type": "object"}}}],
+            system_prompt_content=[{"text": "系统提示词"}]
+        )
+        self.assertEqual(request["system"][-1], {"cachePoint": {"type": "default"}})
+        self.assertEqual(request["toolConfig"]["tools"][-1], {"cachePoint": {"type": "default"}})
+        
+        with patch('exam_generator.tools.exam_tools.llm_config.enable_prompt_cache', False):
+            self.assertIsNone(_build_bedrock_model(10).config.get("cache_config"))
+    
+    @patch('exam_generator.tools.exam_tools.call_claude')
+    def test_question_handles(self, mock_call_claude):
+        """测试工作流中工具只返回题目ID，题目内容由服务端组装"""
+        question = "## 单选题\n\n问题\n\n- (x) A\n- ( ) B"
+        mock_call_claude.return_value = question
+        reference = "细胞是生物体结构和功能的基本单位。" * 100
+        workflow_id = "handles-test"
+        reference_id = question_store.add_reference(workflow_id, reference)
+        
+        try:
+            with patch('exam_generator.tools.exam_tools.exam_config.history_mode', "handles"):
+                with workflow_scope(workflow_id):
+                    result = generate_single_choice_question("细胞", "easy", reference_id)
+            
+            self.assertIn("题目ID: q1", result)
+            self.assertNotIn("- (x) A", result)
+            # 参考资料ID被解析为原文
+            self.assertIn(reference, mock_call_claude.call_args.kwargs["system"])
+            self.assertEqual(question_store.assemble(workflow_id), question)
+        finally:
+            question_store.clear(workflow_id)
+    
     @patch('boto3.client')
     def test_get_bedrock_client(self, mock_client):
         """测试获取Bedrock客户端"""
@@ -104,5 +192,58 @@ class TestExamTools(unittest.TestCase):
         args, kwargs = mock_client.call_args
         self.assertEqual(kwargs['service_name'], 'bedrock-runtime')
 
+class TestBedrockClientMetrics(unittest.TestCase):
+    """测试不经过call_claude的Converse调用也记录Bedrock指标"""
+
+    def setUp(self):
+        from fake_bedrock import FakeBedrockServer, FakeBedrockConfig
+        self.server = FakeBedrockServer(config=FakeBedrockConfig(latency="fixed:0", stream_chunk_delay=0)).start()
+        self.addCleanup(self.server.stop)
+
+    def _client(self, max_attempts):
+        import boto3
+        from botocore.config import Config
+        client = boto3.client(
+            "bedrock-runtime",
+            region_name="us-east-1",
+            endpoint_url=self.server.url,
+            aws_access_key_id="fake",
+            aws_secret_access_key="fake",
+            config=Config(retries={"total_max_attempts": max_attempts, "mode": "standard"})
+        )
+        instrument_bedrock_client(client, source="test-agent")
+        return client
+
+    def _values(self):
+        values, _ = metrics_registry.collect()
+        calls = {status: sum(values.get((bedrock_call_duration.name, ("test-agent", status)), [0])[:-1])
+                 for status in ("ok", "throttled", "error")}
+        return (calls, values.get((bedrock_throttles.name, ("test-agent",)), 0),
+                values.get((bedrock_retries.name, ("test-agent",)), 0))
+
+    def test_converse_attempts(self):
+        """测试每次尝试都记录耗时，botocore内部的重试计入重试次数，限流计入限流次数"""
+        messages = [{"role": "user", "content": [{"text": "你好"}]}]
+        before_calls, before_throttles, before_retries = self._values()
+
+        self._client(max_attempts=1).converse(modelId="model", messages=messages)
+        self.server.config.throttle_rate = 1.0
+        with self.assertRaises(Exception) as raised:
+            self._client(max_attempts=2).converse(modelId="model", messages=messages)
+        self.assertIn("ThrottlingException", str(raised.exception))
+
+        calls, throttles, retries = self._values()
+        self.assertEqual(calls["ok"] - before_calls["ok"], 1)
+        self.assertEqual(calls["throttled"] - before_calls["throttled"], 2)
+        self.assertEqual(throttles - before_throttles, 2)
+        self.assertEqual(retries - before_retries, 1)
+
+    def test_agent_model_instrumented(self):
+        """测试Agent使用的BedrockModel的客户端注册了指标处理器，source为agent"""
+        from exam_generator.agent import _build_bedrock_model
+        with patch('exam_generator.agent.instrument_bedrock_client') as mock_instrument:
+            model = _build_bedrock_model(10)
+        mock_instrument.assert_called_once_with(model.client, source="agent")
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import sys
+import os
+import json
+import boto3
+from botocore.config import Config
+
+# 添加项目根目录和benchmarks目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from fake_bedrock import FakeBedrockServer, FakeBedrockConfig
+
+class TestFakeBedrock(unittest.TestCase):
+    """测试本地模拟bedrock-runtime服务"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeBedrockServer(config=FakeBedrockConfig(latency="fixed:0", stream_chunk_delay=0)).start()
+        cls.client = boto3.client(
+            "bedrock-runtime",
+            region_name="us-east-1",
+            endpoint_url=cls.server.url,
+            aws_access_key_id="fake",
+            aws_secret_access_key="fake",
+            config=Config(retries={"max_attempts": 1})
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_invoke_model_returns_question(self):
+        """测试InvokeModel按提示词返回对应题型的题目和token用量"""
+        body = {"messages": [{"role": "user", "content": '请生成一道关于"光合作用"的填空题'}]}
+        response = self.client.invoke_model(modelId="model", body=json.dumps(body))
+        payload = json.loads(response["body"].read())
+        self.assertTrue(payload["content"][0]["text"].startswith("## 填空题"))
+        self.assertIn("光合作用", payload["content"][0]["text"])
+        self.assertGreater(payload["usage"]["output_tokens"], 0)
+
+    def test_converse_stream_plans_tool_calls(self):
+        """测试ConverseStream按请求的题目数量调用题目生成工具"""
+        tools = [{"toolSpec": {"name": name, "inputSchema": {"json": {"type": "object"}}}}
+                 for name in ("generate_single_choice_question", "generate_fill_blank_question")]
+        prompt = '请根据以下要求生成一份考试：{"count": 3, "types": "singleChoice,fillBlank"}'
+        response = self.client.converse_stream(
+            modelId="model",
+            messages=[{"role": "user", "content": [{"text": prompt}]}],
+            toolConfig={"tools": tools}
+        )
+        events = list(response["stream"])
+        names = [e["contentBlockStart"]["start"]["toolUse"]["name"] for e in events if "contentBlockStart" in e]
+        self.assertEqual(names.count("generate_single_choice_question"), 2)
+        self.assertEqual(names.count("generate_fill_blank_question"), 1)
+        self.assertEqual(events[-2]["messageStop"]["stopReason"], "tool_use")
+
+    def test_throttling_injection(self):
+        """测试注入的限流返回ThrottlingException"""
+        self.server.update_config(throttle_rate=1.0)
+        try:
+            with self.assertRaises(self.client.exceptions.ThrottlingException):
+                self.client.invoke_model(modelId="model", body=json.dumps({"messages": [{"role": "user", "content": "单选题"}]}))
+        finally:
+            self.server.update_config(throttle_rate=0.0)
+        self.assertGreaterEqual(self.server.stats()["throttled"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
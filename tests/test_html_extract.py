@@ -0,0 +1,122 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from exam_generator.tools import html_extract
+from exam_generator.tools.html_extract import EXTRACTORS, create_extractor, extractor_available
+import bench_html_extract
+
+PAGE = """<html><head><title>光合作用 - 百科</title><script>var nav = "<nav>";</script></head><body>
+<header><a href="/">首页</a><a href="/wiki">目录</a></header>
+<nav><ul><li><a href="/a">生物</a></li><li><a href="/b">化学</a></li></ul></nav>
+<div class="breadcrumb"><a href="/">首页</a> &gt; 生物</div>
+<article>
+  <header><h1>光合作用</h1></header>
+  <p>光合作用是绿色植物利用<a href="/light">光能</a>制造有机物的过程。</p>
+  <pre>6CO2 + 6H2O
+→ C6H12O6 + 6O2</pre>
+  <div class="share"><a href="#">分享到微博</a></div>
+</article>
+<aside><h3>相关文章</h3><a href="/c">呼吸作用</a></aside>
+<footer>© 2024 百科</footer>
+</body></html>"""
+
+MAIN_TEXT = "光合作用\n光合作用是绿色植物利用光能制造有机物的过程。\n6CO2 + 6H2O\n→ C6H12O6 + 6O2"
+
+def extract(html, name="html.parser", main_content=True, max_chars=10000, chunk_size=None):
+    extractor = create_extractor(max_chars, name, main_content)
+    chunk_size = chunk_size or len(html)
+    for i in range(0, len(html), chunk_size):
+        extractor.feed(html[i:i + chunk_size])
+    extractor.close()
+    return extractor.get_text()
+
+class TestHTMLExtract(unittest.TestCase):
+    """测试网页文本提取"""
+
+    def test_main_content(self):
+        """测试只保留正文容器中的文字，跳过导航、面包屑、侧栏、页脚和分享链接"""
+        self.assertEqual(extract(PAGE), MAIN_TEXT)
+
+    def test_full_text(self):
+        """测试关闭正文识别时保留全部文字"""
+        text = extract(PAGE, main_content=False)
+        self.assertTrue(text.startswith("光合作用 - 百科\n首页目录\n生物\n化学"))
+        self.assertTrue(text.endswith("© 2024 百科"))
+
+    def test_without_main_container(self):
+        """测试没有main和article时按链接密度识别正文，整页都是链接时退回全部文字"""
+        html = ('<div><a href="/1">第一章</a> | <a href="/2">第二章</a></div>'
+                '<div><p>勾股定理：直角三角形两直角边的平方和等于斜边的平方。</p></div>')
+        self.assertEqual(extract(html), "勾股定理：直角三角形两直角边的平方和等于斜边的平方。")
+        self.assertEqual(extract('<nav><a href="/1">第一章</a>'), "第一章")
+
+    def test_main_inside_boilerplate_class(self):
+        """测试布局容器的class（with-sidebar等）不算模板区域，正文容器不受外层模板区域的影响"""
+        html = ('<div class="layout with-sidebar"><article><h1>光合作用</h1>'
+                '<p>光合作用是绿色植物利用光能制造有机物的过程。</p></article>'
+                '<aside><a href="/r">呼吸作用</a></aside></div><p>联系我们 电话 123</p>')
+        nested = ('<div class="sidebar"><main><p>光合作用是绿色植物利用光能制造有机物的过程。</p></main></div>'
+                  '<p>联系我们 电话 123</p>')
+        for name in EXTRACTORS:
+            if not extractor_available(name):
+                continue
+            with self.subTest(name=name):
+                self.assertEqual(extract(html, name), "光合作用\n光合作用是绿色植物利用光能制造有机物的过程。")
+                self.assertEqual(extract(nested, name), "光合作用是绿色植物利用光能制造有机物的过程。")
+        for class_name in ("has-sidebar", "no-ads", "main-menu-open"):
+            self.assertEqual(extract(f'<div class="{class_name}"><p>勾股定理</p></div>'), "勾股定理")
+        self.assertEqual(extract('<div class="sidebar-left"><p>勾股定理</p></div><p>直角三角形</p>'), "直角三角形")
+
+    def test_tiny_content_falls_back(self):
+        """测试识别出的正文与全部文字相比过少时退回全部文字"""
+        body = "".join(f"<p>第{i}段：有丝分裂分为前期、中期、后期和末期。</p>" for i in range(20))
+        html = f'<div class="comments">{body}</div><p>联系我们</p>'
+        text = extract(html)
+        self.assertTrue(text.startswith("第0段：有丝分裂"))
+        self.assertTrue(text.endswith("联系我们"))
+
+    def test_backends_agree(self):
+        """测试各解析器在逐块输入时提取的正文相同，未安装的解析器跳过"""
+        for name in EXTRACTORS:
+            if not extractor_available(name):
+                continue
+            with self.subTest(name=name):
+                self.assertEqual(extract(PAGE, name, chunk_size=7), MAIN_TEXT)
+
+    def test_stops_when_enough(self):
+        """测试正文足够时done为True，文本截断并注明"""
+        extractor = create_extractor(100, "html.parser")
+        extractor.feed("<article>" + "<p>有丝分裂分为前期、中期、后期和末期。</p>" * 100)
+        self.assertTrue(extractor.done)
+        extractor.close()
+        self.assertTrue(extractor.get_text().endswith("[内容已截断，已截断至: 100字符]"))
+
+    def test_fallback(self):
+        """测试未知或未安装的解析器退回html.parser，auto使用已安装的解析器"""
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(create_extractor(100, "unknown").name, "html.parser")
+        with patch.dict(html_extract._available, {"lxml": False}):
+            with self.assertLogs(level="WARNING"):
+                self.assertEqual(create_extractor(100, "lxml").name, "html.parser")
+            self.assertEqual(create_extractor(100).name, "html.parser")
+
+class TestHTMLExtractBenchmark(unittest.TestCase):
+    """测试网页文本提取基准测试可以运行"""
+
+    def test_run(self):
+        """测试调整规则用的网页和holdout网页都参与比较，正文识别的质量高于旧方式"""
+        results = bench_html_extract.run(repeat=1)
+        self.assertEqual({row["group"] for row in results["html.parser"]}, {"tuned", bench_html_extract.HOLDOUT})
+        for group in ("tuned", bench_html_extract.HOLDOUT):
+            old_f1 = sum(row["f1"] for row in results["bs4（旧）"] if row["group"] == group)
+            new_f1 = sum(row["f1"] for row in results["html.parser"] if row["group"] == group)
+            self.assertGreater(new_f1, old_f1)
+
+if __name__ == '__main__':
+    unittest.main()
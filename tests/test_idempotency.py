@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import time
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exam_generator.utils.idempotency import IdempotencyRegistry, derive_idempotency_key
+
+class TestIdempotency(unittest.TestCase):
+    """测试考试提交的幂等处理"""
+
+    def test_derived_key_is_canonical(self):
+        """测试inputs的键顺序不影响幂等键"""
+        self.assertEqual(
+            derive_idempotency_key({"count": 5, "subject": "数学"}, "t1"),
+            derive_idempotency_key({"subject": "数学", "count": 5}, "t1")
+        )
+        self.assertNotEqual(
+            derive_idempotency_key({"count": 5}, "t1"),
+            derive_idempotency_key({"count": 5}, "t2")
+        )
+
+    def test_completed_result_replayed_within_window(self):
+        """测试成功结果在保留时间内直接返回，过期后重新执行"""
+        registry = IdempotencyRegistry(ttl=0.05)
+        entry, is_owner = registry.begin("k")
+        self.assertTrue(is_owner)
+        registry.complete(entry, {"message": "ok"})
+
+        replay, is_owner = registry.begin("k")
+        self.assertFalse(is_owner)
+        self.assertEqual(registry.wait(replay, timeout=0), ({"message": "ok"}, 200))
+
+        time.sleep(0.06)
+        _, is_owner = registry.begin("k")
+        self.assertTrue(is_owner)
+
+    def test_failure_not_cached(self):
+        """测试失败结果交给等待者但不保留"""
+        registry = IdempotencyRegistry()
+        entry, _ = registry.begin("k")
+        waiter, is_owner = registry.begin("k")
+        self.assertFalse(is_owner)
+        registry.fail(entry, {"error": "失败"}, 500)
+        self.assertEqual(registry.wait(waiter, timeout=0), ({"error": "失败"}, 500))
+        _, is_owner = registry.begin("k")
+        self.assertTrue(is_owner)
+
+    @patch('exam_generator.server.aws_config.setup_credentials')
+    @patch('exam_generator.server.generate_exam')
+    def test_duplicate_submissions_coalesced(self, mock_generate_exam, mock_setup_credentials):
+        """测试并发的重复提交只执行一次工作流"""
+        from exam_generator.server import app
+
+        def slow_generate(exam_request, workflow_id):
+            time.sleep(0.2)
+            return {"exam_content": "## 单选题", "render_result": {"message": "保存成功"}}
+        mock_generate_exam.side_effect = slow_generate
+
+        exam_request = {"inputs": {"subject": "幂等测试", "count": 1}}
+        responses = []
+        def submit():
+            responses.append(app.test_client().post('/workflows/run', json=exam_request))
+        threads = [threading.Thread(target=submit) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(mock_generate_exam.call_count, 1)
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertEqual(len({response.headers["X-Workflow-Id"] for response in responses}), 1)
+        self.assertEqual(sum(1 for r in responses if r.headers.get("Idempotent-Replayed") == "true"), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import sys
+import os
+
+# 添加项目根目录和benchmarks目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from loadtest import percentile, summarize, render_inputs
+
+class TestLoadtestSummary(unittest.TestCase):
+    """测试负载测试结果的汇总"""
+
+    def test_percentile_interpolates(self):
+        """测试分位数按线性插值计算"""
+        values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+        self.assertEqual(percentile(values, 50), 5.5)
+        self.assertAlmostEqual(percentile(values, 90), 9.1)
+        self.assertEqual(percentile(values, 100), 10)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summary_counts_errors_and_throughput(self):
+        """测试只有成功的请求计入延迟和吞吐量"""
+        records = [
+            {"scenario": "quiz", "status": 200, "latency": 1.0, "error": None},
+            {"scenario": "quiz", "status": 200, "latency": 3.0, "error": None},
+            {"scenario": "large", "status": 429, "latency": 0.01, "error": "busy"},
+            {"scenario": "large", "status": None, "latency": 30.0, "error": "ReadTimeout"}
+        ]
+        summary = summarize(records, duration=2, target_rps=2)
+        self.assertEqual(summary["sent"], 4)
+        self.assertEqual(summary["succeeded"], 2)
+        self.assertEqual(summary["error_rate"], 0.5)
+        self.assertEqual(summary["throughput"], 1.0)
+        self.assertEqual(summary["status_counts"], {"200": 2, "429": 1, "error": 1})
+        self.assertEqual(summary["latency"]["p50"], 2.0)
+        self.assertEqual(summary["by_scenario"]["large"]["succeeded"], 0)
+
+    def test_render_inputs(self):
+        """测试inputs中的{n}替换为请求序号"""
+        self.assertEqual(
+            render_inputs({"subject": "生物{n}", "count": 3, "topics": ["细胞{n}"]}, 7),
+            {"subject": "生物7", "count": 3, "topics": ["细胞7"]}
+        )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import queue
+import logging
+
+# 添加项目根目录和基准测试目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from exam_generator.config import log_config
+from exam_generator.utils.logging_utils import log_payload, _QueueHandler, _QueueListener
+from exam_generator.utils.metrics import log_records_dropped, metrics_registry
+import bench_logging
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+class TestLogPayload(unittest.TestCase):
+    """测试较大数据的日志记录"""
+
+    def setUp(self):
+        self.logger = logging.getLogger("tests.payload")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handler = _ListHandler()
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def test_truncated(self):
+        """测试超过字符上限的数据被截断，并注明原长度"""
+        with patch.object(log_config, "payload_max_chars", 20):
+            log_payload(self.logger, "考试生成结果", {"exam_content": "题目" * 100})
+        message = self.handler.messages[0]
+        self.assertTrue(message.startswith('考试生成结果: {"exam_content": "题目'))
+        self.assertIn("已截断", message)
+        self.assertLess(len(message), 80)
+
+    def test_sampling_and_level(self):
+        """测试采样率为0或级别未开启时不记录，也不序列化数据"""
+        class Unserializable:
+            def __str__(self):
+                raise AssertionError("不应该被格式化")
+        with patch.object(log_config, "payload_sample_rate", 0.0):
+            log_payload(self.logger, "收到考试生成请求", Unserializable())
+        log_payload(self.logger, "收到考试生成请求", Unserializable(), level=logging.DEBUG)
+        self.assertEqual(self.handler.messages, [])
+
+class TestQueuePipeline(unittest.TestCase):
+    """测试队列日志"""
+
+    def _dropped(self):
+        values, _ = metrics_registry.collect()
+        return values.get((log_records_dropped.name, ()), 0)
+
+    def test_background_writer(self):
+        """测试记录在后台线程中格式化和写入，异常堆栈在入队时保存"""
+        log_queue = queue.Queue(100)
+        output = _ListHandler()
+        output.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+        listener = _QueueListener(log_queue, output)
+        logger = logging.getLogger("tests.queue")
+        logger.propagate = False
+        handler = _QueueHandler(log_queue)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        listener.start()
+        logger.warning("工作流 %s 超时", "wf-1")
+        try:
+            raise ValueError("渲染失败")
+        except ValueError:
+            logger.error("渲染出错", exc_info=True)
+        listener.stop()
+
+        self.assertEqual(output.messages[0], "WARNING 工作流 wf-1 超时")
+        self.assertIn("ValueError: 渲染失败", output.messages[1])
+
+    def test_full_queue_drops(self):
+        """测试队列已满时丢弃记录并计数，不阻塞调用方"""
+        logger = logging.getLogger("tests.full")
+        logger.propagate = False
+        handler = _QueueHandler(queue.Queue(1))
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        before = self._dropped()
+        for i in range(3):
+            logger.warning("记录%d", i)
+        self.assertEqual(self._dropped() - before, 2)
+
+class TestLoggingBenchmark(unittest.TestCase):
+    """测试日志开销基准测试可以运行"""
+
+    def test_run(self):
+        """测试两种方式都输出每个请求的耗时，并恢复根日志记录器"""
+        root = logging.getLogger()
+        handlers = root.handlers[:]
+        results = bench_logging.run(requests=3, chunks=10, questions=2)
+        self.assertEqual(len(results["sync"]), 3)
+        self.assertEqual(len(results["queued"]), 3)
+        self.assertEqual(root.handlers, handlers)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exam_generator.utils.metrics import MetricsRegistry
+
+class TestMetricsRegistry(unittest.TestCase):
+    """测试进程内指标注册表"""
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.requests = self.registry.counter("test_requests_total", "请求数量", ["result"])
+        self.latency = self.registry.histogram("test_latency_seconds", "耗时", ["tool"], buckets=(0.1, 1))
+
+    def test_counter_from_many_threads(self):
+        """测试多个线程的计数在采集时合并，包括已结束的线程"""
+        def work():
+            for _ in range(1000):
+                self.requests.inc(result="hit")
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.requests.inc(2, result="miss")
+
+        text = self.registry.render()
+        self.assertIn('test_requests_total{result="hit"} 8000', text)
+        self.assertIn('test_requests_total{result="miss"} 2', text)
+        # 已结束线程的分片合并后不再保留
+        self.assertEqual(len(self.registry._shards), 1)
+        self.assertIn('test_requests_total{result="hit"} 8000', self.registry.render())
+
+    def test_histogram_format(self):
+        """测试直方图输出累计分桶、总和和次数"""
+        for value in (0.05, 0.1, 0.5, 3):
+            self.latency.observe(value, tool="render")
+        text = self.registry.render()
+        self.assertIn("# TYPE test_latency_seconds histogram", text)
+        self.assertIn('test_latency_seconds_bucket{tool="render",le="0.1"} 2', text)
+        self.assertIn('test_latency_seconds_bucket{tool="render",le="1"} 3', text)
+        self.assertIn('test_latency_seconds_bucket{tool="render",le="+Inf"} 4', text)
+        self.assertIn('test_latency_seconds_sum{tool="render"} 3.65', text)
+        self.assertIn('test_latency_seconds_count{tool="render"} 4', text)
+
+    def test_gauge_and_label_escaping(self):
+        """测试瞬时值在采集时计算，标签值中的特殊字符被转义"""
+        depth = {"interactive": 3, 'a"b': 1}
+        self.registry.gauge("test_queue_depth", "队列长度", lambda: depth, labelnames=["priority"])
+        text = self.registry.render()
+        self.assertIn('test_queue_depth{priority="interactive"} 3', text)
+        self.assertIn('test_queue_depth{priority="a\\"b"} 1', text)
+        with self.assertRaises(ValueError):
+            self.requests.inc(tool="x")
+
+    def test_snapshot_merge(self):
+        """测试合并其他worker的快照，已退出进程的瞬时值不计入"""
+        self.requests.inc(result="hit")
+        self.registry.gauge("test_in_flight", "执行中", lambda: 2)
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            self.registry.write_snapshot(snapshot_dir)
+            with open(os.path.join(snapshot_dir, f"{os.getpid()}.json"), encoding="utf-8") as f:
+                data = json.load(f)
+            # 模拟一个已经退出的worker留下的快照
+            data["pid"] = 2 ** 22 + 1
+            with open(os.path.join(snapshot_dir, "other.json"), "w", encoding="utf-8") as f:
+                json.dump(data, f)
+
+            text = self.registry.render(snapshot_dir)
+        self.assertIn('test_requests_total{result="hit"} 2', text)
+        self.assertIn("test_in_flight 2", text)
+
+if __name__ == "__main__":
+    unittest.main()
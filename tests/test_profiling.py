@@ -0,0 +1,156 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import time
+import pstats
+import tempfile
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exam_generator.utils.profiling import Profiler, ProfilingError
+
+def busy_validation(duration):
+    """模拟耗时的校验"""
+    end = time.perf_counter() + duration
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+class TestProfiler(unittest.TestCase):
+    """测试按需性能分析"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.profiler = Profiler(tmp.name)
+
+    def test_cprofile_next_workflows(self):
+        """测试cProfile分析接下来N个工作流，之后的工作流不再分析"""
+        session = self.profiler.start("cprofile", workflows=2)
+        for _ in range(3):
+            with self.profiler.workflow_scope():
+                busy_validation(0.01)
+        self.assertTrue(session.wait(5))
+        self.assertEqual(session.to_dict()["workflows_profiled"], 2)
+
+        stats = pstats.Stats(self.profiler.result_path(session.id))
+        calls = {func[2]: stat[1] for func, stat in stats.stats.items()}
+        self.assertEqual(calls["busy_validation"], 2)
+
+    def test_sampling_seconds(self):
+        """测试采样分析读取其他线程的调用栈，结果为折叠栈文本"""
+        worker = threading.Thread(target=busy_validation, args=(0.5,), name="worker-1")
+        worker.start()
+        session = self.profiler.start("sampling", seconds=0.3, interval=0.005)
+        self.assertTrue(session.wait(5))
+        worker.join()
+
+        with open(self.profiler.result_path(session.id), encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertGreater(int(count), 0)
+        busy = [line for line in lines if "busy_validation (tests/test_profiling.py" in line]
+        self.assertTrue(busy)
+        self.assertTrue(busy[0].startswith("worker-N;"))
+
+    def test_single_session_and_errors(self):
+        """测试同一时间只能进行一次分析，参数无效和分析未结束时报错"""
+        with self.assertRaises(ProfilingError):
+            self.profiler.start("perf", seconds=1)
+        with self.assertRaises(ProfilingError):
+            self.profiler.start("cprofile")
+        session = self.profiler.start("cprofile", seconds=30)
+        with self.assertRaises(ProfilingError) as context:
+            self.profiler.start("sampling", seconds=1)
+        self.assertEqual(context.exception.status_code, 409)
+        with self.assertRaises(ProfilingError) as context:
+            self.profiler.result_path(session.id)
+        self.assertEqual(context.exception.status_code, 409)
+
+        # 提前结束：没有工作流时写出空的结果
+        self.profiler.stop()
+        self.assertTrue(session.wait(5))
+        self.assertTrue(os.path.exists(self.profiler.result_path(session.id)))
+
+    def test_sampling_error_finishes_session(self):
+        """测试采样线程出错时分析仍然结束，之后可以开始新的分析"""
+        session = self.profiler.start("sampling", seconds=30, interval=0.005)
+        session.interval = float("nan")
+        self.assertTrue(session.wait(5))
+        self.assertEqual(session.to_dict()["status"], "failed")
+        self.profiler.start("cprofile", seconds=30)
+        self.profiler.stop()
+
+    def test_tracemalloc_diff(self):
+        """测试快照对比返回两次快照之间增长最多的分配位置"""
+        self.profiler.tracemalloc_start()
+        self.addCleanup(self.profiler.tracemalloc_stop)
+        retained = [bytearray(1024) for _ in range(2000)]
+        result = self.profiler.tracemalloc_snapshot(limit=5)
+        self.assertIn("tests/test_profiling.py", result["top"][0]["location"][0])
+        self.assertGreaterEqual(result["top"][0]["size_diff"], 1024 * 2000)
+        self.assertEqual(len(retained), 2000)
+
+class TestAdminEndpoints(unittest.TestCase):
+    """测试管理接口"""
+
+    def setUp(self):
+        from exam_generator.server import app
+        self.client = app.test_client()
+
+    def test_disabled_by_default(self):
+        """测试管理接口默认关闭"""
+        with patch('exam_generator.server.server_config.admin_enabled', False):
+            response = self.client.post('/admin/profile', json={"seconds": 1})
+        self.assertEqual(response.status_code, 404)
+
+    def test_profile_and_download(self):
+        """测试校验管理令牌，开始分析后下载pstats文件"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with patch('exam_generator.server.server_config.admin_enabled', True), \
+                patch('exam_generator.server.server_config.admin_token', 'secret'), \
+                patch('exam_generator.server.profiler', Profiler(tmp.name)):
+            response = self.client.post('/admin/profile', json={"seconds": 1})
+            self.assertEqual(response.status_code, 403)
+
+            headers = {"X-Admin-Token": "secret"}
+            response = self.client.post('/admin/profile', json={"profiler": "cprofile", "seconds": 30}, headers=headers)
+            self.assertEqual(response.status_code, 202)
+            profile_id = response.get_json()["profile"]["id"]
+            self.assertEqual(self.client.get(f'/admin/profile/{profile_id}/download', headers=headers).status_code, 409)
+
+            self.client.post('/admin/profile/stop', headers=headers)
+            response = self.client.get(f'/admin/profile?id={profile_id}', headers=headers)
+            self.assertEqual(response.get_json()["profile"]["status"], "finished")
+            response = self.client.get(f'/admin/profile/{profile_id}/download', headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(f"profile-{profile_id}.pstats", response.headers["Content-Disposition"])
+            response.close()
+
+    def test_invalid_options(self):
+        """测试管理接口的数字参数无效或超出范围时返回400"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with patch('exam_generator.server.server_config.admin_enabled', True), \
+                patch('exam_generator.server.server_config.admin_token', ''), \
+                patch('exam_generator.server.profiler', Profiler(tmp.name)):
+            for options in [{"workflows": "abc"}, {"workflows": 1.5}, {"workflows": 10 ** 6}, {"workflows": 0},
+                            {"seconds": "nan"}, {"seconds": "inf"}, {"seconds": -1},
+                            {"profiler": "sampling", "seconds": 1, "interval": "nan"},
+                            {"profiler": "sampling", "seconds": 1, "interval": 0}]:
+                with self.subTest(options=options):
+                    self.assertEqual(self.client.post('/admin/profile', json=options).status_code, 400)
+            for options in [{"frames": "abc"}, {"frames": -1}, {"frames": 1000}]:
+                with self.subTest(options=options):
+                    self.assertEqual(self.client.post('/admin/tracemalloc/start', json=options).status_code, 400)
+            for options in [{"limit": "abc"}, {"limit": -1}, {"limit": 10 ** 6}]:
+                with self.subTest(options=options):
+                    self.assertEqual(self.client.post('/admin/tracemalloc/snapshot', json=options).status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
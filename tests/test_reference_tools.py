@@ -0,0 +1,264 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import asyncio
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from exam_generator.config import exam_config
+from exam_generator.utils.deadline_utils import deadline_scope
+from exam_generator.tools.reference_tools import FetchCache, fetch_reference_text, ReferenceDownload, extract_page_text
+from exam_generator.tools.async_tools import fetch_url_content_async
+import bench_reference_fetch
+
+class _PageHandler(BaseHTTPRequestHandler):
+    """返回带ETag的网页，记录收到的请求"""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/large":
+            return self._large_page()
+        if self.path == "/slow":
+            return self._slow_page()
+        if self.path == "/file.pdf":
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", "4")
+            self.end_headers()
+            self.wfile.write(b"%PDF")
+            return
+        if server.fail:
+            self.send_response(503)
+            self.end_headers()
+            return
+        etag = f'"v{server.version}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        body = f"<html><body><script>var x;</script><p>光合作用 版本{server.version} {self.path}</p></body></html>".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _large_page(self):
+        """约8MB的网页，客户端提取到足够的文本后会提前断开"""
+        paragraph = "<p>" + "植物通过光合作用制造有机物。" * 20 + "</p>\n"
+        chunk = (paragraph * 100).encode("utf-8")
+        count = 8 * 1024 * 1024 // len(chunk)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(chunk) * count))
+        self.end_headers()
+        try:
+            for _ in range(count):
+                self.wfile.write(chunk)
+                self.server.large_bytes_sent += len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _slow_page(self):
+        """每0.1秒发送一块空白，每次读取都不会超时，但整个下载需要约2秒"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.end_headers()
+        try:
+            self.wfile.write("<html><body><p>叶绿体吸收光能</p>".encode("utf-8"))
+            for _ in range(20):
+                self.wfile.write(b" " * exam_config.fetch_chunk_size)
+                self.wfile.flush()
+                time.sleep(0.1)
+            self.wfile.write("<p>光合作用</p></body></html>".encode("utf-8"))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+class TestFetchCache(unittest.TestCase):
+    """测试参考资料URL的获取缓存"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _PageHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests = []
+        self.server.version = 1
+        self.server.fail = False
+        self.server.large_bytes_sent = 0
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = FetchCache(tmp.name, ttl=3600)
+        patcher = patch('exam_generator.tools.reference_tools.fetch_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fresh_hit(self):
+        """测试新鲜期内同一URL只下载一次，缓存的是提取后的文本"""
+        url = f"{self.base_url}/page"
+        first = fetch_reference_text(url)
+        second = fetch_reference_text(url)
+        self.assertEqual(first, "光合作用 版本1 /page")
+        self.assertEqual(second, first)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_revalidation(self):
+        """测试过期后用ETag条件请求重新验证，内容未变时不再下载，内容改变时更新缓存"""
+        url = f"{self.base_url}/page"
+        fetch_reference_text(url)
+        self.cache.ttl = 0
+        self.assertEqual(fetch_reference_text(url), "光合作用 版本1 /page")
+        self.assertEqual(self.server.requests[-1], ("/page", '"v1"'))
+
+        self.server.version = 2
+        self.assertEqual(fetch_reference_text(url), "光合作用 版本2 /page")
+        self.cache.ttl = 3600
+        self.assertEqual(fetch_reference_text(url), "光合作用 版本2 /page")
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_settings_change(self):
+        """测试提取配置改变后旧的条目按未命中处理，不发送条件请求"""
+        url = f"{self.base_url}/page"
+        fetch_reference_text(url)
+        self.cache.ttl = 0
+        with patch.object(exam_config, "main_content_only", False):
+            self.assertEqual(fetch_reference_text(url), "光合作用 版本1 /page")
+            self.assertEqual(self.server.requests[-1], ("/page", None))
+            self.cache.ttl = 3600
+            fetch_reference_text(url)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_stale_on_error(self):
+        """测试重新验证失败时使用缓存的文本，没有缓存时抛出异常"""
+        fetch_reference_text(f"{self.base_url}/page")
+        self.cache.ttl = 0
+        self.server.fail = True
+        self.assertEqual(fetch_reference_text(f"{self.base_url}/page"), "光合作用 版本1 /page")
+        with self.assertRaises(Exception):
+            fetch_reference_text(f"{self.base_url}/other")
+
+    def test_capacity(self):
+        """测试条目数量超过上限时淘汰最久未使用的条目"""
+        self.cache.max_entries = 2
+        for name in ["a", "b"]:
+            fetch_reference_text(f"{self.base_url}/{name}")
+        # 访问a使它成为最近使用的条目
+        os.utime(self.cache._path(f"{self.base_url}/b"), (1, 1))
+        fetch_reference_text(f"{self.base_url}/a")
+        fetch_reference_text(f"{self.base_url}/c")
+        self.assertEqual(len([name for name in os.listdir(self.cache.cache_dir) if name.endswith(".json")]), 2)
+        self.assertIsNone(self.cache._read(f"{self.base_url}/b"))
+        self.assertIsNotNone(self.cache._read(f"{self.base_url}/a"))
+
+    def test_async_shares_cache(self):
+        """测试异步版本与同步版本共享获取缓存"""
+        url = f"{self.base_url}/page"
+        fetch_reference_text(url)
+        with patch('exam_generator.tools.async_tools.fetch_cache', self.cache):
+            text = asyncio.run(fetch_url_content_async(url))
+            self.cache.ttl = 0
+            revalidated = asyncio.run(fetch_url_content_async(url))
+        self.assertEqual(text, "光合作用 版本1 /page")
+        self.assertEqual(revalidated, text)
+        self.assertEqual(self.server.requests, [("/page", None), ("/page", '"v1"')])
+
+    def test_stream_stops_early(self):
+        """测试大网页提取到足够的文本后停止下载"""
+        text = fetch_reference_text(f"{self.base_url}/large")
+        self.assertTrue(text.startswith("植物通过光合作用制造有机物。"))
+        self.assertIn("[内容已截断，已截断至: 5000字符]", text)
+        self.assertLess(self.server.large_bytes_sent, 4 * 1024 * 1024)
+
+    def test_slow_download_deadline(self):
+        """测试服务器缓慢发送时下载在请求截止时间停止，返回已下载部分的文本且不写入缓存"""
+        url = f"{self.base_url}/slow"
+        started = time.monotonic()
+        with deadline_scope(0.3):
+            text = fetch_reference_text(url)
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertTrue(text.startswith("叶绿体吸收光能"))
+        self.assertIn("[下载超出请求时间预算，只提取了已下载的部分]", text)
+        self.assertIsNone(self.cache._read(url))
+
+    def test_slow_revalidation_uses_stale_entry(self):
+        """测试重新验证超出请求截止时间时使用过期的缓存内容"""
+        url = f"{self.base_url}/slow"
+        self.cache.store(url, "缓存的光合作用", {"ETag": '"v0"'})
+        self.cache.ttl = 0
+        with deadline_scope(0.3):
+            self.assertEqual(fetch_reference_text(url), "缓存的光合作用")
+        with deadline_scope(0.3):
+            self.assertEqual(asyncio.run(fetch_url_content_async(url)), "缓存的光合作用")
+
+    def test_content_type(self):
+        """测试不是网页或纯文本的响应被拒绝，也不会写入缓存"""
+        with self.assertRaises(ValueError):
+            fetch_reference_text(f"{self.base_url}/file.pdf")
+        self.assertIsNone(self.cache._read(f"{self.base_url}/file.pdf"))
+
+class TestReferenceDownload(unittest.TestCase):
+    """测试流式下载的解码和提取"""
+
+    def feed(self, download, data, size):
+        for i in range(0, len(data), size):
+            if download.feed(data[i:i + size]):
+                break
+        return download.finish()
+
+    def test_same_text_as_whole_page(self):
+        """测试逐字节传入时提取结果与一次性提取相同，多字节字符和标签跨块时不会被拆开"""
+        html = ('<html><head><title>光合作用</title><script>if (a<b) {x="</p>"}</script></head>'
+                '<body><h1>光合作用&nbsp;简介</h1><p>植物利用<b>光能</b>制造有机物 &amp; 氧气</p></body></html>')
+        download = ReferenceDownload("http://example.com", "text/html; charset=utf-8")
+        self.assertEqual(self.feed(download, html.encode("utf-8"), 1), extract_page_text(html))
+        self.assertEqual(extract_page_text(html), "光合作用 简介\n植物利用光能制造有机物 & 氧气")
+
+    def test_charset(self):
+        """测试使用<meta>声明的编码，纯文本不解析HTML"""
+        html = '<html><head><meta charset="gbk"></head><body><p>细胞分裂</p></body></html>'
+        download = ReferenceDownload("http://example.com", "text/html")
+        self.assertEqual(self.feed(download, html.encode("gbk"), 7), "细胞分裂")
+        download = ReferenceDownload("http://example.com", "text/plain; charset=utf-8")
+        self.assertEqual(self.feed(download, "  第一行 <b>\n\n第二行".encode("utf-8"), 5), "第一行 <b>\n第二行")
+
+    def test_byte_cap(self):
+        """测试达到字节上限时停止读取，并注明只提取了开头部分"""
+        html = ("<p>有丝分裂</p>" * 1000).encode("utf-8")
+        download = ReferenceDownload("http://example.com", "text/html", max_bytes=1000, max_chars=100000)
+        text = self.feed(download, html, 64)
+        self.assertEqual(download.bytes_read, 1000)
+        self.assertTrue(text.startswith("有丝分裂\n有丝分裂"))
+        self.assertIn("[网页超过1000字节，只提取了开头部分]", text)
+
+class TestReferenceFetchBenchmark(unittest.TestCase):
+    """测试参考资料获取基准测试可以运行"""
+
+    def test_run(self):
+        """测试两种方式提取的文本一致，流式方式只读取网页的开头部分"""
+        results = bench_reference_fetch.run(sizes=[200 * 1024], layouts=["article"], repeat=1)
+        self.assertTrue(results[0]["same_text"])
+        self.assertEqual(results[0]["whole"]["bytes_read"], results[0]["size"])
+        self.assertLess(results[0]["stream"]["bytes_read"], results[0]["size"] / 2)
+
+if __name__ == '__main__':
+    unittest.main()
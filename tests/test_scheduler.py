@@ -0,0 +1,85 @@
+import unittest
+import sys
+import os
+import time
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exam_generator.utils.scheduler import (
+    FairScheduler, PRIORITY_INTERACTIVE, PRIORITY_BATCH, classify_priority
+)
+from exam_generator.utils.deadline_utils import DeadlineExceeded
+
+class TestFairScheduler(unittest.TestCase):
+    """测试题目生成的公平调度器"""
+
+    def run_queued(self, scheduler, requests):
+        """
+        占住唯一的槽位，按顺序排队多个调用，然后释放槽位
+
+        Returns:
+            list: 调用获得槽位的顺序
+        """
+        order = []
+        scheduler.acquire("holder")
+        threads = []
+        for i, (tenant, priority) in enumerate(requests):
+            def worker(name=f"{tenant}-{i}", tenant=tenant, priority=priority):
+                with scheduler.slot(tenant, priority):
+                    order.append(name)
+            thread = threading.Thread(target=worker)
+            thread.start()
+            threads.append(thread)
+            # 等待调用进入队列，保证排队顺序确定
+            while sum(p["queued"] for p in scheduler.get_stats()["by_priority"].values()) < i + 1:
+                time.sleep(0.001)
+        scheduler.release()
+        for thread in threads:
+            thread.join()
+        return order
+
+    def test_round_robin_between_tenants(self):
+        """测试同一优先级内按租户轮转"""
+        scheduler = FairScheduler(max_concurrent=1)
+        order = self.run_queued(scheduler, [
+            ("a", PRIORITY_INTERACTIVE),
+            ("a", PRIORITY_INTERACTIVE),
+            ("a", PRIORITY_INTERACTIVE),
+            ("b", PRIORITY_INTERACTIVE)
+        ])
+        self.assertEqual(order, ["a-0", "b-3", "a-1", "a-2"])
+
+    def test_interactive_preferred_without_starving_batch(self):
+        """测试交互式请求优先，批量请求按权重获得槽位"""
+        scheduler = FairScheduler(max_concurrent=1, weights={PRIORITY_INTERACTIVE: 4, PRIORITY_BATCH: 1})
+        requests = [("big", PRIORITY_BATCH)] * 3 + [("small", PRIORITY_INTERACTIVE)] * 6
+        order = self.run_queued(scheduler, requests)
+        # 先排队的批量请求不会挡住交互式请求，但每5个槽位中批量请求仍获得1个
+        self.assertEqual([name.split("-")[0] for name in order[:5]].count("big"), 1)
+        self.assertTrue(order[0].startswith("small") or order[1].startswith("small"))
+        self.assertEqual(len(order), 9)
+
+    def test_wait_timeout(self):
+        """测试等待超时时抛出DeadlineExceeded并离开队列"""
+        scheduler = FairScheduler(max_concurrent=1)
+        scheduler.acquire("holder")
+        with self.assertRaises(DeadlineExceeded):
+            scheduler.acquire("waiter", timeout=0.05)
+        stats = scheduler.get_stats()
+        self.assertEqual(stats["by_priority"][PRIORITY_INTERACTIVE]["queued"], 0)
+        self.assertEqual(stats["by_priority"][PRIORITY_INTERACTIVE]["timed_out"], 1)
+        scheduler.release()
+
+    def test_classify_priority(self):
+        """测试按题目数量确定优先级，显式指定只能降为批量优先级"""
+        self.assertEqual(classify_priority(5), PRIORITY_INTERACTIVE)
+        self.assertEqual(classify_priority(50), PRIORITY_BATCH)
+        # 显式指定只能降级，不能把大考试升为交互式优先级
+        self.assertEqual(classify_priority(50, explicit=PRIORITY_INTERACTIVE), PRIORITY_BATCH)
+        self.assertEqual(classify_priority(5, explicit=PRIORITY_BATCH), PRIORITY_BATCH)
+        self.assertEqual(classify_priority("abc"), PRIORITY_INTERACTIVE)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import time
+import tempfile
+import fcntl
+import threading
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exam_generator.utils.process_slots import ProcessSlots
+from exam_generator.utils.deadline_utils import DeadlineExceeded
+from exam_generator.utils.task_manager import TaskManager
+from exam_generator.utils.admission import AdmissionController, AdmissionRejected
+from exam_generator.utils.idempotency import IdempotencyRegistry
+
+class TestMultiWorkerState(unittest.TestCase):
+    """测试多worker部署时共享的状态"""
+
+    def test_process_slots_shared_by_lock_dir(self):
+        """测试使用同一目录的名额共享上限"""
+        with tempfile.TemporaryDirectory() as lock_dir:
+            first = ProcessSlots(lock_dir, slots=1)
+            second = ProcessSlots(lock_dir, slots=1)
+            fd = first.acquire()
+            self.assertEqual(second.in_use(), 1)
+            with self.assertRaises(DeadlineExceeded):
+                second.acquire(timeout=0.05)
+            first.release(fd)
+            with second.slot(timeout=0.05):
+                self.assertEqual(first.in_use(), 1)
+            self.assertEqual(first.in_use(), 0)
+
+    def test_in_use_does_not_block_acquire(self):
+        """测试其他worker统计占用数量时申请名额不会被误判为已满"""
+        with tempfile.TemporaryDirectory() as lock_dir:
+            slots = ProcessSlots(lock_dir, slots=1)
+            # 模拟另一个worker的in_use正在探测唯一的名额
+            probe_fd = os.open(os.path.join(lock_dir, "slot-0.busy"), os.O_CREAT | os.O_RDWR, 0o644)
+            fcntl.flock(probe_fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            timer = threading.Timer(0.05, lambda: (fcntl.flock(probe_fd, fcntl.LOCK_UN), os.close(probe_fd)))
+            timer.start()
+            handle = slots.acquire(timeout=0)
+            timer.join()
+            self.assertEqual(slots.in_use(), 1)
+            slots.release(handle)
+            self.assertEqual(slots.in_use(), 0)
+
+    def test_task_state_visible_across_managers(self):
+        """测试一个worker记录的工作流可以被另一个worker查询"""
+        with tempfile.TemporaryDirectory() as state_dir:
+            writer = TaskManager(state_dir=state_dir)
+            reader = TaskManager(state_dir=state_dir)
+            workflow_id = writer.start_workflow("考试生成")
+            writer.complete_workflow(workflow_id, {"exam_content": "## 单选题"})
+
+            workflow = reader.get_workflow(workflow_id)
+            self.assertEqual(workflow["status"], "completed")
+            self.assertIn(workflow_id, reader.get_workflows())
+
+    def test_step_progress_visible_across_managers(self):
+        """测试步骤开始和结束时保存工作流，另一个worker可以看到执行中的进度"""
+        with tempfile.TemporaryDirectory() as state_dir:
+            writer = TaskManager(state_dir=state_dir)
+            reader = TaskManager(state_dir=state_dir)
+            workflow_id = writer.start_workflow("考试生成")
+            step_id = writer.add_step(workflow_id, "生成题目")
+            writer.start_step(workflow_id, step_id)
+            self.assertEqual(reader.get_workflow(workflow_id)["steps"][0]["status"], "running")
+            writer.complete_step(workflow_id, step_id)
+            self.assertEqual(reader.get_workflows()[workflow_id]["steps"][0]["status"], "completed")
+
+            # 文件没有变化时不重新读取
+            with patch.object(reader, "_load", wraps=reader._load) as load:
+                reader.get_workflows()
+                self.assertEqual(load.call_count, 0)
+
+    def test_expired_task_state_removed(self):
+        """测试结束超过保留时间的工作流从内存和共享状态目录中删除，执行中的工作流保留"""
+        with tempfile.TemporaryDirectory() as state_dir:
+            writer = TaskManager(state_dir=state_dir, ttl=3600)
+            finished = writer.start_workflow("考试生成")
+            writer.complete_workflow(finished)
+            running = writer.start_workflow("考试生成")
+            expired = time.time() - 7200
+            os.utime(os.path.join(state_dir, f"{finished}.json"), (expired, expired))
+            writer.tasks[finished]["end_time"] = datetime.fromtimestamp(expired).isoformat()
+
+            reader = TaskManager(state_dir=state_dir, ttl=3600)
+            reader.cleanup(force=True)
+            self.assertEqual(os.listdir(state_dir), [f"{running}.json"])
+            writer.cleanup(force=True)
+            self.assertEqual(list(writer.get_workflows()), [running])
+
+    def test_admission_shared_across_controllers(self):
+        """测试使用同一目录的准入控制共享并发上限和排队上限"""
+        with tempfile.TemporaryDirectory() as slots_dir:
+            def controller():
+                return AdmissionController(
+                    max_concurrent=1, max_queue_depth=1, max_queue_wait=5,
+                    process_slots=ProcessSlots(os.path.join(slots_dir, "workflows"), 1),
+                    queue_slots=ProcessSlots(os.path.join(slots_dir, "workflow-queue"), 1)
+                )
+            first, second, third = controller(), controller(), controller()
+            admission = first.acquire()
+
+            admitted = threading.Event()
+            def waiter():
+                with second.admit():
+                    admitted.set()
+            thread = threading.Thread(target=waiter)
+            thread.start()
+            while third.get_stats()["queue_depth_all_processes"] < 1:
+                time.sleep(0.001)
+
+            # 所有worker合计的队列已满，另一个worker的请求也立即被拒绝
+            with self.assertRaises(AdmissionRejected) as context:
+                third.acquire()
+            self.assertEqual(context.exception.status_code, 429)
+            self.assertEqual(third.get_stats()["running_all_processes"], 1)
+
+            first.release(admission)
+            thread.join()
+            self.assertTrue(admitted.is_set())
+            self.assertEqual(second.get_stats()["admitted"], 1)
+
+            admission = first.acquire()
+            with self.assertRaises(AdmissionRejected) as context:
+                third.acquire(timeout=0.05)
+            self.assertEqual(context.exception.status_code, 503)
+            first.release(admission)
+            self.assertEqual(third.get_stats()["queue_depth_all_processes"], 0)
+
+    def test_idempotency_shared_across_registries(self):
+        """测试落到另一个worker的重复提交等待并复用第一个请求的结果，而不是重新执行"""
+        with tempfile.TemporaryDirectory() as shared_dir:
+            owner_registry = IdempotencyRegistry(shared_dir=shared_dir, poll_interval=0.01)
+            other_registry = IdempotencyRegistry(shared_dir=shared_dir, poll_interval=0.01)
+
+            entry, is_owner = owner_registry.begin("k")
+            self.assertTrue(is_owner)
+            owner_registry.set_workflow("k", "wf-1")
+            waiter, is_owner = other_registry.begin("k")
+            self.assertFalse(is_owner)
+            self.assertEqual(waiter.workflow_id, "wf-1")
+            self.assertIsNone(other_registry.wait(waiter, timeout=0.05))
+
+            owner_registry.complete(entry, {"message": "ok"})
+            self.assertEqual(other_registry.wait(waiter, timeout=1), ({"message": "ok"}, 200))
+            replay, is_owner = IdempotencyRegistry(shared_dir=shared_dir).begin("k")
+            self.assertFalse(is_owner)
+            self.assertEqual(other_registry.wait(replay, timeout=0), ({"message": "ok"}, 200))
+
+            # 失败的结果交给等待的worker，但之后的提交重新执行
+            entry, _ = owner_registry.begin("f")
+            waiter, _ = other_registry.begin("f")
+            owner_registry.fail(entry, {"error": "失败"}, 500)
+            self.assertEqual(other_registry.wait(waiter, timeout=1), ({"error": "失败"}, 500))
+            retry, is_owner = other_registry.begin("f")
+            self.assertTrue(is_owner)
+
+            # 执行的worker退出（锁被释放）但没有写入结果时，等待的worker得到错误而不是一直等待
+            waiter, is_owner = owner_registry.begin("f")
+            self.assertFalse(is_owner)
+            other_registry._unlock(retry.lock_fd)
+            retry.lock_fd = None
+            self.assertEqual(owner_registry.wait(waiter, timeout=1)[1], 500)
+
+    def test_expired_idempotency_records_removed(self):
+        """测试共享目录中过期的幂等记录被删除"""
+        with tempfile.TemporaryDirectory() as shared_dir:
+            registry = IdempotencyRegistry(ttl=0.01, shared_dir=shared_dir, cleanup_interval=0)
+            entry, _ = registry.begin("k")
+            registry.complete(entry, {"message": "ok"})
+            time.sleep(0.02)
+            IdempotencyRegistry(ttl=0.01, shared_dir=shared_dir, cleanup_interval=0).begin("other")
+            record_path, lock_path = registry._paths("k")
+            self.assertFalse(os.path.exists(record_path))
+            self.assertFalse(os.path.exists(lock_path))
+
+    def test_drain_rejects_new_workflows(self):
+        """测试排空时拒绝新的工作流并等待执行中的工作流结束"""
+        controller = AdmissionController(max_concurrent=2)
+        admission = controller.acquire()
+        controller.begin_drain()
+        with self.assertRaises(AdmissionRejected) as context:
+            controller.acquire()
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertFalse(controller.wait_idle(timeout=0.01))
+        controller.release(admission)
+        self.assertTrue(controller.wait_idle(timeout=0.01))
+
+if __name__ == '__main__':
+    unittest.main()
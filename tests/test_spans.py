@@ -0,0 +1,120 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from strands import Agent, tool
+from strands.tools.executors import ConcurrentToolExecutor
+from exam_generator.utils.task_manager import TaskManager, TaskTrackingHook
+from exam_generator.utils.context_utils import workflow_scope
+from exam_generator.utils.span_utils import span, critical_path, summarize_spans
+from tests.fake_model import ScriptedModel
+
+@tool
+def traced_tool(n: int) -> str:
+    """
+    在工具内记录阶段的测试工具
+
+    Args:
+        n: 编号
+    """
+    with span("inner", n=n):
+        return f"完成 {n}"
+
+def _span(span_id, name, start, end, parent_id=None):
+    return {"id": span_id, "parent_id": parent_id, "name": name, "start": start, "end": end, "duration": end - start}
+
+class TestCriticalPath(unittest.TestCase):
+    """测试关键路径计算"""
+
+    def test_parallel_children(self):
+        """测试并发的子阶段只有决定结束时间的部分计入关键路径"""
+        spans = [
+            _span("a", "A", 0, 4),
+            _span("b", "B", 4, 10),
+            _span("b1", "B1", 4, 6, parent_id="b"),
+            _span("b2", "B2", 5, 9, parent_id="b")
+        ]
+        breakdown = critical_path(spans, 0, 10)
+        self.assertEqual(breakdown["A"], 4)
+        self.assertEqual(breakdown["B"], 1)
+        self.assertEqual(breakdown["B1"], 1)
+        self.assertEqual(breakdown["B2"], 4)
+        self.assertEqual(breakdown["untracked"], 0)
+        self.assertEqual(sum(breakdown.values()), 10)
+
+    def test_untracked_time_and_summary(self):
+        """测试没有阶段覆盖的时间计为untracked，汇总按耗时降序"""
+        spans = [_span("a", "model.invoke", 1, 4), _span("b", "model.invoke", 1, 2)]
+        summary = summarize_spans(spans, 0, 5)
+        self.assertEqual(summary["critical_path_total"], 5)
+        self.assertEqual(summary["critical_path"][0], {"name": "model.invoke", "duration": 3, "share": 0.6})
+        self.assertEqual(summary["critical_path"][1], {"name": "untracked", "duration": 2, "share": 0.4})
+        self.assertEqual(summary["phases"]["model.invoke"]["count"], 2)
+        self.assertEqual(summary["phases"]["model.invoke"]["total_time"], 4)
+
+class TestWorkflowSpans(unittest.TestCase):
+    """测试工作流中记录的阶段"""
+
+    def setUp(self):
+        self.manager = TaskManager()
+        self.workflow_id = self.manager.start_workflow("考试生成")
+        self.step_id = self.manager.add_step(self.workflow_id, "生成考试")
+        patcher = patch('exam_generator.utils.task_manager.task_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_no_span_outside_workflow(self):
+        """测试不在工作流中时不记录阶段"""
+        with span("render") as current:
+            self.assertIsNone(current)
+        self.assertEqual(self.manager.get_workflow(self.workflow_id)["spans"], [])
+
+    def test_tool_spans_nested_under_orchestrator(self):
+        """测试并发工具调用的阶段嵌套在Agent阶段下，工具内的阶段嵌套在对应的工具阶段下"""
+        agent = Agent(
+            model=ScriptedModel([[("traced_tool", {"n": i}) for i in range(3)], "完成"]),
+            tools=[traced_tool],
+            callback_handler=None,
+            hooks=[TaskTrackingHook(self.manager)],
+            tool_executor=ConcurrentToolExecutor()
+        )
+        with workflow_scope(self.workflow_id, self.step_id), span("orchestrator"):
+            agent("开始")
+        self.manager.complete_workflow(self.workflow_id)
+
+        spans = {item["id"]: item for item in self.manager.get_workflow(self.workflow_id)["spans"]}
+        by_name = {}
+        for item in spans.values():
+            by_name.setdefault(item["name"], []).append(item)
+        self.assertEqual(len(by_name["tool.traced_tool"]), 3)
+        self.assertEqual(len(by_name["inner"]), 3)
+        orchestrator = by_name["orchestrator"][0]
+        for item in by_name["tool.traced_tool"]:
+            self.assertEqual(item["parent_id"], orchestrator["id"])
+            self.assertEqual(item["step_id"], self.step_id)
+        for item in by_name["inner"]:
+            parent = spans[item["parent_id"]]
+            self.assertEqual(parent["name"], "tool.traced_tool")
+            self.assertEqual(parent["tool_use_id"], item["tool_use_id"])
+
+        report = self.manager.generate_evaluation_report(self.workflow_id)
+        names = [item["name"] for item in report["phase_breakdown"]["critical_path"]]
+        self.assertIn("orchestrator", names)
+        self.assertEqual(report["phase_breakdown"]["phases"]["inner"]["count"], 3)
+
+    def test_failed_span(self):
+        """测试代码块抛出异常时阶段标记为失败"""
+        with workflow_scope(self.workflow_id, self.step_id):
+            with self.assertRaises(ValueError):
+                with span("render"):
+                    raise ValueError("渲染失败")
+        recorded = self.manager.get_workflow(self.workflow_id)["spans"][0]
+        self.assertEqual(recorded["status"], "error")
+        self.assertIn("渲染失败", recorded["error"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import io
+import json
+import time
+import threading
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from strands import Agent, tool
+from strands.tools.executors import ConcurrentToolExecutor
+from exam_generator.agent import ToolConcurrencyLimit
+from exam_generator.utils.task_manager import TaskManager, TaskStatus, TaskTrackingHook, create_task_tracking_callback
+from exam_generator.utils.context_utils import workflow_scope, set_current_tool_use
+from exam_generator.tools.exam_tools import call_claude
+from tests.fake_model import ScriptedModel
+
+_running = {"active": 0, "peak": 0}
+_running_lock = threading.Lock()
+
+@tool
+def slow_tool(n: int) -> str:
+    """
+    耗时的测试工具
+    
+    Args:
+        n: 编号
+    """
+    with _running_lock:
+        _running["active"] += 1
+        _running["peak"] = max(_running["peak"], _running["active"])
+    time.sleep(0.1)
+    with _running_lock:
+        _running["active"] -= 1
+    return f"完成 {n}"
+
+class TestTokenAccounting(unittest.TestCase):
+    """测试token用量统计"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.manager = TaskManager()
+        self.workflow_id = self.manager.start_workflow("考试生成")
+        self.step_id = self.manager.add_step(self.workflow_id, "生成考试")
+
+    def test_agent_usage_from_callback(self):
+        """测试Agent模型调用的用量通过回调记录"""
+        callback = create_task_tracking_callback(self.manager, self.workflow_id, self.step_id)
+        callback(event={"metadata": {"usage": {"inputTokens": 1200, "outputTokens": 300, "totalTokens": 1500}}})
+
+        report = self.manager.generate_evaluation_report(self.workflow_id)
+        self.assertEqual(report["token_usage"]["input_tokens"], 1200)
+        self.assertEqual(report["token_usage"]["output_tokens"], 300)
+        self.assertEqual(report["token_usage"]["total_tokens"], 1500)
+        self.assertEqual(report["token_usage_by_source"]["agent"]["model_calls"], 1)
+        self.assertGreater(report["token_usage"]["estimated_cost"], 0)
+
+    @patch('exam_generator.tools.exam_tools.get_bedrock_client')
+    def test_tool_usage_attached_to_tool_call(self, mock_get_client):
+        """测试工具内的模型调用用量关联到工具调用记录"""
+        body = json.dumps({
+            "content": [{"text": "## 单选题\n\n题目\n\n- (x) A\n- ( ) B"}],
+            "usage": {"input_tokens": 500, "output_tokens": 80}
+        }).encode('utf-8')
+        mock_client = MagicMock()
+        mock_client.invoke_model.return_value = {"body": io.BytesIO(body)}
+        mock_get_client.return_value = mock_client
+
+        self.manager.record_tool_call(
+            self.workflow_id, self.step_id, "generate_single_choice_question", tool_use_id="tooluse-1"
+        )
+
+        with patch('exam_generator.utils.task_manager.task_manager', self.manager):
+            with workflow_scope(self.workflow_id, self.step_id):
+                set_current_tool_use("tooluse-1")
+                try:
+                    call_claude("测试", source="generate_single_choice_question")
+                finally:
+                    set_current_tool_use(None)
+
+        report = self.manager.generate_evaluation_report(self.workflow_id)
+        tool_stats = report["tool_distribution"]["generate_single_choice_question"]
+        self.assertEqual(tool_stats["input_tokens"], 500)
+        self.assertEqual(tool_stats["output_tokens"], 80)
+        self.assertIn("generate_single_choice_question", report["token_usage_by_source"])
+
+        summary = self.manager.generate_token_summary()
+        self.assertEqual(summary["workflows"], 1)
+        self.assertEqual(summary["total_tokens"], 580)
+
+class TestConcurrentToolTracking(unittest.TestCase):
+    """测试并发工具调用的跟踪"""
+
+    def test_overlapping_tool_calls(self):
+        """测试同一轮的多个工具调用并发执行且各自正确记录"""
+        manager = TaskManager()
+        workflow_id = manager.start_workflow("考试生成")
+        step_id = manager.add_step(workflow_id, "生成考试")
+        model = ScriptedModel([[("slow_tool", {"n": i}) for i in range(5)], "完成"])
+        agent = Agent(
+            model=model,
+            tools=ToolConcurrencyLimit(3).wrap([slow_tool]),
+            callback_handler=create_task_tracking_callback(manager, workflow_id, step_id),
+            hooks=[TaskTrackingHook(manager)],
+            tool_executor=ConcurrentToolExecutor()
+        )
+        _running["peak"] = 0
+
+        with workflow_scope(workflow_id, step_id):
+            agent("开始")
+
+        # 并发数不超过上限
+        self.assertEqual(_running["peak"], 3)
+
+        tool_calls = manager.get_workflow(workflow_id)["steps"][0]["tool_calls"]
+        self.assertEqual(len(tool_calls), 5)
+        for i, tool_call in enumerate(sorted(tool_calls, key=lambda tc: tc["tool_use_id"])):
+            self.assertEqual(tool_call["status"], TaskStatus.COMPLETED)
+            self.assertIn(f"完成 {i}", json.dumps(tool_call["output_data"], ensure_ascii=False))
+
+        report = manager.generate_evaluation_report(workflow_id)
+        self.assertEqual(report["token_usage_by_source"]["agent"]["model_calls"], 2)
+
+    def test_queue_time_excluded(self):
+        """测试等待并发名额的时间记录为tool.queue阶段，不计入工具的执行时间"""
+        manager = TaskManager()
+        workflow_id = manager.start_workflow("考试生成")
+        step_id = manager.add_step(workflow_id, "生成考试")
+        agent = Agent(
+            model=ScriptedModel([[("slow_tool", {"n": i}) for i in range(3)], "完成"]),
+            tools=ToolConcurrencyLimit(1).wrap([slow_tool]),
+            callback_handler=None,
+            hooks=[TaskTrackingHook(manager)],
+            tool_executor=ConcurrentToolExecutor()
+        )
+        with patch('exam_generator.utils.task_manager.task_manager', manager), workflow_scope(workflow_id, step_id):
+            agent("开始")
+
+        workflow = manager.get_workflow(workflow_id)
+        for tool_call in workflow["steps"][0]["tool_calls"]:
+            duration = datetime.fromisoformat(tool_call["end_time"]) - datetime.fromisoformat(tool_call["start_time"])
+            self.assertLess(duration.total_seconds(), 0.18)
+        spans = workflow["spans"]
+        tool_spans = [item for item in spans if item["name"] == "tool.slow_tool"]
+        queue_spans = [item for item in spans if item["name"] == "tool.queue"]
+        self.assertEqual(len(tool_spans), 3)
+        self.assertEqual(len(queue_spans), 3)
+        self.assertTrue(all(item["duration"] < 0.18 for item in tool_spans))
+        self.assertGreater(max(item["duration"] for item in queue_spans), 0.15)
+
+if __name__ == '__main__':
+    unittest.main()
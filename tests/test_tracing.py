@@ -0,0 +1,130 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.sampling import Decision, ParentBased
+from strands import Agent
+from strands.tools.executors import ConcurrentToolExecutor
+from exam_generator.utils.task_manager import TaskManager, TaskTrackingHook
+from exam_generator.utils.context_utils import workflow_scope
+from exam_generator.utils.span_utils import span
+from exam_generator.utils.tracing import (
+    RateLimitedSampler, JsonlSpanExporter, use_tracer_provider, start_server_span, end_otel_span,
+    inject_trace_headers, current_trace_id
+)
+from tests.fake_model import ScriptedModel
+from tests.test_spans import traced_tool
+
+class TestRateLimitedSampler(unittest.TestCase):
+    """测试采样器"""
+
+    def test_rate_limit(self):
+        """测试每秒开始的追踪数量不超过上限"""
+        sampler = RateLimitedSampler(1.0, 5)
+        decisions = [sampler.should_sample(None, trace_id, "root").decision for trace_id in range(1, 21)]
+        self.assertEqual(decisions.count(Decision.RECORD_AND_SAMPLE), 5)
+
+    def test_ratio_and_unlimited(self):
+        """测试采样率为0时不采样，上限为0时不限制数量"""
+        self.assertEqual(RateLimitedSampler(0.0, 10).should_sample(None, 1, "root").decision, Decision.DROP)
+        sampler = RateLimitedSampler(1.0, 0)
+        self.assertTrue(all(sampler.should_sample(None, i, "root").decision == Decision.RECORD_AND_SAMPLE for i in range(1, 101)))
+
+    def test_children_follow_parent(self):
+        """测试达到上限后，已采样追踪中的子span仍然被采样"""
+        provider = TracerProvider(sampler=ParentBased(RateLimitedSampler(1.0, 1)))
+        tracer = provider.get_tracer("test")
+        with tracer.start_as_current_span("root") as root:
+            self.assertTrue(root.is_recording())
+            with tracer.start_as_current_span("child") as child:
+                self.assertTrue(child.is_recording())
+        self.assertFalse(tracer.start_span("second-root").is_recording())
+
+class TestTracing(unittest.TestCase):
+    """测试阶段计时与OpenTelemetry span的衔接"""
+
+    def setUp(self):
+        self.exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(self.exporter))
+        use_tracer_provider(provider)
+        self.addCleanup(use_tracer_provider, None)
+        self.manager = TaskManager()
+        patcher = patch('exam_generator.utils.task_manager.task_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_request_trace(self):
+        """测试请求、阶段、工具调用和工具内的阶段属于同一个追踪，并继续上游的traceparent"""
+        upstream = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+        request_span, token = start_server_span("POST /workflows/run", {"traceparent": upstream})
+        workflow_id = self.manager.start_workflow("考试生成")
+        step_id = self.manager.add_step(workflow_id, "生成考试")
+        agent = Agent(
+            model=ScriptedModel([[("traced_tool", {"n": i}) for i in range(2)], "完成"]),
+            tools=[traced_tool],
+            callback_handler=None,
+            hooks=[TaskTrackingHook(self.manager)],
+            tool_executor=ConcurrentToolExecutor()
+        )
+        with workflow_scope(workflow_id, step_id), span("orchestrator"):
+            agent("开始")
+            headers = inject_trace_headers({})
+        end_otel_span(request_span, token)
+
+        self.assertEqual(self.manager.get_workflow(workflow_id)["trace_id"], "0af7651916cd43dd8448eb211c80319c")
+        self.assertTrue(headers["traceparent"].startswith("00-0af7651916cd43dd8448eb211c80319c-"))
+
+        spans = {item.name: item for item in self.exporter.get_finished_spans()}
+        self.assertEqual({item.context.trace_id for item in self.exporter.get_finished_spans()}, {0x0af7651916cd43dd8448eb211c80319c})
+        self.assertEqual(spans["POST /workflows/run"].parent.span_id, 0xb7ad6b7169203331)
+        self.assertEqual(spans["orchestrator"].parent.span_id, spans["POST /workflows/run"].context.span_id)
+        self.assertEqual(spans["orchestrator"].attributes["exam.workflow_id"], workflow_id)
+        tools = [item for item in self.exporter.get_finished_spans() if item.name == "tool.traced_tool"]
+        inner = [item for item in self.exporter.get_finished_spans() if item.name == "inner"]
+        self.assertEqual(len(tools), 2)
+        self.assertTrue(all(item.parent.span_id == spans["orchestrator"].context.span_id for item in tools))
+        self.assertEqual({item.parent.span_id for item in inner}, {item.context.span_id for item in tools})
+        self.assertIsNone(current_trace_id())
+
+    def test_disabled(self):
+        """测试未启用追踪时不创建span，也不添加请求头"""
+        use_tracer_provider(None)
+        workflow_id = self.manager.start_workflow("考试生成")
+        with workflow_scope(workflow_id), span("render") as current:
+            self.assertIsNone(current.otel_span)
+            self.assertEqual(inject_trace_headers({}), {})
+        self.assertEqual(self.exporter.get_finished_spans(), ())
+        self.assertEqual(len(self.manager.get_workflow(workflow_id)["spans"]), 1)
+
+    def test_jsonl_export(self):
+        """测试本地JSONL文件中每行一个span，包含父span ID和失败状态"""
+        workflow_id = self.manager.start_workflow("考试生成")
+        with workflow_scope(workflow_id), span("step"):
+            with self.assertRaises(ValueError):
+                with span("render"):
+                    raise ValueError("渲染失败")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "traces.jsonl")
+            JsonlSpanExporter(path).export(self.exporter.get_finished_spans())
+            with open(path, encoding="utf-8") as f:
+                records = {record["name"]: record for record in map(json.loads, f)}
+        self.assertEqual(records["render"]["parent_span_id"], records["step"]["span_id"])
+        self.assertEqual(records["render"]["trace_id"], records["step"]["trace_id"])
+        self.assertEqual(records["render"]["status"], "ERROR")
+        self.assertIn("渲染失败", records["render"]["status_message"])
+        self.assertEqual(records["step"]["status"], "UNSET")
+        self.assertGreaterEqual(records["step"]["duration_ms"], records["render"]["duration_ms"])
+
+if __name__ == '__main__':
+    unittest.main()
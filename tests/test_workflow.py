@@ -7,7 +7,8 @@ import json
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from exam_generator.agent import generate_exam
+from exam_generator.agent import generate_exam, AgentPool
+from exam_generator.batch import run_batch
 from exam_generator.tools.content_tools import extract_exam_metadata, plan_exam_content
 from exam_generator.tools.exam_tools import (
     generate_single_choice_question,
@@ -15,6 +16,7 @@ from exam_generator.tools.exam_tools import (
     generate_fill_blank_question
 )
 from exam_generator.tools.render_tools import send_to_flask_service
+from exam_generator.utils.task_manager import task_manager
 
 class TestWorkflow(unittest.TestCase):
     """测试完整工作流程"""
@@ -59,13 +61,26 @@ class TestWorkflow(unittest.TestCase):
         self.assertIn("保存成功", result["message"])
         self.assertIn("http://", result["message"])
     
+    @patch('exam_generator.tools.exam_tools.question_cache.get', return_value=None)
+    @patch('exam_generator.tools.exam_tools.call_claude')
     @patch('exam_generator.agent.create_agent')
     @patch('exam_generator.tools.render_tools.requests.post')
-    def test_generate_exam(self, mock_post, mock_create_agent):
-        """测试generate_exam函数"""
-        # 模拟Agent返回
-        mock_agent = MagicMock()
-        mock_agent.return_value.message = "## 单选题\n\n1+1=?\n\n- (x) 2\n- ( ) 3\n- ( ) 4\n- ( ) 5"
+    def test_generate_exam(self, mock_post, mock_create_agent, mock_call_claude, mock_cache_get):
+        """测试generate_exam函数由服务端按规划顺序组装考试"""
+        questions = {
+            "generate_single_choice_question": "## 单选题\n\n1+1=?\n\n- (x) 2\n- ( ) 3\n- ( ) 4\n- ( ) 5",
+            "generate_fill_blank_question": "## 填空题\n\n2+2=______\n\n- R:= 4"
+        }
+        mock_call_claude.side_effect = lambda prompt, **kwargs: questions[kwargs["source"]]
+        
+        # 模拟Agent：按与规划相反的顺序调用题目生成工具，最终回复中不包含题目内容
+        def run_agent(prompt):
+            generate_fill_blank_question("加法", "easy")
+            generate_single_choice_question("加法", "easy")
+            result = MagicMock()
+            result.__str__.return_value = "完成"
+            return result
+        mock_agent = MagicMock(side_effect=run_agent)
         mock_create_agent.return_value = mock_agent
         
         # 模拟Flask服务响应
@@ -78,8 +93,8 @@ class TestWorkflow(unittest.TestCase):
             "inputs": {
                 "grade": "1st",
                 "subject": "Mathematics",
-                "count": 1,
-                "types": "singleChoice",
+                "count": 2,
+                "types": "singleChoice,fillBlank",
                 "topics": "加法",
                 "difficulty": "easy"
             }
@@ -92,6 +107,91 @@ class TestWorkflow(unittest.TestCase):
         self.assertIn("exam_content", result)
         self.assertIn("render_result", result)
         self.assertIn("message", result["render_result"])
+        self.assertEqual(
+            result["exam_content"],
+            questions["generate_single_choice_question"] + "\n\n" + questions["generate_fill_blank_question"]
+        )
+        self.assertEqual(mock_post.call_args.kwargs["data"].decode('utf-8'), result["exam_content"])
+    
+    @patch('exam_generator.agent.time.sleep')
+    @patch('exam_generator.tools.exam_tools.question_cache.get', return_value=None)
+    @patch('exam_generator.tools.exam_tools.call_claude')
+    @patch('exam_generator.agent.create_agent')
+    @patch('exam_generator.tools.render_tools.requests.post')
+    def test_generate_exam_resumes_after_throttling(self, mock_post, mock_create_agent, mock_call_claude, mock_cache_get, mock_sleep):
+        """测试限流重试时保留已生成的题目，只生成缺少的题目"""
+        mock_call_claude.return_value = "## 单选题\n\n1+1=?\n\n- (x) 2\n- ( ) 3\n- ( ) 4\n- ( ) 5"
+        prompts = []
+        
+        def run_agent(prompt):
+            prompts.append(prompt)
+            generate_single_choice_question(f"题目{len(prompts)}", "easy")
+            if len(prompts) == 1:
+                raise Exception("throttlingException: Too many requests")
+            return MagicMock()
+        mock_create_agent.return_value = MagicMock(side_effect=run_agent)
+        mock_post.return_value.json.return_value = {"message": "保存成功"}
+        
+        exam_request = {"inputs": {"count": 2, "types": "singleChoice", "difficulty": "easy"}}
+        workflow_id = task_manager.start_workflow("考试生成")
+        result = generate_exam(exam_request, workflow_id)
+        
+        # 第二次尝试只生成缺少的一道题目
+        self.assertEqual(len(prompts), 2)
+        self.assertIn("q1", prompts[1])
+        self.assertIn("只需要再生成1道单选题", prompts[1])
+        self.assertEqual(mock_call_claude.call_count, 2)
+        self.assertEqual(result["exam_content"].count("## 单选题"), 2)
+        
+        work = task_manager.generate_evaluation_report(workflow_id)["generation_work"]
+        self.assertEqual(work["questions_used"], 2)
+        self.assertEqual(work["questions_reused"], 1)
+        self.assertEqual(work["failed_steps"], 1)
+    
+    @patch('exam_generator.tools.exam_tools.question_cache.set')
+    @patch('exam_generator.tools.exam_tools.question_cache.get', return_value=None)
+    @patch('exam_generator.tools.exam_tools.call_claude')
+    @patch('exam_generator.tools.render_tools.requests.post')
+    def test_batch_shares_work(self, mock_post, mock_call_claude, mock_cache_get, mock_cache_set):
+        """测试批量生成对相同的考试共享题目，对变体生成不同的题目"""
+        mock_call_claude.side_effect = lambda prompt, **kwargs: f"## 单选题\n\n{prompt.strip().splitlines()[0]}\n\n- (x) A\n- ( ) B"
+        mock_post.return_value.json.return_value = {"message": "保存成功\n查看链接http://localhost:5006/get_html/test"}
+        exam_request = {"inputs": {"count": 2, "types": "singleChoice", "topics": "加法", "difficulty": "easy"}}
+        
+        # 相同的考试请求只生成和渲染一次
+        workflow_id = task_manager.start_workflow("批量考试生成")
+        result = run_batch({"requests": [exam_request, exam_request]}, workflow_id)
+        self.assertEqual(result["statistics"]["questions_total"], 4)
+        self.assertEqual(result["statistics"]["questions_generated"], 2)
+        self.assertEqual(result["statistics"]["unique_specs"], 1)
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(result["exams"][0]["link"], "http://localhost:5006/get_html/test")
+        self.assertIn("生成题目", result["timings"])
+        
+        # 同一规格的变体生成不同的题目
+        mock_call_claude.reset_mock()
+        workflow_id = task_manager.start_workflow("批量考试生成")
+        result = run_batch({"spec": exam_request, "variants": 2}, workflow_id)
+        self.assertEqual(result["statistics"]["questions_generated"], 4)
+        self.assertEqual(mock_call_claude.call_count, 4)
+        self.assertNotEqual(result["exams"][0]["exam_content"], result["exams"][1]["exam_content"])
+    
+    def test_invalid_batch_returns_400(self):
+        """测试格式错误的批量请求返回400，不占用准入名额也不创建工作流"""
+        from exam_generator.server import app
+        client = app.test_client()
+        with patch('exam_generator.server.admission_controller') as controller, \
+                patch('exam_generator.server.task_manager') as manager:
+            for body in [{}, {"spec": {"inputs": {"count": 1}}, "variants": 0},
+                         {"spec": {"inputs": {"count": 1}}, "variants": "abc"},
+                         {"spec": {"inputs": {"count": 1}}, "variants": 1000},
+                         {"spec": {"inputs": {"count": 1}}, "variants": 10 ** 8},
+                         {"requests": [{"timeout": 10}]}]:
+                with self.subTest(body=body):
+                    response = client.post('/workflows/batch', json=body)
+                    self.assertEqual(response.status_code, 400)
+            controller.admit.assert_not_called()
+            manager.start_workflow.assert_not_called()
     
     @patch('exam_generator.tools.exam_tools.call_claude')
     def test_parallel_question_generation(self, mock_call_claude):
@@ -116,5 +216,23 @@ class TestWorkflow(unittest.TestCase):
         self.assertTrue(all(isinstance(result, str) for result in results))
         self.assertTrue(any("## 单选题" in result for result in results))
 
+    def test_agent_pool_reuse(self):
+        """测试Agent池复用并重置Agent"""
+        pool = AgentPool(max_size=1)
+        
+        agent = pool.acquire("test-workflow-id", "test-step-id")
+        agent.messages.append({"role": "user", "content": [{"text": "上一次请求"}]})
+        pool.release(agent)
+        
+        # 再次获取时得到同一个Agent，且对话历史已清空
+        reused = pool.acquire()
+        self.assertIs(reused, agent)
+        self.assertEqual(reused.messages, [])
+        
+        # 池中没有空闲Agent时创建新的
+        another = pool.acquire()
+        self.assertIsNot(another, reused)
+        self.assertIs(another.model, reused.model)
+
 if __name__ == '__main__':
     unittest.main()